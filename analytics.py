@@ -0,0 +1,285 @@
+"""Daily admissions, length-of-stay and revenue rollups.
+
+``DailyRollups`` keeps one small document per day and dimension key in the
+``daily_rollups`` collection::
+
+    {"_id": "admission_type:ICU:2026-01-03", "dimension": "admission_type",
+     "key": "ICU", "day": "2026-01-03", "admissions": 3, "discharges": 2,
+     "patient_days": 9, "los": {"1": 0, "2": 1, "3": 0, "4-7": 1, ...},
+     "billed": 31500.0}
+
+Rollups exist for the whole hospital (dimension ``all``), per admission type
+and per assigned doctor.  Admissions are counted on the admission day;
+discharges, their length of stay and the final bill of the stay are counted
+on the discharge day.  ``update`` builds only the complete days after the
+stored watermark, a month of days per pair of aggregations, so running it
+nightly costs one day of work however long the history is.  A dashboard
+then reads at most one document per day and key, instead of re-scanning
+every patient.
+
+Closed days are not revisited; after a bulk import or a correction to an
+old admission, ``rebuild --since`` recomputes from that day on.  Patients
+archived before their discharge day was rolled up are not counted.
+
+    python analytics.py update
+    python analytics.py report --by admission_type --from 2025-01-01
+    python analytics.py rebuild --since 2025-06-01
+"""
+import argparse
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReplaceOne
+
+from billing import days_admitted
+from metrics import timed
+
+DIMENSIONS = ("all", "admission_type", "assigned_doctor")
+ALL = "all"
+# Upper bound (inclusive, in days) and label of each length-of-stay bucket
+LOS_BUCKETS = [(1, "1"), (2, "2"), (3, "3"), (7, "4-7"), (14, "8-14"), (30, "15-30"),
+               (None, "31+")]
+LOS_LABELS = [label for _, label in LOS_BUCKETS]
+_LOS_BOUNDS = [bound for bound, _ in LOS_BUCKETS if bound is not None]
+COUNT_FIELDS = ("admissions", "discharges", "patient_days", "billed")
+DEFAULT_CHUNK_DAYS = 31
+WATERMARK_ID = "analytics"
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def los_bucket(days: int) -> str:
+    return LOS_LABELS[bisect_left(_LOS_BOUNDS, days)]
+
+
+def rollup_id(dimension: str, key: str, day: str) -> str:
+    return f"{dimension}:{key}:{day}"
+
+
+def _day(value: datetime) -> str:
+    return value.strftime(DAY_FORMAT)
+
+
+def _midnight(value: datetime) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+
+def empty_rollup() -> Dict:
+    rollup = dict.fromkeys(COUNT_FIELDS, 0)
+    rollup["billed"] = 0.0
+    rollup["los"] = dict.fromkeys(LOS_LABELS, 0)
+    return rollup
+
+
+def _keys(admission_type: Optional[str], doctor: Optional[str]) -> List[Tuple[str, str]]:
+    """The (dimension, key) rollups one admission or discharge contributes to"""
+    keys = [(ALL, ALL)]
+    if admission_type:
+        keys.append(("admission_type", admission_type))
+    if doctor:
+        keys.append(("assigned_doctor", doctor))
+    return keys
+
+
+class DailyRollups:
+    """Incrementally built daily rollups and range queries over them"""
+
+    def __init__(self, rollups_collection, patients_collection, meta_collection):
+        self.rollups_collection = rollups_collection
+        self.patients_collection = patients_collection
+        self.meta_collection = meta_collection
+
+    # -- building ----------------------------------------------------------
+
+    def watermark(self) -> Optional[str]:
+        """Last day that is fully rolled up, or None before the first update"""
+        meta = self.meta_collection.find_one({"_id": WATERMARK_ID}, {"through": 1})
+        return meta.get("through") if meta else None
+
+    def _set_watermark(self, day: Optional[str]) -> None:
+        if day is None:
+            self.meta_collection.delete_one({"_id": WATERMARK_ID})
+        else:
+            self.meta_collection.replace_one(
+                {"_id": WATERMARK_ID}, {"through": day, "updated_at": datetime.now()},
+                upsert=True)
+
+    def _first_day(self) -> Optional[datetime]:
+        first = list(self.patients_collection.find(
+            {"admission_info.admission_date": {"$exists": True}},
+            {"_id": 0, "admission_info.admission_date": 1})
+            .sort("admission_info.admission_date", 1).limit(1))
+        admitted = first[0]["admission_info"]["admission_date"] if first else None
+        return _midnight(admitted) if isinstance(admitted, datetime) else None
+
+    def _aggregate(self, start: datetime, end: datetime) -> Dict[Tuple[str, str, str], Dict]:
+        """Rollups for the days in ``[start, end)``, keyed by (dimension, key, day)"""
+        rollups: Dict[Tuple[str, str, str], Dict] = defaultdict(empty_rollup)
+        admission_day = {"$dateToString": {"format": DAY_FORMAT,
+                                           "date": "$admission_info.admission_date"}}
+        admissions = [
+            {"$match": {"admission_info.admission_date": {"$gte": start, "$lt": end}}},
+            {"$group": {"_id": {"day": admission_day,
+                                "type": "$admission_info.admission_type",
+                                "doctor": "$admission_info.assigned_doctor"},
+                        "count": {"$sum": 1}}},
+        ]
+        for group in self.patients_collection.aggregate(admissions):
+            key = group["_id"]
+            for dimension, value in _keys(key.get("type"), key.get("doctor")):
+                rollups[(dimension, value, key["day"])]["admissions"] += group["count"]
+        # Length of stay needs both dates of each discharge, so the pipeline
+        # only narrows the documents and the buckets are filled here.
+        discharges = [
+            {"$match": {"admission_info.discharge_date": {"$gte": start, "$lt": end}}},
+            {"$project": {"_id": 0,
+                          "type": "$admission_info.admission_type",
+                          "doctor": "$admission_info.assigned_doctor",
+                          "admitted": "$admission_info.admission_date",
+                          "discharged": "$admission_info.discharge_date",
+                          "billed": "$billing_info.total_amount"}},
+        ]
+        for row in self.patients_collection.aggregate(discharges):
+            day = _day(row["discharged"])
+            stay = days_admitted(row["admitted"], row["discharged"]) \
+                if isinstance(row.get("admitted"), datetime) else 0
+            bucket = los_bucket(stay) if stay > 0 else None
+            billed = row.get("billed") or 0.0
+            for dimension, value in _keys(row.get("type"), row.get("doctor")):
+                rollup = rollups[(dimension, value, day)]
+                rollup["discharges"] += 1
+                rollup["patient_days"] += max(stay, 0)
+                rollup["billed"] += billed
+                if bucket:
+                    rollup["los"][bucket] += 1
+        return rollups
+
+    def _write(self, rollups: Dict[Tuple[str, str, str], Dict]) -> int:
+        ops = [ReplaceOne({"_id": rollup_id(dimension, key, day)},
+                          dict(rollup, dimension=dimension, key=key, day=day), upsert=True)
+               for (dimension, key, day), rollup in rollups.items()]
+        if ops:
+            self.rollups_collection.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    @timed("analytics_update")
+    def update(self, now: Optional[datetime] = None,
+               chunk_days: int = DEFAULT_CHUNK_DAYS) -> Dict[str, int]:
+        """Roll up every complete day after the watermark (today stays open)"""
+        end = _midnight(now or datetime.now())
+        through = self.watermark()
+        start = datetime.strptime(through, DAY_FORMAT) + timedelta(days=1) if through \
+            else self._first_day()
+        report = {"days": 0, "documents": 0}
+        if start is None:
+            return report
+        while start < end:
+            chunk_end = min(start + timedelta(days=chunk_days), end)
+            report["documents"] += self._write(self._aggregate(start, chunk_end))
+            report["days"] += (chunk_end - start).days
+            # Advance only after the chunk is written, so an interrupted
+            # update resumes where it stopped.
+            self._set_watermark(_day(chunk_end - timedelta(days=1)))
+            start = chunk_end
+        return report
+
+    @timed("analytics_rebuild")
+    def rebuild(self, since: Optional[datetime] = None,
+                now: Optional[datetime] = None) -> Dict[str, int]:
+        """Recompute the rollups from ``since`` (or from the first admission) on"""
+        if since is None:
+            self.rollups_collection.delete_many({})
+            self._set_watermark(None)
+        else:
+            since = _midnight(since)
+            self.rollups_collection.delete_many({"day": {"$gte": _day(since)}})
+            self._set_watermark(_day(since - timedelta(days=1)))
+        return self.update(now)
+
+    # -- queries -----------------------------------------------------------
+
+    def _find(self, dimension: str, start: Optional[datetime], end: Optional[datetime],
+              key: Optional[str] = None):
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension '{dimension}', expected one of "
+                             f"{', '.join(DIMENSIONS)}")
+        query: Dict = {"dimension": dimension}
+        if start or end:
+            query["day"] = {}
+            if start:
+                query["day"]["$gte"] = _day(start)
+            if end:
+                query["day"]["$lt"] = _day(end)
+        if key is not None:
+            query["key"] = key
+        return self.rollups_collection.find(query, {"_id": 0, "dimension": 0})
+
+    @timed("analytics_series")
+    def series(self, dimension: str = ALL, start: Optional[datetime] = None,
+               end: Optional[datetime] = None, key: Optional[str] = None) -> List[Dict]:
+        """Day documents of one dimension in ``[start, end)``, oldest first"""
+        return sorted(self._find(dimension, start, end, key),
+                      key=lambda rollup: (rollup["day"], rollup["key"]))
+
+    @timed("analytics_summary")
+    def summary(self, dimension: str = ALL, start: Optional[datetime] = None,
+                end: Optional[datetime] = None) -> Dict[str, Dict]:
+        """Totals per key of ``dimension`` over ``[start, end)``, with average stay"""
+        totals: Dict[str, Dict] = defaultdict(empty_rollup)
+        for rollup in self._find(dimension, start, end):
+            total = totals[rollup["key"]]
+            for field in COUNT_FIELDS:
+                total[field] += rollup.get(field, 0)
+            for label, count in (rollup.get("los") or {}).items():
+                total["los"][label] = total["los"].get(label, 0) + count
+        for total in totals.values():
+            total["average_stay"] = total["patient_days"] / total["discharges"] \
+                if total["discharges"] else 0.0
+        return dict(totals)
+
+
+def _date(value: str) -> datetime:
+    return datetime.strptime(value, DAY_FORMAT)
+
+
+def main():
+    from app import HospitalManagementSystem, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Daily admissions, stay and revenue rollups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("update", help="roll up the complete days after the watermark")
+    rebuild = sub.add_parser("rebuild", help="recompute the rollups")
+    rebuild.add_argument("--since", type=_date, help="first day to recompute, YYYY-MM-DD")
+    report = sub.add_parser("report", help="totals per key over a period")
+    report.add_argument("--by", choices=DIMENSIONS, default=ALL)
+    report.add_argument("--from", dest="start", type=_date,
+                        help="first day, YYYY-MM-DD (default: a year ago)")
+    report.add_argument("--to", dest="end", type=_date, help="day after the last, YYYY-MM-DD")
+    args = parser.parse_args()
+
+    hms = HospitalManagementSystem(backend=backend_from_env())
+    try:
+        if args.command == "update":
+            result = hms.analytics.update()
+            print(f"✅ Rolled up {result['days']:,} days ({result['documents']:,} documents), "
+                  f"through {hms.analytics.watermark()}")
+        elif args.command == "rebuild":
+            result = hms.analytics.rebuild(args.since)
+            print(f"✅ Rebuilt {result['days']:,} days ({result['documents']:,} documents)")
+        else:
+            hms.analytics.update()
+            start = args.start or _midnight(datetime.now()) - timedelta(days=365)
+            totals = hms.analytics.summary(args.by, start, args.end)
+            print(f"{'':<24} {'admitted':>9} {'discharged':>10} {'avg stay':>9} {'billed':>14}"
+                  + "".join(f" {label:>6}" for label in LOS_LABELS))
+            for key, total in sorted(totals.items()):
+                print(f"{key:<24} {total['admissions']:>9,} {total['discharges']:>10,} "
+                      f"{total['average_stay']:>9.1f} {total['billed']:>14,.2f}"
+                      + "".join(f" {total['los'][label]:>6,}" for label in LOS_LABELS))
+    finally:
+        hms.close()
+
+
+if __name__ == "__main__":
+    main()
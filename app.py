@@ -1,41 +1,194 @@
-import pymongo
-from pymongo import MongoClient
+import os
+import sys
 from datetime import datetime, timedelta
-import uuid
 from typing import Dict, List, Optional
 import json
 
+from assignment import AssignmentEngine
+from analytics import DailyRollups
+from archive import Archiver, CollectionArchive, SegmentArchive
+from billing import BatchBillingEngine, base_charges
+from cache import DEFAULT_TTL, PatientCache
+from census import WardCensus
+from history import PatientHistory
+from ids import IdAllocator
+from importer import ImportReport, import_file
+from indexes import schema_version, sync_indexes
+from ledger import PaymentLedger
+from listing import DEFAULT_PAGE_SIZE, PatientListing
+from metrics import METRICS, CommandMetrics, serve
+from operations import CONFLICT, PatientOperations, expected_values, new_patient_document
+from search import PatientSearch, search_key_update
+from storage import EmbeddedBackend, MongoBackend, StorageBackend
+from tariffs import TariffBook
+from write_queue import WriteBehindQueue, WriteJournal
+
 class HospitalManagementSystem:
-    def __init__(self, connection_string="mongodb://localhost:27017/", db_name="hospital_db"):
-        """Initialize the Hospital Management System with MongoDB connection"""
+    def __init__(self, connection_string="mongodb://localhost:27017/", db_name="hospital_db",
+                 backend: Optional[StorageBackend] = None, cache: Optional[PatientCache] = None,
+                 lazy: bool = True):
+        """Initialize the Hospital Management System with a storage backend (MongoDB by default)
+
+        With ``lazy`` the backend connects, and indexes are verified, on the
+        first database operation instead of here.
+        """
         try:
-            self.client = MongoClient(connection_string)
-            self.db = self.client[db_name]
-            self.patients_collection = self.db["patients"]
-            self.billing_collection = self.db["billing"]
+            self.backend = backend or MongoBackend(connection_string, db_name)
+            self.patients_collection = self.backend.collection("patients")
+            self.billing_collection = self.backend.collection("billing")
+            self.charges_collection = self.backend.collection("charges")
+            self.census_collection = self.backend.collection("census")
+            self.payments_collection = self.backend.collection("payments")
+            self.receivables_collection = self.backend.collection("receivables")
+            self.archive_index_collection = self.backend.collection("archive_index")
+            self.meta_collection = self.backend.collection("meta")
+            self.counters_collection = self.backend.collection("counters")
+            self.rollups_collection = self.backend.collection("daily_rollups")
+            self.history_collection = self.backend.collection("patient_history")
+            self.tariffs_collection = self.backend.collection("tariffs")
+            self.rooms_collection = self.backend.collection("rooms")
+            self.collections = {
+                "patients": self.patients_collection,
+                "billing": self.billing_collection,
+                "charges": self.charges_collection,
+                "census": self.census_collection,
+                "payments": self.payments_collection,
+                "receivables": self.receivables_collection,
+                "archive_index": self.archive_index_collection,
+                "daily_rollups": self.rollups_collection,
+                "patient_history": self.history_collection
+            }
+            if os.environ.get("HMS_ARCHIVE_DIR"):
+                archive_tier = SegmentArchive(os.environ["HMS_ARCHIVE_DIR"])
+            else:
+                self.collections["archived_patients"] = self.backend.collection("archived_patients")
+                self.collections["archived_billing"] = self.backend.collection("archived_billing")
+                archive_tier = CollectionArchive(self.collections["archived_patients"],
+                                                 self.collections["archived_billing"])
+            self.ids = IdAllocator(self.counters_collection)
+            self.cache = cache
+            self.search_engine = PatientSearch(self.patients_collection, cache)
+            self.listing = PatientListing(self.patients_collection)
+            self.metrics = METRICS
+            self.operations = PatientOperations(self.patients_collection, self.billing_collection, cache)
+            self.census = WardCensus(self.census_collection, self.patients_collection)
+            self.operations.add_listener(self.census.record)
+            self.assignment = AssignmentEngine(self.patients_collection,
+                                               rooms_collection=self.rooms_collection,
+                                               census=self.census)
+            self.operations.add_listener(self.assignment.record)
+            self.ledger = PaymentLedger(self.payments_collection, self.receivables_collection,
+                                        self.patients_collection, self.billing_collection,
+                                        self.operations)
+            self.operations.add_listener(self.ledger.record)
+            self.history = PatientHistory(self.history_collection, self.patients_collection)
+            self.operations.add_listener(self.history.record)
+            self.tariffs = TariffBook(self.tariffs_collection)
+            self.billing_engine = BatchBillingEngine(self.patients_collection, self.billing_collection,
+                                                     self.charges_collection, self.ledger,
+                                                     self.tariffs)
+            self.billing_engine.add_listener(self.history.billed)
+            self.archiver = Archiver(self.patients_collection, self.billing_collection,
+                                     self.archive_index_collection, archive_tier, cache)
+            self.archiver.add_listener(self.census.apply_changes)
+            self.archiver.add_listener(self.ledger.apply_changes)
+            self.analytics = DailyRollups(self.rollups_collection, self.patients_collection,
+                                          self.meta_collection)
+            self.write_queue = None
+            if os.environ.get("HMS_WRITE_BEHIND", "").lower() in ("1", "true", "yes"):
+                journal = os.environ.get("HMS_WRITE_JOURNAL")
+                self.write_queue = WriteBehindQueue(
+                    self.operations, journal=WriteJournal(journal) if journal else None)
             
    
-            self.client.admin.command('ping')
-            
-     
-            try:
-                self.patients_collection.create_index("patient_id", unique=True)
-                self.billing_collection.create_index("patient_id")
-            except Exception as index_error:
-         
-                pass
-            
-            print("✅ Connected to MongoDB successfully!")
+            self.backend.on_connect(self._prepare)
+            if not lazy:
+                self.backend.ping()
+                print(f"✅ Connected to {self.backend.describe()} successfully!")
+            else:
+                print(f"✅ Using {self.backend.describe()}")
             print(f"📊 Database: {db_name}")
             
         except Exception as e:
-            print(f"❌ Error connecting to MongoDB: {e}")
+            print(f"❌ Error connecting to storage backend: {e}")
             print("💡 Make sure MongoDB is running or check your connection string")
             raise
 
+    def _prepare(self):
+        """Verify the schema unless its stored version is current, then finish payments
+
+        A payment recorded by a process that stopped before applying it to
+        the balance is applied here.
+        """
+        meta = self.meta_collection.find_one({"_id": "schema"}, {"version": 1})
+        if not meta or meta.get("version") != schema_version(self.collections):
+            self._sync_schema()
+        reconciled = self.ledger.reconcile()
+        if reconciled:
+            print(f"💳 Applied {reconciled} payment(s) left unapplied by an interrupted run")
+
+    def _sync_schema(self):
+        """Verify indexes and derived collections"""
+        try:
+            sync_indexes(self.collections)
+        except Exception as index_error:
+            print(f"⚠️ Could not create indexes: {index_error}")
+            print("💡 Run 'python indexes.py sync' to see which index failed")
+            return
+        if not self.census_collection.estimated_document_count():
+            self.census.rebuild()
+        if not self.receivables_collection.estimated_document_count():
+            self.ledger.rebuild()
+        self.record_schema_version()
+
+    def record_schema_version(self):
+        """Remember that the declared indexes are in place"""
+        self.meta_collection.replace_one(
+            {"_id": "schema"},
+            {"version": schema_version(self.collections), "updated_at": datetime.now()},
+            upsert=True)
+
+    def close(self):
+        """Flush queued writes and close the underlying storage backend"""
+        if self.write_queue is not None:
+            self.write_queue.close()
+        self.assignment.close()
+        self.backend.close()
+
+    def get_patient(self, patient_id: str) -> Optional[Dict]:
+        """Patient document, including writes still queued in write-behind mode"""
+        if self.write_queue is not None:
+            return self.write_queue.get_patient(patient_id)
+        return self.operations.get_patient(patient_id)
+
+    def _report_queued(self, patient_id: str, what: str):
+        """Callback telling the terminal when a queued write could not be applied"""
+        def report(future):
+            result = future.result()
+            if not result.ok:
+                print(f"\n⚠️ Queued {what} for {patient_id} not applied: {result.message}")
+        return report
+
+    def run_billing(self, **kwargs):
+        """Run the batch billing engine and drop cached documents it rewrote"""
+        report = self.billing_engine.run(**kwargs)
+        if self.cache is not None:
+            self.cache.clear()
+        return report
+
+    def import_file(self, path: str, **kwargs) -> ImportReport:
+        """Bulk import patients; the census, receivables, beds and history follow each batch"""
+        listeners = [self.census.apply_changes, self.ledger.apply_changes,
+                     self.assignment.apply_changes, self.history.imported]
+        if self.cache is not None:
+            # A lookup before the import may have cached the patient as missing
+            listeners.append(lambda changes: self.cache.invalidate_many(
+                after["patient_id"] for _, after in changes))
+        return import_file(self.patients_collection, path, listeners=listeners, **kwargs)
+
     def generate_patient_id(self) -> str:
         """Generate a unique patient ID"""
-        return f"PAT{str(uuid.uuid4())[:8].upper()}"
+        return self.ids.next_id()
 
     def patient_onboarding(self) -> str:
         """Handle patient onboarding process"""
@@ -47,42 +200,67 @@ class HospitalManagementSystem:
 
             print("Please enter patient information:")
             
-            patient_data = {
-                "patient_id": self.generate_patient_id(),
-                "personal_info": {
-                    "name": input("Enter patient name: ").strip(),
-                    "age": int(input("Enter patient age: ")),
-                    "gender": input("Enter gender (M/F/Other): ").strip(),
-                    "phone": input("Enter phone number: ").strip(),
-                    "address": input("Enter address: ").strip(),
-                    "emergency_contact": input("Enter emergency contact: ").strip()
-                },
-                "medical_info": {
-                    "disease": input("Enter disease/condition: ").strip(),
-                    "symptoms": input("Enter symptoms: ").strip(),
-                    "allergies": input("Enter allergies (if any): ").strip(),
-                    "medical_history": input("Enter medical history: ").strip()
-                },
-                "admission_info": {
-                    "admission_date": datetime.now(),
-                    "admission_type": input("Enter admission type (Emergency/Regular/ICU): ").strip(),
-                    "assigned_doctor": input("Enter assigned doctor name: ").strip(),
-                    "room_number": input("Enter room number: ").strip(),
-                    "status": "Active"
-                },
-                "billing_info": {
-                    "total_amount": 0.0,
-                    "paid_amount": 0.0,
-                    "outstanding_amount": 0.0
-                },
-                "created_at": datetime.now(),
-                "updated_at": datetime.now()
+            personal_info = {
+                "name": input("Enter patient name: ").strip(),
+                "age": int(input("Enter patient age: ")),
+                "gender": input("Enter gender (M/F/Other): ").strip(),
+                "phone": input("Enter phone number: ").strip(),
+                "address": input("Enter address: ").strip(),
+                "emergency_contact": input("Enter emergency contact: ").strip()
             }
-            
-      
-            result = self.patients_collection.insert_one(patient_data)
-            
-            if result.inserted_id:
+            medical_info = {
+                "disease": input("Enter disease/condition: ").strip(),
+                "symptoms": input("Enter symptoms: ").strip(),
+                "allergies": input("Enter allergies (if any): ").strip(),
+                "medical_history": input("Enter medical history: ").strip()
+            }
+            admission_types = self.tariffs.current().admission_types
+            admission_type = input(f"Enter admission type ({'/'.join(admission_types)}): ").strip()
+            if admission_type not in admission_types:
+                print(f"❌ No rates for admission type '{admission_type}'")
+                print("💡 Publish them with 'python tariffs.py set-rate'")
+                return None
+            # Hold the best bed and doctor while the clerk answers, so concurrent
+            # admissions are not offered the same last bed
+            reservation = self.assignment.reserve(admission_type)
+            kept = False
+            try:
+                doctor_hint = f" (Enter for {reservation.assigned_doctor}, {reservation.caseload} active)" if reservation.assigned_doctor else ""
+                assigned_doctor = input(f"Enter assigned doctor name{doctor_hint}: ").strip() or reservation.assigned_doctor
+                room_hint = f" (Enter for {reservation.room_number}, {reservation.free_beds} free)" if reservation.room_number else " (no free beds listed)"
+                room_number = input(f"Enter room number{room_hint}: ").strip() or reservation.room_number
+                if not assigned_doctor or not room_number:
+                    print("❌ A doctor and a room are required")
+                    return None
+                if room_number != reservation.room_number:
+                    free_beds = self.assignment.free_beds(room_number)
+                    if free_beds is None:
+                        print(f"⚠️ Room {room_number} is not in the room inventory; its capacity is unknown")
+                        print("💡 Add it with 'python assignment.py set-rooms'")
+                    elif free_beds <= 0:
+                        print(f"❌ Room {room_number} has no free bed")
+                        return None
+                patient_data = new_patient_document(
+                    self.generate_patient_id(), personal_info, medical_info,
+                    admission_type=admission_type,
+                    assigned_doctor=assigned_doctor,
+                    room_number=room_number
+                )
+                
+          
+                result = self.operations.onboard(patient_data)
+                # The onboarding consumes the reservation only if it took the reserved bed and doctor
+                kept = result.ok and (room_number, assigned_doctor) == (
+                    reservation.room_number, reservation.assigned_doctor)
+            finally:
+                if not kept:
+                    self.assignment.release(reservation)
+            
+            if result.status == CONFLICT:
+                print(f"❌ Patient ID {patient_data['patient_id']} is already in use; nothing was saved.")
+                print("💡 Check the ID counter with 'python ids.py status'")
+                return None
+            elif result.ok:
                 print(f"\n✅ Patient onboarded successfully!")
                 print(f"🆔 Patient ID: {patient_data['patient_id']}")
                 print(f"📅 Admission Date: {patient_data['admission_info']['admission_date'].strftime('%Y-%m-%d %H:%M:%S')}")
@@ -90,7 +268,7 @@ class HospitalManagementSystem:
                 print(f"👨‍⚕️ Doctor: {patient_data['admission_info']['assigned_doctor']}")
                 return patient_data['patient_id']
             else:
-                print("❌ Failed to onboard patient")
+                print(f"❌ Failed to onboard patient: {result.message}")
                 return None
                 
         except ValueError as e:
@@ -111,7 +289,7 @@ class HospitalManagementSystem:
                 patient_id = input("Enter Patient ID: ").strip()
             
       
-            patient = self.patients_collection.find_one({"patient_id": patient_id})
+            patient = self.get_patient(patient_id)
             
             if not patient:
                 print("❌ Patient not found!")
@@ -139,22 +317,21 @@ class HospitalManagementSystem:
             discharge_notes = input("Enter discharge notes: ").strip()
             
            
-            discharge_data = {
-                "admission_info.status": "Discharged",
-                "admission_info.discharge_date": datetime.now(),
-                "admission_info.discharge_notes": discharge_notes,
-                "updated_at": datetime.now()
-            }
+            if self.write_queue is not None:
+                self.write_queue.discharge(patient_id, discharge_notes).add_done_callback(
+                    self._report_queued(patient_id, "discharge"))
+                print("✅ Discharge queued")
+                return True
             
-            result = self.patients_collection.update_one(
-                {"patient_id": patient_id},
-                {"$set": discharge_data}
-            )
+            result = self.operations.discharge(patient_id, discharge_notes)
             
-            if result.modified_count > 0:
+            if result.ok:
                 print("✅ Patient discharged successfully!")
-                print(f"📅 Discharge Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+                print(f"📅 Discharge Date: {result.patient['admission_info']['discharge_date'].strftime('%Y-%m-%d %H:%M:%S')}")
                 return True
+            elif result.status == CONFLICT:
+                print(f"❌ Discharge not applied: {result.message}")
+                return False
             else:
                 print("❌ Failed to discharge patient")
                 return False
@@ -174,7 +351,7 @@ class HospitalManagementSystem:
                 patient_id = input("Enter Patient ID: ").strip()
             
           
-            patient = self.patients_collection.find_one({"patient_id": patient_id})
+            patient = self.get_patient(patient_id)
             
             if not patient:
                 print("❌ Patient not found!")
@@ -185,30 +362,26 @@ class HospitalManagementSystem:
             print(f"🩺 Condition: {patient['medical_info']['disease']}")
             
           
-            admission_date = patient['admission_info']['admission_date']
             current_date = datetime.now()
-            days_admitted = (current_date - admission_date).days + 1
-            
-           
-            fee_structure = {
-                "Emergency": {"room_per_day": 5000, "doctor_fee": 2000, "medicine_base": 1500},
-                "Regular": {"room_per_day": 3000, "doctor_fee": 1500, "medicine_base": 1000},
-                "ICU": {"room_per_day": 10000, "doctor_fee": 3000, "medicine_base": 2500}
-            }
-            
+            tariff = self.tariffs.current()
+            base = base_charges(patient['admission_info']['admission_type'],
+                                patient['admission_info']['admission_date'], current_date, tariff)
             admission_type = patient['admission_info']['admission_type']
-            fees = fee_structure.get(admission_type, fee_structure["Regular"])
-            
-            
-            room_charges = fees["room_per_day"] * days_admitted
-            doctor_charges = fees["doctor_fee"]
-            medicine_charges = fees["medicine_base"]
+            days_admitted = base["days_admitted"]
+            room_charges = base["room_charges"]
+            doctor_charges = base["doctor_charges"]
+            medicine_charges = base["medicine_charges"]
             
            
             print(f"\n📊 Base Charges (for {days_admitted} days):")
             print(f"   Room Charges: ₹{room_charges:,.2f}")
             print(f"   Doctor Charges: ₹{doctor_charges:,.2f}")
             print(f"   Medicine Charges: ₹{medicine_charges:,.2f}")
+            periods = tariff.periods(admission_type, patient['admission_info']['admission_date'],
+                                     days_admitted)
+            if len(periods) > 1:
+                for first_day, days, rate in periods:
+                    print(f"   {days} days from {first_day:%Y-%m-%d} at ₹{rate:,.2f}/day")
             
             print("\n--- Additional Charges ---")
             try:
@@ -220,29 +393,11 @@ class HospitalManagementSystem:
                 lab_charges = procedure_charges = pharmacy_charges = 0
             
            
-            total_amount = (room_charges + doctor_charges + medicine_charges + 
-                          lab_charges + procedure_charges + pharmacy_charges)
-            
-            
-            bill_breakdown = {
-                "patient_id": patient_id,
-                "patient_name": patient['personal_info']['name'],
-                "admission_date": admission_date.strftime('%Y-%m-%d'),
-                "days_admitted": days_admitted,
-                "admission_type": admission_type,
-                "charges": {
-                    "room_charges": room_charges,
-                    "doctor_charges": doctor_charges,
-                    "medicine_charges": medicine_charges,
-                    "lab_charges": lab_charges,
-                    "procedure_charges": procedure_charges,
-                    "pharmacy_charges": pharmacy_charges
-                },
-                "total_amount": total_amount,
-                "generated_date": datetime.now(),
-                "status": "Generated"
-            }
-            
+            bill_breakdown = self.billing_engine.prepare_bill(
+                patient, lab_charges, procedure_charges, pharmacy_charges,
+                now=current_date, tariff=tariff)
+            total_amount = bill_breakdown["total_amount"]
+            charges = bill_breakdown["charges"]
             
             print("\n" + "="*50)
             print("           BILL BREAKDOWN")
@@ -254,37 +409,34 @@ class HospitalManagementSystem:
             print(f"Room Charges: ₹{room_charges:,.2f}")
             print(f"Doctor Charges: ₹{doctor_charges:,.2f}")
             print(f"Medicine Charges: ₹{medicine_charges:,.2f}")
-            print(f"Lab Test Charges: ₹{lab_charges:,.2f}")
-            print(f"Procedure Charges: ₹{procedure_charges:,.2f}")
-            print(f"Pharmacy Charges: ₹{pharmacy_charges:,.2f}")
+            print(f"Lab Test Charges: ₹{charges['lab_charges']:,.2f}")
+            print(f"Procedure Charges: ₹{charges['procedure_charges']:,.2f}")
+            print(f"Pharmacy Charges: ₹{charges['pharmacy_charges']:,.2f}")
             print("-" * 50)
             print(f"💰 TOTAL AMOUNT: ₹{total_amount:,.2f}")
             print("="*50)
             
             
-            existing_bill = self.billing_collection.find_one({"patient_id": patient_id})
-            if existing_bill:
-                
-                self.billing_collection.update_one(
-                    {"patient_id": patient_id},
-                    {"$set": bill_breakdown}
-                )
-                print("📄 Bill updated in database")
-            else:
-                
-                self.billing_collection.insert_one(bill_breakdown)
-                print("📄 Bill saved to database")
-            
-        
-            self.patients_collection.update_one(
-                {"patient_id": patient_id},
-                {"$set": {
-                    "billing_info.total_amount": total_amount,
-                    "billing_info.outstanding_amount": total_amount,
-                    "updated_at": datetime.now()
-                }}
-            )
+            if self.write_queue is not None:
+                queued = self.write_queue.save_bill(bill_breakdown)
+                queued.add_done_callback(self._report_queued(patient_id, "bill"))
+                queued.add_done_callback(lambda future: future.result().ok and
+                                         self.billing_engine.mark_billed(
+                                             bill_breakdown["applied_charges"]))
+                paid = patient['billing_info'].get('paid_amount', 0)
+                print("📄 Bill queued")
+                print(f"💳 Paid: ₹{paid:,.2f}   Outstanding: ₹{total_amount - paid:,.2f}")
+                return bill_breakdown
+            
+            result = self.operations.save_bill(bill_breakdown)
+            if not result.ok:
+                print(f"❌ Bill not saved: {result.message}")
+                return None
+            self.billing_engine.mark_billed(bill_breakdown["applied_charges"])
+            print("📄 Bill saved to database" if result.message == "created" else "📄 Bill updated in database")
             print("📋 Patient billing info updated")
+            billing = result.patient['billing_info']
+            print(f"💳 Paid: ₹{billing.get('paid_amount', 0):,.2f}   Outstanding: ₹{billing['outstanding_amount']:,.2f}")
             
             return bill_breakdown
             
@@ -303,11 +455,15 @@ class HospitalManagementSystem:
                 patient_id = input("Enter Patient ID: ").strip()
             
         
-            patient = self.patients_collection.find_one({"patient_id": patient_id})
+            patient = self.get_patient(patient_id)
             
             if not patient:
-                print("❌ Patient not found!")
-                return None
+                archived = self.archiver.lookup(patient_id)
+                if not archived:
+                    print("❌ Patient not found!")
+                    return None
+                patient = archived["patient"]
+                print("🗄️  Patient record served from the archive")
             
            
             print(f"\n{'='*60}")
@@ -374,8 +530,8 @@ class HospitalManagementSystem:
             print(f"❌ Error retrieving patient information: {e}")
             return None
 
-    def search_patients(self, search_term: str = None) -> List[Dict]:
-        """Search patients by name or patient ID"""
+    def search_patients(self, search_term: str = None, limit: int = 20) -> List[Dict]:
+        """Search patients by name or patient ID (best matches first)"""
         print("\n" + "="*50)
         print("         SEARCH PATIENTS")
         print("="*50)
@@ -389,14 +545,7 @@ class HospitalManagementSystem:
                 return []
             
            
-            query = {
-                "$or": [
-                    {"patient_id": {"$regex": search_term, "$options": "i"}},
-                    {"personal_info.name": {"$regex": search_term, "$options": "i"}}
-                ]
-            }
-            
-            patients = list(self.patients_collection.find(query))
+            patients = self.search_engine.search(search_term, limit=limit)
             
             if not patients:
                 print(f"❌ No patients found matching '{search_term}'!")
@@ -426,8 +575,99 @@ class HospitalManagementSystem:
             print(f"❌ Error searching patients: {e}")
             return []
 
+    def list_patients(self, after: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                      status: Optional[str] = None, doctor: Optional[str] = None,
+                      admission_type: Optional[str] = None, room_number: Optional[str] = None):
+        """Return one page of patient summaries and the token for the next page"""
+        return self.listing.page(after, limit, status=status, doctor=doctor,
+                                 admission_type=admission_type, room_number=room_number)
+
+    def view_all_patients(self, status: Optional[str] = None, page_size: int = DEFAULT_PAGE_SIZE) -> int:
+        """Print patients page by page; returns how many were shown"""
+        try:
+            total = self.listing.count(status=status)
+            if not total:
+                print("No patients found in database.")
+                return 0
+            
+            print(f"\n📊 Total Patients: {total}")
+            shown = 0
+            for page in self.listing.iter_pages(page_size, status=status):
+                lines = []
+                for patient in page:
+                    status_emoji = "🟢" if patient['admission_info']['status'] == 'Active' else "🔴"
+                    lines.append(f"{status_emoji} {patient['patient_id']} - {patient['personal_info']['name']} - {patient['admission_info']['status']}\n")
+                sys.stdout.write("".join(lines))
+                sys.stdout.flush()
+                shown += len(page)
+                
+                if shown < total:
+                    more = input(f"-- {shown}/{total} shown, Enter for more, q to stop: ").strip().lower()
+                    if more == 'q':
+                        break
+            return shown
+            
+        except Exception as e:
+            print(f"❌ Error fetching patients: {e}")
+            return 0
+
+    def ward_census(self) -> Dict:
+        """Print active admissions per type, occupied rooms and doctor caseloads"""
+        try:
+            snapshot = self.census.snapshot()
+            print("\n" + "="*50)
+            print("        WARD CENSUS")
+            print("="*50)
+            print("🟢 " + ", ".join(f"{status}: {count}" for status, count in sorted(snapshot['status'].items())))
+            print("🏥 " + ", ".join(f"{kind}: {count}" for kind, count in sorted(snapshot['admission_type'].items())))
+            print(f"🛏️ Occupied rooms ({len(snapshot['room_number'])}):")
+            for room, count in sorted(snapshot['room_number'].items()):
+                print(f"   Room {room}: {count}")
+            print("👨‍⚕️ Doctor caseloads:")
+            for doctor, count in sorted(snapshot['assigned_doctor'].items()):
+                print(f"   {doctor}: {count}")
+            return snapshot
+        except Exception as e:
+            print(f"❌ Error reading census: {e}")
+            return {}
+
+    def record_payment(self, patient_id: str = None) -> bool:
+        """Record a payment against a patient's outstanding balance"""
+        print("\n" + "="*50)
+        print("        RECORD PAYMENT")
+        print("="*50)
+        
+        try:
+            if not patient_id:
+                patient_id = input("Enter Patient ID: ").strip()
+            
+            billing = self.ledger.balance(patient_id)
+            if billing is None:
+                print("❌ Patient not found!")
+                return False
+            print(f"💰 Outstanding Amount: ₹{billing.get('outstanding_amount', 0):,.2f}")
+            
+            amount = float(input("Enter amount received: "))
+            method = input("Enter payment method (cash/card/upi/insurance): ").strip() or "cash"
+            reference = input("Enter receipt or transaction reference (Enter to generate): ").strip()
+            
+            result = self.ledger.record_payment(patient_id, amount, method, reference or None)
+            if result.ok:
+                print(f"✅ Payment of ₹{amount:,.2f} recorded!")
+                print(f"💳 Outstanding Amount: ₹{result.patient['billing_info']['outstanding_amount']:,.2f}")
+                return True
+            print(f"❌ Payment not recorded: {result.message}")
+            return False
+            
+        except ValueError as e:
+            print(f"❌ Invalid amount: {e}")
+            return False
+        except Exception as e:
+            print(f"❌ Error recording payment: {e}")
+            return False
+
     def get_all_patients(self) -> List[Dict]:
-        """Get all patients from database"""
+        """Get all patients from database (loads every full document; prefer list_patients)"""
         try:
             patients = list(self.patients_collection.find())
             return patients
@@ -438,7 +678,7 @@ class HospitalManagementSystem:
     def update_patient_info(self, patient_id: str) -> bool:
         """Update patient information"""
         try:
-            patient = self.patients_collection.find_one({"patient_id": patient_id})
+            patient = self.get_patient(patient_id)
             if not patient:
                 print("❌ Patient not found!")
                 return False
@@ -454,6 +694,10 @@ class HospitalManagementSystem:
             
             if choice == '1':
                
+                new_name = input(f"Name ({patient['personal_info']['name']}): ").strip()
+                if new_name:
+                    update_data.update(search_key_update(new_name))
+                
                 new_phone = input(f"Phone ({patient['personal_info']['phone']}): ").strip()
                 if new_phone:
                     update_data["personal_info.phone"] = new_phone
@@ -470,23 +714,41 @@ class HospitalManagementSystem:
                     
             elif choice == '3':
              
-                new_room = input(f"Room ({patient['admission_info']['room_number']}): ").strip()
+                suggestion = self.assignment.suggest(patient['admission_info']['admission_type'])
+                room_hint = f", emptiest: {suggestion.room_number}" if suggestion.room_number else ""
+                new_room = input(f"Room ({patient['admission_info']['room_number']}{room_hint}): ").strip()
                 if new_room:
+                    free_beds = self.assignment.free_beds(new_room)
+                    if free_beds is None:
+                        print(f"⚠️ Room {new_room} is not in the room inventory; its capacity is unknown")
+                        print("💡 Add it with 'python assignment.py set-rooms'")
+                    elif free_beds <= 0:
+                        print(f"❌ Room {new_room} has no free bed")
+                        return False
                     update_data["admission_info.room_number"] = new_room
                 
-                new_doctor = input(f"Doctor ({patient['admission_info']['assigned_doctor']}): ").strip()
+                doctor_hint = f", least loaded: {suggestion.assigned_doctor}" if suggestion.assigned_doctor else ""
+                new_doctor = input(f"Doctor ({patient['admission_info']['assigned_doctor']}{doctor_hint}): ").strip()
                 if new_doctor:
                     update_data["admission_info.assigned_doctor"] = new_doctor
             
             if len(update_data) > 1: 
-                result = self.patients_collection.update_one(
-                    {"patient_id": patient_id},
-                    {"$set": update_data}
-                )
+                changed = [field for field in update_data if field not in ("updated_at", "search")]
+                if self.write_queue is not None:
+                    self.write_queue.update_fields(
+                        patient_id, update_data, expected=expected_values(patient, changed)
+                    ).add_done_callback(self._report_queued(patient_id, "update"))
+                    print("✅ Patient information update queued")
+                    return True
+                result = self.operations.update_fields(
+                    patient_id, update_data, expected=expected_values(patient, changed))
                 
-                if result.modified_count > 0:
+                if result.ok:
                     print("✅ Patient information updated successfully!")
                     return True
+                elif result.status == CONFLICT:
+                    print(f"❌ Update not applied: {result.message}. Please reload and try again.")
+                    return False
                 else:
                     print("❌ Failed to update patient information")
                     return False
@@ -498,12 +760,41 @@ class HospitalManagementSystem:
             print(f"❌ Error updating patient: {e}")
             return False
 
+def backend_from_env() -> StorageBackend:
+    """Pick the storage backend from HMS_BACKEND (mongo|embedded)"""
+    if os.environ.get("HMS_BACKEND", "mongo").lower() == "embedded":
+        return EmbeddedBackend(os.environ.get("HMS_DATA_FILE") or None)
+    options = {}
+    if os.environ.get("HMS_METRICS_PORT"):
+        options["event_listeners"] = [CommandMetrics(METRICS)]
+    return MongoBackend(os.environ.get("HMS_MONGO_URI", "mongodb://localhost:27017/"),
+                        os.environ.get("HMS_DB_NAME", "hospital_db"), **options)
+
+def cache_from_env() -> Optional[PatientCache]:
+    """Enable the patient cache when HMS_CACHE_SIZE is set"""
+    size = int(os.environ.get("HMS_CACHE_SIZE", "0") or 0)
+    if size <= 0:
+        return None
+    return PatientCache(size, float(os.environ.get("HMS_CACHE_TTL", DEFAULT_TTL)))
+
+def metrics_from_env():
+    """Apply HMS_SLOW_MS and start the metrics endpoint when HMS_METRICS_PORT is set"""
+    if os.environ.get("HMS_SLOW_MS"):
+        METRICS.slow_ms = float(os.environ["HMS_SLOW_MS"])
+    port = int(os.environ.get("HMS_METRICS_PORT", "0") or 0)
+    if port:
+        server = serve(port, os.environ.get("HMS_METRICS_HOST", "127.0.0.1"))
+        print(f"📈 Metrics on http://{server.server_address[0]}:{port}/metrics")
+        return server
+    return None
+
 def main():
     """Main function to run the Hospital Management System"""
     try:
 
         print("🏥 Initializing Hospital Management System...")
-        hms = HospitalManagementSystem()
+        metrics_from_env()
+        hms = HospitalManagementSystem(backend=backend_from_env(), cache=cache_from_env())
         
         while True:
             print("\n" + "="*60)
@@ -516,10 +807,12 @@ def main():
             print("5. Search Patients")
             print("6. Update Patient Information")
             print("7. View All Patients")
-            print("8. Exit")
+            print("8. Ward Census")
+            print("9. Record Payment")
+            print("10. Exit")
             print("="*60)
             
-            choice = input("Enter your choice (1-8): ").strip()
+            choice = input("Enter your choice (1-10): ").strip()
             
             if choice == '1':
                 hms.patient_onboarding()
@@ -541,22 +834,22 @@ def main():
                 hms.update_patient_info(patient_id)
             
             elif choice == '7':
-                patients = hms.get_all_patients()
-                if patients:
-                    print(f"\n📊 Total Patients: {len(patients)}")
-                    for patient in patients:
-                        status = "🟢" if patient['admission_info']['status'] == 'Active' else "🔴"
-                        print(f"{status} {patient['patient_id']} - {patient['personal_info']['name']} - {patient['admission_info']['status']}")
-                else:
-                    print("No patients found in database.")
+                status = input("Filter by status (Active/Discharged, Enter for all): ").strip()
+                hms.view_all_patients(status=status or None)
             
             elif choice == '8':
+                hms.ward_census()
+            
+            elif choice == '9':
+                hms.record_payment()
+            
+            elif choice == '10':
                 print("\n👋 Thank you for using Hospital Management System!")
                 print("Database connection closed successfully.")
                 break
             
             else:
-                print("❌ Invalid choice! Please select 1-8.")
+                print("❌ Invalid choice! Please select 1-10.")
             
             input("\nPress Enter to continue...")
     
@@ -568,7 +861,7 @@ def main():
  
         try:
             if 'hms' in locals():
-                hms.client.close()
+                hms.close()
         except:
             pass
 
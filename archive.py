@@ -0,0 +1,287 @@
+"""Archival tier for long-discharged patients.
+
+``Archiver.run`` moves patients discharged more than ``older_than_days``
+ago, together with their ``billing`` documents, out of the hot collections
+in keyset-ordered batches of ``batch_size``.  Each batch is copied to the
+archive tier, recorded in ``archive_index`` and only then deleted from the
+hot collections, so an interrupted run is simply resumed by running it
+again.  Each delete is pinned to the ``updated_at`` of the copy that was
+archived: a patient changed in between stays hot, loses its index entry
+and is archived again by a later run.  Only settled accounts (nothing outstanding) are archived unless
+``include_unsettled`` is set, which keeps receivables on the hot side.
+
+Two tiers are available:
+
+* ``CollectionArchive`` keeps the documents in ``archived_patients`` and
+  ``archived_billing``.
+* ``SegmentArchive`` appends each batch as one gzip member to NDJSON segment
+  files in a directory (``archive-000001.ndjson.gz`` ...), rotating at
+  ``segment_bytes``; the index stores the member's byte offset so a lookup
+  decompresses one batch, not the whole segment.
+
+``archive_index`` holds one small document per archived patient::
+
+    {"_id": "PATB221D700", "tier": "segment", "segment": "archive-000003.ndjson.gz",
+     "offset": 1048576, "archived_at": ...}
+
+    python archive.py run --older-than-days 180 --batch-size 500
+    python archive.py lookup PATB221D700
+    HMS_ARCHIVE_DIR=/var/lib/hms/archive python archive.py run
+"""
+import argparse
+import gzip
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bson import json_util
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+
+from metrics import timed
+
+DEFAULT_OLDER_THAN_DAYS = 180
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+SEGMENT_PREFIX = "archive-"
+SEGMENT_SUFFIX = ".ndjson.gz"
+
+_JSON_OPTIONS = json_util.JSONOptions(tz_aware=False)
+
+Changes = List[Tuple[Optional[Dict], Optional[Dict]]]
+
+
+class ArchiveReport:
+    """Outcome of one archival run"""
+
+    def __init__(self):
+        self.patients = 0
+        self.bills = 0
+        self.batches = 0
+        self.elapsed = 0.0
+
+    def summary(self) -> str:
+        return (f"{self.patients:,} patients and {self.bills:,} bills archived in "
+                f"{self.batches:,} batches ({self.elapsed:.2f}s)")
+
+
+class CollectionArchive:
+    """Archive tier backed by two archive collections"""
+
+    tier = "collection"
+
+    def __init__(self, patients_collection, billing_collection):
+        self.patients_collection = patients_collection
+        self.billing_collection = billing_collection
+
+    def write(self, patients: List[Dict], bills: List[Dict]) -> Dict[str, Dict]:
+        """Store one batch idempotently; returns the index fields per patient"""
+        self.patients_collection.bulk_write(
+            [ReplaceOne({"patient_id": p["patient_id"]}, p, upsert=True) for p in patients],
+            ordered=False)
+        if bills:
+            self.billing_collection.bulk_write(
+                [ReplaceOne({"_id": b["_id"]}, b, upsert=True) for b in bills], ordered=False)
+        return {p["patient_id"]: {} for p in patients}
+
+    def read(self, patient_id: str, location: Dict) -> Optional[Dict]:
+        patient = self.patients_collection.find_one({"patient_id": patient_id})
+        if patient is None:
+            return None
+        return {"patient": patient,
+                "bills": list(self.billing_collection.find({"patient_id": patient_id}))}
+
+
+class SegmentArchive:
+    """Archive tier backed by gzip NDJSON segment files"""
+
+    tier = "segment"
+
+    def __init__(self, directory: str, segment_bytes: int = DEFAULT_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _current_segment(self) -> str:
+        names = sorted(n for n in os.listdir(self.directory)
+                       if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX))
+        if names and os.path.getsize(os.path.join(self.directory, names[-1])) < self.segment_bytes:
+            return names[-1]
+        number = int(names[-1][len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) + 1 if names else 1
+        return f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}"
+
+    def write(self, patients: List[Dict], bills: List[Dict]) -> Dict[str, Dict]:
+        """Append the batch as one gzip member and fsync it before returning"""
+        by_patient: Dict[str, List[Dict]] = {}
+        for bill in bills:
+            by_patient.setdefault(bill["patient_id"], []).append(bill)
+        lines = "".join(json_util.dumps({"patient": p, "bills": by_patient.get(p["patient_id"], [])})
+                        + "\n" for p in patients)
+        member = gzip.compress(lines.encode("utf-8"))
+        with self._lock:
+            segment = self._current_segment()
+            path = os.path.join(self.directory, segment)
+            with open(path, "ab") as fh:
+                offset = fh.tell()
+                fh.write(member)
+                fh.flush()
+                os.fsync(fh.fileno())
+        return {p["patient_id"]: {"segment": segment, "offset": offset} for p in patients}
+
+    def read(self, patient_id: str, location: Dict) -> Optional[Dict]:
+        """Decompress only the gzip member holding the patient"""
+        with open(os.path.join(self.directory, location["segment"]), "rb") as fh:
+            fh.seek(location["offset"])
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            data = b""
+            while not decompressor.eof:
+                chunk = fh.read(64 * 1024)
+                if not chunk:
+                    break
+                data += decompressor.decompress(chunk)
+        marker = f'"patient_id": "{patient_id}"'
+        for line in data.decode("utf-8").splitlines():
+            if marker in line:
+                record = json_util.loads(line, json_options=_JSON_OPTIONS)
+                if record["patient"]["patient_id"] == patient_id:
+                    return record
+        return None
+
+
+class Archiver:
+    """Moves old discharged patients to an archive tier and looks them up there"""
+
+    def __init__(self, patients_collection, billing_collection, index_collection, tier,
+                 cache=None):
+        self.patients_collection = patients_collection
+        self.billing_collection = billing_collection
+        self.index_collection = index_collection
+        self.tier = tier
+        self.cache = cache
+        self._listeners: List[Callable[[Changes], None]] = []
+
+    def add_listener(self, listener: Callable[[Changes], None]) -> None:
+        """Call ``listener([(patient, None), ...])`` after each batch leaves the hot tier"""
+        self._listeners.append(listener)
+
+    def candidates_filter(self, cutoff: datetime, include_unsettled: bool = False) -> Dict:
+        query = {"admission_info.status": "Discharged",
+                 "admission_info.discharge_date": {"$lt": cutoff}}
+        if not include_unsettled:
+            query["billing_info.outstanding_amount"] = {"$lte": 0}
+        return query
+
+    @timed("archive_run")
+    def run(self, older_than_days: int = DEFAULT_OLDER_THAN_DAYS,
+            batch_size: int = DEFAULT_BATCH_SIZE, max_batches: Optional[int] = None,
+            pause: float = 0.0, include_unsettled: bool = False,
+            now: Optional[datetime] = None, progress=None) -> ArchiveReport:
+        """Archive in batches of ``batch_size``, sleeping ``pause`` seconds between them"""
+        now = now or datetime.now()
+        query = self.candidates_filter(now - timedelta(days=older_than_days), include_unsettled)
+        report = ArchiveReport()
+        started = time.perf_counter()
+        after = None
+        while max_batches is None or report.batches < max_batches:
+            page = dict(query)
+            if after is not None:
+                page["patient_id"] = {"$gt": after}
+            patients = list(self.patients_collection.find(page).sort("patient_id", 1)
+                            .limit(batch_size))
+            if not patients:
+                break
+            self._archive_batch(patients, query, now, report)
+            after = patients[-1]["patient_id"]
+            if progress:
+                progress(report)
+            if pause and len(patients) == batch_size:
+                time.sleep(pause)
+        report.elapsed = time.perf_counter() - started
+        return report
+
+    def _archive_batch(self, patients: List[Dict], query: Dict, now: datetime,
+                       report: ArchiveReport) -> None:
+        ids = [p["patient_id"] for p in patients]
+        bills = list(self.billing_collection.find({"patient_id": {"$in": ids}}))
+        locations = self.tier.write(patients, bills)
+        self.index_collection.bulk_write(
+            [UpdateOne({"_id": patient_id},
+                       {"$set": dict(location, tier=self.tier.tier, archived_at=now)},
+                       upsert=True)
+             for patient_id, location in locations.items()], ordered=False)
+        # Only delete the copies that were archived: a patient changed
+        # meanwhile stays, and is archived again (idempotently) next run
+        result = self.patients_collection.bulk_write(
+            [DeleteOne(dict(query, patient_id=p["patient_id"], updated_at=p.get("updated_at")))
+             for p in patients], ordered=False)
+        kept = set()
+        if result.deleted_count < len(patients):
+            kept = {p["patient_id"] for p in self.patients_collection.find(
+                {"patient_id": {"$in": ids}}, {"_id": 0, "patient_id": 1})}
+            if kept:
+                self.index_collection.bulk_write(
+                    [DeleteOne({"_id": patient_id}) for patient_id in kept], ordered=False)
+        removed = [p for p in patients if p["patient_id"] not in kept]
+        removed_ids = [p["patient_id"] for p in removed]
+        if removed_ids:
+            self.billing_collection.delete_many({"patient_id": {"$in": removed_ids}})
+        if self.cache is not None:
+            self.cache.invalidate_many(removed_ids)
+        for listener in self._listeners:
+            listener([(patient, None) for patient in removed])
+        report.patients += len(removed)
+        report.bills += sum(1 for bill in bills if bill["patient_id"] not in kept)
+        report.batches += 1
+
+    @timed("archive_lookup")
+    def lookup(self, patient_id: str) -> Optional[Dict]:
+        """``{"patient": ..., "bills": [...]}`` for an archived patient, else None"""
+        location = self.index_collection.find_one({"_id": patient_id})
+        if location is None:
+            return None
+        return self.tier.read(patient_id, location)
+
+    def is_archived(self, patient_id: str) -> bool:
+        return self.index_collection.find_one({"_id": patient_id}, {"_id": 1}) is not None
+
+
+def main():
+    from app import HospitalManagementSystem, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Archive long-discharged patients")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="move old discharged patients to the archive")
+    run.add_argument("--older-than-days", type=int, default=DEFAULT_OLDER_THAN_DAYS)
+    run.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    run.add_argument("--max-batches", type=int)
+    run.add_argument("--pause", type=float, default=0.0,
+                     help="seconds to sleep between batches")
+    run.add_argument("--include-unsettled", action="store_true",
+                     help="also archive patients with an outstanding balance")
+    lookup = sub.add_parser("lookup", help="print an archived patient")
+    lookup.add_argument("patient_id")
+    args = parser.parse_args()
+
+    hms = HospitalManagementSystem(backend=backend_from_env())
+    try:
+        if args.command == "run":
+            report = hms.archiver.run(
+                args.older_than_days, args.batch_size, args.max_batches, args.pause,
+                args.include_unsettled,
+                progress=lambda r: print(f"  {r.patients:,} archived", end="\r"))
+            print(f"✅ {report.summary()}")
+        else:
+            record = hms.archiver.lookup(args.patient_id)
+            if record is None:
+                print("❌ Patient is not in the archive")
+                return
+            print(json_util.dumps(record, indent=2))
+    finally:
+        hms.close()
+
+
+if __name__ == "__main__":
+    main()
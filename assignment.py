@@ -0,0 +1,444 @@
+"""Load-aware room and doctor assignment.
+
+``AssignmentEngine`` keeps, in memory, one heap of rooms per admission type
+ordered by free beds and one heap of doctors ordered by active caseload.
+Heaps use lazy invalidation: a change pushes a fresh entry and stale
+entries are discarded when they reach the top, so suggesting, reserving
+and recording a change are all O(log n).
+
+The structures are seeded on first use with one aggregation over active
+admissions and then follow every onboarding, discharge and room or doctor
+change as a ``PatientOperations`` listener.  ``reserve`` takes a bed and a
+doctor slot immediately, so a burst of admissions handled by several
+clerks never receives the same bed twice; the reservation is consumed by
+the matching onboarding or returned with ``release``.
+
+The room inventory is read from the ``rooms`` collection, one document per
+room::
+
+    {"_id": "500", "admission_type": "ICU", "beds": 1}
+
+A room a patient occupies that is not in the inventory has unknown
+capacity: it is logged once, never offered and never refused
+(``free_beds`` is None).  Writes made by other processes and inventory
+changes are picked up by ``refresh``, which runs on a background thread
+every ``refresh_interval`` seconds once the engine is seeded, so no request
+waits for the rebuild.
+
+    python assignment.py set-rooms ICU 500-539 --beds 1
+    python assignment.py load rooms.json
+    python assignment.py rooms
+    python assignment.py suggest ICU
+    python assignment.py show Regular
+"""
+import argparse
+import heapq
+import json
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from pymongo import UpdateOne
+
+DEFAULT_REFRESH_INTERVAL = 300.0
+
+logger = logging.getLogger(__name__)
+
+
+class Assignment(NamedTuple):
+    """A suggested (or reserved) bed and doctor; either may be None if none is free"""
+    admission_type: str
+    room_number: Optional[str]
+    assigned_doctor: Optional[str]
+    free_beds: int = 0
+    caseload: int = 0
+
+
+def load_rooms(rooms_collection) -> Dict[str, Dict[str, int]]:
+    """Rooms and bed counts per admission type from the ``rooms`` collection"""
+    rooms: Dict[str, Dict[str, int]] = {}
+    for doc in rooms_collection.find({}, {"admission_type": 1, "beds": 1}):
+        rooms.setdefault(doc["admission_type"], {})[doc["_id"]] = doc["beds"]
+    return rooms
+
+
+def validate_rooms(rooms: Dict) -> Dict[str, Dict[str, int]]:
+    """Normalized copy of an inventory; raises ValueError on the first bad entry"""
+    if not isinstance(rooms, dict):
+        raise ValueError("the inventory must map admission types to {room: beds}")
+    normalized: Dict[str, Dict[str, int]] = {}
+    seen: Dict[str, str] = {}
+    for admission_type, type_rooms in rooms.items():
+        if not admission_type or not isinstance(type_rooms, dict):
+            raise ValueError(f"admission type {admission_type!r} needs a {{room: beds}} map")
+        for room, beds in type_rooms.items():
+            room = str(room).strip()
+            if not room:
+                raise ValueError(f"empty room number under {admission_type}")
+            if isinstance(beds, bool) or not isinstance(beds, int) or beds < 1:
+                raise ValueError(f"room {room}: beds must be a whole number of at least 1")
+            if room in seen:
+                raise ValueError(f"room {room} is listed under both {seen[room]} "
+                                 f"and {admission_type}")
+            seen[room] = admission_type
+            normalized.setdefault(admission_type, {})[room] = beds
+    return normalized
+
+
+def save_rooms(rooms_collection, rooms: Dict[str, Dict[str, int]]) -> int:
+    """Add or update rooms in the inventory; returns how many were written"""
+    requests = [UpdateOne({"_id": room}, {"$set": {"admission_type": admission_type,
+                                                   "beds": beds}}, upsert=True)
+                for admission_type, type_rooms in validate_rooms(rooms).items()
+                for room, beds in type_rooms.items()]
+    if requests:
+        rooms_collection.bulk_write(requests, ordered=False)
+    return len(requests)
+
+
+def room_range(value: str) -> List[str]:
+    """``"500-539"`` as room numbers (anything else, such as ``"ICU-3"``, is one room)"""
+    first, sep, last = value.partition("-")
+    if not (sep and first.isdigit() and last.isdigit()):
+        return [value]
+    if int(first) > int(last):
+        raise ValueError(f"bad room range {value!r}, expected FIRST-LAST")
+    return [str(room) for room in range(int(first), int(last) + 1)]
+
+
+def _room_order(room: str) -> Tuple[int, str]:
+    return (int(room), room) if room.isdigit() else (1 << 30, room)
+
+
+def _placement(patient: Optional[Dict]) -> Optional[Tuple[str, str, str]]:
+    """(admission type, room, doctor) an active patient occupies"""
+    if not patient:
+        return None
+    admission = patient.get("admission_info") or {}
+    if admission.get("status") != "Active":
+        return None
+    return (admission.get("admission_type") or "", admission.get("room_number") or "",
+            admission.get("assigned_doctor") or "")
+
+
+class _LoadHeap:
+    """Min-heap of keys by a priority that changes, with lazy invalidation"""
+
+    def __init__(self):
+        self.priority: Dict[str, Tuple] = {}
+        self._heap: List[Tuple[Tuple, str]] = []
+
+    def set(self, key: str, priority: Tuple) -> None:
+        self.priority[key] = priority
+        heapq.heappush(self._heap, (priority, key))
+        if len(self._heap) > 4 * len(self.priority) + 64:
+            self._heap = [(p, k) for k, p in self.priority.items()]
+            heapq.heapify(self._heap)
+
+    def top(self) -> Optional[Tuple[Tuple, str]]:
+        heap = self._heap
+        while heap:
+            priority, key = heap[0]
+            if self.priority.get(key) == priority:
+                return priority, key
+            heapq.heappop(heap)
+        return None
+
+    def smallest(self, count: int) -> List[Tuple[Tuple, str]]:
+        return heapq.nsmallest(count, self.priority.items(), key=lambda item: item[1])
+
+
+class AssignmentEngine:
+    """Free beds per admission type and doctor caseloads, kept in heaps"""
+
+    def __init__(self, patients_collection, rooms: Optional[Dict[str, Dict[str, int]]] = None,
+                 rooms_collection=None, doctors: Iterable[str] = (), census=None,
+                 refresh_interval: Optional[float] = DEFAULT_REFRESH_INTERVAL):
+        self.patients_collection = patients_collection
+        self.rooms_collection = rooms_collection
+        self.census = census
+        self.refresh_interval = refresh_interval
+        self._configured_rooms = validate_rooms(rooms) if rooms is not None else None
+        self._configured_doctors = list(doctors)
+        self._lock = threading.RLock()
+        self._seeded = False
+        self._reserved: Counter = Counter()
+        self._unknown_rooms: set = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -- state -------------------------------------------------------------
+
+    def _inventory(self) -> Dict[str, Dict[str, int]]:
+        if self._configured_rooms is not None:
+            return self._configured_rooms
+        if self.rooms_collection is None:
+            return {}
+        return load_rooms(self.rooms_collection)
+
+    def _reset(self, inventory: Dict[str, Dict[str, int]]) -> None:
+        self._capacity: Dict[str, int] = {}
+        self._room_type: Dict[str, str] = {}
+        self._occupancy: Counter = Counter()
+        self._caseload: Counter = Counter()
+        self._rooms: Dict[str, _LoadHeap] = {}
+        self._doctors = _LoadHeap()
+        for admission_type, rooms in inventory.items():
+            for room, beds in rooms.items():
+                self._add_room(admission_type, room, beds)
+        for doctor in self._configured_doctors:
+            self._set_caseload(doctor, 0)
+
+    def _add_room(self, admission_type: str, room: str, beds: int) -> None:
+        self._capacity[room] = beds
+        self._room_type[room] = admission_type
+        self._set_occupancy(room, self._occupancy[room])
+
+    def _set_occupancy(self, room: str, occupied: int) -> None:
+        self._occupancy[room] = occupied
+        heap = self._rooms.setdefault(self._room_type[room], _LoadHeap())
+        heap.set(room, (occupied - self._capacity[room], _room_order(room)))
+
+    def _set_caseload(self, doctor: str, caseload: int) -> None:
+        self._caseload[doctor] = caseload
+        self._doctors.set(doctor, (caseload, doctor))
+
+    def _move(self, placement: Tuple[str, str, str], delta: int) -> None:
+        admission_type, room, doctor = placement
+        if room in self._capacity:
+            self._set_occupancy(room, self._occupancy[room] + delta)
+        elif room:
+            # Unknown capacity: counted, but never offered or refused
+            self._occupancy[room] += delta
+            if room not in self._unknown_rooms:
+                self._unknown_rooms.add(room)
+                logger.warning("Room %s (%s) is not in the room inventory; its capacity is "
+                               "unknown", room, admission_type or "no admission type")
+        if doctor:
+            self._set_caseload(doctor, self._caseload[doctor] + delta)
+
+    def refresh(self) -> None:
+        """Reseed from the inventory and active admissions (and doctors in the census)"""
+        inventory = self._inventory()
+        pipeline = [
+            {"$match": {"admission_info.status": "Active"}},
+            {"$group": {"_id": {"type": "$admission_info.admission_type",
+                                "room": "$admission_info.room_number",
+                                "doctor": "$admission_info.assigned_doctor"},
+                        "count": {"$sum": 1}}},
+        ]
+        groups = list(self.patients_collection.aggregate(pipeline))
+        known_doctors = self.census.counts("assigned_doctor", include_empty=True) \
+            if self.census is not None else {}
+        with self._lock:
+            self._reset(inventory)
+            for doctor in known_doctors:
+                self._set_caseload(doctor, 0)
+            for group in groups:
+                key = group["_id"]
+                placement = (key.get("type") or "", key.get("room") or "", key.get("doctor") or "")
+                self._move(placement, group["count"])
+            for placement, count in self._reserved.items():
+                self._move(placement, count)
+            self._seeded = True
+
+    def _ensure_seeded(self) -> None:
+        if not self._seeded:
+            with self._lock:
+                if not self._seeded:
+                    self.refresh()
+            self.start()
+
+    def start(self) -> None:
+        """Run ``refresh`` every ``refresh_interval`` seconds on a background thread"""
+        with self._lock:
+            if self._thread is not None or not self.refresh_interval or self._stop.is_set():
+                return
+            self._thread = threading.Thread(target=self._run, name="hms-assignment-refresh",
+                                            daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Rebuilding room and doctor assignment failed; retrying in "
+                                 "%.0fs", self.refresh_interval)
+
+    def close(self) -> None:
+        """Stop the background refresh"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def set_rooms(self, rooms: Dict[str, Dict[str, int]]) -> int:
+        """Add or update rooms in the ``rooms`` collection and use them at once"""
+        if self.rooms_collection is None:
+            raise ValueError("this engine has no rooms collection")
+        written = save_rooms(self.rooms_collection, rooms)
+        if self._seeded:
+            self.refresh()
+        return written
+
+    # -- listener ----------------------------------------------------------
+
+    def record(self, event: str, before: Optional[Dict], after: Optional[Dict]) -> None:
+        """``PatientOperations`` listener: move beds and caseloads with each write"""
+        old, new = _placement(before), _placement(after)
+        if old == new or not self._seeded:
+            return
+        with self._lock:
+            if old:
+                self._move(old, -1)
+            if new:
+                if self._reserved[new] > 0:
+                    # Already counted when it was reserved
+                    self._reserved[new] -= 1
+                else:
+                    self._move(new, 1)
+
+    def apply_changes(self, changes: Iterable[Tuple[Optional[Dict], Optional[Dict]]]) -> None:
+        """Batch listener (bulk imports): move beds and caseloads for many writes"""
+        for before, after in changes:
+            self.record("", before, after)
+
+    # -- queries -----------------------------------------------------------
+
+    def suggest(self, admission_type: str) -> Assignment:
+        """Room with the most free beds and the least loaded doctor, without taking them"""
+        self._ensure_seeded()
+        with self._lock:
+            return self._best(admission_type)
+
+    def _best(self, admission_type: str) -> Assignment:
+        room = free = None
+        heap = self._rooms.get(admission_type)
+        top = heap.top() if heap else None
+        if top is not None and top[0][0] < 0:
+            room, free = top[1], -top[0][0]
+        doctor_top = self._doctors.top()
+        doctor = doctor_top[1] if doctor_top else None
+        return Assignment(admission_type, room, doctor, free or 0,
+                          self._caseload[doctor] if doctor else 0)
+
+    def reserve(self, admission_type: str) -> Assignment:
+        """Take the best bed and doctor now; consumed by the matching onboarding"""
+        self._ensure_seeded()
+        with self._lock:
+            best = self._best(admission_type)
+            if best.room_number is not None or best.assigned_doctor is not None:
+                placement = (admission_type, best.room_number or "", best.assigned_doctor or "")
+                self._reserved[placement] += 1
+                self._move(placement, 1)
+            return best
+
+    def release(self, assignment: Assignment) -> None:
+        """Give back a reservation that was not used"""
+        placement = (assignment.admission_type, assignment.room_number or "",
+                     assignment.assigned_doctor or "")
+        with self._lock:
+            if self._reserved[placement] > 0:
+                self._reserved[placement] -= 1
+                self._move(placement, -1)
+
+    def free_beds(self, room_number: str) -> Optional[int]:
+        """Free beds in a room, or None for a room that is not in the inventory"""
+        self._ensure_seeded()
+        with self._lock:
+            if room_number not in self._capacity:
+                return None
+            return self._capacity[room_number] - self._occupancy[room_number]
+
+    def occupancy(self, room_number: str) -> int:
+        """Active patients in a room, whether or not it is in the inventory"""
+        self._ensure_seeded()
+        with self._lock:
+            return self._occupancy[room_number]
+
+    def room_type(self, room_number: str) -> Optional[str]:
+        self._ensure_seeded()
+        with self._lock:
+            return self._room_type.get(room_number)
+
+    def caseload(self, doctor: str) -> int:
+        self._ensure_seeded()
+        with self._lock:
+            return self._caseload[doctor]
+
+    def least_loaded_doctors(self, count: int = 5) -> List[Tuple[str, int]]:
+        self._ensure_seeded()
+        with self._lock:
+            return [(doctor, priority[0]) for doctor, priority in self._doctors.smallest(count)]
+
+    def emptiest_rooms(self, admission_type: str, count: int = 5) -> List[Tuple[str, int]]:
+        """Rooms of a type with the most free beds, as (room, free beds)"""
+        self._ensure_seeded()
+        with self._lock:
+            heap = self._rooms.get(admission_type)
+            if heap is None:
+                return []
+            return [(room, -priority[0]) for room, priority in heap.smallest(count)
+                    if priority[0] < 0]
+
+
+def main():
+    from app import HospitalManagementSystem, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Room and doctor assignment")
+    sub = parser.add_subparsers(dest="command", required=True)
+    suggest = sub.add_parser("suggest", help="best free bed and doctor for an admission")
+    suggest.add_argument("admission_type")
+    show = sub.add_parser("show", help="emptiest rooms and least loaded doctors")
+    show.add_argument("admission_type", nargs="?", default="Regular")
+    show.add_argument("--top", type=int, default=10)
+    set_rooms = sub.add_parser("set-rooms", help="add or update rooms in the inventory")
+    set_rooms.add_argument("admission_type")
+    set_rooms.add_argument("rooms", nargs="+", help="room numbers or FIRST-LAST ranges")
+    set_rooms.add_argument("--beds", type=int, required=True)
+    load = sub.add_parser("load", help='load a JSON inventory {"ICU": {"500": 1}, ...}')
+    load.add_argument("file")
+    sub.add_parser("rooms", help="print the room inventory")
+    args = parser.parse_args()
+
+    hms = HospitalManagementSystem(backend=backend_from_env())
+    try:
+        engine = hms.assignment
+        if args.command in ("set-rooms", "load"):
+            if args.command == "load":
+                with open(args.file, encoding="utf-8") as fh:
+                    rooms = json.load(fh)
+            else:
+                rooms = {args.admission_type: {room: args.beds for value in args.rooms
+                                               for room in room_range(value)}}
+            try:
+                written = engine.set_rooms(rooms)
+            except ValueError as e:
+                raise SystemExit(f"❌ {e}")
+            print(f"✅ Saved {written} room(s)")
+        elif args.command == "rooms":
+            for admission_type, rooms in sorted(load_rooms(hms.rooms_collection).items()):
+                beds = sum(rooms.values())
+                print(f"{admission_type}: {len(rooms)} rooms, {beds} beds")
+                for room in sorted(rooms, key=_room_order):
+                    print(f"  Room {room:<8} {rooms[room]} beds")
+        elif args.command == "suggest":
+            best = engine.suggest(args.admission_type)
+            room = f"room {best.room_number} ({best.free_beds} free)" if best.room_number \
+                else "no free bed"
+            print(f"🛏️ {args.admission_type}: {room}, 👨‍⚕️ {best.assigned_doctor} "
+                  f"({best.caseload} active)")
+        else:
+            print(f"{args.admission_type} rooms with free beds:")
+            for room, free in engine.emptiest_rooms(args.admission_type, args.top):
+                print(f"  Room {room:<8} {free} free")
+            print("Least loaded doctors:")
+            for doctor, caseload in engine.least_loaded_doctors(args.top):
+                print(f"  {doctor:<24} {caseload}")
+    finally:
+        hms.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""asyncio API for the Hospital Management System.
+
+``AsyncHospitalService`` exposes onboarding, discharge, billing, status
+lookup, search, listing and updates as coroutines that return data instead
+of printing.  The blocking storage calls run on a bounded thread pool that
+shares the backend's connection pool, and a semaphore caps the number of
+requests in flight so thousands of concurrent callers queue instead of
+exhausting connections.  With write-behind enabled on the
+``HospitalManagementSystem``, discharges, bills and updates go through its
+queue (the coroutine returns once the write is flushed) and status lookups
+include queued writes, like the terminal screens.
+
+    service = AsyncHospitalService(HospitalManagementSystem(...))
+    patient = await service.status("PATB221D700")
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from operations import INVALID, NOT_FOUND, UNAVAILABLE, OperationResult, new_patient_document
+
+DEFAULT_WORKERS = 64
+DEFAULT_MAX_IN_FLIGHT = 10000
+
+
+class AsyncHospitalService:
+    """Coroutine front-end over a ``HospitalManagementSystem``"""
+
+    def __init__(self, hms, max_workers: int = DEFAULT_WORKERS,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.hms = hms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="hms-async")
+        self._max_in_flight = max_in_flight
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def _run(self, fn: Callable, *args, **kwargs) -> Any:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_in_flight)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor,
+                                               functools.partial(fn, *args, **kwargs))
+
+    async def _write(self, name: str, *args) -> OperationResult:
+        """``PatientOperations`` write ``name``, through the write-behind queue if enabled"""
+        queue = self.hms.write_queue
+        if queue is None:
+            return await self._run(getattr(self.hms.operations, name), *args)
+        # Enqueueing can wait for room in the queue, so it runs off the loop too
+        future = await self._run(getattr(queue, name), *args)
+        return await asyncio.wrap_future(future)
+
+    async def onboard(self, personal_info: Dict, medical_info: Dict, admission_type: str,
+                      assigned_doctor: Optional[str] = None,
+                      room_number: Optional[str] = None) -> OperationResult:
+        """Admit a new patient; the result carries the stored document
+
+        A missing doctor or room is filled in from the assignment engine
+        (least loaded doctor, room with the most free beds).  Admission types
+        without rates in the current tariff are refused with ``INVALID``, and
+        ``UNAVAILABLE`` means no bed or doctor is free right now.
+        """
+        return await self._run(self._onboard, personal_info, medical_info, admission_type,
+                               assigned_doctor, room_number)
+
+    def _onboard(self, personal_info: Dict, medical_info: Dict, admission_type: str,
+                 assigned_doctor: Optional[str], room_number: Optional[str]) -> OperationResult:
+        # Allocating an ID may reserve a new block, so it runs off the event loop too
+        if admission_type not in self.hms.tariffs.current().admission_types:
+            return OperationResult(INVALID, None,
+                                   f"No rates for admission type '{admission_type}'")
+        reservation = None
+        if not assigned_doctor or not room_number:
+            reservation = self.hms.assignment.reserve(admission_type)
+            assigned_doctor = assigned_doctor or reservation.assigned_doctor
+            room_number = room_number or reservation.room_number
+            if not assigned_doctor or not room_number:
+                self.hms.assignment.release(reservation)
+                return OperationResult(UNAVAILABLE, None,
+                                       f"No free {admission_type} bed or doctor available")
+        patient_data = new_patient_document(self.hms.generate_patient_id(), personal_info,
+                                            medical_info, admission_type, assigned_doctor,
+                                            room_number)
+        result = self.hms.operations.onboard(patient_data)
+        if reservation is not None and (not result.ok or (
+                room_number, assigned_doctor) != (reservation.room_number,
+                                                  reservation.assigned_doctor)):
+            self.hms.assignment.release(reservation)
+        return result
+
+    async def discharge(self, patient_id: str, notes: str = "") -> OperationResult:
+        return await self._write("discharge", patient_id, notes)
+
+    async def bill(self, patient_id: str, lab_charges: float = 0.0,
+                   procedure_charges: float = 0.0,
+                   pharmacy_charges: float = 0.0) -> Optional[Dict]:
+        """Compute and store a bill; returns it, or None if the patient does not exist"""
+        bill = await self._run(self._build_bill, patient_id, lab_charges, procedure_charges,
+                               pharmacy_charges)
+        if bill is None:
+            return None
+        result = await self._write("save_bill", bill)
+        if result.ok:
+            await self._run(self.hms.billing_engine.mark_billed, bill["applied_charges"])
+        return bill if result.status != NOT_FOUND else None
+
+    def _build_bill(self, patient_id: str, lab: float, procedure: float,
+                    pharmacy: float) -> Optional[Dict]:
+        patient = self.hms.get_patient(patient_id)
+        if patient is None:
+            return None
+        return self.hms.billing_engine.prepare_bill(patient, lab, procedure, pharmacy,
+                                                    tariff=self.hms.tariffs.current())
+
+    async def status(self, patient_id: str) -> Optional[Dict]:
+        """Full patient document, or None"""
+        return await self._run(self.hms.get_patient, patient_id)
+
+    async def search(self, term: str, limit: int = 20) -> List[Dict]:
+        return await self._run(self.hms.search_engine.search, term, limit)
+
+    async def list_patients(self, after: Optional[str] = None, limit: int = 50,
+                            **filters) -> Tuple[List[Dict], Optional[str]]:
+        return await self._run(self.hms.listing.page, after, limit, None, **filters)
+
+    async def update(self, patient_id: str, changes: Dict,
+                     expected: Optional[Dict] = None) -> OperationResult:
+        return await self._write("update_fields", patient_id, changes, expected)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self) -> "AsyncHospitalService":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
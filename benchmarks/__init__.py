@@ -0,0 +1 @@
+"""Benchmarks for the Hospital Management System (run with ``python -m benchmarks.<name>``)"""
@@ -0,0 +1,109 @@
+"""Compare the MongoDB and embedded storage backends.
+
+Each operation replays the exact storage calls ``HospitalManagementSystem``
+issues for onboarding, status lookup, search and billing, so the numbers
+reflect the backend rather than the console prompts.
+
+    python -m benchmarks.bench_backends --patients 20000
+    python -m benchmarks.bench_backends --mongo-uri mongodb://localhost:27017/
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+from datetime import datetime
+
+from app import HospitalManagementSystem
+from benchmarks.common import make_patient, print_table, time_calls
+from storage import EmbeddedBackend, MongoBackend
+
+
+def run_backend(label: str, hms: HospitalManagementSystem, patients: int, lookups: int,
+                seed: int) -> list:
+    rng = random.Random(seed)
+    patients_coll = hms.patients_collection
+    billing_coll = hms.billing_collection
+    patients_coll.delete_many({})
+    billing_coll.delete_many({})
+
+    docs = [make_patient(i, rng) for i in range(patients)]
+    ids = [doc["patient_id"] for doc in docs]
+
+    def onboard(i):
+        patients_coll.insert_one(docs[i])
+
+    def lookup(i):
+        patients_coll.find_one({"patient_id": ids[rng.randrange(patients)]})
+
+    def search(i):
+        term = ids[rng.randrange(patients)][-5:]
+        list(patients_coll.find({"$or": [
+            {"patient_id": {"$regex": term, "$options": "i"}},
+            {"personal_info.name": {"$regex": term, "$options": "i"}},
+        ]}))
+
+    def bill(i):
+        patient_id = ids[rng.randrange(patients)]
+        patient = patients_coll.find_one({"patient_id": patient_id})
+        total = 3000.0 * (i % 7 + 1)
+        bill_doc = {"patient_id": patient_id, "patient_name": patient["personal_info"]["name"],
+                    "total_amount": total, "generated_date": datetime.now(), "status": "Generated"}
+        if billing_coll.find_one({"patient_id": patient_id}):
+            billing_coll.update_one({"patient_id": patient_id}, {"$set": bill_doc})
+        else:
+            billing_coll.insert_one(bill_doc)
+        patients_coll.update_one({"patient_id": patient_id}, {"$set": {
+            "billing_info.total_amount": total,
+            "billing_info.outstanding_amount": total,
+            "updated_at": datetime.now()}})
+
+    rows = []
+    for name, fn, count in (("onboarding", onboard, patients), ("lookup", lookup, lookups),
+                            ("search", search, max(1, lookups // 20)), ("billing", bill, lookups)):
+        stats = time_calls(fn, count)
+        rows.append({"backend": label, "operation": name, **stats})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-uri", help="also benchmark this MongoDB deployment")
+    parser.add_argument("--mongo-db", default="hospital_bench")
+    parser.add_argument("--journal", action="store_true",
+                        help="run the embedded backend with an append-only file")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    rows = []
+    journal_dir = tempfile.mkdtemp() if args.journal else None
+    path = os.path.join(journal_dir, "hospital.journal") if journal_dir else None
+    hms = HospitalManagementSystem(backend=EmbeddedBackend(path))
+    rows += run_backend("embedded" + ("+journal" if path else ""), hms, args.patients,
+                        args.lookups, args.seed)
+    hms.close()
+
+    if args.mongo_uri:
+        backend = MongoBackend(args.mongo_uri, args.mongo_db, serverSelectionTimeoutMS=2000)
+        try:
+            hms = HospitalManagementSystem(args.mongo_uri, args.mongo_db, backend=backend)
+        except Exception:
+            print("⚠️  MongoDB not reachable, skipping")
+        else:
+            rows += run_backend("mongodb", hms, args.patients, args.lookups, args.seed)
+            hms.patients_collection.drop()
+            hms.billing_collection.drop()
+            hms.close()
+
+    print()
+    print_table(rows, ["backend", "operation", "ops", "mean_us", "p50_us", "p99_us", "ops_per_sec"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(rows, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
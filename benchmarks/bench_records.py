@@ -0,0 +1,90 @@
+"""Memory and group-by speed: nested dicts vs slotted records vs columns.
+
+    python -m benchmarks.bench_records --patients 500000
+"""
+import argparse
+import json
+import pickle
+import time
+import tracemalloc
+from collections import defaultdict
+
+from benchmarks.common import print_table
+from datagen import PatientGenerator
+from records import COLUMNS_PROJECTION, PatientColumns, PatientRecord
+from storage import apply_projection
+
+
+def measure(build):
+    """Build once untraced for timing, then again under tracemalloc for size"""
+    started = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, size, elapsed
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def dict_group_by(docs):
+    totals = defaultdict(float)
+    for doc in docs:
+        admission = doc["admission_info"]
+        if admission["status"] == "Active":
+            totals[admission["admission_type"]] += doc["billing_info"]["outstanding_amount"]
+    return totals
+
+
+def record_group_by(records):
+    totals = defaultdict(float)
+    for record in records:
+        if record.status == "Active":
+            totals[record.admission_type] += record.outstanding_amount
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    generated = [apply_projection(doc, COLUMNS_PROJECTION)
+                 for doc in PatientGenerator(seed=args.seed).patients(args.patients)]
+    payload = pickle.dumps(generated)
+    del generated
+
+    docs, dict_bytes, _ = measure(lambda: pickle.loads(payload))
+    records, record_bytes, record_build = measure(
+        lambda: [PatientRecord.from_document(doc) for doc in docs])
+    columns, column_bytes, column_build = measure(lambda: PatientColumns.from_documents(docs))
+
+    _, dict_ms = timed(lambda: dict_group_by(docs))
+    _, record_ms = timed(lambda: record_group_by(records))
+    _, column_ms = timed(lambda: columns.sum_by("admission_type", "outstanding_amount",
+                                                status="Active"))
+    rows = [
+        {"representation": "nested dicts", "mb": dict_bytes / 1e6, "build_ms": 0.0,
+         "group_by_ms": dict_ms},
+        {"representation": "PatientRecord", "mb": record_bytes / 1e6,
+         "build_ms": record_build * 1000, "group_by_ms": record_ms},
+        {"representation": "PatientColumns", "mb": column_bytes / 1e6,
+         "build_ms": column_build * 1000, "group_by_ms": column_ms},
+    ]
+    print(f"{args.patients:,} patients (report fields only)")
+    print_table(rows, ["representation", "mb", "build_ms", "group_by_ms"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(rows, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Search latency as the patients collection grows.
+
+Compares the indexed search (``PatientSearch``) with the legacy unanchored,
+case-insensitive ``$regex`` scan at each collection size.  The legacy scan is
+skipped above ``--legacy-max`` patients because it grows linearly.
+
+    python -m benchmarks.bench_search --sizes 10000,100000,1000000
+"""
+import argparse
+import json
+import random
+
+from benchmarks.common import make_patient, print_table, time_calls
+from search import PatientSearch, ensure_search_keys
+from storage import EmbeddedBackend, MongoBackend
+
+
+def legacy_search(collection, term):
+    return list(collection.find({"$or": [
+        {"patient_id": {"$regex": term, "$options": "i"}},
+        {"personal_info.name": {"$regex": term, "$options": "i"}},
+    ]}))
+
+
+def run(label, collection, sizes, queries, legacy_max, seed):
+    rng = random.Random(seed)
+    collection.delete_many({})
+    collection.create_index("patient_id", unique=True)
+    engine = PatientSearch(collection)
+    engine.ensure_indexes()
+    rows = []
+    loaded = 0
+    for size in sizes:
+        batch = [ensure_search_keys(make_patient(i, rng)) for i in range(loaded, size)]
+        for start in range(0, len(batch), 10000):
+            collection.insert_many(batch[start:start + 10000], ordered=False)
+        loaded = size
+        names = [d["personal_info"]["name"] for d in batch[:1000]] or ["Aby Pal"]
+        terms = [rng.choice(names).split()[rng.randrange(2)][:4] for _ in range(queries)]
+        ids = [f"PAT{rng.randrange(size):08X}" for _ in range(queries)]
+
+        cases = [("name prefix", lambda i: engine.search(terms[i])),
+                 ("exact id", lambda i: engine.search(ids[i]))]
+        if size <= legacy_max:
+            cases.append(("legacy regex", lambda i: legacy_search(collection, terms[i])))
+        for name, fn in cases:
+            count = queries if name != "legacy regex" else max(1, queries // 10)
+            rows.append({"backend": label, "patients": size, "query": name,
+                         **time_calls(fn, count)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,50000,200000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--legacy-max", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--mongo-uri", help="also benchmark this MongoDB deployment")
+    parser.add_argument("--mongo-db", default="hospital_bench")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+
+    rows = run("embedded", EmbeddedBackend().collection("patients"), sizes, args.queries,
+               args.legacy_max, args.seed)
+    if args.mongo_uri:
+        backend = MongoBackend(args.mongo_uri, args.mongo_db, serverSelectionTimeoutMS=2000)
+        try:
+            backend.ping()
+        except Exception:
+            print("⚠️  MongoDB not reachable, skipping")
+        else:
+            collection = backend.collection("patients_search_bench")
+            rows += run("mongodb", collection, sizes, args.queries, args.legacy_max, args.seed)
+            collection.drop()
+        backend.close()
+
+    print_table(rows, ["backend", "patients", "query", "ops", "mean_us", "p50_us", "p99_us"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(rows, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Start-up cost of the application, measured in fresh interpreters.
+
+Each run starts a new ``python`` process that imports ``app``, builds
+``HospitalManagementSystem`` and performs one patient lookup, and reports
+how long each step took.  Runs are repeated for eager and lazy start-up,
+with and without a stored schema version, and the medians are printed.
+
+    python -m benchmarks.bench_startup --runs 15
+    python -m benchmarks.bench_startup --mongo-uri mongodb://localhost:27017/
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import print_table
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+from app import HospitalManagementSystem, backend_from_env
+imported = time.perf_counter()
+hms = HospitalManagementSystem(backend=backend_from_env(), lazy={lazy})
+built = time.perf_counter()
+hms.operations.get_patient("PAT00000001")
+looked_up = time.perf_counter()
+hms.close()
+print(json.dumps({{"import_ms": (imported - started) * 1000,
+                   "construct_ms": (built - imported) * 1000,
+                   "first_lookup_ms": (looked_up - built) * 1000}}))
+"""
+
+
+def run_child(env: dict, lazy: bool) -> dict:
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", CHILD.format(lazy=lazy)], env=env,
+                               capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def forget_schema(env: dict) -> None:
+    """Drop the stored schema version so the next start verifies indexes again"""
+    code = ("from app import HospitalManagementSystem, backend_from_env\n"
+            "hms = HospitalManagementSystem(backend=backend_from_env())\n"
+            "hms.meta_collection.delete_many({})\n"
+            "hms.close()")
+    subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--patients", type=int, default=10000,
+                        help="patients in the embedded journal")
+    parser.add_argument("--mongo-uri", help="measure against this MongoDB deployment")
+    parser.add_argument("--mongo-db", default="hospital_startup")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [
+        os.getcwd(), os.environ.get("PYTHONPATH")])))
+    env.pop("HMS_METRICS_PORT", None)
+    if args.mongo_uri:
+        env.update(HMS_BACKEND="mongo", HMS_MONGO_URI=args.mongo_uri, HMS_DB_NAME=args.mongo_db)
+    else:
+        from datagen import load
+        from storage import EmbeddedBackend
+
+        journal = os.path.join(tempfile.mkdtemp(), "startup.journal")
+        backend = EmbeddedBackend(journal)
+        load(backend.collection("patients"), backend.collection("billing"), args.patients)
+        backend.close()
+        env.update(HMS_BACKEND="embedded", HMS_DATA_FILE=journal)
+
+    rows = []
+    for label, lazy, cold in (("eager, verify indexes", False, True),
+                              ("eager, schema cached", False, False),
+                              ("lazy, verify indexes", True, True),
+                              ("lazy, schema cached", True, False)):
+        samples = []
+        for _ in range(args.runs):
+            if cold:
+                forget_schema(env)
+            samples.append(run_child(env, lazy))
+        row = {"startup": label}
+        for key in ("import_ms", "construct_ms", "first_lookup_ms", "process_ms"):
+            row[key] = statistics.median(sample[key] for sample in samples)
+        rows.append(row)
+    print_table(rows, ["startup", "import_ms", "construct_ms", "first_lookup_ms", "process_ms"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(rows, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
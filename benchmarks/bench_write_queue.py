@@ -0,0 +1,105 @@
+"""Shift-change write burst: synchronous writes against the write-behind queue.
+
+``--nurses`` threads each make ``--writes`` field updates on patients of a
+ward of ``--ward`` active patients, first through ``PatientOperations``
+(one acknowledged write each) and then through ``WriteBehindQueue``.  The
+table shows the latency each nurse saw per write, the time until every
+write was in the database, and how many database writes that took.
+
+    python -m benchmarks.bench_write_queue --nurses 200 --writes 20 --rtt-ms 1
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from app import HospitalManagementSystem
+from benchmarks.common import make_patient, print_table
+from benchmarks.loadtest import LatencyBackend, percentile
+from search import ensure_search_keys
+from write_queue import WriteBehindQueue, WriteJournal
+
+
+def burst(update, ward, nurses: int, writes: int, seed: int):
+    """Run the burst through ``update(patient_id, changes)``; returns latencies and seconds"""
+    latencies = []
+    lock = threading.Lock()
+
+    def nurse(n):
+        rng = random.Random(seed + n)
+        mine = []
+        for i in range(writes):
+            patient_id = rng.choice(ward)
+            started = time.perf_counter()
+            update(patient_id, {"medical_info.symptoms": f"round {i} by nurse {n}"})
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=nurse, args=(n,)) for n in range(nurses)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nurses", type=int, default=100)
+    parser.add_argument("--writes", type=int, default=20, help="writes per nurse")
+    parser.add_argument("--ward", type=int, default=300, help="patients being updated")
+    parser.add_argument("--rtt-ms", type=float, default=1.0,
+                        help="artificial round trip per database call (embedded only)")
+    parser.add_argument("--journal", action="store_true", help="journal queued writes to disk")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    backend = LatencyBackend(args.rtt_ms / 1000)
+    patients = []
+    for i in range(args.ward):
+        patient = make_patient(i, rng)
+        patient["admission_info"]["status"] = "Active"
+        patients.append(ensure_search_keys(patient))
+    backend.collection("patients").insert_many(patients)
+    hms = HospitalManagementSystem(backend=backend)
+    ward = [p["patient_id"] for p in patients]
+    total = args.nurses * args.writes
+
+    rows = []
+    latencies, elapsed = burst(lambda pid, changes: hms.operations.update_fields(pid, changes),
+                               ward, args.nurses, args.writes, args.seed)
+    rows.append({"mode": "synchronous", "writes": total, "db_writes": total,
+                 "p50_ms": percentile(latencies, 0.5) * 1000,
+                 "p99_ms": percentile(latencies, 0.99) * 1000,
+                 "all_written_s": elapsed, "writes_per_sec": total / elapsed})
+
+    journal = WriteJournal(os.path.join(tempfile.mkdtemp(), "writes.ndjson")) \
+        if args.journal else None
+    queue = WriteBehindQueue(hms.operations, journal=journal)
+    started = time.perf_counter()
+    latencies, _ = burst(queue.update_fields, ward, args.nurses, args.writes, args.seed)
+    queue.close()
+    elapsed = time.perf_counter() - started
+    rows.append({"mode": "write-behind" + (" + journal" if journal else ""), "writes": total,
+                 "db_writes": queue.bulk_writes,
+                 "p50_ms": percentile(latencies, 0.5) * 1000,
+                 "p99_ms": percentile(latencies, 0.99) * 1000,
+                 "all_written_s": elapsed, "writes_per_sec": total / elapsed})
+    hms.close()
+
+    print_table(rows, ["mode", "writes", "db_writes", "p50_ms", "p99_ms", "all_written_s",
+                       "writes_per_sec"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(rows, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
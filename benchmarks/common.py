@@ -0,0 +1,81 @@
+"""Helpers shared by the benchmark scripts"""
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+FIRST_NAMES = ["Aby", "Sanchez", "Maria", "Ravi", "Chen", "Fatima", "John", "Priya",
+               "Lucas", "Amara", "Kenji", "Olga", "Diego", "Noor", "Sven", "Leila"]
+LAST_NAMES = ["Pal", "Garcia", "Sharma", "Wang", "Khan", "Smith", "Iyer", "Silva",
+              "Okafor", "Tanaka", "Petrova", "Lopez", "Haddad", "Berg", "Mehta", "Jones"]
+DOCTORS = ["Dr. House", "Dr. Grey", "Dr. Strange", "Dr. Watson", "Dr. Quinn", "Dr. Who"]
+ADMISSION_TYPES = ["Emergency", "Regular", "ICU"]
+
+
+def make_patient(index: int, rng: random.Random) -> Dict:
+    """Build a patient document shaped like the ones patient_onboarding writes"""
+    admitted = datetime(2025, 1, 1) + timedelta(minutes=rng.randrange(0, 60 * 24 * 365))
+    status = "Active" if rng.random() < 0.3 else "Discharged"
+    admission_info = {
+        "admission_date": admitted,
+        "admission_type": rng.choice(ADMISSION_TYPES),
+        "assigned_doctor": rng.choice(DOCTORS),
+        "room_number": str(rng.randrange(1, 400)),
+        "status": status,
+    }
+    if status == "Discharged":
+        admission_info["discharge_date"] = admitted + timedelta(days=rng.randrange(1, 20))
+        admission_info["discharge_notes"] = "rest and follow up"
+    return {
+        "patient_id": f"PAT{index:08X}",
+        "personal_info": {
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "age": rng.randrange(1, 95),
+            "gender": rng.choice(["M", "F", "Other"]),
+            "phone": f"{rng.randrange(10**9, 10**10)}",
+            "address": f"{rng.randrange(1, 200)}, downtown",
+            "emergency_contact": f"{rng.randrange(10**9, 10**10)}",
+        },
+        "medical_info": {
+            "disease": "fever",
+            "symptoms": "headache",
+            "allergies": "none",
+            "medical_history": "none",
+        },
+        "admission_info": admission_info,
+        "billing_info": {"total_amount": 0.0, "paid_amount": 0.0, "outstanding_amount": 0.0},
+        "created_at": admitted,
+        "updated_at": admitted,
+    }
+
+
+def time_calls(fn: Callable[[int], object], count: int) -> Dict[str, float]:
+    """Call ``fn(i)`` ``count`` times and summarise the latencies in microseconds"""
+    samples: List[float] = []
+    for i in range(count):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        "ops": count,
+        "mean_us": statistics.fmean(samples) if samples else 0.0,
+        "p50_us": samples[len(samples) // 2] if samples else 0.0,
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))] if samples else 0.0,
+        "ops_per_sec": count / (sum(samples) / 1e6) if samples else 0.0,
+    }
+
+
+def print_table(rows: List[Dict], columns: List[str]) -> None:
+    widths = {c: max(len(c), *(len(_fmt(r.get(c))) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    print("  ".join("-" * widths[c] for c in columns))
+    for row in rows:
+        print("  ".join(_fmt(row.get(c)).ljust(widths[c]) for c in columns))
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float):
+        return f"{value:,.1f}"
+    return str(value)
@@ -0,0 +1,155 @@
+"""Load test for the asyncio API.
+
+Runs ``--concurrency`` client coroutines that issue ``--requests`` calls in a
+realistic front-desk mix against a local stand-in database (the embedded
+backend, optionally with an artificial per-call round-trip delay) or a real
+MongoDB deployment, then reports requests per second and latency
+percentiles.
+
+    python -m benchmarks.loadtest --concurrency 2000 --requests 20000 --rtt-ms 1
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from app import HospitalManagementSystem
+from async_api import AsyncHospitalService
+from benchmarks.common import make_patient, print_table
+from search import ensure_search_keys
+from storage import EmbeddedBackend, MongoBackend
+
+OPERATION_MIX = [("status", 50), ("search", 15), ("list", 10), ("update", 10),
+                 ("bill", 5), ("onboard", 5), ("discharge", 5)]
+
+
+class LatencyCollection:
+    """Collection proxy that sleeps before each call, imitating a network round trip"""
+
+    def __init__(self, collection, delay: float):
+        self._collection = collection
+        self._delay = delay
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            time.sleep(self._delay)
+            return attr(*args, **kwargs)
+        return call
+
+
+class LatencyBackend(EmbeddedBackend):
+    def __init__(self, delay: float):
+        super().__init__()
+        self._delay = delay
+
+    def collection(self, name):
+        coll = super().collection(name)
+        return LatencyCollection(coll, self._delay) if self._delay else coll
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def run_load(service, ids, requests, concurrency, seed):
+    rng = random.Random(seed)
+    names, weights = zip(*OPERATION_MIX)
+    plan = rng.choices(names, weights, k=requests)
+    latencies = {name: [] for name in names}
+    next_index = 0
+
+    async def one(op):
+        patient_id = rng.choice(ids)
+        if op == "status":
+            await service.status(patient_id)
+        elif op == "search":
+            await service.search(patient_id[:7] if rng.random() < 0.5 else "aby")
+        elif op == "list":
+            await service.list_patients(limit=50, status="Active")
+        elif op == "update":
+            await service.update(patient_id, {"medical_info.symptoms": "checked"})
+        elif op == "bill":
+            await service.bill(patient_id, lab_charges=250.0)
+        elif op == "onboard":
+            await service.onboard({"name": "Load Test", "age": 30, "gender": "Other",
+                                   "phone": "0", "address": "-", "emergency_contact": "0"},
+                                  {"disease": "-", "symptoms": "-", "allergies": "-",
+                                   "medical_history": "-"}, "Regular", "Dr. House", "1")
+        else:
+            await service.discharge(patient_id, "load test")
+
+    async def client():
+        nonlocal next_index
+        while next_index < len(plan):
+            op = plan[next_index]
+            next_index += 1
+            start = time.perf_counter()
+            await one(op)
+            latencies[op].append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--rtt-ms", type=float, default=0.0,
+                        help="artificial round-trip delay per storage call (embedded only)")
+    parser.add_argument("--mongo-uri", help="run against this MongoDB deployment instead")
+    parser.add_argument("--mongo-db", default="hospital_loadtest")
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        backend = MongoBackend(args.mongo_uri, args.mongo_db, maxPoolSize=args.workers)
+    else:
+        backend = LatencyBackend(args.rtt_ms / 1000.0)
+    hms = HospitalManagementSystem(backend=backend)
+    rng = random.Random(args.seed)
+    hms.patients_collection.delete_many({})
+    docs = [ensure_search_keys(make_patient(i, rng)) for i in range(args.patients)]
+    for start in range(0, len(docs), 10000):
+        hms.patients_collection.insert_many(docs[start:start + 10000], ordered=False)
+    ids = [doc["patient_id"] for doc in docs]
+
+    service = AsyncHospitalService(hms, max_workers=args.workers)
+    latencies, elapsed = asyncio.run(
+        run_load(service, ids, args.requests, args.concurrency, args.seed))
+    service.close()
+
+    rows = []
+    everything = sorted(v for samples in latencies.values() for v in samples)
+    for op, samples in list(latencies.items()) + [("all", everything)]:
+        samples = sorted(samples)
+        rows.append({"operation": op, "requests": len(samples),
+                     "p50_ms": percentile(samples, 0.50), "p99_ms": percentile(samples, 0.99),
+                     "max_ms": samples[-1] if samples else 0.0})
+    print(f"\n{len(everything):,} requests, concurrency {args.concurrency}, "
+          f"{args.workers} workers: {len(everything) / elapsed:,.0f} requests/s")
+    print_table(rows, ["operation", "requests", "p50_ms", "p99_ms", "max_ms"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"rps": len(everything) / elapsed, "elapsed": elapsed, "rows": rows},
+                      fh, indent=2)
+    if args.mongo_uri:
+        hms.patients_collection.drop()
+        hms.billing_collection.drop()
+    hms.close()
+
+
+if __name__ == "__main__":
+    main()
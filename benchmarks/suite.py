@@ -0,0 +1,199 @@
+"""Benchmark every HospitalManagementSystem operation at several data scales.
+
+Each scale gets a fresh database filled by ``datagen``; the suite then
+times lookups, onboarding, discharge, billing, updates, search, listing,
+the census and the legacy full-list load, and writes one JSON document per
+run so results can be diffed across commits.  ``--compare`` prints the p50
+change against an earlier results file and flags regressions.
+
+    python -m benchmarks.suite --scales 10k,1m --json results.json
+    python -m benchmarks.suite --scales 10k --compare results.json
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from benchmarks.common import print_table, time_calls
+from billing import build_bill
+from datagen import PatientGenerator, load, scale_count
+from operations import new_patient_document
+from storage import EmbeddedBackend, MongoBackend
+
+FULL_LOAD_MAX = 1_000_000
+BILLING_RUN_MAX = 1_000_000
+COLLECTIONS = ("patients", "billing", "charges", "census", "payments", "receivables",
+               "daily_rollups", "patient_history", "meta")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def bench_scale(hms, count: int, generator: PatientGenerator, iterations: int,
+                rng: random.Random) -> List[Dict]:
+    """Time each operation against a database holding ``count`` generated patients"""
+    ids = [f"PAT{rng.randrange(count):08X}" for _ in range(iterations)]
+    sample = list(generator.patients(min(count, 2000)))
+    names = [p["personal_info"]["name"] for p in sample]
+    active, _ = hms.listing.page(limit=iterations * 2, projection={"_id": 0, "patient_id": 1},
+                                 status="Active")
+    active_ids = [p["patient_id"] for p in active]
+    rng.shuffle(active_ids)
+    to_discharge = active_ids[:iterations // 2]
+    to_update = active_ids[iterations // 2:] or ids
+    new_ids = [f"PAT{count + i:08X}" for i in range(iterations)]
+    onboard_template = sample[0]
+    hms.analytics.update(now=generator.now)
+    year_ago = generator.now - timedelta(days=365)
+
+    def onboard(i):
+        hms.operations.onboard(new_patient_document(
+            new_ids[i], dict(onboard_template["personal_info"]),
+            dict(onboard_template["medical_info"]), "Regular", "Dr. Pal", "101"))
+
+    def fee_calculator(i):
+        patient = hms.operations.get_patient(ids[i])
+        hms.operations.save_bill(build_bill(patient, 350.0, 0.0, 200.0))
+
+    def pay(i):
+        hms.ledger.record_payment(ids[i], 100.0, "card")
+
+    def discharge(i):
+        hms.operations.discharge(to_discharge[i % len(to_discharge)] if to_discharge else ids[i],
+                                 "benchmark")
+
+    def update(i):
+        hms.operations.update_fields(to_update[i % len(to_update)],
+                                     {"admission_info.room_number": str(100 + i % 300)})
+
+    def deep_page(i):
+        hms.listing.page(after=ids[i], limit=50)
+
+    cases = [
+        ("patient status", lambda i: hms.operations.get_patient(ids[i])),
+        ("onboard", onboard),
+        ("fee calculator", fee_calculator),
+        ("record payment", pay),
+        ("discharge", discharge),
+        ("update room", update),
+        ("search exact id", lambda i: hms.search_engine.search(ids[i])),
+        ("search id prefix", lambda i: hms.search_engine.search(ids[i][:7])),
+        ("search name prefix", lambda i: hms.search_engine.search(names[i % len(names)][:4])),
+        ("search full name", lambda i: hms.search_engine.search(names[i % len(names)])),
+        ("list first page", lambda i: hms.listing.page(limit=50)),
+        ("list keyset page", deep_page),
+        ("list active page", lambda i: hms.listing.page(limit=50, status="Active")),
+        ("count patients", lambda i: hms.listing.count()),
+        ("ward census", lambda i: hms.census.snapshot()),
+        ("receivables", lambda i: hms.ledger.receivables()),
+        ("analytics year by type", lambda i: hms.analytics.summary("admission_type", year_ago)),
+    ]
+    rows = []
+    for name, fn in cases:
+        rows.append({"operation": name, **time_calls(fn, iterations)})
+    if count <= FULL_LOAD_MAX:
+        rows.append({"operation": "get all patients", **time_calls(
+            lambda i: hms.get_all_patients(), 1 if count > 100_000 else 3)})
+    if count <= BILLING_RUN_MAX:
+        started = time.perf_counter()
+        report = hms.run_billing()
+        elapsed = time.perf_counter() - started
+        rows.append({"operation": "batch billing run", "ops": 1, "mean_us": elapsed * 1e6,
+                     "p50_us": elapsed * 1e6, "p99_us": elapsed * 1e6,
+                     "ops_per_sec": report.patients / elapsed if elapsed else 0.0})
+    return rows
+
+
+def compare(previous: Dict, current: Dict, threshold: float) -> int:
+    """Print the p50 change per (scale, operation); returns the number of regressions"""
+    before = {(r["scale"], r["operation"]): r for r in previous.get("results", [])}
+    rows = []
+    regressions = 0
+    for row in current["results"]:
+        old = before.get((row["scale"], row["operation"]))
+        if old is None or not old["p50_us"]:
+            continue
+        ratio = row["p50_us"] / old["p50_us"]
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        regressions += bool(flag)
+        rows.append({"scale": row["scale"], "operation": row["operation"],
+                     "old_p50_us": old["p50_us"], "new_p50_us": row["p50_us"],
+                     "change": f"{(ratio - 1) * 100:+.0f}%", "flag": flag})
+    if rows:
+        print_table(rows, ["scale", "operation", "old_p50_us", "new_p50_us", "change", "flag"])
+    return regressions
+
+
+def main():
+    from app import HospitalManagementSystem
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="10k", help="comma-separated: 10k,1m,10m or counts")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-uri", help="benchmark this MongoDB deployment instead")
+    parser.add_argument("--mongo-db", default="hospital_suite")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="p50 slowdown that counts as a regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    generator = PatientGenerator(seed=args.seed)
+    results = []
+    for scale in args.scales.split(","):
+        count = scale_count(scale)
+        if args.mongo_uri:
+            backend = MongoBackend(args.mongo_uri, args.mongo_db)
+            for name in COLLECTIONS:
+                backend.collection(name).drop()
+        else:
+            backend = EmbeddedBackend()
+        load_seconds = load(backend.collection("patients"), backend.collection("billing"),
+                            count, generator, payments_collection=backend.collection("payments"))
+        hms = HospitalManagementSystem(backend=backend)
+        rows = [{"operation": "load", "ops": count, "mean_us": load_seconds * 1e6 / count,
+                 "p50_us": load_seconds * 1e6 / count, "p99_us": load_seconds * 1e6 / count,
+                 "ops_per_sec": count / load_seconds}]
+        rows += bench_scale(hms, count, generator, args.iterations, random.Random(args.seed))
+        for row in rows:
+            row.update(scale=scale, patients=count)
+        print(f"\n{count:,} patients ({backend.describe()})")
+        print_table(rows, ["operation", "ops", "mean_us", "p50_us", "p99_us", "ops_per_sec"])
+        results.extend(rows)
+        if args.mongo_uri:
+            for name in COLLECTIONS:
+                backend.collection(name).drop()
+        hms.close()
+
+    document = {
+        "meta": {"started": datetime.now().isoformat(timespec="seconds"),
+                 "commit": _git_commit(), "python": platform.python_version(),
+                 "platform": platform.platform(), "seed": args.seed,
+                 "iterations": args.iterations,
+                 "backend": "mongo" if args.mongo_uri else "embedded"},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(document, fh, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fh:
+            regressions = compare(json.load(fh), document, args.threshold)
+        if regressions:
+            print(f"❌ {regressions} operation(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""Stay charges and the non-interactive nightly billing run.
+
+``BatchBillingEngine`` streams every ``Active`` admission with a projection
+and computes a page's room, doctor and medicine charges column by column
+(``Tariff.charge_columns``) from the current ``tariffs.Tariff``, fetched once
+per run so rates add no reads, then folds in pending itemized charges from
+the ``charges`` collection.  The results are written back with one
+``bulk_write`` per collection per page.  Each patient's outstanding balance
+is recomputed by the server from the new total and what has already been
+paid, and when a ``PaymentLedger`` is given the receivables move by the
+page's change in one more bulk write.  Admissions whose type has no rates in
+the tariff are skipped and counted.
+
+Bills are written first, with status ``Posting`` and the IDs of the charges
+they fold in, and become ``Generated`` once the patients' totals are
+written.  A patient discharged after its page was read is not billed: its
+previous bill and its charges are put back.  A run that stops in between
+leaves a record: the next run first finishes the ``Posting`` bills, does
+not fold in a charge twice, and recomputes the receivables from the
+posted totals, since the stop may have come before or after the ledger
+followed.
+
+Interactive bills (``prepare_bill``) add the amounts the clerk enters to the
+itemized charges already on the patient's bill and to the pending ones.
+
+    python billing.py run
+    python billing.py add-charge PATB221D700 lab 750 "CBC panel"
+"""
+import argparse
+import copy
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo import DeleteOne, ReplaceOne, UpdateMany, UpdateOne
+
+from listing import PatientListing
+from metrics import timed
+from operations import bill_total_update
+from storage import apply_update
+from tariffs import DEFAULT_TARIFF, Tariff
+
+logger = logging.getLogger(__name__)
+
+# Status of a bill written by a billing run whose patient total is not written yet
+POSTING = "Posting"
+
+CHARGE_CATEGORIES = ("lab", "procedure", "pharmacy")
+ITEMIZED_FIELDS = tuple(f"{category}_charges" for category in CHARGE_CATEGORIES)
+
+BILLING_PROJECTION = {
+    "_id": 0,
+    "patient_id": 1,
+    "personal_info.name": 1,
+    "admission_info.admission_type": 1,
+    "admission_info.admission_date": 1,
+    "billing_info": 1,
+}
+
+
+def days_admitted(admission_date: datetime, now: datetime) -> int:
+    return (now - admission_date).days + 1
+
+
+def base_charges(admission_type: str, admission_date: datetime, now: datetime,
+                 tariff: Optional[Tariff] = None) -> Dict:
+    """Room, doctor and medicine charges for a stay up to ``now``
+
+    Raises ValueError if ``tariff`` (the built-in one by default) has no
+    rates for ``admission_type``.
+    """
+    days = days_admitted(admission_date, now)
+    charges = (tariff or DEFAULT_TARIFF).charges(admission_type, admission_date, days)
+    return dict(charges, days_admitted=days)
+
+
+def build_bill(patient: Dict, lab_charges: float = 0.0, procedure_charges: float = 0.0,
+               pharmacy_charges: float = 0.0, now: Optional[datetime] = None,
+               tariff: Optional[Tariff] = None) -> Dict:
+    """Bill document for one patient, in the shape stored in the billing collection"""
+    now = now or datetime.now()
+    tariff = tariff or DEFAULT_TARIFF
+    admission = patient['admission_info']
+    base = base_charges(admission['admission_type'], admission['admission_date'], now, tariff)
+    charges = {
+        "room_charges": base["room_charges"],
+        "doctor_charges": base["doctor_charges"],
+        "medicine_charges": base["medicine_charges"],
+        "lab_charges": lab_charges,
+        "procedure_charges": procedure_charges,
+        "pharmacy_charges": pharmacy_charges
+    }
+    return {
+        "patient_id": patient['patient_id'],
+        "patient_name": patient['personal_info']['name'],
+        "admission_date": admission['admission_date'].strftime('%Y-%m-%d'),
+        "days_admitted": base["days_admitted"],
+        "admission_type": admission['admission_type'],
+        "charges": charges,
+        "total_amount": sum(charges.values()),
+        "tariff_version": tariff.version,
+        "generated_date": now,
+        "status": "Generated"
+    }
+
+
+class BillingRunReport:
+    """Outcome of one batch billing run"""
+
+    def __init__(self):
+        self.patients = 0
+        self.charges_applied = 0
+        self.total_billed = 0.0
+        self.pages = 0
+        self.elapsed = 0.0
+        self.skipped = 0
+        self.recovered = 0
+        self.tariff_version = None
+
+    def summary(self) -> str:
+        rate = self.patients / self.elapsed if self.elapsed else 0.0
+        skipped = f", {self.skipped:,} skipped (no rates for their admission type)" \
+            if self.skipped else ""
+        if self.recovered:
+            skipped += f", {self.recovered:,} bills of an interrupted run posted"
+        return (f"{self.patients:,} patients billed (₹{self.total_billed:,.2f}) "
+                f"at tariff version {self.tariff_version}{skipped}, "
+                f"{self.charges_applied:,} itemized charges applied in {self.elapsed:.2f}s "
+                f"({rate:,.0f} patients/s)")
+
+
+class BatchBillingEngine:
+    """Bills every active admission without prompting"""
+
+    def __init__(self, patients_collection, billing_collection, charges_collection,
+                 ledger=None, tariffs=None):
+        self.patients_collection = patients_collection
+        self.billing_collection = billing_collection
+        self.charges_collection = charges_collection
+        self.ledger = ledger
+        self.tariffs = tariffs
+        self.listing = PatientListing(patients_collection)
+        self._listeners: List[Callable[[List[Tuple[Dict, Dict]]], None]] = []
+        if ledger is not None:
+            self.add_listener(ledger.apply_changes)
+
+    def add_listener(self, listener: Callable[[List[Tuple[Dict, Dict]]], None]) -> None:
+        """Call ``listener([(before, after), ...])`` for each billed page (projected patients)"""
+        self._listeners.append(listener)
+
+    def add_charge(self, patient_id: str, category: str, amount: float,
+                   description: str = "") -> None:
+        """Queue an itemized charge for the next billing run"""
+        if category not in CHARGE_CATEGORIES:
+            raise ValueError(f"Unknown charge category '{category}', expected one of "
+                             f"{', '.join(CHARGE_CATEGORIES)}")
+        self.charges_collection.insert_one({
+            "patient_id": patient_id,
+            "category": category,
+            "amount": float(amount),
+            "description": description,
+            "status": "Pending",
+            "created_at": datetime.now()
+        })
+
+    def prepare_bill(self, patient: Dict, lab_charges: float = 0.0,
+                     procedure_charges: float = 0.0, pharmacy_charges: float = 0.0,
+                     now: Optional[datetime] = None, tariff: Optional[Tariff] = None) -> Dict:
+        """Bill for one patient billed at the desk, with its pending itemized charges
+
+        The amounts entered are added to the itemized charges already on the
+        patient's bill and to the pending ones, whose IDs the bill lists in
+        ``applied_charges``; pass them to ``mark_billed`` once it is saved.
+        """
+        patient_id = patient["patient_id"]
+        previous = self._current_bills([patient_id])
+        new, new_ids = self._pending_charges([patient_id], previous).get(patient_id, ({}, []))
+        already = previous.get(patient_id, {}).get("charges", {})
+        entered = dict(zip(ITEMIZED_FIELDS, (lab_charges, procedure_charges, pharmacy_charges)))
+        bill = build_bill(patient, *(already.get(field, 0.0) + new.get(field, 0.0)
+                                     + entered[field] for field in ITEMIZED_FIELDS),
+                          now=now, tariff=tariff)
+        bill["applied_charges"] = new_ids
+        return bill
+
+    def mark_billed(self, charge_ids: List, now: Optional[datetime] = None) -> None:
+        """Mark charges folded into a saved bill as Billed"""
+        if charge_ids:
+            self.charges_collection.bulk_write([UpdateMany(
+                {"_id": {"$in": charge_ids}},
+                {"$set": {"status": "Billed", "billed_at": now or datetime.now()}})])
+
+    @timed("billing_run")
+    def run(self, now: Optional[datetime] = None, page_size: int = 5000) -> BillingRunReport:
+        """Bill all active admissions as of ``now``"""
+        now = now or datetime.now()
+        report = BillingRunReport()
+        # One tariff for the whole run, even if a new version is published meanwhile
+        tariff = self.tariffs.current() if self.tariffs is not None else DEFAULT_TARIFF
+        report.tariff_version = tariff.version
+        started = time.perf_counter()
+        report.recovered = self.finish_posting(now)
+        for page in self.listing.iter_pages(page_size, BILLING_PROJECTION, status="Active"):
+            self._bill_page(page, now, tariff, report)
+            report.pages += 1
+        report.elapsed = time.perf_counter() - started
+        return report
+
+    def _bill_page(self, page: List[Dict], now: datetime, tariff: Tariff,
+                   report: BillingRunReport) -> None:
+        ids = [p["patient_id"] for p in page]
+        types = [p["admission_info"].get("admission_type") for p in page]
+        dates = [p["admission_info"]["admission_date"] for p in page]
+        days = [days_admitted(date, now) for date in dates]
+        room, doctor, medicine = tariff.charge_columns(types, dates, days)
+
+        previous = self._current_bills(ids)
+        pending = self._pending_charges(ids, previous)
+        empty: Tuple[Dict, List] = ({}, [])
+        itemized = {field: [previous.get(pid, {}).get("charges", {}).get(field, 0.0)
+                            + pending.get(pid, empty)[0].get(field, 0.0) for pid in ids]
+                    for field in ITEMIZED_FIELDS}
+        columns = dict(room_charges=room, doctor_charges=doctor, medicine_charges=medicine,
+                       **itemized)
+
+        bill_ops, totals, billed, skipped = [], {}, [], []
+        for i, patient_id in enumerate(ids):
+            if room[i] is None:
+                skipped.append(patient_id)
+                continue
+            charges = {field: column[i] for field, column in columns.items()}
+            total = totals[patient_id] = sum(charges.values())
+            bill_ops.append(UpdateOne({"patient_id": patient_id}, {"$set": {
+                "patient_id": patient_id,
+                "patient_name": page[i]["personal_info"]["name"],
+                "admission_date": dates[i].strftime('%Y-%m-%d'),
+                "days_admitted": days[i],
+                "admission_type": types[i],
+                "charges": charges,
+                "total_amount": total,
+                "tariff_version": tariff.version,
+                "generated_date": now,
+                # The charges this bill includes but that may still read Pending
+                "applied_charges": pending.get(patient_id, empty)[1],
+                "status": POSTING
+            }}, upsert=True))
+            billed.append(page[i])
+        if skipped:
+            logger.warning("Not billing %d patients whose admission type has no rates in "
+                           "tariff version %s: %s", len(skipped), tariff.version,
+                           ", ".join(skipped[:10]) + (" ..." if len(skipped) > 10 else ""))
+            report.skipped += len(skipped)
+        if not billed:
+            return
+
+        # Bills are written first, as Posting, with the charges they fold in.
+        # Until the patients' totals and the listeners have followed, the bills
+        # stay Posting, and the next run finishes them (finish_posting).
+        self.billing_collection.bulk_write(bill_ops, ordered=False)
+        self.mark_billed([cid for p in billed
+                          for cid in pending.get(p["patient_id"], empty)[1]], now)
+        posted = {p["patient_id"] for p in self._post(
+            billed, totals, now, {"admission_info.status": "Active"})}
+        withdrawn = [p["patient_id"] for p in billed if p["patient_id"] not in posted]
+        if withdrawn:
+            self._withdraw(withdrawn, previous, pending)
+        report.patients += len(posted)
+        report.total_billed += sum(totals[pid] for pid in posted)
+        report.charges_applied += sum(len(pending.get(pid, empty)[1]) for pid in posted)
+
+    def _post(self, patients: List[Dict], totals: Dict[str, float], now: datetime,
+              condition: Dict) -> List[Dict]:
+        """Mirror bill totals on the patients, tell the listeners and mark the bills posted
+
+        Only patients whose total was written (``condition`` may leave some
+        out) are passed to the listeners and have their bill marked; they
+        are returned.
+        """
+        patient_ops = [UpdateOne(dict(condition, patient_id=p["patient_id"]),
+                                 bill_total_update(totals[p["patient_id"]], now, now))
+                       for p in patients]
+        result = self.patients_collection.bulk_write(patient_ops, ordered=False)
+        if result.matched_count < len(patient_ops):
+            stored = {doc["patient_id"]: doc.get("billing_info", {}).get("total_amount")
+                      for doc in self.patients_collection.find(
+                          {"patient_id": {"$in": [p["patient_id"] for p in patients]}},
+                          {"_id": 0, "patient_id": 1, "billing_info.total_amount": 1})}
+            patients = [p for p in patients
+                        if stored.get(p["patient_id"]) == totals[p["patient_id"]]]
+        if not patients:
+            return []
+        if self._listeners:
+            changes = []
+            for patient in patients:
+                after = copy.deepcopy(patient)
+                apply_update(after, bill_total_update(totals[patient["patient_id"]], now, now))
+                changes.append((patient, after))
+            for listener in self._listeners:
+                listener(changes)
+        self.billing_collection.bulk_write([UpdateMany(
+            {"patient_id": {"$in": [p["patient_id"] for p in patients]}, "status": POSTING},
+            {"$set": {"status": "Generated"}})])
+        return patients
+
+    def _withdraw(self, patient_ids: List[str], previous: Dict[str, Dict],
+                  pending: Dict[str, Tuple[Dict[str, float], List]]) -> None:
+        """Put back the bills and charges of patients that left ``Active`` mid-run"""
+        logger.warning("Not billing %d patients discharged during the billing run: %s",
+                       len(patient_ids), ", ".join(patient_ids[:10])
+                       + (" ..." if len(patient_ids) > 10 else ""))
+        self.billing_collection.bulk_write(
+            [ReplaceOne({"patient_id": pid}, previous[pid]) if pid in previous
+             else DeleteOne({"patient_id": pid}) for pid in patient_ids], ordered=False)
+        charge_ids = [cid for pid in patient_ids for cid in pending.get(pid, ({}, []))[1]]
+        if charge_ids:
+            self.charges_collection.bulk_write([UpdateMany(
+                {"_id": {"$in": charge_ids}},
+                {"$set": {"status": "Pending"}, "$unset": {"billed_at": ""}})])
+
+    def finish_posting(self, now: Optional[datetime] = None) -> int:
+        """Post bills an interrupted run wrote but did not mirror on the patients
+
+        Patient totals are set from the bills, so a patient whose total was
+        already written is not changed twice.  The run may have stopped
+        before or after the listeners saw the new totals, so the ledger is
+        then rebuilt from the posted totals.  Returns the bills finished.
+        """
+        now = now or datetime.now()
+        bills = {bill["patient_id"]: bill["total_amount"] for bill in self.billing_collection.find(
+            {"status": POSTING}, {"_id": 0, "patient_id": 1, "total_amount": 1})}
+        if not bills:
+            return 0
+        logger.warning("Finishing %d bills left Posting by an interrupted billing run",
+                       len(bills))
+        patients = list(self.patients_collection.find(
+            {"patient_id": {"$in": list(bills)}}, BILLING_PROJECTION))
+        if patients:
+            self._post(patients, bills, now, {})
+        missing = set(bills) - {p["patient_id"] for p in patients}
+        if missing:
+            self.billing_collection.bulk_write([UpdateMany(
+                {"patient_id": {"$in": list(missing)}, "status": POSTING},
+                {"$set": {"status": "Generated"}})])
+        if self.ledger is not None:
+            self.ledger.rebuild()
+        return len(bills)
+
+    def _current_bills(self, ids: List[str]) -> Dict[str, Dict]:
+        """The patients' current bills, whose itemized charges a new bill carries over
+
+        ``applied_charges`` on each holds the IDs of the charges the bill
+        folded in last.
+        """
+        return {bill["patient_id"]: bill
+                for bill in self.billing_collection.find({"patient_id": {"$in": ids}})}
+
+    def _pending_charges(self, ids: List[str], bills: Dict[str, Dict]
+                         ) -> Dict[str, Tuple[Dict[str, float], List]]:
+        """Pending charges per patient: (sums not yet on the bill, every pending ID)
+
+        A charge the current bill already lists was folded in by a run that
+        stopped before marking it Billed; it is not added again.
+        """
+        pending: Dict[str, Tuple[Dict[str, float], List]] = {}
+        cursor = self.charges_collection.find(
+            {"patient_id": {"$in": ids}, "status": "Pending"},
+            {"patient_id": 1, "category": 1, "amount": 1})
+        for charge in cursor:
+            sums, charge_ids = pending.setdefault(charge["patient_id"], ({}, []))
+            charge_ids.append(charge["_id"])
+            if charge["_id"] in (bills.get(charge["patient_id"], {}).get("applied_charges") or ()):
+                continue
+            field = f"{charge['category']}_charges"
+            sums[field] = sums.get(field, 0.0) + charge["amount"]
+        return pending
+
+
+def main():
+    from app import HospitalManagementSystem, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Batch billing for active admissions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="bill every active admission")
+    run.add_argument("--page-size", type=int, default=5000)
+    charge = sub.add_parser("add-charge", help="queue an itemized charge")
+    charge.add_argument("patient_id")
+    charge.add_argument("category", choices=CHARGE_CATEGORIES)
+    charge.add_argument("amount", type=float)
+    charge.add_argument("description", nargs="?", default="")
+    args = parser.parse_args()
+
+    hms = HospitalManagementSystem(backend=backend_from_env())
+    try:
+        if args.command == "run":
+            report = hms.run_billing(page_size=args.page_size)
+            print(f"✅ Billing run finished: {report.summary()}")
+        else:
+            hms.billing_engine.add_charge(args.patient_id, args.category, args.amount,
+                                          args.description)
+            print(f"✅ {args.category.title()} charge of ₹{args.amount:,.2f} queued for {args.patient_id}")
+    finally:
+        hms.close()
+
+
+if __name__ == "__main__":
+    main()
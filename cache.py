@@ -0,0 +1,99 @@
+"""In-process read-through cache for patient documents.
+
+Entries are keyed by ``patient_id``, bounded in number (least recently used
+entries are evicted first) and expire ``ttl`` seconds after they were
+stored.  Every write path refreshes or drops the entry it touches.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+DEFAULT_MAX_SIZE = 1024
+DEFAULT_TTL = 30.0
+
+
+class PatientCache:
+    """Bounded LRU cache with per-entry TTL and hit/miss counters"""
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, ttl: float = DEFAULT_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, patient_id: str) -> Optional[Dict]:
+        """Return a copy of the cached document, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, doc = entry
+            if expires_at <= self._clock():
+                del self._entries[patient_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(patient_id)
+            self.hits += 1
+        return copy.deepcopy(doc)
+
+    def put(self, patient_id: str, doc: Optional[Dict]) -> None:
+        """Store (a copy of) ``doc``; ``None`` drops the entry"""
+        if doc is None:
+            self.invalidate(patient_id)
+            return
+        entry = (self._clock() + self.ttl, copy.deepcopy(doc))
+        with self._lock:
+            self._entries[patient_id] = entry
+            self._entries.move_to_end(patient_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, patient_id: str) -> None:
+        with self._lock:
+            self._entries.pop(patient_id, None)
+
+    def invalidate_many(self, patient_ids: Iterable[str]) -> None:
+        with self._lock:
+            for patient_id in patient_ids:
+                self._entries.pop(patient_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_load(self, patient_id: str, loader: Callable[[str], Optional[Dict]]) -> Optional[Dict]:
+        """Read-through lookup: serve from cache or load and remember"""
+        doc = self.get(patient_id)
+        if doc is None:
+            doc = loader(patient_id)
+            if doc is not None:
+                self.put(patient_id, doc)
+        return doc
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,187 @@
+"""Ward census: incrementally maintained patient counters.
+
+Each counter is one small document in the ``census`` collection::
+
+    {"_id": "room_number:204", "dimension": "room_number", "key": "204", "count": 2}
+
+Counters per ``status`` cover every patient; counters per ``admission_type``,
+``room_number`` and ``assigned_doctor`` cover active admissions only, so they
+read directly as occupancy and caseload.  ``WardCensus.record`` is registered
+as a ``PatientOperations`` listener and turns each onboarding, discharge or
+room/doctor change into ``$inc`` upserts, so a dashboard reads a handful of
+counter documents instead of scanning the patients collection.
+``rebuild`` recounts everything with one aggregation per dimension and
+repairs any drift (after bulk imports or writes made outside the app).
+
+    python census.py show room_number
+    python census.py rebuild --check
+"""
+import argparse
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from metrics import timed
+
+DIMENSIONS = {
+    "status": "admission_info.status",
+    "admission_type": "admission_info.admission_type",
+    "room_number": "admission_info.room_number",
+    "assigned_doctor": "admission_info.assigned_doctor",
+}
+ACTIVE_ONLY = ("admission_type", "room_number", "assigned_doctor")
+
+
+def counter_id(dimension: str, key: str) -> str:
+    return f"{dimension}:{key}"
+
+
+def census_keys(patient: Optional[Dict]) -> List[Tuple[str, str]]:
+    """The (dimension, key) counters a patient document contributes to"""
+    if not patient:
+        return []
+    admission = patient.get("admission_info") or {}
+    status = admission.get("status")
+    keys = []
+    for dimension, path in DIMENSIONS.items():
+        if dimension in ACTIVE_ONLY and status != "Active":
+            continue
+        value = admission.get(path.split(".", 1)[1])
+        if value not in (None, ""):
+            keys.append((dimension, str(value)))
+    return keys
+
+
+class WardCensus:
+    """O(1) counters per admission type, room, doctor and status"""
+
+    def __init__(self, census_collection, patients_collection):
+        self.census_collection = census_collection
+        self.patients_collection = patients_collection
+
+    @timed("census_record")
+    def record(self, event: str, before: Optional[Dict], after: Optional[Dict]) -> None:
+        """``PatientOperations`` listener: apply the counter delta of one write"""
+        self.apply_changes([(before, after)])
+
+    def apply_changes(self, changes: Iterable[Tuple[Optional[Dict], Optional[Dict]]]) -> None:
+        """Apply the counter delta of many (before, after) patient pairs at once"""
+        delta: Counter = Counter()
+        for before, after in changes:
+            delta.update(census_keys(after))
+            delta.subtract(census_keys(before))
+        self.apply(delta)
+
+    def apply(self, delta: Dict[Tuple[str, str], int]) -> None:
+        """Add ``delta`` to the counters in one bulk write"""
+        now = datetime.now()
+        ops = [UpdateOne({"_id": counter_id(dimension, key)},
+                         {"$inc": {"count": amount},
+                          "$set": {"updated_at": now},
+                          "$setOnInsert": {"dimension": dimension, "key": key}},
+                         upsert=True)
+               for (dimension, key), amount in delta.items() if amount]
+        if ops:
+            self.census_collection.bulk_write(ops, ordered=False)
+
+    def get(self, dimension: str, key: str) -> int:
+        """Current value of one counter"""
+        counter = self.census_collection.find_one({"_id": counter_id(dimension, key)},
+                                                  {"count": 1})
+        return counter["count"] if counter else 0
+
+    def counts(self, dimension: str, include_empty: bool = False) -> Dict[str, int]:
+        """All counters of one dimension, e.g. occupancy per room"""
+        counts = {}
+        for counter in self.census_collection.find({"dimension": dimension},
+                                                   {"_id": 0, "key": 1, "count": 1}):
+            if counter["count"] or include_empty:
+                counts[counter["key"]] = counter["count"]
+        return counts
+
+    @timed("census_snapshot")
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """Every non-zero counter, grouped by dimension"""
+        snapshot: Dict[str, Dict[str, int]] = {dimension: {} for dimension in DIMENSIONS}
+        for counter in self.census_collection.find({}, {"_id": 0, "dimension": 1, "key": 1,
+                                                        "count": 1}):
+            if counter["count"] and counter["dimension"] in snapshot:
+                snapshot[counter["dimension"]][counter["key"]] = counter["count"]
+        return snapshot
+
+    def recount(self) -> Dict[Tuple[str, str], int]:
+        """Authoritative counts straight from the patients collection"""
+        counts: Dict[Tuple[str, str], int] = {}
+        for dimension, path in DIMENSIONS.items():
+            pipeline = [{"$group": {"_id": f"${path}", "count": {"$sum": 1}}}]
+            if dimension in ACTIVE_ONLY:
+                pipeline.insert(0, {"$match": {"admission_info.status": "Active"}})
+            for group in self.patients_collection.aggregate(pipeline):
+                if group["_id"] not in (None, ""):
+                    counts[(dimension, str(group["_id"]))] = group["count"]
+        return counts
+
+    def drift(self) -> Dict[Tuple[str, str], Tuple[int, int]]:
+        """Counters that disagree with a recount, as ``(stored, actual)`` pairs"""
+        actual = self.recount()
+        stored = {(c["dimension"], c["key"]): c["count"]
+                  for c in self.census_collection.find({}, {"dimension": 1, "key": 1,
+                                                            "count": 1})}
+        return {key: (stored.get(key, 0), actual.get(key, 0))
+                for key in set(stored) | set(actual)
+                if stored.get(key, 0) != actual.get(key, 0)}
+
+    @timed("census_rebuild")
+    def rebuild(self) -> Dict[Tuple[str, str], Tuple[int, int]]:
+        """Recount and correct drifted counters; returns what was corrected
+
+        Corrections are set as absolute values, so run this while writes are
+        quiet (e.g. right after an import) to avoid overwriting a concurrent
+        increment.
+        """
+        drifted = self.drift()
+        now = datetime.now()
+        ops = [UpdateOne({"_id": counter_id(dimension, key)},
+                         {"$set": {"dimension": dimension, "key": key, "count": actual,
+                                   "updated_at": now}},
+                         upsert=True)
+               for (dimension, key), (_, actual) in drifted.items()]
+        if ops:
+            self.census_collection.bulk_write(ops, ordered=False)
+        return drifted
+
+
+def main():
+    from app import HospitalManagementSystem, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Ward census counters")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="print counters")
+    show.add_argument("dimension", nargs="?", choices=sorted(DIMENSIONS))
+    rebuild = sub.add_parser("rebuild", help="recount from the patients collection")
+    rebuild.add_argument("--check", action="store_true",
+                         help="only report drift, do not correct it")
+    args = parser.parse_args()
+
+    hms = HospitalManagementSystem(backend=backend_from_env())
+    try:
+        if args.command == "show":
+            snapshot = hms.census.snapshot()
+            for dimension in [args.dimension] if args.dimension else sorted(snapshot):
+                print(f"{dimension}:")
+                for key, count in sorted(snapshot[dimension].items()):
+                    print(f"  {key:<24} {count:>6}")
+        else:
+            drifted = hms.census.drift() if args.check else hms.census.rebuild()
+            for (dimension, key), (stored, actual) in sorted(drifted.items()):
+                print(f"  {dimension}:{key} stored {stored}, actual {actual}")
+            verb = "found" if args.check else "corrected"
+            print(f"✅ {len(drifted)} drifted counter(s) {verb}")
+    finally:
+        hms.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Seeded synthetic patient and billing data.
+
+Documents are built with ``new_patient_document`` and ``build_bill`` so they
+have exactly the nested shape that onboarding and the fee calculator write.
+Records are generated in fixed blocks, each with its own seeded random
+generator, so record ``i`` is the same for a given seed no matter how many
+records are requested or how the output is chunked.
+
+    python datagen.py --scale 1m --out patients.ndjson.gz --billing-out billing.ndjson.gz
+    HMS_BACKEND=embedded HMS_DATA_FILE=big.journal python datagen.py --scale 10k --load
+"""
+import argparse
+import gzip
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Optional, Tuple
+
+from bson import json_util
+
+from billing import build_bill
+from ledger import payment_entry
+from operations import new_patient_document
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+REFERENCE_NOW = datetime(2026, 1, 1, 9, 0)
+BLOCK_SIZE = 10_000
+
+FIRST_NAMES = ["Aby", "Maria", "Ravi", "Chen", "Fatima", "John", "Priya", "Lucas", "Amara",
+               "Kenji", "Olga", "Diego", "Noor", "Sven", "Leila", "Arjun", "Sofia", "Mateo",
+               "Aisha", "Wei", "Elena", "Omar", "Hana", "Tomas", "Zara", "Ivan", "Meera",
+               "Jonas", "Yuki", "Kwame", "Ines", "Rohan", "Lina", "Pablo", "Asha", "Emil"]
+LAST_NAMES = ["Pal", "Garcia", "Sharma", "Wang", "Khan", "Smith", "Iyer", "Silva", "Okafor",
+              "Tanaka", "Petrova", "Lopez", "Haddad", "Berg", "Mehta", "Jones", "Nguyen",
+              "Rossi", "Kowalski", "Mensah", "Sato", "Fischer", "Das", "Costa", "Ali",
+              "Novak", "Reddy", "Moreau", "Kim", "Yilmaz", "Andersen", "Banerjee"]
+CONDITIONS = [
+    ("pneumonia", "cough, fever, shortness of breath"),
+    ("appendicitis", "abdominal pain, nausea"),
+    ("fractured femur", "severe leg pain, swelling"),
+    ("myocardial infarction", "chest pain, sweating"),
+    ("dengue fever", "high fever, joint pain, rash"),
+    ("hypoglycemia", "dizziness, confusion, sweating"),
+    ("asthma exacerbation", "wheezing, chest tightness"),
+    ("kidney stones", "flank pain, blood in urine"),
+    ("stroke", "slurred speech, weakness on one side"),
+    ("gastroenteritis", "vomiting, diarrhoea, dehydration"),
+    ("sepsis", "fever, rapid heart rate, low blood pressure"),
+    ("migraine", "severe headache, light sensitivity"),
+]
+ALLERGIES = ["none", "none", "none", "penicillin", "peanuts", "latex", "sulfa drugs", "dust"]
+HISTORIES = ["none", "none", "hypertension", "type 2 diabetes", "asthma", "prior surgery",
+             "smoker", "heart disease"]
+DOCTORS = [f"Dr. {name}" for name in LAST_NAMES[:24]]
+ADMISSION_WEIGHTS = {"Regular": 70, "Emergency": 20, "ICU": 10}
+ROOMS = {"Regular": (100, 400), "Emergency": (1, 60), "ICU": (500, 540)}
+STAY_DAYS = {"Regular": (2, 10), "Emergency": (1, 5), "ICU": (3, 21)}
+DISCHARGE_NOTES = ["rest and follow up in a week", "continue medication for 10 days",
+                   "physiotherapy twice a week", "return if symptoms recur"]
+
+
+class PatientGenerator:
+    """Deterministic stream of (patient, bill) documents"""
+
+    def __init__(self, seed: int = 42, now: datetime = REFERENCE_NOW,
+                 active_fraction: float = 0.15, billed_active_fraction: float = 0.5,
+                 history_days: int = 365):
+        self.seed = seed
+        self.now = now
+        self.active_fraction = active_fraction
+        self.billed_active_fraction = billed_active_fraction
+        self.history_days = history_days
+        self._types = list(ADMISSION_WEIGHTS)
+        self._weights = list(ADMISSION_WEIGHTS.values())
+
+    def _block_rng(self, block: int) -> random.Random:
+        return random.Random(f"{self.seed}:{block}")
+
+    def records(self, count: int, start: int = 0) -> Iterator[Tuple[Dict, Optional[Dict]]]:
+        """Records ``start`` .. ``start + count - 1``; the bill is None for unbilled patients"""
+        end = start + count
+        index = start
+        while index < end:
+            block = index // BLOCK_SIZE
+            rng = self._block_rng(block)
+            offset = block * BLOCK_SIZE
+            # Advance through the block from its start so record i never
+            # depends on where the caller started.
+            for position in range(offset, min(end, offset + BLOCK_SIZE)):
+                record = self._record(position, rng)
+                if position >= index:
+                    yield record
+            index = min(end, offset + BLOCK_SIZE)
+
+    def patients(self, count: int, start: int = 0) -> Iterator[Dict]:
+        for patient, _ in self.records(count, start):
+            yield patient
+
+    def _record(self, index: int, rng: random.Random) -> Tuple[Dict, Optional[Dict]]:
+        admission_type = rng.choices(self._types, self._weights)[0]
+        low, high = STAY_DAYS[admission_type]
+        stay = rng.randint(low, high)
+        active = rng.random() < self.active_fraction
+        if active:
+            admitted = self.now - timedelta(days=rng.randrange(0, stay),
+                                            minutes=rng.randrange(0, 24 * 60))
+        else:
+            admitted = self.now - timedelta(days=rng.randrange(stay, self.history_days),
+                                            minutes=rng.randrange(0, 24 * 60))
+        admitted = admitted.replace(microsecond=0)
+        disease, symptoms = rng.choice(CONDITIONS)
+        room_low, room_high = ROOMS[admission_type]
+        patient = new_patient_document(
+            f"PAT{index:08X}",
+            {
+                "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "age": min(99, max(0, int(rng.gauss(48, 22)))),
+                "gender": rng.choices(["M", "F", "Other"], [49, 49, 2])[0],
+                "phone": str(rng.randrange(6 * 10**9, 10**10)),
+                "address": f"{rng.randrange(1, 400)}, {rng.choice(LAST_NAMES)} Street",
+                "emergency_contact": str(rng.randrange(6 * 10**9, 10**10)),
+            },
+            {
+                "disease": disease,
+                "symptoms": symptoms,
+                "allergies": rng.choice(ALLERGIES),
+                "medical_history": rng.choice(HISTORIES),
+            },
+            admission_type,
+            rng.choice(DOCTORS),
+            str(rng.randrange(room_low, room_high)),
+            now=admitted)
+        if active:
+            billed_at = self.now
+        else:
+            billed_at = admitted + timedelta(days=stay - 1, hours=rng.randrange(1, 12))
+            admission = patient["admission_info"]
+            admission["status"] = "Discharged"
+            admission["discharge_date"] = billed_at
+            admission["discharge_notes"] = rng.choice(DISCHARGE_NOTES)
+            patient["updated_at"] = billed_at
+
+        if active and rng.random() >= self.billed_active_fraction:
+            return patient, None
+        bill = build_bill(patient,
+                          lab_charges=float(rng.choice([0, 0, 350, 750, 1200])),
+                          procedure_charges=float(rng.choice([0, 0, 0, 5000, 15000])),
+                          pharmacy_charges=float(rng.randrange(0, 40) * 50),
+                          now=billed_at)
+        total = bill["total_amount"]
+        roll = rng.random()
+        if active:
+            paid = float(round(total * rng.choice([0.0, 0.25, 0.5]), 2))
+        elif roll < 0.7:
+            paid = total
+        elif roll < 0.9:
+            paid = float(round(total * rng.uniform(0.2, 0.9), 2))
+        else:
+            paid = 0.0
+        patient["billing_info"] = {"total_amount": total, "paid_amount": paid,
+                                   "outstanding_amount": total - paid,
+                                   "billed_on": billed_at.strftime('%Y-%m-%d')}
+        patient["updated_at"] = max(patient["updated_at"], billed_at)
+        return patient, bill
+
+
+def scale_count(scale: str) -> int:
+    """Record count for a named scale (``10k``/``1m``/``10m``) or a plain number"""
+    key = scale.lower()
+    return SCALES[key] if key in SCALES else int(key.replace("_", ""))
+
+
+def payment_for(patient: Dict, bill: Optional[Dict]) -> Optional[Dict]:
+    """Ledger entry matching a generated patient's paid amount, if any"""
+    paid = patient["billing_info"]["paid_amount"]
+    if not paid or bill is None:
+        return None
+    return payment_entry(patient["patient_id"], paid, method="card",
+                         reference=f"GEN-{patient['patient_id']}",
+                         received_at=bill["generated_date"])
+
+
+def load(patients_collection, billing_collection, count: int,
+         generator: Optional[PatientGenerator] = None, batch_size: int = 5000,
+         progress=None, payments_collection=None) -> float:
+    """Insert ``count`` generated records with unordered batches; returns seconds taken
+
+    With ``payments_collection`` every paid amount also gets its ledger entry.
+    """
+    generator = generator or PatientGenerator()
+    started = time.perf_counter()
+    patients, bills, payments = [], [], []
+    done = 0
+
+    def flush():
+        patients_collection.insert_many(patients, ordered=False)
+        if bills:
+            billing_collection.insert_many(bills, ordered=False)
+        if payments:
+            payments_collection.insert_many(payments, ordered=False)
+
+    for patient, bill in generator.records(count):
+        patients.append(patient)
+        if bill is not None:
+            bills.append(bill)
+        if payments_collection is not None:
+            payment = payment_for(patient, bill)
+            if payment is not None:
+                payments.append(payment)
+        if len(patients) >= batch_size:
+            flush()
+            done += len(patients)
+            patients, bills, payments = [], [], []
+            if progress:
+                progress(done)
+    if patients:
+        flush()
+    return time.perf_counter() - started
+
+
+def _open_out(path: str):
+    return gzip.open(path, "wt", encoding="utf-8") if path.endswith(".gz") \
+        else open(path, "w", encoding="utf-8")
+
+
+def write_ndjson(path: str, count: int, generator: Optional[PatientGenerator] = None,
+                 billing_path: Optional[str] = None) -> Tuple[int, int]:
+    """Write patients (and optionally bills) as extended-JSON lines; returns the counts"""
+    generator = generator or PatientGenerator()
+    written = billed = 0
+    bill_out = _open_out(billing_path) if billing_path else None
+    try:
+        with _open_out(path) as out:
+            for patient, bill in generator.records(count):
+                out.write(json_util.dumps(patient) + "\n")
+                written += 1
+                if bill is not None and bill_out is not None:
+                    bill_out.write(json_util.dumps(bill) + "\n")
+                    billed += 1
+    finally:
+        if bill_out is not None:
+            bill_out.close()
+    return written, billed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic hospital data")
+    parser.add_argument("--scale", default="10k",
+                        help="10k, 100k, 1m, 10m or a record count")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="write patients as NDJSON (.gz to compress)")
+    parser.add_argument("--billing-out", help="also write bills as NDJSON")
+    parser.add_argument("--load", action="store_true",
+                        help="insert into the configured backend (HMS_BACKEND etc.)")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    if not args.out and not args.load:
+        parser.error("pass --out and/or --load")
+
+    count = scale_count(args.scale)
+    generator = PatientGenerator(seed=args.seed)
+    if args.out:
+        started = time.perf_counter()
+        written, billed = write_ndjson(args.out, count, generator, args.billing_out)
+        print(f"✅ Wrote {written:,} patients and {billed:,} bills in "
+              f"{time.perf_counter() - started:.1f}s")
+    if args.load:
+        from app import HospitalManagementSystem, backend_from_env
+
+        hms = HospitalManagementSystem(backend=backend_from_env())
+        try:
+            elapsed = load(hms.patients_collection, hms.billing_collection, count, generator,
+                           args.batch_size,
+                           progress=lambda n: print(f"  {n:,} / {count:,}", end="\r"),
+                           payments_collection=hms.payments_collection)
+            hms.census.rebuild()
+            hms.ledger.rebuild()
+            print(f"✅ Loaded {count:,} patients in {elapsed:.1f}s "
+                  f"({count / elapsed:,.0f} patients/s)")
+        finally:
+            hms.close()
+
+
+if __name__ == "__main__":
+    main()
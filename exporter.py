@@ -0,0 +1,232 @@
+"""Streaming export of patients and bills to flat CSV or NDJSON.
+
+Documents are read through one batched cursor projected to the exported
+sub-documents, flattened (``personal_info.name`` becomes a column of its
+own) and written row by row, so memory stays constant however many records
+are exported.  Output ending in ``.gz`` is gzip-compressed.  ``--from`` and
+``--to`` are both inclusive days.
+
+    python exporter.py patients patients.csv.gz --status Discharged --from 2025-01-01
+    python exporter.py billing bills.ndjson.gz --to 2025-12-31
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, TextIO, Tuple
+
+from metrics import timed
+
+DEFAULT_BATCH_SIZE = 2000
+PROGRESS_EVERY = 50_000
+
+PATIENT_COLUMNS = [
+    "patient_id",
+    "personal_info.name", "personal_info.age", "personal_info.gender", "personal_info.phone",
+    "personal_info.address", "personal_info.emergency_contact",
+    "medical_info.disease", "medical_info.symptoms", "medical_info.allergies",
+    "medical_info.medical_history",
+    "admission_info.admission_date", "admission_info.admission_type",
+    "admission_info.assigned_doctor", "admission_info.room_number", "admission_info.status",
+    "admission_info.discharge_date", "admission_info.discharge_notes",
+    "billing_info.total_amount", "billing_info.paid_amount", "billing_info.outstanding_amount",
+    "billing_info.billed_on",
+    "created_at", "updated_at",
+]
+BILLING_COLUMNS = [
+    "patient_id", "patient_name", "admission_date", "days_admitted", "admission_type",
+    "charges.room_charges", "charges.doctor_charges", "charges.medicine_charges",
+    "charges.lab_charges", "charges.procedure_charges", "charges.pharmacy_charges",
+    "total_amount", "generated_date", "status",
+]
+# Collection, columns, field the --status filter applies to, field the date range applies to
+DATASETS = {
+    "patients": ("patients", PATIENT_COLUMNS, "admission_info.status",
+                 "admission_info.admission_date"),
+    "billing": ("billing", BILLING_COLUMNS, "status", "generated_date"),
+}
+FORMATS = ("csv", "ndjson")
+
+
+class ExportReport:
+    """Rows, bytes and throughput of one export"""
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.rows:,} rows, {self.bytes / 1e6:,.1f} MB written in "
+                f"{self.elapsed:.2f}s ({self.rate:,.0f} rows/s)")
+
+
+def export_filter(status_field: str, date_field: str, status: Optional[str] = None,
+                  start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict:
+    """Query for an optional status and a half-open ``[start, end)`` date range"""
+    query: Dict = {}
+    if status:
+        query[status_field] = status
+    if start or end:
+        query[date_field] = {}
+        if start:
+            query[date_field]["$gte"] = start
+        if end:
+            query[date_field]["$lt"] = end
+    return query
+
+
+def flattener(columns: List[str]) -> Callable[[Dict], List[Any]]:
+    """Function turning a nested document into one value per dotted column
+
+    Consecutive columns under the same sub-document are read with one
+    lookup of that sub-document, which is the common case here.
+    """
+    groups: List[Tuple[Optional[str], List[str]]] = []
+    for column in columns:
+        parent, _, leaf = column.rpartition(".")
+        parent = parent or None
+        if groups and groups[-1][0] == parent:
+            groups[-1][1].append(leaf)
+        else:
+            groups.append((parent, [leaf]))
+    parent_paths = [parent.split(".") if parent else [] for parent, _ in groups]
+    empty: Dict = {}
+
+    def flatten(doc: Dict) -> List[Any]:
+        row: List[Any] = []
+        for (_, leaves), path in zip(groups, parent_paths):
+            sub: Any = doc
+            for part in path:
+                sub = sub.get(part) if isinstance(sub, dict) else None
+            if not isinstance(sub, dict):
+                sub = empty
+            row.extend([sub.get(leaf) for leaf in leaves])
+        return row
+    return flatten
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+
+class _CountingWriter(io.RawIOBase):
+    """Binary sink that counts the (compressed) bytes reaching the file"""
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.written += len(data)
+        return self.fh.write(data)
+
+
+def open_target(path: str, counter: _CountingWriter, level: int) -> TextIO:
+    if path.endswith(".gz"):
+        binary = gzip.GzipFile(filename=path[:-3], mode="wb", fileobj=counter,
+                               compresslevel=level)
+    else:
+        binary = io.BufferedWriter(counter, buffer_size=1 << 20)
+    return io.TextIOWrapper(binary, encoding="utf-8", newline="", write_through=False)
+
+
+def write_rows(out: TextIO, columns: List[str], rows: Iterable[List[Any]], fmt: str,
+               report: ExportReport, progress=None) -> None:
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        emit = lambda row: writer.writerow([_cell(v) for v in row])
+    else:
+        encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"),
+                                  default=_cell).encode
+        emit = lambda row: out.write(encode(dict(zip(columns, row))) + "\n")
+    for row in rows:
+        emit(row)
+        report.rows += 1
+        if progress and report.rows % PROGRESS_EVERY == 0:
+            progress(report)
+
+
+@timed("export")
+def export(collection, path: str, columns: List[str], query: Optional[Dict] = None,
+           fmt: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE, level: int = 6,
+           progress=None) -> ExportReport:
+    """Stream ``collection`` matching ``query`` to ``path`` as flat rows"""
+    fmt = fmt or ("ndjson" if ".ndjson" in path or ".jsonl" in path else "csv")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}', expected one of {', '.join(FORMATS)}")
+    # Whole sub-documents are cheaper to project than each leaf; the
+    # flattener picks the leaves out anyway.
+    projection = {"_id": 0}
+    projection.update({column.split(".", 1)[0]: 1 for column in columns})
+    report = ExportReport()
+    cursor = collection.find(query or {}, projection).batch_size(batch_size)
+    flatten = flattener(columns)
+    with open(path, "wb") as fh:
+        counter = _CountingWriter(fh)
+        with open_target(path, counter, level) as out:
+            write_rows(out, columns, map(flatten, cursor), fmt, report, progress)
+        report.bytes = counter.written
+    report.finished = time.perf_counter()
+    return report
+
+
+def _date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def _day_after(value: str) -> datetime:
+    """Exclusive end for an inclusive ``--to`` day"""
+    return _date(value) + timedelta(days=1)
+
+
+def main():
+    from app import HospitalManagementSystem, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Export patients or bills to CSV/NDJSON")
+    parser.add_argument("dataset", choices=sorted(DATASETS))
+    parser.add_argument("path", help="output file; .gz compresses, .ndjson selects NDJSON")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--status", help="admission status (patients) or bill status (billing)")
+    parser.add_argument("--from", dest="start", type=_date,
+                        help="admission date (patients) or bill date (billing) on or after")
+    parser.add_argument("--to", dest="end", type=_day_after,
+                        help="... and on or before, YYYY-MM-DD")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--level", type=int, default=6, choices=range(1, 10),
+                        help="gzip compression level")
+    args = parser.parse_args()
+
+    collection_name, columns, status_field, date_field = DATASETS[args.dataset]
+    hms = HospitalManagementSystem(backend=backend_from_env())
+    try:
+        query = export_filter(status_field, date_field, args.status, args.start, args.end)
+        report = export(hms.collections[collection_name], args.path, columns, query,
+                        args.format, args.batch_size, args.level,
+                        progress=lambda r: print(f"  {r.rows:,} rows ({r.rate:,.0f}/s)",
+                                                 end="\r"))
+        print(f"✅ Exported {report.summary()}")
+    finally:
+        hms.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Append-only change history of patient documents.
+
+``PatientHistory.record`` is registered as a ``PatientOperations`` listener
+and appends one compact event per write to ``patient_history``, holding only
+the fields the write changed::
+
+    {"patient_id": "PATB221D700", "at": ..., "event": "updated", "depth": 5,
+     "changes": [["personal_info.phone", "9876543210"], ["updated_at", ...]],
+     "removed": []}
+
+Events are ordered by ``at`` (the ``updated_at`` the write set) and ``_id``.
+Every ``SNAPSHOT_EVERY`` events of a patient one event also carries the full
+document as ``snapshot`` (``depth`` counts the events since it).  The first
+event of a patient that existed before history was kept is a ``baseline``
+snapshot of the document before the write.  ``as_of`` therefore rebuilds
+any point in time from the nearest snapshot and at most ``SNAPSHOT_EVERY``
+events, read back with one indexed query however long the history is.
+Nightly billing runs are recorded per page through ``billed``.
+
+    python history.py show PATB221D700 --limit 20
+    python history.py as-of PATB221D700 2026-01-03T10:00
+"""
+import argparse
+import copy
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import json_util
+
+from metrics import timed
+from operations import BILLED, IMPORTED
+
+SNAPSHOT_EVERY = 32
+BASELINE = "baseline"
+# Derived or storage-only fields that are not part of the history
+IGNORED_FIELDS = ("_id", "search")
+MAX_TRACKED = 100_000
+NEWEST_FIRST = [("at", -1), ("_id", -1)]
+
+Changes = List[Tuple[Optional[Dict], Optional[Dict]]]
+
+
+def _leaves(doc: Dict, prefix: str = "", out: Optional[Dict] = None) -> Dict[str, Any]:
+    """Dotted path -> value of every non-document leaf (an empty document is a leaf)"""
+    out = {} if out is None else out
+    for key, value in doc.items():
+        if not prefix and key in IGNORED_FIELDS:
+            continue
+        path = prefix + key
+        if isinstance(value, dict) and value:
+            _leaves(value, path + ".", out)
+        else:
+            out[path] = value
+    return out
+
+
+def field_diff(before: Optional[Dict], after: Dict) -> Tuple[List[List], List[str]]:
+    """``(changes, removed)``: leaves ``after`` sets differently and leaves it drops"""
+    old = _leaves(before) if before else {}
+    new = _leaves(after)
+    changes = [[path, value] for path, value in new.items()
+               if path not in old or old[path] != value]
+    removed = [path for path in old if path not in new]
+    return changes, removed
+
+
+def apply_diff(doc: Dict, changes: Iterable[List], removed: Iterable[str]) -> None:
+    """Replay one event onto ``doc`` in place"""
+    for path in removed:
+        *parents, leaf = path.split(".")
+        target: Any = doc
+        for part in parents:
+            target = target.get(part) if isinstance(target, dict) else None
+        if isinstance(target, dict):
+            target.pop(leaf, None)
+    for path, value in changes:
+        *parents, leaf = path.split(".")
+        target = doc
+        for part in parents:
+            child = target.get(part)
+            if not isinstance(child, dict):
+                child = target[part] = {}
+            target = child
+        target[leaf] = copy.deepcopy(value)
+
+
+def snapshot_of(doc: Dict) -> Dict:
+    return {k: copy.deepcopy(v) for k, v in doc.items() if k not in IGNORED_FIELDS}
+
+
+class PatientHistory:
+    """Field-level change events with periodic snapshots"""
+
+    def __init__(self, history_collection, patients_collection,
+                 snapshot_every: int = SNAPSHOT_EVERY):
+        self.history_collection = history_collection
+        self.patients_collection = patients_collection
+        self.snapshot_every = snapshot_every
+        self._depth: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    # -- recording ---------------------------------------------------------
+
+    def record(self, event: str, before: Optional[Dict], after: Optional[Dict]) -> None:
+        """``PatientOperations`` listener: append the diff of one write"""
+        self.append(event, [(before, after)])
+
+    def billed(self, changes: Changes) -> None:
+        """``BatchBillingEngine`` listener: append the diffs of one page of a billing run
+
+        The page documents are projected, so snapshots that fall due are
+        taken from the stored documents instead.
+        """
+        self.append(BILLED, changes, complete=False)
+
+    def imported(self, changes: Changes) -> None:
+        """Import listener: start the history of each imported patient with a snapshot"""
+        self.append(IMPORTED, changes)
+
+    def _depths(self, patient_ids: List[str]) -> Dict[str, int]:
+        """Events since the last snapshot per patient (absent: no history yet)"""
+        with self._lock:
+            depths = {pid: self._depth[pid] for pid in patient_ids if pid in self._depth}
+        # Only the newest event of each patient is read, from the
+        # (patient_id, at, _id) index, however long the history is
+        for pid in patient_ids:
+            if pid in depths:
+                continue
+            newest = list(self.history_collection.find({"patient_id": pid}, {"depth": 1})
+                          .sort(NEWEST_FIRST).limit(1))
+            if newest:
+                depths[pid] = newest[0]["depth"]
+        return depths
+
+    @timed("history_record")
+    def append(self, event: str, changes: Changes, complete: bool = True) -> None:
+        """Append one event per ``(before, after)`` pair
+
+        With ``complete`` the documents are whole patient documents; otherwise
+        they are projections and only their fields are compared.
+        """
+        changes = [(before, after) for before, after in changes if after]
+        if not changes:
+            return
+        now = datetime.now()
+        depths = self._depths(list(dict.fromkeys(after["patient_id"] for _, after in changes)))
+        documents, due = [], []
+        for before, after in changes:
+            patient_id = after["patient_id"]
+            depth = depths.get(patient_id)
+            if depth is None and before is not None and complete:
+                documents.append({"patient_id": patient_id, "event": BASELINE, "depth": 0,
+                                  "at": before.get("updated_at") or before.get("created_at")
+                                  or now, "changes": [], "removed": [],
+                                  "snapshot": snapshot_of(before)})
+                depth = 0
+            diff, removed = field_diff(before, after)
+            document = {"patient_id": patient_id, "event": event,
+                        "at": after.get("updated_at") or now, "changes": diff,
+                        "removed": removed}
+            if depth is None or depth + 1 >= self.snapshot_every:
+                if complete:
+                    document["snapshot"] = snapshot_of(after)
+                else:
+                    due.append((document, depth))
+                depth = 0
+            else:
+                depth += 1
+            document["depth"] = depth
+            depths[patient_id] = depth
+            documents.append(document)
+        if due:
+            current = {p["patient_id"]: p for p in self.patients_collection.find(
+                {"patient_id": {"$in": [d["patient_id"] for d, _ in due]}})}
+            for document, previous in due:
+                patient_id = document["patient_id"]
+                if patient_id in current:
+                    document["snapshot"] = snapshot_of(current[patient_id])
+                else:
+                    # No snapshot could be taken, so this is not a new starting point
+                    document["depth"] = (previous or 0) + 1
+                    if depths.get(patient_id) == 0:
+                        depths[patient_id] = document["depth"]
+        self.history_collection.insert_many(documents, ordered=True)
+        with self._lock:
+            if len(self._depth) > MAX_TRACKED:
+                self._depth.clear()
+            self._depth.update(depths)
+
+    # -- reading -----------------------------------------------------------
+
+    def events(self, patient_id: str, limit: int = 50,
+               before: Optional[datetime] = None) -> List[Dict]:
+        """Newest events of a patient first (without their snapshots)"""
+        query: Dict = {"patient_id": patient_id}
+        if before is not None:
+            query["at"] = {"$lt": before}
+        return list(self.history_collection.find(query, {"snapshot": 0})
+                    .sort(NEWEST_FIRST).limit(limit))
+
+    @timed("history_as_of")
+    def as_of(self, patient_id: str, at: datetime) -> Optional[Dict]:
+        """The patient document as it was at ``at``, or None if it had no history yet"""
+        cursor = self.history_collection.find(
+            {"patient_id": patient_id, "at": {"$lte": at}}).sort(NEWEST_FIRST)
+        # Snapshots are at most SNAPSHOT_EVERY events apart; fetch that many
+        # at once and keep reading only if writers in other processes
+        # stretched the gap.
+        cursor = cursor.batch_size(self.snapshot_every + 1)
+        pending: List[Dict] = []
+        for event in cursor:
+            if "snapshot" in event:
+                doc = dict(event["snapshot"], patient_id=patient_id)
+                for newer in reversed(pending):
+                    apply_diff(doc, newer["changes"], newer["removed"])
+                return doc
+            pending.append(event)
+        return None
+
+
+def _moment(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def main():
+    from app import HospitalManagementSystem, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Patient change history")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="recent changes of a patient")
+    show.add_argument("patient_id")
+    show.add_argument("--limit", type=int, default=20)
+    as_of = sub.add_parser("as-of", help="a patient's record at a point in time")
+    as_of.add_argument("patient_id")
+    as_of.add_argument("at", type=_moment, help="YYYY-MM-DD[THH:MM[:SS]]")
+    args = parser.parse_args()
+
+    hms = HospitalManagementSystem(backend=backend_from_env())
+    try:
+        if args.command == "show":
+            events = hms.history.events(args.patient_id, args.limit)
+            if not events:
+                print("❌ No history for this patient")
+                return
+            for event in events:
+                print(f"{event['at']:%Y-%m-%d %H:%M:%S}  {event['event']}")
+                for path, value in event["changes"]:
+                    if path != "updated_at":
+                        print(f"    {path} = {value}")
+                for path in event["removed"]:
+                    print(f"    {path} removed")
+        else:
+            doc = hms.history.as_of(args.patient_id, args.at)
+            if doc is None:
+                print("❌ No history for this patient at that time")
+                return
+            print(json_util.dumps(doc, indent=2))
+    finally:
+        hms.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Streaming bulk import of patient records.
+
+Reads mongoexport-style Extended-JSON arrays (like ``hospital_db.patients.json``)
+or NDJSON, one document at a time, and writes them with batched, unordered
+``insert_many`` calls.  The documents each batch inserted are passed to the
+``listeners`` as ``(None, document)`` pairs, so the census, ledger
+receivables, bed occupancy and history follow an import like any other
+write; ``HospitalManagementSystem.import_file`` registers them.
+
+    python importer.py hospital_db.patients.json
+    python importer.py site_b.ndjson.gz --batch-size 5000
+"""
+import argparse
+import gzip
+import json
+import time
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+from search import ensure_search_keys
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_KEPT_ERRORS = 1000
+
+Changes = List[Tuple[Optional[Dict], Optional[Dict]]]
+
+_JSON_OPTIONS = json_util.JSONOptions(tz_aware=False)
+_DECODER = json.JSONDecoder(object_hook=partial(json_util.object_hook,
+                                                json_options=_JSON_OPTIONS))
+
+
+class ImportReport:
+    """Counters, per-record errors and throughput of one import run"""
+
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def add_error(self, record: int, reason: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_KEPT_ERRORS:
+            self.errors.append({"record": record, "error": reason})
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.inserted / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.read:,} read, {self.inserted:,} inserted, {self.failed:,} failed "
+                f"in {self.elapsed:.2f}s ({self.rate:,.0f} records/s)")
+
+
+def open_source(path: str) -> TextIO:
+    """Open a plain or gzip-compressed export file for reading"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _iter_array(fh: TextIO, buffer: str, chunk_size: int) -> Iterator[Tuple[int, object]]:
+    """Yield the elements of a top-level JSON array without reading it whole"""
+    pos = buffer.index("[") + 1
+    record = 0
+    eof = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("unexpected end of file inside JSON array")
+            chunk = fh.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            value, end = _DECODER.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = fh.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        record += 1
+        yield record, value
+        pos = end
+
+
+def _iter_ndjson(fh: TextIO, first_line: str) -> Iterator[Tuple[int, object]]:
+    """Yield one decoded value (or the decode error) per non-blank line"""
+    record = 0
+    for line in _chain_first(first_line, fh):
+        if not line.strip():
+            continue
+        record += 1
+        try:
+            yield record, _DECODER.decode(line)
+        except ValueError as exc:
+            yield record, exc
+
+
+def _chain_first(first: str, fh: TextIO) -> Iterator[str]:
+    if first:
+        yield first
+    yield from fh
+
+
+def iter_records(fh: TextIO, fmt: str = "auto",
+                 chunk_size: int = 1 << 16) -> Iterator[Tuple[int, object]]:
+    """Stream ``(record_number, document_or_error)`` pairs from an export file"""
+    if fmt == "ndjson":
+        yield from _iter_ndjson(fh, "")
+        return
+    head = ""
+    while not head.strip():
+        chunk = fh.read(1) if fmt == "auto" else fh.read(chunk_size)
+        if not chunk:
+            return
+        head += chunk
+    if fmt == "array" or (fmt == "auto" and head.lstrip().startswith("[")):
+        yield from _iter_array(fh, head + fh.read(chunk_size), chunk_size)
+    else:
+        yield from _iter_ndjson(fh, head + fh.readline())
+
+
+def validate_patient(doc: object) -> Optional[str]:
+    """Return why a decoded record cannot be imported as a patient, or None"""
+    if not isinstance(doc, dict):
+        return "record is not a JSON object"
+    if not doc.get("patient_id"):
+        return "missing patient_id"
+    for section in ("personal_info", "admission_info"):
+        if not isinstance(doc.get(section), dict):
+            return f"missing {section}"
+    return None
+
+
+def _flush(collection, batch: List[Tuple[int, Dict]], report: ImportReport,
+           listeners: Iterable[Callable[[Changes], None]] = ()) -> None:
+    if not batch:
+        return
+    failed = set()
+    try:
+        result = collection.insert_many([doc for _, doc in batch], ordered=False)
+        report.inserted += len(result.inserted_ids)
+    except BulkWriteError as exc:
+        details = exc.details or {}
+        report.inserted += details.get("nInserted", 0)
+        for error in details.get("writeErrors", []):
+            failed.add(error["index"])
+            report.add_error(batch[error["index"]][0], error.get("errmsg", "write error"))
+    changes = [(None, doc) for position, (_, doc) in enumerate(batch) if position not in failed]
+    batch.clear()
+    if changes:
+        for listener in listeners:
+            listener(changes)
+
+
+def import_patients(collection, fh: TextIO, fmt: str = "auto",
+                    batch_size: int = DEFAULT_BATCH_SIZE,
+                    validate: Callable[[object], Optional[str]] = validate_patient,
+                    progress: Optional[Callable[[ImportReport], None]] = None,
+                    progress_every: int = 50000,
+                    listeners: Iterable[Callable[[Changes], None]] = ()) -> ImportReport:
+    """Stream records from ``fh`` into ``collection`` in unordered batches
+
+    Each listener is called with ``[(None, document), ...]`` for the
+    documents every batch inserted.
+    """
+    listeners = list(listeners)
+    report = ImportReport()
+    batch: List[Tuple[int, Dict]] = []
+    for record, doc in iter_records(fh, fmt):
+        report.read += 1
+        if isinstance(doc, Exception):
+            report.add_error(record, f"invalid JSON: {doc}")
+            continue
+        problem = validate(doc) if validate else None
+        if problem:
+            report.add_error(record, problem)
+            continue
+        ensure_search_keys(doc)
+        batch.append((record, doc))
+        if len(batch) >= batch_size:
+            _flush(collection, batch, report, listeners)
+        if progress and report.read % progress_every == 0:
+            progress(report)
+    _flush(collection, batch, report, listeners)
+    report.finished = time.perf_counter()
+    return report
+
+
+def import_file(collection, path: str, **kwargs) -> ImportReport:
+    """Import a plain or gzip-compressed export file"""
+    with open_source(path) as fh:
+        return import_patients(collection, fh, **kwargs)
+
+
+def main():
+    from app import HospitalManagementSystem, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Bulk import patients from JSON/NDJSON exports")
+    parser.add_argument("path", help="export file (.json, .ndjson, optionally .gz)")
+    parser.add_argument("--format", choices=["auto", "array", "ndjson"], default="auto")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--show-errors", type=int, default=20,
+                        help="number of per-record errors to print")
+    args = parser.parse_args()
+
+    hms = HospitalManagementSystem(backend=backend_from_env())
+    try:
+        report = hms.import_file(
+            args.path, fmt=args.format, batch_size=args.batch_size,
+            progress=lambda r: print(f"⏳ {r.summary()}"))
+    finally:
+        hms.close()
+
+    print(f"✅ Import finished: {report.summary()}")
+    for error in report.errors[:args.show_errors]:
+        print(f"❌ Record {error['record']}: {error['error']}")
+    if report.failed > args.show_errors:
+        print(f"... and {report.failed - args.show_errors:,} more errors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Declared indexes and query-plan checks.
+
+``INDEXES`` is the single list of indexes the application relies on,
+including compound indexes that serve a filter plus the ``patient_id``
+keyset sort and partial indexes restricted to active admissions.
+``sync_indexes`` creates missing indexes and rebuilds any whose definition
+changed, so it is safe to run on every start-up.  ``check_plans`` explains
+every query shape in ``query_shapes()`` and reports the ones that would
+scan the whole collection.
+
+    python indexes.py sync
+    python indexes.py check      # exits 1 if any query shape does a COLLSCAN
+"""
+import argparse
+import hashlib
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from listing import SUMMARY_PROJECTION, listing_filter
+from search import LISTING_PROJECTION
+
+ACTIVE = {"admission_info.status": "Active"}
+
+
+class IndexSpec(NamedTuple):
+    """One declared index; ``partial`` is a ``partialFilterExpression``"""
+    collection: str
+    keys: List[Tuple[str, int]]
+    unique: bool = False
+    partial: Optional[Dict] = None
+    name: Optional[str] = None
+
+    @property
+    def index_name(self) -> str:
+        return self.name or "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+
+INDEXES = [
+    IndexSpec("patients", [("patient_id", 1)], unique=True),
+    IndexSpec("patients", [("search.name", 1)]),
+    IndexSpec("patients", [("search.tokens", 1)]),
+    IndexSpec("patients", [("admission_info.status", 1), ("patient_id", 1)]),
+    IndexSpec("patients", [("admission_info.assigned_doctor", 1), ("patient_id", 1)]),
+    IndexSpec("patients", [("admission_info.admission_type", 1), ("patient_id", 1)]),
+    IndexSpec("patients", [("admission_info.room_number", 1), ("patient_id", 1)],
+              partial=ACTIVE, name="active_room_number"),
+    IndexSpec("patients", [("admission_info.admission_date", 1)]),
+    IndexSpec("patients", [("admission_info.discharge_date", 1)]),
+    IndexSpec("billing", [("patient_id", 1)]),
+    IndexSpec("billing", [("status", 1), ("patient_id", 1)]),
+    IndexSpec("billing", [("generated_date", 1)]),
+    IndexSpec("charges", [("patient_id", 1)]),
+    IndexSpec("census", [("dimension", 1)]),
+    IndexSpec("payments", [("patient_id", 1), ("received_at", 1)]),
+    IndexSpec("payments", [("reference", 1)], unique=True),
+    IndexSpec("payments", [("applied", 1)], partial={"applied": False}, name="unapplied"),
+    IndexSpec("archived_patients", [("patient_id", 1)], unique=True),
+    IndexSpec("archived_billing", [("patient_id", 1)]),
+    IndexSpec("daily_rollups", [("dimension", 1), ("day", 1)]),
+    IndexSpec("patient_history", [("patient_id", 1), ("at", 1), ("_id", 1)]),
+]
+
+
+def schema_version(collections: Dict[str, Any], specs: Optional[List[IndexSpec]] = None) -> str:
+    """Fingerprint of the declared indexes on ``collections``
+
+    Stored after a successful sync; start-up skips index verification while
+    the stored value matches, and any change to ``INDEXES`` changes it.
+    """
+    specs = INDEXES if specs is None else specs
+    declared = sorted(repr(tuple(spec)) for spec in specs if spec.collection in collections)
+    return hashlib.sha1("\n".join(declared).encode("utf-8")).hexdigest()[:16]
+
+
+class QueryShape(NamedTuple):
+    """A query the application issues, with representative values"""
+    name: str
+    collection: str
+    filter: Dict
+    sort: Optional[List[Tuple[str, int]]] = None
+    limit: int = 0
+    projection: Optional[Dict] = None
+
+
+def query_shapes(patient_id: str = "PAT00000000") -> List[QueryShape]:
+    """Every query shape issued by the app, its subsystems and the CLIs"""
+    by_id = {"patient_id": patient_id}
+    keyset = [("patient_id", 1)]
+    after = {"patient_id": {"$gt": patient_id}}
+    now = datetime.now()
+    return [
+        QueryShape("patient by id", "patients", by_id),
+        QueryShape("active patient by id", "patients", dict(by_id, **ACTIVE)),
+        QueryShape("search: id prefix", "patients", {"patient_id": {"$regex": "^PAT0"}},
+                   limit=100, projection=LISTING_PROJECTION),
+        QueryShape("search: name prefix", "patients", {"search.name": {"$regex": "^ab"}},
+                   [("search.name", 1)], 100, LISTING_PROJECTION),
+        QueryShape("search: token prefix", "patients",
+                   {"search.tokens": {"$regex": "^ab"},
+                    "$and": [{"search.tokens": {"$regex": "^pa"}}]},
+                   limit=100, projection=LISTING_PROJECTION),
+        QueryShape("listing: all", "patients", dict(after), keyset, 50, SUMMARY_PROJECTION),
+        QueryShape("listing: by status", "patients", dict(listing_filter("Active"), **after),
+                   keyset, 50, SUMMARY_PROJECTION),
+        QueryShape("listing: by doctor", "patients",
+                   dict(listing_filter(doctor="Dr. House"), **after), keyset, 50,
+                   SUMMARY_PROJECTION),
+        QueryShape("listing: by admission type", "patients",
+                   dict(listing_filter(admission_type="ICU"), **after), keyset, 50,
+                   SUMMARY_PROJECTION),
+        QueryShape("listing: active in room", "patients",
+                   listing_filter("Active", room_number="204"), keyset, 50, SUMMARY_PROJECTION),
+        QueryShape("admissions in period", "patients",
+                   {"admission_info.admission_date": {"$gte": now - timedelta(days=1),
+                                                      "$lt": now}}),
+        QueryShape("discharge batch outcome", "patients",
+                   {"patient_id": {"$in": [patient_id, "PAT00000001"]}}),
+        QueryShape("bill by patient", "billing", by_id),
+        QueryShape("bills for page", "billing", {"patient_id": {"$in": [patient_id]}}),
+        QueryShape("bills by status", "billing", {"status": "Generated"}),
+        QueryShape("pending charges for page", "charges",
+                   {"patient_id": {"$in": [patient_id]}, "status": "Pending"}),
+        QueryShape("census counter", "census", {"_id": "room_number:204"}),
+        QueryShape("census dimension", "census", {"dimension": "room_number"}),
+        QueryShape("payments for patient", "payments", by_id, [("received_at", 1)]),
+        QueryShape("payment by reference", "payments", {"reference": "RCPT-0001"}),
+        QueryShape("unapplied payments", "payments", {"applied": False}),
+        QueryShape("receivables day", "receivables", {"_id": "ICU:2026-01-03"}),
+        QueryShape("archive candidates", "patients",
+                   {"admission_info.status": "Discharged",
+                    "admission_info.discharge_date": {"$lt": now - timedelta(days=180)},
+                    "billing_info.outstanding_amount": {"$lte": 0}, **after}, keyset, 500),
+        QueryShape("export: patients by status and period", "patients",
+                   {"admission_info.status": "Discharged",
+                    "admission_info.admission_date": {"$gte": now - timedelta(days=30),
+                                                      "$lt": now}}),
+        QueryShape("export: bills in period", "billing",
+                   {"generated_date": {"$gte": now - timedelta(days=30), "$lt": now}}),
+        QueryShape("id counter", "counters", {"_id": "patient_id"}),
+        QueryShape("archive index entry", "archive_index", {"_id": patient_id}),
+        QueryShape("archived patient by id", "archived_patients", by_id),
+        QueryShape("archived bills by patient", "archived_billing", by_id),
+        QueryShape("first admission", "patients",
+                   {"admission_info.admission_date": {"$exists": True}},
+                   [("admission_info.admission_date", 1)], 1),
+        QueryShape("discharges in period", "patients",
+                   {"admission_info.discharge_date": {"$gte": now - timedelta(days=31),
+                                                      "$lt": now}}),
+        QueryShape("history of patient", "patient_history",
+                   {"patient_id": patient_id, "at": {"$lte": now}}, [("at", -1), ("_id", -1)],
+                   33),
+        QueryShape("rollups in period", "daily_rollups",
+                   {"dimension": "admission_type", "day": {"$gte": "2025-01-01",
+                                                           "$lt": "2026-01-01"}}),
+    ]
+
+
+class SyncReport:
+    """What ``sync_indexes`` changed"""
+
+    def __init__(self):
+        self.created: List[str] = []
+        self.rebuilt: List[str] = []
+        self.dropped: List[str] = []
+        self.unchanged: List[str] = []
+
+    def summary(self) -> str:
+        return (f"{len(self.created)} created, {len(self.rebuilt)} rebuilt, "
+                f"{len(self.dropped)} dropped, {len(self.unchanged)} unchanged")
+
+
+def _definition(info: Dict) -> Tuple:
+    keys = [(field, int(direction)) for field, direction in info["key"]]
+    return keys, bool(info.get("unique", False)), info.get("partialFilterExpression") or None
+
+
+def sync_indexes(collections: Dict[str, Any], specs: Optional[List[IndexSpec]] = None,
+                 drop_extra: bool = False) -> SyncReport:
+    """Make each collection's indexes match the declared ``specs``"""
+    report = SyncReport()
+    specs = INDEXES if specs is None else specs
+    for name, collection in collections.items():
+        declared = [spec for spec in specs if spec.collection == name]
+        existing = collection.index_information()
+        for spec in declared:
+            label = f"{name}.{spec.index_name}"
+            wanted = (list(spec.keys), spec.unique, spec.partial)
+            info = existing.pop(spec.index_name, None)
+            if info is not None and _definition(info) == wanted:
+                report.unchanged.append(label)
+                continue
+            for other, other_info in list(existing.items()):
+                if other != "_id_" and _definition(other_info)[0] == wanted[0]:
+                    collection.drop_index(other)
+                    existing.pop(other)
+                    report.dropped.append(f"{name}.{other}")
+            if info is not None:
+                collection.drop_index(spec.index_name)
+            options: Dict[str, Any] = {"name": spec.index_name, "unique": spec.unique}
+            if spec.partial:
+                options["partialFilterExpression"] = spec.partial
+            collection.create_index(list(spec.keys), **options)
+            (report.rebuilt if info is not None else report.created).append(label)
+        if drop_extra:
+            for other in existing:
+                if other != "_id_":
+                    collection.drop_index(other)
+                    report.dropped.append(f"{name}.{other}")
+    return report
+
+
+class PlanCheck(NamedTuple):
+    shape: QueryShape
+    stages: List[str]
+    indexes: List[str]
+
+    @property
+    def collscan(self) -> bool:
+        return "COLLSCAN" in self.stages
+
+
+def _walk_plan(node: Any, stages: List[str], indexes: List[str]) -> None:
+    if isinstance(node, dict):
+        if "stage" in node:
+            stages.append(node["stage"])
+        if node.get("indexName"):
+            indexes.append(node["indexName"])
+        for value in node.values():
+            _walk_plan(value, stages, indexes)
+    elif isinstance(node, list):
+        for value in node:
+            _walk_plan(value, stages, indexes)
+
+
+def check_plans(collections: Dict[str, Any],
+                shapes: Optional[List[QueryShape]] = None) -> List[PlanCheck]:
+    """Explain each query shape and report the winning plan's stages and indexes
+
+    Shapes on collections missing from ``collections`` (such as the archive
+    collections when archiving to segment files) are skipped.
+    """
+    checks = []
+    for shape in query_shapes() if shapes is None else shapes:
+        if shape.collection not in collections:
+            continue
+        cursor = collections[shape.collection].find(shape.filter, shape.projection)
+        if shape.sort:
+            cursor = cursor.sort(shape.sort)
+        if shape.limit:
+            cursor = cursor.limit(shape.limit)
+        stages: List[str] = []
+        indexes: List[str] = []
+        _walk_plan(cursor.explain().get("queryPlanner", {}).get("winningPlan"), stages, indexes)
+        checks.append(PlanCheck(shape, stages, indexes))
+    return checks
+
+
+def main():
+    from app import HospitalManagementSystem, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Index management and query-plan checks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sync = sub.add_parser("sync", help="create or rebuild the declared indexes")
+    sync.add_argument("--drop-extra", action="store_true",
+                      help="also drop indexes that are not declared")
+    sub.add_parser("check", help="explain every query shape and fail on collection scans")
+    args = parser.parse_args()
+
+    hms = HospitalManagementSystem(backend=backend_from_env())
+    try:
+        if args.command == "sync":
+            report = sync_indexes(hms.collections, drop_extra=args.drop_extra)
+            hms.record_schema_version()
+            for label in report.created + report.rebuilt + report.dropped:
+                print(f"  {label}")
+            print(f"✅ Indexes in sync: {report.summary()}")
+            return
+        checks = check_plans(hms.collections)
+        for check in checks:
+            mark = "❌" if check.collscan else "✅"
+            print(f"{mark} {check.shape.name:<28} {' <- '.join(check.stages):<36} "
+                  f"{', '.join(check.indexes)}")
+        scans = [check for check in checks if check.collscan]
+        if scans:
+            print(f"❌ {len(scans)} query shape(s) fall back to a collection scan")
+            sys.exit(1)
+        print(f"✅ All {len(checks)} query shapes use an index")
+    finally:
+        hms.close()
+
+
+if __name__ == "__main__":
+    main()
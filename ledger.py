@@ -0,0 +1,329 @@
+"""Payments ledger and hospital-wide receivables.
+
+Every payment or refund is appended to the ``payments`` collection; only
+its ``applied`` flag changes afterwards::
+
+    {"patient_id": "PATB221D700", "amount": 5000.0, "kind": "payment",
+     "method": "card", "reference": "...", "received_at": ..., "applied": True}
+
+Recording one also ``$inc``s the patient's ``billing_info.paid_amount`` and
+``outstanding_amount`` in a single write, so a balance is read from the
+patient document instead of re-summing bills and payments.  The unique
+``reference`` makes a retried payment a no-op.  The balance write is keyed
+on the entry's ID, which it adds to ``billing_info.payment_ids``, so it can
+be repeated safely: entries left ``applied: False`` by a crash between the
+two writes are applied by ``reconcile`` when the application starts.
+
+Hospital-wide receivables are kept in the ``receivables`` collection, one
+small document per admission type and billing day::
+
+    {"_id": "ICU:2026-01-03", "admission_type": "ICU", "billed_on": "2026-01-03",
+     "billed": 31500.0, "paid": 10000.0, "outstanding": 21500.0}
+
+``PaymentLedger.record`` is registered as a ``PatientOperations`` listener
+and applies the change of each bill or payment with ``$inc`` upserts;
+``receivables`` folds the day documents into ageing buckets at read time.
+``rebuild`` recomputes patient balances from the bills and the ledger, then
+the receivables from the patients, and corrects anything that drifted.
+
+    python ledger.py pay PATB221D700 5000 --method card
+    python ledger.py balance PATB221D700
+    python ledger.py receivables
+    python ledger.py rebuild --check
+"""
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from metrics import timed
+from operations import CONFLICT, NOT_FOUND, OperationResult, PatientOperations
+
+UNBILLED = "unbilled"
+AGEING_BUCKETS = ((30, "0-30"), (60, "31-60"), (90, "61-90"), (None, "90+"))
+BALANCE_FIELDS = ("billed", "paid", "outstanding")
+BALANCE_PROJECTION = {"_id": 0, "patient_id": 1, "admission_info.admission_type": 1,
+                      "billing_info": 1}
+
+
+def receivable_key(patient: Optional[Dict]) -> Optional[Tuple[str, str]]:
+    """(admission type, billing day) a patient's balance is aged under"""
+    if not patient:
+        return None
+    billing = patient.get("billing_info") or {}
+    if not any(billing.get(f) for f in ("total_amount", "paid_amount", "outstanding_amount")):
+        return None
+    admission_type = (patient.get("admission_info") or {}).get("admission_type") or "Unknown"
+    return admission_type, billing.get("billed_on") or UNBILLED
+
+
+def contribution(patient: Optional[Dict]) -> Dict[Tuple[str, str], Tuple[float, float, float]]:
+    """What one patient adds to the receivables, as (billed, paid, outstanding)"""
+    key = receivable_key(patient)
+    if key is None:
+        return {}
+    billing = patient["billing_info"]
+    return {key: (billing.get("total_amount") or 0.0, billing.get("paid_amount") or 0.0,
+                  billing.get("outstanding_amount") or 0.0)}
+
+
+def ageing_bucket(billed_on: str, now: datetime) -> str:
+    if billed_on == UNBILLED:
+        return UNBILLED
+    age = (now - datetime.strptime(billed_on, "%Y-%m-%d")).days
+    for limit, label in AGEING_BUCKETS:
+        if limit is None or age <= limit:
+            return label
+    return AGEING_BUCKETS[-1][1]
+
+
+def payment_entry(patient_id: str, amount: float, kind: str = "payment",
+                  method: str = "cash", reference: Optional[str] = None,
+                  received_at: Optional[datetime] = None) -> Dict:
+    """Ledger document for one payment (or, with a negative amount, a refund)"""
+    return {
+        "patient_id": patient_id,
+        "amount": float(amount),
+        "kind": kind,
+        "method": method,
+        "reference": reference or str(ObjectId()),
+        "received_at": received_at or datetime.now()
+    }
+
+
+class PaymentLedger:
+    """Append-only payments plus O(1) balances and receivables"""
+
+    def __init__(self, payments_collection, receivables_collection, patients_collection,
+                 billing_collection, operations: PatientOperations):
+        self.payments_collection = payments_collection
+        self.receivables_collection = receivables_collection
+        self.patients_collection = patients_collection
+        self.billing_collection = billing_collection
+        self.operations = operations
+
+    @timed("ledger_record")
+    def record(self, event: str, before: Optional[Dict], after: Optional[Dict]) -> None:
+        """``PatientOperations`` listener: move the receivables by one write's change"""
+        self.apply_changes([(before, after)])
+
+    def apply_changes(self, changes: Iterable[Tuple[Optional[Dict], Optional[Dict]]]) -> None:
+        """Apply the receivables delta of many (before, after) patient pairs in one bulk write"""
+        delta: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0.0, 0.0, 0.0])
+        for before, after in changes:
+            for sign, patient in ((1, after), (-1, before)):
+                for key, amounts in contribution(patient).items():
+                    totals = delta[key]
+                    for i, amount in enumerate(amounts):
+                        totals[i] += sign * amount
+        now = datetime.now()
+        ops = [UpdateOne({"_id": f"{admission_type}:{billed_on}"},
+                         {"$inc": dict(zip(BALANCE_FIELDS, amounts)),
+                          "$set": {"updated_at": now},
+                          "$setOnInsert": {"admission_type": admission_type,
+                                           "billed_on": billed_on}},
+                         upsert=True)
+               for (admission_type, billed_on), amounts in delta.items() if any(amounts)]
+        if ops:
+            self.receivables_collection.bulk_write(ops, ordered=False)
+
+    def record_payment(self, patient_id: str, amount: float, method: str = "cash",
+                       reference: Optional[str] = None, now: Optional[datetime] = None,
+                       kind: str = "payment") -> OperationResult:
+        """Append a payment and apply it to the patient's balance
+
+        The ledger entry is written first, not yet applied, so a retry with
+        the same ``reference`` is rejected before the balance moves twice.
+        """
+        if kind == "payment" and amount <= 0:
+            raise ValueError("Payment amount must be positive")
+        entry = dict(payment_entry(patient_id, amount, kind, method, reference, now),
+                     applied=False)
+        try:
+            self.payments_collection.insert_one(entry)
+        except DuplicateKeyError:
+            return OperationResult(CONFLICT, None,
+                                   f"Payment {entry['reference']} was already recorded")
+        return self._apply(entry, now)
+
+    def _apply(self, entry: Dict, now: Optional[datetime] = None) -> OperationResult:
+        """Apply one ledger entry to the balance (at most once) and mark it applied"""
+        result = self.operations.apply_payment(entry["patient_id"], entry["amount"], now,
+                                               payment_id=entry["_id"])
+        if result.status == NOT_FOUND:
+            self.payments_collection.delete_one({"_id": entry["_id"]})
+        else:
+            self.payments_collection.update_one({"_id": entry["_id"]},
+                                                {"$set": {"applied": True}})
+        return result
+
+    def reconcile(self) -> int:
+        """Apply entries whose balance update did not complete; returns how many"""
+        entries = list(self.payments_collection.find({"applied": False}))
+        for entry in entries:
+            self._apply(entry)
+        return len(entries)
+
+    def record_refund(self, patient_id: str, amount: float, method: str = "cash",
+                      reference: Optional[str] = None,
+                      now: Optional[datetime] = None) -> OperationResult:
+        """Refund ``amount`` (a positive number) to the patient"""
+        if amount <= 0:
+            raise ValueError("Refund amount must be positive")
+        return self.record_payment(patient_id, -amount, method, reference, now, kind="refund")
+
+    def balance(self, patient_id: str) -> Optional[Dict]:
+        """The patient's billing_info (total, paid, outstanding) or None"""
+        patient = self.patients_collection.find_one({"patient_id": patient_id},
+                                                    {"_id": 0, "billing_info": 1})
+        return patient.get("billing_info", {}) if patient else None
+
+    def history(self, patient_id: str) -> List[Dict]:
+        """Ledger entries of one patient, oldest first"""
+        return list(self.payments_collection.find({"patient_id": patient_id}, {"_id": 0})
+                    .sort("received_at", 1))
+
+    @timed("ledger_receivables")
+    def receivables(self, now: Optional[datetime] = None) -> Dict[str, Dict[str, Dict]]:
+        """Billed, paid and outstanding totals per admission type and ageing bucket"""
+        now = now or datetime.now()
+        report: Dict[str, Dict[str, Dict]] = {}
+        for day in self.receivables_collection.find({}, {"_id": 0, "admission_type": 1,
+                                                         "billed_on": 1, "billed": 1,
+                                                         "paid": 1, "outstanding": 1}):
+            bucket = report.setdefault(day["admission_type"], {}).setdefault(
+                ageing_bucket(day["billed_on"], now), dict.fromkeys(BALANCE_FIELDS, 0.0))
+            for field in BALANCE_FIELDS:
+                bucket[field] += day.get(field, 0.0)
+        return report
+
+    def _expected_balances(self, patient: Dict, bills: Dict[str, Dict],
+                           paid: Dict[str, float]) -> Dict:
+        billing = patient.get("billing_info") or {}
+        bill = bills.get(patient["patient_id"])
+        total = bill["total_amount"] if bill else billing.get("total_amount", 0.0)
+        expected = {"total_amount": total,
+                    "paid_amount": paid.get(patient["patient_id"], 0.0),
+                    "outstanding_amount": total - paid.get(patient["patient_id"], 0.0)}
+        if bill and not billing.get("billed_on"):
+            expected["billed_on"] = bill["generated_date"].strftime("%Y-%m-%d")
+        return expected
+
+    @timed("ledger_rebuild")
+    def rebuild(self, check: bool = False) -> Dict[str, int]:
+        """Recompute balances from bills and the ledger, then the receivables
+
+        Corrections are written as absolute values, so run this while writes
+        are quiet.  With ``check`` nothing is written and only the counts of
+        drifted patients and receivables documents are returned.
+        """
+        paid = {group["_id"]: group["amount"] for group in self.payments_collection.aggregate(
+            [{"$group": {"_id": "$patient_id", "amount": {"$sum": "$amount"}}}])}
+        bills = {bill["patient_id"]: bill for bill in self.billing_collection.find(
+            {}, {"_id": 0, "patient_id": 1, "total_amount": 1, "generated_date": 1})}
+
+        patient_ops = []
+        receivables: Dict[str, Dict] = {}
+        for patient in self.patients_collection.find({}, BALANCE_PROJECTION):
+            billing = patient.get("billing_info") or {}
+            expected = self._expected_balances(patient, bills, paid)
+            changed = {f"billing_info.{field}": value for field, value in expected.items()
+                       if billing.get(field) != value}
+            if changed:
+                patient_ops.append(UpdateOne({"patient_id": patient["patient_id"]},
+                                             {"$set": changed}))
+                billing = {**billing, **expected}
+            for (admission_type, billed_on), amounts in contribution(
+                    {**patient, "billing_info": billing}).items():
+                day = receivables.setdefault(f"{admission_type}:{billed_on}", {
+                    "admission_type": admission_type, "billed_on": billed_on,
+                    **dict.fromkeys(BALANCE_FIELDS, 0.0)})
+                for field, amount in zip(BALANCE_FIELDS, amounts):
+                    day[field] += amount
+
+        stored = {day["_id"]: day for day in self.receivables_collection.find({})}
+        now = datetime.now()
+        receivable_ops = []
+        for day_id in set(stored) | set(receivables):
+            actual = receivables.get(day_id)
+            current = stored.get(day_id)
+            if actual is None:
+                if any(abs(current.get(f, 0.0)) > 0.005 for f in BALANCE_FIELDS):
+                    receivable_ops.append(DeleteOne({"_id": day_id}))
+            elif current is None or any(abs(current.get(f, 0.0) - actual[f]) > 0.005
+                                        for f in BALANCE_FIELDS):
+                receivable_ops.append(UpdateOne({"_id": day_id},
+                                                {"$set": {**actual, "updated_at": now}},
+                                                upsert=True))
+        if not check:
+            if patient_ops:
+                self.patients_collection.bulk_write(patient_ops, ordered=False)
+                if self.operations.cache is not None:
+                    self.operations.cache.clear()
+            if receivable_ops:
+                self.receivables_collection.bulk_write(receivable_ops, ordered=False)
+        return {"patients": len(patient_ops), "receivables": len(receivable_ops)}
+
+
+def main():
+    from app import HospitalManagementSystem, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Payments ledger and receivables")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("pay", "record a payment"), ("refund", "record a refund")):
+        entry = sub.add_parser(name, help=help_text)
+        entry.add_argument("patient_id")
+        entry.add_argument("amount", type=float)
+        entry.add_argument("--method", default="cash")
+        entry.add_argument("--reference", help="idempotency key (receipt or transaction id)")
+    balance = sub.add_parser("balance", help="show a patient's balance and payments")
+    balance.add_argument("patient_id")
+    sub.add_parser("receivables", help="totals per admission type and ageing bucket")
+    rebuild = sub.add_parser("rebuild", help="recompute balances from bills and the ledger")
+    rebuild.add_argument("--check", action="store_true",
+                         help="only report drift, do not correct it")
+    args = parser.parse_args()
+
+    hms = HospitalManagementSystem(backend=backend_from_env())
+    try:
+        if args.command in ("pay", "refund"):
+            record = hms.ledger.record_payment if args.command == "pay" else hms.ledger.record_refund
+            result = record(args.patient_id, args.amount, args.method, args.reference)
+            if result.ok:
+                billing = result.patient["billing_info"]
+                print(f"✅ {args.command.title()} of ₹{args.amount:,.2f} recorded; "
+                      f"outstanding ₹{billing['outstanding_amount']:,.2f}")
+            else:
+                print(f"❌ {result.message}")
+        elif args.command == "balance":
+            billing = hms.ledger.balance(args.patient_id)
+            if billing is None:
+                print("❌ Patient not found!")
+                return
+            for field in ("total_amount", "paid_amount", "outstanding_amount"):
+                print(f"  {field:<20} ₹{billing.get(field, 0.0):>14,.2f}")
+            for entry in hms.ledger.history(args.patient_id):
+                print(f"  {entry['received_at']:%Y-%m-%d %H:%M}  {entry['kind']:<8} "
+                      f"₹{entry['amount']:>12,.2f}  {entry['method']}  {entry['reference']}")
+        elif args.command == "receivables":
+            for admission_type, buckets in sorted(hms.ledger.receivables().items()):
+                print(f"{admission_type}:")
+                for bucket, totals in sorted(buckets.items()):
+                    print(f"  {bucket:<9} billed ₹{totals['billed']:>14,.2f}  "
+                          f"paid ₹{totals['paid']:>14,.2f}  "
+                          f"outstanding ₹{totals['outstanding']:>14,.2f}")
+        else:
+            drifted = hms.ledger.rebuild(check=args.check)
+            verb = "found" if args.check else "corrected"
+            print(f"✅ {drifted['patients']} patient balance(s) and {drifted['receivables']} "
+                  f"receivables document(s) {verb}")
+    finally:
+        hms.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Streaming, paginated patient listing.
+
+Pages are fetched with keyset pagination on the unique ``patient_id`` index
+(``patient_id > last_seen`` sorted ascending) and a server-side projection,
+so memory use is bounded by the page size no matter how large the
+collection is.
+"""
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from metrics import timed
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+SUMMARY_PROJECTION = {
+    "_id": 0,
+    "patient_id": 1,
+    "personal_info.name": 1,
+    "admission_info.status": 1,
+    "admission_info.admission_type": 1,
+    "admission_info.assigned_doctor": 1,
+    "admission_info.room_number": 1,
+}
+
+
+def listing_filter(status: Optional[str] = None, doctor: Optional[str] = None,
+                   admission_type: Optional[str] = None,
+                   room_number: Optional[str] = None) -> Dict:
+    """Translate listing filters into a patients query"""
+    query: Dict = {}
+    if status:
+        query["admission_info.status"] = status
+    if doctor:
+        query["admission_info.assigned_doctor"] = doctor
+    if admission_type:
+        query["admission_info.admission_type"] = admission_type
+    if room_number:
+        query["admission_info.room_number"] = room_number
+    return query
+
+
+class PatientListing:
+    """Keyset-paginated, projected reads over the patients collection"""
+
+    def __init__(self, patients_collection):
+        self.patients_collection = patients_collection
+
+    @timed("list_page")
+    def page(self, after: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+             projection: Optional[Dict] = None, **filters) -> Tuple[List[Dict], Optional[str]]:
+        """Return one page and the ``after`` token for the next one (None at the end)"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query = listing_filter(**filters)
+        if after is not None:
+            query["patient_id"] = {"$gt": after}
+        fields = dict(projection or SUMMARY_PROJECTION)
+        fields["patient_id"] = 1
+        cursor = self.patients_collection.find(query, fields).sort("patient_id", 1) \
+            .limit(limit).batch_size(limit)
+        patients = list(cursor)
+        next_after = patients[-1]["patient_id"] if len(patients) == limit else None
+        return patients, next_after
+
+    def iter_pages(self, page_size: int = DEFAULT_PAGE_SIZE, projection: Optional[Dict] = None,
+                   **filters) -> Iterator[List[Dict]]:
+        """Yield successive pages until the listing is exhausted"""
+        after = None
+        while True:
+            patients, after = self.page(after, page_size, projection, **filters)
+            if patients:
+                yield patients
+            if after is None:
+                return
+
+    def iter_patients(self, batch_size: int = 500, projection: Optional[Dict] = None,
+                      **filters) -> Iterator[Dict]:
+        """Stream every matching patient, one bounded page at a time"""
+        for patients in self.iter_pages(batch_size, projection, **filters):
+            yield from patients
+
+    def count(self, **filters) -> int:
+        query = listing_filter(**filters)
+        if not query:
+            return self.patients_collection.estimated_document_count()
+        return self.patients_collection.count_documents(query)
@@ -0,0 +1,361 @@
+"""Latency instrumentation and metrics export.
+
+``METRICS`` is the process-wide registry.  Operations decorated with
+``timed(name)`` record their latency in a histogram (and count errors);
+``CommandMetrics`` is a pymongo command listener that records per-command
+latency, document counts and bytes on the wire.  Any operation or command
+slower than ``slow_ms`` is appended to a bounded slow log and logged on the
+``hms.slow`` logger.  ``serve`` exposes everything over HTTP:
+
+    /metrics        Prometheus text format
+    /metrics.json   JSON snapshot
+    /slow           recent slow operations (JSON)
+
+    HMS_METRICS_PORT=9464 HMS_SLOW_MS=50 python app.py
+"""
+import functools
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import bson
+from pymongo import monitoring
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_SLOW_MS = 100.0
+SLOW_LOG_SIZE = 200
+
+slow_logger = logging.getLogger("hms.slow")
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (seconds)"""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        index = 0
+        while index < len(self.buckets) and seconds > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the ``fraction`` quantile"""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum_ms": self.sum * 1000,
+            "mean_ms": self.sum / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max * 1000,
+            "p50_ms": self.quantile(0.50) * 1000,
+            "p90_ms": self.quantile(0.90) * 1000,
+            "p99_ms": self.quantile(0.99) * 1000,
+        }
+
+
+class Metrics:
+    """Operation and command histograms, counters and the slow-operation log"""
+
+    def __init__(self, slow_ms: float = DEFAULT_SLOW_MS, slow_log_size: int = SLOW_LOG_SIZE):
+        self.slow_ms = slow_ms
+        self.operations: Dict[str, Histogram] = {}
+        self.operation_errors: Dict[str, int] = {}
+        self.commands: Dict[str, Histogram] = {}
+        self.command_failures: Dict[str, int] = {}
+        self.command_documents: Dict[str, int] = {}
+        self.command_bytes: Dict[Tuple[str, str], int] = {}
+        self.slow_log: deque = deque(maxlen=slow_log_size)
+        self.slow_total = 0
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float, failed: bool = False,
+                detail: str = "") -> None:
+        """Record one operation"""
+        with self._lock:
+            histogram = self.operations.get(name)
+            if histogram is None:
+                histogram = self.operations[name] = Histogram()
+            histogram.observe(seconds)
+            if failed:
+                self.operation_errors[name] = self.operation_errors.get(name, 0) + 1
+        self._check_slow("operation", name, seconds, detail)
+
+    def observe_command(self, name: str, seconds: float, documents: int = 0,
+                        bytes_sent: int = 0, bytes_received: int = 0, failed: bool = False,
+                        detail: str = "") -> None:
+        """Record one database command"""
+        with self._lock:
+            histogram = self.commands.get(name)
+            if histogram is None:
+                histogram = self.commands[name] = Histogram()
+            histogram.observe(seconds)
+            if failed:
+                self.command_failures[name] = self.command_failures.get(name, 0) + 1
+            self.command_documents[name] = self.command_documents.get(name, 0) + documents
+            for direction, amount in (("sent", bytes_sent), ("received", bytes_received)):
+                key = (name, direction)
+                self.command_bytes[key] = self.command_bytes.get(key, 0) + amount
+        self._check_slow("command", name, seconds, detail)
+
+    def _check_slow(self, kind: str, name: str, seconds: float, detail: str) -> None:
+        elapsed_ms = seconds * 1000
+        if elapsed_ms < self.slow_ms:
+            return
+        entry = {"at": datetime.now().isoformat(timespec="milliseconds"), "kind": kind,
+                 "name": name, "ms": round(elapsed_ms, 3), "detail": detail}
+        with self._lock:
+            self.slow_log.append(entry)
+            self.slow_total += 1
+        slow_logger.warning("slow %s %s took %.1fms %s", kind, name, elapsed_ms, detail)
+
+    def timer(self, name: str, detail: str = "") -> "_Timer":
+        """Context manager that records the enclosed block as operation ``name``"""
+        return _Timer(self, name, detail)
+
+    def reset(self) -> None:
+        with self._lock:
+            for table in (self.operations, self.operation_errors, self.commands,
+                          self.command_failures, self.command_documents, self.command_bytes):
+                table.clear()
+            self.slow_log.clear()
+            self.slow_total = 0
+
+    def snapshot(self) -> Dict:
+        """Everything as plain JSON-serialisable data"""
+        with self._lock:
+            return {
+                "operations": {name: dict(h.snapshot(), errors=self.operation_errors.get(name, 0))
+                               for name, h in sorted(self.operations.items())},
+                "commands": {name: dict(h.snapshot(),
+                                        failures=self.command_failures.get(name, 0),
+                                        documents=self.command_documents.get(name, 0),
+                                        bytes_sent=self.command_bytes.get((name, "sent"), 0),
+                                        bytes_received=self.command_bytes.get((name, "received"), 0))
+                             for name, h in sorted(self.commands.items())},
+                "slow": {"threshold_ms": self.slow_ms, "total": self.slow_total,
+                         "recent": list(self.slow_log)},
+            }
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            _histogram_lines(lines, "hms_operation_seconds", "operation", self.operations,
+                             "Latency of application operations")
+            _counter_lines(lines, "hms_operation_errors_total", "Operations that raised",
+                           {(("operation", k),): v for k, v in self.operation_errors.items()})
+            _histogram_lines(lines, "hms_db_command_seconds", "command", self.commands,
+                             "Latency of database commands")
+            _counter_lines(lines, "hms_db_command_failures_total", "Failed database commands",
+                           {(("command", k),): v for k, v in self.command_failures.items()})
+            _counter_lines(lines, "hms_db_command_documents_total",
+                           "Documents returned or written by database commands",
+                           {(("command", k),): v for k, v in self.command_documents.items()})
+            _counter_lines(lines, "hms_db_command_bytes_total",
+                           "Bytes sent to and received from the database",
+                           {(("command", c), ("direction", d)): v
+                            for (c, d), v in self.command_bytes.items()})
+            _counter_lines(lines, "hms_slow_operations_total",
+                           f"Operations and commands slower than {self.slow_ms:g}ms",
+                           {(): self.slow_total})
+        return "\n".join(lines) + "\n"
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def _histogram_lines(lines: List[str], metric: str, label: str,
+                     histograms: Dict[str, Histogram], help_text: str) -> None:
+    lines.append(f"# HELP {metric} {help_text}")
+    lines.append(f"# TYPE {metric} histogram")
+    for name, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"{metric}_bucket{_labels([(label, name), ('le', le)])} {cumulative}")
+        lines.append(f"{metric}_sum{_labels([(label, name)])} {histogram.sum:.6f}")
+        lines.append(f"{metric}_count{_labels([(label, name)])} {histogram.count}")
+
+
+def _counter_lines(lines: List[str], metric: str, help_text: str, values: Dict) -> None:
+    lines.append(f"# HELP {metric} {help_text}")
+    lines.append(f"# TYPE {metric} counter")
+    for labels, value in sorted(values.items()):
+        lines.append(f"{metric}{_labels(labels)} {value}")
+
+
+class _Timer:
+    def __init__(self, metrics: Metrics, name: str, detail: str):
+        self.metrics = metrics
+        self.name = name
+        self.detail = detail
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.metrics.observe(self.name, time.perf_counter() - self.started,
+                             failed=exc_type is not None, detail=self.detail)
+
+
+METRICS = Metrics()
+
+# Slow-log details are served over HTTP, so they name patients only by ID
+_PATIENT_ID = re.compile(r"^PAT[0-9A-F]{8,10}$")
+
+
+def _patient_id(value: Any) -> Optional[str]:
+    if isinstance(value, dict):
+        value = value.get("patient_id")
+    return value if isinstance(value, str) and _PATIENT_ID.match(value) else None
+
+
+def _safe_detail(args: Tuple) -> str:
+    """Patient IDs among a call's arguments; never the arguments themselves"""
+    ids = [pid for pid in map(_patient_id, args) if pid]
+    return f"patient_id={ids[0]}" if ids else ""
+
+
+def timed(name: str, metrics: Optional[Metrics] = None) -> Callable:
+    """Decorator recording each call's latency as operation ``name``"""
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            registry = metrics or METRICS
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                elapsed = time.perf_counter() - started
+                detail = ""
+                if elapsed * 1000 >= registry.slow_ms:
+                    detail = _safe_detail(args[1:3])
+                registry.observe(name, elapsed, failed, detail)
+        return wrapper
+    return decorate
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """pymongo command listener feeding ``Metrics``
+
+    Pass it to ``MongoClient(event_listeners=[...])`` (``MongoBackend``
+    forwards client options).  Measuring bytes re-encodes each command and
+    reply, so it can be switched off on very hot paths.
+    """
+
+    def __init__(self, metrics: Optional[Metrics] = None, measure_bytes: bool = True):
+        self.metrics = metrics or METRICS
+        self.measure_bytes = measure_bytes
+        self._sent: Dict[Tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, event) -> Tuple:
+        return event.connection_id, event.request_id
+
+    def started(self, event) -> None:
+        if self.measure_bytes:
+            size = len(bson.encode(event.command))
+            with self._lock:
+                self._sent[self._key(event)] = size
+
+    def succeeded(self, event) -> None:
+        with self._lock:
+            sent = self._sent.pop(self._key(event), 0)
+        received = len(bson.encode(event.reply)) if self.measure_bytes else 0
+        self.metrics.observe_command(event.command_name, event.duration_micros / 1e6,
+                                     _reply_documents(event.reply), sent, received,
+                                     detail=event.database_name)
+
+    def failed(self, event) -> None:
+        with self._lock:
+            sent = self._sent.pop(self._key(event), 0)
+        self.metrics.observe_command(event.command_name, event.duration_micros / 1e6,
+                                     bytes_sent=sent, failed=True,
+                                     detail=_failure_code(event.failure))
+
+
+def _failure_code(failure: Any) -> str:
+    """Error code of a failed command (the message may quote documents)"""
+    if isinstance(failure, dict):
+        return str(failure.get("codeName") or failure.get("code") or "error")
+    return "error"
+
+
+def _reply_documents(reply: Dict) -> int:
+    """Documents returned (cursor batches) or affected (write ``n``) by a command"""
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    n = reply.get("n")
+    return n if isinstance(n, int) else 0
+
+
+def serve(port: int, host: str = "127.0.0.1", metrics: Optional[Metrics] = None):
+    """Start the metrics endpoint on a daemon thread; returns the server"""
+    # Imported here so processes that never serve metrics don't pay for http.server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    served = metrics or METRICS
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        metrics: Metrics = served
+
+        def do_GET(self) -> None:
+            path = self.path.split("?", 1)[0]
+            if path == "/metrics":
+                body, content_type = self.metrics.prometheus(), "text/plain; version=0.0.4"
+            elif path == "/metrics.json":
+                body, content_type = json.dumps(self.metrics.snapshot(), indent=2), \
+                    "application/json"
+            elif path == "/slow":
+                body, content_type = json.dumps(self.metrics.snapshot()["slow"], indent=2), \
+                    "application/json"
+            else:
+                self.send_error(404)
+                return
+            payload = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="hms-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,336 @@
+"""Non-interactive patient operations.
+
+Each operation is a single conditional write (``find_one_and_update``,
+upserts, or one ``bulk_write``) instead of a read followed by a write, so
+two terminals acting on the same patient cannot both succeed.  The losing
+side gets an explicit ``conflict`` result carrying the current state.
+
+Listeners registered with ``add_listener`` are called as
+``listener(event, before, after)`` after every successful onboarding
+(``onboarded``), discharge (``discharged``), field update (``updated``),
+bill (``billed``) and payment (``paid``), which lets derived state such as
+the ward census and receivables follow each write.
+"""
+import copy
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from cache import PatientCache
+from metrics import timed
+from search import ensure_search_keys
+from storage import apply_update
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+NOT_FOUND = "not_found"
+# The write lost a race with another writer; re-reading and retrying may succeed
+CONFLICT = "conflict"
+# The request can never succeed as given (e.g. an unknown admission type)
+INVALID = "invalid"
+# Valid, but a resource it needs is exhausted right now (e.g. no free bed)
+UNAVAILABLE = "unavailable"
+
+ONBOARDED = "onboarded"
+DISCHARGED = "discharged"
+UPDATED = "updated"
+BILLED = "billed"
+PAID = "paid"
+# Written by a bulk import instead of a PatientOperations write
+IMPORTED = "imported"
+
+Listener = Callable[[str, Optional[Dict], Optional[Dict]], None]
+
+
+class OperationResult(NamedTuple):
+    """Outcome of an operation; ``patient`` is the document after a write,
+    or the current document when the write lost a race"""
+    status: str
+    patient: Optional[Dict] = None
+    message: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.status == OK
+
+
+def new_patient_document(patient_id: str, personal_info: Dict, medical_info: Dict,
+                         admission_type: str, assigned_doctor: str, room_number: str,
+                         now: Optional[datetime] = None) -> Dict:
+    """Patient document for a new, active admission"""
+    now = now or datetime.now()
+    patient_data = {
+        "patient_id": patient_id,
+        "personal_info": personal_info,
+        "medical_info": medical_info,
+        "admission_info": {
+            "admission_date": now,
+            "admission_type": admission_type,
+            "assigned_doctor": assigned_doctor,
+            "room_number": room_number,
+            "status": "Active"
+        },
+        "billing_info": {
+            "total_amount": 0.0,
+            "paid_amount": 0.0,
+            "outstanding_amount": 0.0
+        },
+        "created_at": now,
+        "updated_at": now
+    }
+    return ensure_search_keys(patient_data)
+
+
+def to_millis(moment: datetime) -> datetime:
+    """Truncate to BSON date precision so stored values compare equal"""
+    return moment.replace(microsecond=moment.microsecond // 1000 * 1000)
+
+
+class PatientOperations:
+    """Single-round-trip, race-safe writes on patients and bills"""
+
+    def __init__(self, patients_collection, billing_collection,
+                 cache: Optional[PatientCache] = None):
+        self.patients_collection = patients_collection
+        self.billing_collection = billing_collection
+        self.cache = cache
+        self._listeners: List[Listener] = []
+
+    def add_listener(self, listener: Listener) -> None:
+        """Call ``listener(event, before, after)`` after each successful write"""
+        self._listeners.append(listener)
+
+    def _notify(self, event: str, before: Optional[Dict], after: Optional[Dict]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(event, before, after)
+            except Exception:
+                logger.exception("Listener %r failed on %s of %s", listener, event,
+                                 (after or before or {}).get("patient_id"))
+
+    def publish(self, event: str, before: Optional[Dict], after: Optional[Dict]) -> None:
+        """Cache and announce a write made outside this class (the write-behind queue)"""
+        self._remember((after or before or {}).get("patient_id"), after)
+        self._notify(event, before, after)
+
+    def _load(self, patient_id: str) -> Optional[Dict]:
+        return self.patients_collection.find_one({"patient_id": patient_id})
+
+    def _remember(self, patient_id: str, patient: Optional[Dict]) -> None:
+        if self.cache is not None:
+            self.cache.put(patient_id, patient)
+
+    @timed("get_patient")
+    def get_patient(self, patient_id: str, projection: Optional[Dict] = None) -> Optional[Dict]:
+        """Full documents are served read-through from the cache when one is configured"""
+        if projection is not None:
+            return self.patients_collection.find_one({"patient_id": patient_id}, projection)
+        if self.cache is None:
+            return self._load(patient_id)
+        return self.cache.get_or_load(patient_id, self._load)
+
+    @timed("onboard")
+    def onboard(self, patient_data: Dict) -> OperationResult:
+        """Insert a new patient document"""
+        try:
+            self.patients_collection.insert_one(patient_data)
+        except DuplicateKeyError:
+            return OperationResult(CONFLICT, None,
+                                   f"Patient ID {patient_data.get('patient_id')} already exists")
+        self._remember(patient_data["patient_id"], patient_data)
+        self._notify(ONBOARDED, None, patient_data)
+        return OperationResult(OK, patient_data)
+
+    def _explain_miss(self, patient_id: str, reason: str) -> OperationResult:
+        """Distinguish a missing patient from a lost race after a conditional write"""
+        current = self._load(patient_id)
+        self._remember(patient_id, current)
+        if current is None:
+            return OperationResult(NOT_FOUND, None, "Patient not found")
+        return OperationResult(CONFLICT, current, reason.format(patient=current))
+
+    @timed("discharge")
+    def discharge(self, patient_id: str, notes: str = "",
+                  now: Optional[datetime] = None) -> OperationResult:
+        """Discharge a patient only if they are still Active"""
+        now = to_millis(now or datetime.now())
+        update = {"$set": {
+            "admission_info.status": "Discharged",
+            "admission_info.discharge_date": now,
+            "admission_info.discharge_notes": notes,
+            "updated_at": now
+        }}
+        before = self.patients_collection.find_one_and_update(
+            {"patient_id": patient_id, "admission_info.status": "Active"}, update,
+            return_document=ReturnDocument.BEFORE)
+        if before is not None:
+            patient = _updated(before, update)
+            self._remember(patient_id, patient)
+            self._notify(DISCHARGED, before, patient)
+            return OperationResult(OK, patient)
+        return self._explain_miss(
+            patient_id, "Patient is not currently active (status: {patient[admission_info][status]})")
+
+    @timed("discharge_many")
+    def discharge_many(self, patient_ids: Iterable[str], notes: str = "",
+                       now: Optional[datetime] = None) -> Dict[str, str]:
+        """Discharge several patients in one bulk write; returns a status per patient
+
+        Each discharge is tagged with a batch id so that, when some updates do
+        not match, one follow-up read tells which patients this call discharged
+        and which had already been discharged elsewhere.
+        """
+        patient_ids = list(dict.fromkeys(patient_ids))
+        if not patient_ids:
+            return {}
+        now = to_millis(now or datetime.now())
+        batch_id = ObjectId()
+        update = {"$set": {
+            "admission_info.status": "Discharged",
+            "admission_info.discharge_date": now,
+            "admission_info.discharge_notes": notes,
+            "admission_info.discharge_batch": batch_id,
+            "updated_at": now
+        }}
+        result = self.patients_collection.bulk_write(
+            [UpdateOne({"patient_id": pid, "admission_info.status": "Active"}, update)
+             for pid in patient_ids], ordered=False)
+        if self.cache is not None:
+            self.cache.invalidate_many(patient_ids)
+        if result.matched_count == len(patient_ids) and not self._listeners:
+            return dict.fromkeys(patient_ids, OK)
+        outcomes = dict.fromkeys(patient_ids, NOT_FOUND)
+        projection = None if self._listeners else {
+            "_id": 0, "patient_id": 1, "admission_info.discharge_batch": 1}
+        for patient in self.patients_collection.find({"patient_id": {"$in": patient_ids}},
+                                                     projection):
+            tagged = patient.get("admission_info", {}).get("discharge_batch")
+            outcomes[patient["patient_id"]] = OK if tagged == batch_id else CONFLICT
+            if tagged == batch_id and self._listeners:
+                self._notify(DISCHARGED, _active_before_discharge(patient), patient)
+        return outcomes
+
+    @timed("save_bill")
+    def save_bill(self, bill: Dict, now: Optional[datetime] = None) -> OperationResult:
+        """Mirror the bill's total on the patient, then upsert the bill (one write each)
+
+        The outstanding balance becomes the new total minus what the patient
+        has already paid, computed by the server in the same write.  The
+        patient is written first, so no bill is stored for an unknown ID.
+        """
+        now = to_millis(now or datetime.now())
+        patient_id = bill["patient_id"]
+        update = bill_total_update(bill["total_amount"], bill["generated_date"], now)
+        before = self.patients_collection.find_one_and_update(
+            {"patient_id": patient_id}, update, return_document=ReturnDocument.BEFORE)
+        if before is None:
+            self._remember(patient_id, None)
+            return OperationResult(NOT_FOUND, None, "Patient not found")
+        bill_result = self.billing_collection.update_one(
+            {"patient_id": patient_id}, {"$set": bill}, upsert=True)
+        patient = _updated(before, update)
+        self._remember(patient_id, patient)
+        self._notify(BILLED, before, patient)
+        message = "created" if bill_result.upserted_id is not None else "updated"
+        return OperationResult(OK, patient, message)
+
+    @timed("apply_payment")
+    def apply_payment(self, patient_id: str, amount: float, now: Optional[datetime] = None,
+                      payment_id: Any = None) -> OperationResult:
+        """Add ``amount`` to the paid balance and take it off the outstanding one
+
+        With a ``payment_id`` the ID is added to ``billing_info.payment_ids``
+        in the same write, and a payment already listed there is a
+        ``conflict`` instead of being applied twice.
+        """
+        now = to_millis(now or datetime.now())
+        query: Dict[str, Any] = {"patient_id": patient_id}
+        update = {"$inc": {"billing_info.paid_amount": amount,
+                           "billing_info.outstanding_amount": -amount},
+                  "$set": {"updated_at": now}}
+        if payment_id is not None:
+            query["billing_info.payment_ids"] = {"$ne": payment_id}
+            update["$push"] = {"billing_info.payment_ids": payment_id}
+        before = self.patients_collection.find_one_and_update(
+            query, update, return_document=ReturnDocument.BEFORE)
+        if before is None:
+            if payment_id is not None:
+                return self._explain_miss(patient_id, f"Payment {payment_id} was already applied")
+            self._remember(patient_id, None)
+            return OperationResult(NOT_FOUND, None, "Patient not found")
+        patient = _updated(before, update)
+        self._remember(patient_id, patient)
+        self._notify(PAID, before, patient)
+        return OperationResult(OK, patient)
+
+    @timed("update_fields")
+    def update_fields(self, patient_id: str, changes: Dict,
+                      expected: Optional[Dict] = None,
+                      now: Optional[datetime] = None) -> OperationResult:
+        """Apply ``$set`` changes if every ``expected`` field still has its expected value
+
+        Passing the values the clerk saw as ``expected`` turns a concurrent edit
+        of the same fields by another terminal into a ``conflict`` result
+        instead of a silent overwrite.
+        """
+        changes = dict(changes)
+        changes["updated_at"] = to_millis(now or datetime.now())
+        query = {"patient_id": patient_id}
+        query.update(expected or {})
+        update = {"$set": changes}
+        before = self.patients_collection.find_one_and_update(
+            query, update, return_document=ReturnDocument.BEFORE)
+        if before is not None:
+            patient = _updated(before, update)
+            self._remember(patient_id, patient)
+            self._notify(UPDATED, before, patient)
+            return OperationResult(OK, patient)
+        return self._explain_miss(patient_id, "Patient was changed by someone else")
+
+
+def bill_total_update(total: float, billed_at: datetime, now: datetime) -> List[Dict]:
+    """Update pipeline setting a patient's bill total and recomputing what is outstanding
+
+    ``billing_info.billed_on`` records the day the patient was first billed;
+    receivables are aged from it.
+    """
+    return [{"$set": {
+        "billing_info.total_amount": total,
+        "billing_info.outstanding_amount": {
+            "$subtract": [total, {"$ifNull": ["$billing_info.paid_amount", 0]}]},
+        "billing_info.billed_on": {
+            "$ifNull": ["$billing_info.billed_on", billed_at.strftime('%Y-%m-%d')]},
+        "updated_at": now
+    }}]
+
+
+def _updated(before: Dict, update: Any) -> Dict:
+    """The document a conditional write produced, derived from its pre-image"""
+    after = copy.deepcopy(before)
+    apply_update(after, update)
+    return after
+
+
+def _active_before_discharge(patient: Dict) -> Dict:
+    before = copy.deepcopy(patient)
+    admission = before.setdefault("admission_info", {})
+    admission["status"] = "Active"
+    for field in ("discharge_date", "discharge_notes", "discharge_batch"):
+        admission.pop(field, None)
+    return before
+
+
+def expected_values(patient: Dict, fields: List[str]) -> Dict:
+    """Current values of dotted ``fields`` in ``patient``, for ``update_fields``"""
+    expected = {}
+    for field in fields:
+        value = patient
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        expected[field] = value
+    return expected
@@ -0,0 +1,421 @@
+"""Compact in-memory patient representations.
+
+``PatientRecord`` is a slotted, flat record for working with one patient at
+a time.  ``PatientColumns`` holds many patients as one array per field:
+numbers and dates live in ``array`` buffers (dates as epoch milliseconds),
+and repeated strings such as status, admission type and doctor are
+dictionary-encoded into one-byte codes (widened to two or four bytes as
+distinct values grow), so filters and group-bys run over contiguous
+buffers instead of nested dicts.  Ages that are missing, not numbers or
+out of range are stored as unknown.  Both convert to and from the
+MongoDB document shape.
+
+    python records.py --by admission_type --sum outstanding_amount --status Active
+"""
+import argparse
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from itertools import compress
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from search import ensure_search_keys
+
+# (attribute, dotted document path) for every field a patient document carries
+FIELDS: List[Tuple[str, str]] = [
+    ("object_id", "_id"),
+    ("patient_id", "patient_id"),
+    ("name", "personal_info.name"),
+    ("age", "personal_info.age"),
+    ("gender", "personal_info.gender"),
+    ("phone", "personal_info.phone"),
+    ("address", "personal_info.address"),
+    ("emergency_contact", "personal_info.emergency_contact"),
+    ("disease", "medical_info.disease"),
+    ("symptoms", "medical_info.symptoms"),
+    ("allergies", "medical_info.allergies"),
+    ("medical_history", "medical_info.medical_history"),
+    ("admission_date", "admission_info.admission_date"),
+    ("admission_type", "admission_info.admission_type"),
+    ("assigned_doctor", "admission_info.assigned_doctor"),
+    ("room_number", "admission_info.room_number"),
+    ("status", "admission_info.status"),
+    ("discharge_date", "admission_info.discharge_date"),
+    ("discharge_notes", "admission_info.discharge_notes"),
+    ("total_amount", "billing_info.total_amount"),
+    ("paid_amount", "billing_info.paid_amount"),
+    ("outstanding_amount", "billing_info.outstanding_amount"),
+    ("created_at", "created_at"),
+    ("updated_at", "updated_at"),
+]
+_PATHS = {path for _, path in FIELDS}
+_PARENTS = {path.split(".", 1)[0] for path in _PATHS if "." in path}
+# Written back only when present, so documents that never had them round-trip unchanged
+_OPTIONAL = {"_id", "admission_info.discharge_date", "admission_info.discharge_notes"}
+_DERIVED = {"search"}
+
+
+def _getter(path: str):
+    """Fast accessor for a dotted path (None when any part is missing)"""
+    parts = path.split(".")
+    if len(parts) == 1:
+        return lambda doc: doc.get(path)
+    parent, child = ".".join(parts[:-1]), parts[-1]
+    get_parent = _getter(parent)
+
+    def get(doc):
+        value = get_parent(doc)
+        return value.get(child) if isinstance(value, dict) else None
+    return get
+
+
+def _set(doc: Dict, path: str, value: Any) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+_GETTERS = [(attr, _getter(path)) for attr, path in FIELDS]
+
+
+class PatientRecord:
+    """One patient as a flat, slotted object
+
+    Fields the record does not model (e.g. ``admission_info.discharge_batch``)
+    are kept in ``extra`` under their dotted path, so converting a document
+    to a record and back loses nothing but the derived ``search`` keys,
+    which are recomputed.
+    """
+    __slots__ = tuple(attr for attr, _ in FIELDS) + ("extra",)
+
+    object_id: Any
+    patient_id: str
+    name: str
+    age: Optional[int]
+    gender: Optional[str]
+    phone: Optional[str]
+    address: Optional[str]
+    emergency_contact: Optional[str]
+    disease: Optional[str]
+    symptoms: Optional[str]
+    allergies: Optional[str]
+    medical_history: Optional[str]
+    admission_date: Optional[datetime]
+    admission_type: Optional[str]
+    assigned_doctor: Optional[str]
+    room_number: Optional[str]
+    status: Optional[str]
+    discharge_date: Optional[datetime]
+    discharge_notes: Optional[str]
+    total_amount: float
+    paid_amount: float
+    outstanding_amount: float
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+    extra: Optional[Dict[str, Any]]
+
+    def __init__(self, **values):
+        for attr, _ in FIELDS:
+            setattr(self, attr, values.pop(attr, None))
+        self.extra = values.pop("extra", None)
+        if values:
+            raise TypeError(f"Unknown PatientRecord fields: {', '.join(values)}")
+
+    @classmethod
+    def from_document(cls, doc: Dict) -> "PatientRecord":
+        record = cls.__new__(cls)
+        for attr, get in _GETTERS:
+            setattr(record, attr, get(doc))
+        extra = {}
+        for key, value in doc.items():
+            if key in _PARENTS and isinstance(value, dict):
+                for sub, sub_value in value.items():
+                    if f"{key}.{sub}" not in _PATHS:
+                        extra[f"{key}.{sub}"] = sub_value
+            elif key not in _PATHS and key not in _DERIVED:
+                extra[key] = value
+        record.extra = extra or None
+        return record
+
+    def to_document(self) -> Dict:
+        doc: Dict = {}
+        for attr, path in FIELDS:
+            value = getattr(self, attr)
+            if value is None and path in _OPTIONAL:
+                continue
+            _set(doc, path, value)
+        for path, value in (self.extra or {}).items():
+            _set(doc, path, value)
+        return ensure_search_keys(doc)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, PatientRecord):
+            return NotImplemented
+        return all(getattr(self, a) == getattr(other, a) for a in self.__slots__)
+
+    def __repr__(self) -> str:
+        return (f"PatientRecord(patient_id={self.patient_id!r}, name={self.name!r}, "
+                f"status={self.status!r}, admission_type={self.admission_type!r})")
+
+
+EPOCH = datetime(1970, 1, 1)
+NO_DATE = -2 ** 63
+_MS = timedelta(milliseconds=1)
+
+
+def _to_millis(value: Optional[datetime]) -> int:
+    if value is None:
+        return NO_DATE
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // _MS
+
+
+def _from_millis(value: int) -> Optional[datetime]:
+    return None if value == NO_DATE else EPOCH + value * _MS
+
+
+class _Dictionary:
+    """Dictionary-encoded string column: one small integer code per row
+
+    Codes start as bytes and are widened to ``H`` past 256 distinct values
+    and to ``I`` past 65,536.
+    """
+
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self.index: Dict[Optional[str], int] = {}
+        self.codes = array("B")
+
+    def append(self, value: Optional[str]) -> None:
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+            if code > 255 and self.codes.typecode == "B":
+                self.codes = array("H", self.codes)
+            elif code > 0xFFFF and self.codes.typecode == "H":
+                self.codes = array("I", self.codes)
+        self.codes.append(code)
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        return self.values[self.codes[row]]
+
+    def mask(self, value: Optional[str]) -> bytes:
+        """One byte per row, 1 where the row equals ``value``"""
+        code = self.index.get(value)
+        if code is None:
+            return bytes(len(self.codes))
+        if self.codes.typecode == "B":
+            table = bytearray(256)
+            table[code] = 1
+            return self.codes.tobytes().translate(table)
+        return bytes(c == code for c in self.codes)
+
+
+# Columns kept by PatientColumns: (attribute, document path, storage kind)
+COLUMNS: List[Tuple[str, str, str]] = [
+    ("patient_id", "patient_id", "str"),
+    ("name", "personal_info.name", "str"),
+    ("age", "personal_info.age", "int"),
+    ("gender", "personal_info.gender", "dict"),
+    ("disease", "medical_info.disease", "dict"),
+    ("admission_date", "admission_info.admission_date", "date"),
+    ("admission_type", "admission_info.admission_type", "dict"),
+    ("assigned_doctor", "admission_info.assigned_doctor", "dict"),
+    ("room_number", "admission_info.room_number", "dict"),
+    ("status", "admission_info.status", "dict"),
+    ("discharge_date", "admission_info.discharge_date", "date"),
+    ("total_amount", "billing_info.total_amount", "float"),
+    ("paid_amount", "billing_info.paid_amount", "float"),
+    ("outstanding_amount", "billing_info.outstanding_amount", "float"),
+]
+_COLUMN_GETTERS = [(attr, _getter(path), kind) for attr, path, kind in COLUMNS]
+COLUMNS_PROJECTION = dict({"_id": 0}, **{path: 1 for _, path, _ in COLUMNS})
+_NO_AGE = -1
+_MAX_AGE = 2 ** 15 - 1
+# Above this many categories one pass over (code, value) pairs beats a masked pass per category
+_MASKED_GROUPS = 8
+
+
+def _age(value: Any) -> int:
+    """Age for the ``h`` column: missing, non-numeric or out-of-range ages are unknown"""
+    if value is None or isinstance(value, bool):
+        return _NO_AGE
+    try:
+        age = int(value)
+    except (TypeError, ValueError, OverflowError):
+        return _NO_AGE
+    return age if 0 <= age <= _MAX_AGE else _NO_AGE
+
+
+class PatientColumns:
+    """Column-per-field batch of patients for scans and group-bys"""
+
+    def __init__(self):
+        self.columns: Dict[str, Any] = {}
+        self._kinds: Dict[str, str] = {}
+        for attr, _, kind in COLUMNS:
+            self._kinds[attr] = kind
+            if kind == "str":
+                self.columns[attr] = []
+            elif kind == "dict":
+                self.columns[attr] = _Dictionary()
+            elif kind == "int":
+                self.columns[attr] = array("h")
+            elif kind == "date":
+                self.columns[attr] = array("q")
+            else:
+                self.columns[attr] = array("d")
+        self._length = 0
+
+    @classmethod
+    def from_documents(cls, docs: Iterable[Dict]) -> "PatientColumns":
+        batch = cls()
+        for doc in docs:
+            batch.append(doc)
+        return batch
+
+    @classmethod
+    def from_collection(cls, collection, query: Optional[Dict] = None,
+                        batch_size: int = 5000) -> "PatientColumns":
+        """Load the modelled fields of every matching patient with a projection"""
+        cursor = collection.find(query or {}, COLUMNS_PROJECTION).batch_size(batch_size)
+        return cls.from_documents(cursor)
+
+    def append(self, doc: Dict) -> None:
+        for attr, get, kind in _COLUMN_GETTERS:
+            value = get(doc)
+            column = self.columns[attr]
+            if kind == "int":
+                column.append(_age(value))
+            elif kind == "date":
+                column.append(_to_millis(value))
+            elif kind == "float":
+                column.append(0.0 if value is None else float(value))
+            else:
+                column.append(value)
+        self._length += 1
+
+    def __len__(self) -> int:
+        return self._length
+
+    def value(self, attr: str, row: int) -> Any:
+        column = self.columns[attr]
+        kind = self._kinds[attr]
+        if kind == "date":
+            return _from_millis(column[row])
+        if kind == "int":
+            return None if column[row] == _NO_AGE else column[row]
+        return column[row]
+
+    def document(self, row: int) -> Dict:
+        """Row ``row`` in (projected) patient document shape"""
+        doc: Dict = {}
+        for attr, path, _ in COLUMNS:
+            value = self.value(attr, row)
+            if value is None and path == "admission_info.discharge_date":
+                continue
+            _set(doc, path, value)
+        return doc
+
+    def record(self, row: int) -> PatientRecord:
+        return PatientRecord(**{attr: self.value(attr, row) for attr, _, _ in COLUMNS})
+
+    def documents(self) -> Iterator[Dict]:
+        for row in range(self._length):
+            yield self.document(row)
+
+    def categories(self, attr: str) -> List[Optional[str]]:
+        return list(self.columns[attr].values)
+
+    def mask(self, **equals) -> Optional[bytes]:
+        """Row mask (1/0 per row) for dictionary-encoded ``field=value`` filters"""
+        result: Optional[bytes] = None
+        for attr, value in equals.items():
+            if self._kinds.get(attr) != "dict":
+                raise ValueError(f"Can only filter on dictionary-encoded columns, not '{attr}'")
+            mask = self.columns[attr].mask(value)
+            result = mask if result is None else \
+                (int.from_bytes(result, "little") & int.from_bytes(mask, "little")
+                 ).to_bytes(self._length, "little")
+        return result
+
+    def count_by(self, attr: str, **where) -> Dict[Optional[str], int]:
+        """Rows per category of a dictionary-encoded column"""
+        column = self.columns[attr]
+        mask = self.mask(**where)
+        codes = column.codes if mask is None else compress(column.codes, mask)
+        return {column.values[code]: count for code, count in Counter(codes).items()}
+
+    def sum_by(self, attr: str, value_attr: str, **where) -> Dict[Optional[str], float]:
+        """Sum of a numeric column per category of a dictionary-encoded column"""
+        column = self.columns[attr]
+        codes, values = column.codes, self.columns[value_attr]
+        mask = self.mask(**where)
+        if mask is not None:
+            codes = array(codes.typecode, compress(codes, mask))
+            values = array(values.typecode, compress(values, mask))
+        if len(column.values) > _MASKED_GROUPS or codes.typecode != "B":
+            sums = [0.0] * len(column.values)
+            for code, value in zip(codes, values):
+                sums[code] += value
+            return {column.values[code]: total for code, total in enumerate(sums) if total}
+        raw = codes.tobytes()
+        totals = {}
+        for code, category in enumerate(column.values):
+            table = bytearray(256)
+            table[code] = 1
+            total = sum(compress(values, raw.translate(table)))
+            if total:
+                totals[category] = total
+        return totals
+
+    def total(self, value_attr: str, **where) -> float:
+        values = self.columns[value_attr]
+        mask = self.mask(**where)
+        return sum(values if mask is None else compress(values, mask))
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the column buffers (excluding string objects)"""
+        size = 0
+        for attr, column in self.columns.items():
+            if isinstance(column, _Dictionary):
+                size += column.codes.itemsize * len(column.codes)
+            elif isinstance(column, array):
+                size += column.itemsize * len(column)
+            else:
+                size += 8 * len(column)
+        return size
+
+
+def main():
+    from app import HospitalManagementSystem, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Group-by report over all patients")
+    parser.add_argument("--by", default="admission_type",
+                        choices=[attr for attr, _, kind in COLUMNS if kind == "dict"])
+    parser.add_argument("--sum", choices=[attr for attr, _, kind in COLUMNS if kind == "float"],
+                        help="also total this amount per group")
+    parser.add_argument("--status", help="only patients with this status")
+    args = parser.parse_args()
+
+    hms = HospitalManagementSystem(backend=backend_from_env())
+    try:
+        where = {"status": args.status} if args.status else {}
+        batch = PatientColumns.from_collection(hms.patients_collection)
+        counts = batch.count_by(args.by, **where)
+        sums = batch.sum_by(args.by, args.sum, **where) if args.sum else {}
+        print(f"{len(batch):,} patients loaded ({batch.nbytes() / 1e6:,.1f} MB of column buffers)")
+        for category, count in sorted(counts.items(), key=lambda item: -item[1]):
+            line = f"  {str(category):<24} {count:>9,}"
+            if args.sum:
+                line += f"  ₹{sums.get(category, 0.0):>14,.2f}"
+            print(line)
+    finally:
+        hms.close()
+
+
+if __name__ == "__main__":
+    main()
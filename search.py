@@ -0,0 +1,188 @@
+"""Indexed patient search.
+
+Every patient document carries a ``search`` sub-document with a normalized,
+lowercased copy of the name and its tokens::
+
+    "search": {"name": "aby pal", "tokens": ["aby", "pal"]}
+
+Both fields are indexed, and searches use exact ``patient_id`` matches plus
+anchored, case-sensitive prefix expressions, all of which can be answered
+from an index instead of a collection scan.
+"""
+import argparse
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from metrics import timed
+
+DEFAULT_LIMIT = 20
+CANDIDATE_FACTOR = 5
+
+# Terms that can only be a patient ID (hex digits, at least one of them a digit);
+# other "PAT..." terms may be the start of a name, so ID prefixes rank last for them
+PATIENT_ID_PATTERN = re.compile(r"^PAT(?=[0-9A-F]*[0-9])[0-9A-F]+$")
+PATIENT_ID_PREFIX = re.compile(r"^PAT[0-9A-F]*$")
+
+LISTING_PROJECTION = {
+    "_id": 0,
+    "patient_id": 1,
+    "personal_info.name": 1,
+    "medical_info.disease": 1,
+    "admission_info.status": 1,
+    "admission_info.room_number": 1,
+    "admission_info.assigned_doctor": 1,
+    "search": 1,
+}
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, strip accents and collapse punctuation/whitespace to single spaces"""
+    decomposed = unicodedata.normalize("NFKD", name or "")
+    ascii_name = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_WORD.sub(" ", ascii_name.lower()).strip()
+
+
+def search_keys(name: str) -> Dict:
+    """Build the ``search`` sub-document stored alongside a patient"""
+    normalized = normalize_name(name)
+    return {"name": normalized, "tokens": sorted(set(normalized.split()))}
+
+
+def search_key_update(name: str) -> Dict:
+    """``$set`` fields that keep the search keys in step with a renamed patient"""
+    return {"personal_info.name": name, "search": search_keys(name)}
+
+
+def _prefix_filter(field: str, prefix: str) -> Dict:
+    return {field: {"$regex": "^" + re.escape(prefix)}}
+
+
+class PatientSearch:
+    """Ranked, limited patient search backed by indexes"""
+
+    def __init__(self, patients_collection, cache=None):
+        self.patients_collection = patients_collection
+        self.cache = cache
+
+    def ensure_indexes(self) -> None:
+        self.patients_collection.create_index("search.name")
+        self.patients_collection.create_index("search.tokens")
+
+    @timed("search")
+    def search(self, term: str, limit: int = DEFAULT_LIMIT) -> List[Dict]:
+        """Return up to ``limit`` patients ranked by how well they match ``term``
+
+        Ranking: exact patient ID, patient ID prefix, exact name, name prefix,
+        then names whose tokens start with every search word.  A term like
+        "pat" that may be a name or an ID prefix ranks ID prefixes last.
+        """
+        term = (term or "").strip()
+        if not term:
+            return []
+        candidate_limit = max(limit * CANDIDATE_FACTOR, limit)
+        ranked: Dict[str, tuple] = {}
+
+        def offer(rank: int, patient: Dict) -> None:
+            key = patient["patient_id"]
+            entry = (rank, patient.get("search", {}).get("name", ""), key)
+            if key not in ranked or entry < ranked[key][0]:
+                ranked[key] = (entry, patient)
+
+        patient_id = term.upper()
+        if PATIENT_ID_PATTERN.match(patient_id):
+            exact = self.patients_collection.find_one({"patient_id": patient_id},
+                                                      LISTING_PROJECTION)
+            if exact:
+                offer(0, exact)
+            id_prefix_rank = 1
+        else:
+            id_prefix_rank = 5 if PATIENT_ID_PREFIX.match(patient_id) else None
+        if id_prefix_rank is not None:
+            for patient in self.patients_collection.find(
+                    _prefix_filter("patient_id", patient_id), LISTING_PROJECTION
+            ).limit(candidate_limit):
+                offer(id_prefix_rank, patient)
+
+        normalized = normalize_name(term)
+        words = normalized.split()
+        if words:
+            for patient in self.patients_collection.find(
+                    _prefix_filter("search.name", normalized), LISTING_PROJECTION
+            ).sort("search.name", 1).limit(candidate_limit):
+                offer(2 if patient["search"]["name"] == normalized else 3, patient)
+
+            # The longest word drives the index; the others are filtered by the
+            # server too, so common words cannot crowd matches out of the limit
+            anchor = max(words, key=len)
+            query = _prefix_filter("search.tokens", anchor)
+            others = [w for w in words if w != anchor]
+            if others:
+                query["$and"] = [_prefix_filter("search.tokens", w) for w in others]
+            for patient in self.patients_collection.find(
+                    query, LISTING_PROJECTION).limit(candidate_limit):
+                offer(4, patient)
+
+        results = sorted(ranked.values(), key=lambda item: item[0])[:limit]
+        return [patient for _, patient in results]
+
+    def backfill(self, batch_size: int = 1000) -> int:
+        """Add search keys to documents written before they existed"""
+        updated = 0
+        batch: List[UpdateOne] = []
+        patient_ids: List[str] = []
+
+        def write() -> int:
+            modified = self.patients_collection.bulk_write(batch, ordered=False).modified_count
+            if self.cache is not None:
+                self.cache.invalidate_many(patient_ids)
+            batch.clear()
+            patient_ids.clear()
+            return modified
+
+        cursor = self.patients_collection.find(
+            {"search": {"$exists": False}}, {"patient_id": 1, "personal_info.name": 1})
+        for patient in cursor:
+            name = patient.get("personal_info", {}).get("name", "")
+            batch.append(UpdateOne({"_id": patient["_id"]}, {"$set": {"search": search_keys(name)}}))
+            patient_ids.append(patient.get("patient_id"))
+            if len(batch) >= batch_size:
+                updated += write()
+        if batch:
+            updated += write()
+        return updated
+
+
+def ensure_search_keys(doc: Dict, name: Optional[str] = None) -> Dict:
+    """Attach search keys to a patient document if it does not have them"""
+    if "search" not in doc:
+        doc["search"] = search_keys(name if name is not None
+                                    else doc.get("personal_info", {}).get("name", ""))
+    return doc
+
+
+def main():
+    from app import HospitalManagementSystem, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Patient search maintenance")
+    parser.add_argument("--backfill", action="store_true",
+                        help="add search keys to patients that lack them")
+    parser.add_argument("term", nargs="?", help="run a search and print the matches")
+    args = parser.parse_args()
+
+    hms = HospitalManagementSystem(backend=backend_from_env())
+    try:
+        if args.backfill:
+            print(f"✅ Search keys added to {hms.search_engine.backfill():,} patient(s)")
+        if args.term:
+            hms.search_patients(args.term)
+    finally:
+        hms.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1475 @@
+"""Storage backends for the Hospital Management System.
+
+A backend hands out collection objects that speak the subset of the pymongo
+``Collection`` API used by ``HospitalManagementSystem``.  ``MongoBackend`` is
+a thin wrapper around ``MongoClient``; ``EmbeddedBackend`` keeps every
+collection in process memory, with an optional append-only journal file so
+the data survives restarts.
+"""
+import bisect
+import json
+import os
+import re
+import threading
+from itertools import islice
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+
+class StorageBackend:
+    """Interface every storage backend implements"""
+
+    name = "abstract"
+
+    def collection(self, name: str):
+        """Return a collection handle with a pymongo-compatible API"""
+        raise NotImplementedError
+
+    def ping(self) -> None:
+        """Raise if the backend is not reachable"""
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        """Short human readable description used in startup messages"""
+        return self.name
+
+    def close(self) -> None:
+        """Release connections, file handles and other resources"""
+
+    def on_connect(self, hook: Callable[[], None]) -> None:
+        """Run ``hook`` once the backend is connected (immediately if it already is)"""
+        hook()
+
+
+class LazyCollection:
+    """Collection handle that connects its backend on first use"""
+
+    __slots__ = ("_backend", "_name", "_collection")
+
+    def __init__(self, backend: "MongoBackend", name: str):
+        self._backend = backend
+        self._name = name
+        self._collection = None
+
+    def __getattr__(self, attr: str) -> Any:
+        collection = self._collection
+        if collection is None:
+            collection = self._backend.connect()[self._name]
+            self._collection = collection
+        return getattr(collection, attr)
+
+    def __repr__(self) -> str:
+        return f"LazyCollection({self._name!r})"
+
+
+class MongoBackend(StorageBackend):
+    """Backend that talks to a MongoDB server through pymongo
+
+    The ``MongoClient`` is created on first use of a collection (or of
+    ``client``/``db``), so building the application costs no network round
+    trips; hooks registered with ``on_connect`` run right after, before the
+    first operation proceeds.
+    """
+
+    name = "mongodb"
+
+    def __init__(self, connection_string: str = "mongodb://localhost:27017/",
+                 db_name: str = "hospital_db", **client_options):
+        self.connection_string = connection_string
+        self.db_name = db_name
+        self.client_options = client_options
+        self._client = None
+        self._db = None
+        self._hooks: List[Callable[[], None]] = []
+        self._running_hooks = False
+        self._lock = threading.RLock()
+
+    def connect(self):
+        """Create the client if needed and run pending hooks; returns the database"""
+        with self._lock:
+            if self._client is None:
+                from pymongo import MongoClient
+
+                self._client = MongoClient(self.connection_string, **self.client_options)
+                self._db = self._client[self.db_name]
+            # Hooks use the collections themselves; don't re-enter them from there.
+            # A hook that fails stays pending and is retried on the next use.
+            if not self._running_hooks:
+                self._running_hooks = True
+                try:
+                    while self._hooks:
+                        self._hooks[0]()
+                        self._hooks.pop(0)
+                finally:
+                    self._running_hooks = False
+            return self._db
+
+    @property
+    def client(self):
+        self.connect()
+        return self._client
+
+    @property
+    def db(self):
+        return self.connect()
+
+    def collection(self, name: str):
+        if self._db is not None and not self._hooks:
+            return self._db[name]
+        return LazyCollection(self, name)
+
+    def on_connect(self, hook: Callable[[], None]) -> None:
+        with self._lock:
+            self._hooks.append(hook)
+            connected = self._client is not None
+        if connected:
+            self.connect()
+
+    def ping(self) -> None:
+        self.client.admin.command('ping')
+
+    def describe(self) -> str:
+        return f"MongoDB ({self.db_name})"
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+
+
+class EmbeddedBackend(StorageBackend):
+    """In-process backend with an optional append-only journal file"""
+
+    name = "embedded"
+
+    def __init__(self, path: Optional[str] = None, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._collections: Dict[str, "EmbeddedCollection"] = {}
+        self._lock = threading.RLock()
+        self._journal = None
+        if path:
+            if os.path.exists(path):
+                self._replay(path)
+            self._journal = open(path, "a", encoding="utf-8")
+
+    def collection(self, name: str) -> "EmbeddedCollection":
+        with self._lock:
+            coll = self._collections.get(name)
+            if coll is None:
+                coll = EmbeddedCollection(name, self)
+                self._collections[name] = coll
+            return coll
+
+    def ping(self) -> None:
+        if self._journal is not None and self._journal.closed:
+            raise RuntimeError("embedded journal is closed")
+
+    def describe(self) -> str:
+        return f"embedded ({self.path or 'in-memory'})"
+
+    def close(self) -> None:
+        with self._lock:
+            if self._journal is not None and not self._journal.closed:
+                self._journal.flush()
+                self._journal.close()
+
+    def compact(self) -> None:
+        """Rewrite the journal so it holds one entry per live document"""
+        if not self.path:
+            return
+        with self._lock:
+            tmp_path = self.path + ".compact"
+            with open(tmp_path, "w", encoding="utf-8") as out:
+                for name, coll in self._collections.items():
+                    for spec in coll._index_specs():
+                        out.write(_dump_entry({"op": "index", "c": name, "spec": spec}))
+                    for doc in coll._docs.values():
+                        out.write(_dump_entry({"op": "put", "c": name, "d": doc}))
+            if self._journal is not None:
+                self._journal.close()
+            os.replace(tmp_path, self.path)
+            self._journal = open(self.path, "a", encoding="utf-8")
+
+    def _log(self, entry: Dict) -> None:
+        if self._journal is None:
+            return
+        self._journal.write(_dump_entry(entry))
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _replay(self, path: str) -> None:
+        with open(path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = _load_entry(line)
+                coll = self.collection(entry["c"])
+                op = entry["op"]
+                if op == "put":
+                    coll._put(entry["d"])
+                elif op == "del":
+                    coll._remove(entry["id"])
+                elif op == "index":
+                    spec = entry["spec"]
+                    keys = [tuple(key) for key in spec.get("keys") or [(spec["field"], 1)]]
+                    coll._ensure_index(keys, spec.get("unique", False), spec["name"],
+                                       spec.get("partial"))
+                elif op == "drop_index":
+                    coll._indexes.pop(entry["name"], None)
+                elif op == "drop":
+                    coll._clear()
+                    coll._indexes.clear()
+
+
+# Dates are journaled as epoch milliseconds, which replay far faster than ISO strings
+_JOURNAL_OPTIONS = json_util.LEGACY_JSON_OPTIONS
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _dump_entry(entry: Dict) -> str:
+    return json_util.dumps(entry, json_options=_JOURNAL_OPTIONS) + "\n"
+
+
+def _journal_hook(obj: Dict) -> Any:
+    if len(obj) == 1:
+        value = obj.get("$date")
+        if type(value) is int:
+            return _EPOCH + timedelta(milliseconds=value)
+        if "$oid" in obj:
+            return ObjectId(obj["$oid"])
+    for key in obj:
+        if key[:1] == "$":
+            return json_util.object_hook(obj)
+    return obj
+
+
+_JOURNAL_DECODER = json.JSONDecoder(object_hook=_journal_hook)
+
+
+def _load_entry(line: str) -> Dict:
+    """Decode a journal line (older journals with ISO dates decode too)"""
+    return _JOURNAL_DECODER.decode(line)
+
+
+_MISSING = object()
+
+
+def _get_path(doc: Any, path: str) -> Any:
+    """Resolve a dotted path; returns _MISSING when a segment is absent"""
+    current = doc
+    for part in path.split("."):
+        if isinstance(current, dict):
+            if part not in current:
+                return _MISSING
+            current = current[part]
+        elif isinstance(current, list) and part.isdigit():
+            index = int(part)
+            if index >= len(current):
+                return _MISSING
+            current = current[index]
+        else:
+            return _MISSING
+    return current
+
+
+def _set_path(doc: Dict, path: str, value: Any) -> None:
+    parts = path.split(".")
+    current = doc
+    for part in parts[:-1]:
+        nxt = current.get(part)
+        if not isinstance(nxt, dict):
+            nxt = {}
+            current[part] = nxt
+        current = nxt
+    current[parts[-1]] = value
+
+
+def _unset_path(doc: Dict, path: str) -> None:
+    parts = path.split(".")
+    current = doc
+    for part in parts[:-1]:
+        current = current.get(part)
+        if not isinstance(current, dict):
+            return
+    current.pop(parts[-1], None)
+
+
+def _clone(value: Any) -> Any:
+    """Copy nested dicts/lists; leaves immutable leaves shared"""
+    if isinstance(value, dict):
+        return {k: _clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_clone(v) for v in value]
+    return value
+
+
+_TYPE_ORDER = {type(None): 0, int: 1, float: 1, str: 2, dict: 3, list: 4,
+               ObjectId: 5, bool: 6, datetime: 7}
+
+
+def _sort_key(value: Any) -> Tuple:
+    """Order values of mixed types roughly the way BSON comparison does"""
+    if value is _MISSING:
+        return (0, 0)
+    rank = _TYPE_ORDER.get(type(value), 8)
+    if rank == 3:
+        return (rank, str(sorted(value.items())))
+    if rank == 4:
+        return (rank, [_sort_key(v) for v in value])
+    if rank == 8:
+        return (rank, str(value))
+    return (rank, value)
+
+
+def _compare(a: Any, b: Any) -> Optional[int]:
+    """Three-way compare for same-kind values, None when incomparable"""
+    rank_a, rank_b = _TYPE_ORDER.get(type(a)), _TYPE_ORDER.get(type(b))
+    if rank_a is None or rank_a != rank_b or rank_a in (3, 4):
+        return None
+    return (a > b) - (a < b)
+
+
+def _compile_regex(pattern: Any, options: str = "") -> "re.Pattern":
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    flags = 0
+    for opt in options:
+        flags |= {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL,
+                  "x": re.VERBOSE}.get(opt, 0)
+    return re.compile(pattern, flags)
+
+
+def _candidates(value: Any) -> List[Any]:
+    """Values a field condition is tested against (array elements + array)"""
+    if value is _MISSING:
+        return [_MISSING]
+    if isinstance(value, list):
+        return list(value) + [value]
+    return [value]
+
+
+def _match_operator(op: str, arg: Any, value: Any, spec: Dict) -> bool:
+    if op == "$eq":
+        return any(v == arg and v is not _MISSING for v in _candidates(value)) or \
+            (arg is None and value is _MISSING)
+    if op == "$ne":
+        return not _match_operator("$eq", arg, value, spec)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        for v in _candidates(value):
+            cmp = _compare(v, arg)
+            if cmp is None:
+                continue
+            if (op == "$gt" and cmp > 0) or (op == "$gte" and cmp >= 0) or \
+                    (op == "$lt" and cmp < 0) or (op == "$lte" and cmp <= 0):
+                return True
+        return False
+    if op == "$in":
+        if isinstance(arg, _InList):
+            return any((v in arg.members) if _hashable(v) else (v in arg)
+                       for v in _candidates(value)) or \
+                (value is _MISSING and None in arg.members) or \
+                any(_match_operator("$regex", a, value, spec) for a in arg.patterns)
+        return any(_match_operator("$eq", a, value, spec) if not isinstance(a, re.Pattern)
+                   else _match_operator("$regex", a, value, spec) for a in arg)
+    if op == "$nin":
+        return not _match_operator("$in", arg, value, spec)
+    if op == "$exists":
+        return (value is not _MISSING) == bool(arg)
+    if op == "$regex":
+        regex = _compile_regex(arg, spec.get("$options", ""))
+        return any(isinstance(v, str) and regex.search(v) for v in _candidates(value))
+    if op == "$options":
+        return True
+    if op == "$not":
+        return not _match_condition(value, arg)
+    if op == "$size":
+        return isinstance(value, list) and len(value) == arg
+    if op == "$elemMatch":
+        return isinstance(value, list) and any(
+            isinstance(v, dict) and match_document(v, arg) for v in value)
+    raise ValueError(f"Unsupported query operator: {op}")
+
+
+class _InList(list):
+    """``$in`` operand with a hash set for O(1) membership tests"""
+
+    def __init__(self, values: Iterable[Any]):
+        super().__init__(values)
+        self.members = {v for v in self if _hashable(v) and not isinstance(v, re.Pattern)}
+        self.patterns = [v for v in self if isinstance(v, re.Pattern)]
+
+
+def _prepare_query(query: Dict) -> Dict:
+    """Swap large ``$in`` lists for hashed versions before matching many documents"""
+    prepared = None
+    for key, condition in query.items():
+        new = condition
+        if key in ("$and", "$or", "$nor"):
+            new = [_prepare_query(sub) for sub in condition]
+        elif isinstance(condition, dict) and isinstance(condition.get("$in"), list) \
+                and not isinstance(condition["$in"], _InList) and len(condition["$in"]) > 8:
+            new = dict(condition, **{"$in": _InList(condition["$in"])})
+        if new is not condition:
+            if prepared is None:
+                prepared = dict(query)
+            prepared[key] = new
+    return query if prepared is None else prepared
+
+
+def _match_condition(value: Any, condition: Any) -> bool:
+    if isinstance(condition, re.Pattern):
+        return _match_operator("$regex", condition, value, {})
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        return all(_match_operator(op, arg, value, condition) for op, arg in condition.items())
+    return _match_operator("$eq", condition, value, {})
+
+
+def match_document(doc: Dict, query: Optional[Dict]) -> bool:
+    """Evaluate a MongoDB-style filter against a document"""
+    if not query:
+        return True
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(match_document(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(match_document(doc, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(match_document(doc, sub) for sub in condition):
+                return False
+        elif not _match_condition(_get_path(doc, key), condition):
+            return False
+    return True
+
+
+def apply_projection(doc: Dict, projection: Optional[Any]) -> Dict:
+    """Return a projected copy of ``doc`` (inclusion or exclusion style)"""
+    if not projection:
+        return _clone(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = bool(projection.get("_id", 1))
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and all(fields.values()):
+        result: Dict = {}
+        if include_id and "_id" in doc:
+            result["_id"] = doc["_id"]
+        for path in fields:
+            value = _get_path(doc, path)
+            if value is not _MISSING:
+                _set_path(result, path, _clone(value))
+        return result
+    result = _clone(doc)
+    for path, flag in fields.items():
+        if not flag:
+            _unset_path(result, path)
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+
+def apply_update(doc: Dict, update: Any, inserting: bool = False) -> None:
+    """Apply update operators (or an update pipeline of ``$set``/``$unset`` stages) in place"""
+    if isinstance(update, list):
+        for stage in update:
+            (op, fields), = stage.items()
+            if op in ("$set", "$addFields"):
+                values = {path: evaluate_expression(doc, expr) for path, expr in fields.items()}
+                for path, value in values.items():
+                    _set_path(doc, path, _clone(value))
+            elif op == "$unset":
+                for path in [fields] if isinstance(fields, str) else fields:
+                    _unset_path(doc, path)
+            else:
+                raise ValueError(f"Unsupported update pipeline stage: {op}")
+        return
+    if not any(k.startswith("$") for k in update):
+        raise ValueError("update only works with $ operators")
+    for op, fields in update.items():
+        if op == "$set":
+            for path, value in fields.items():
+                _set_path(doc, path, _clone(value))
+        elif op == "$setOnInsert":
+            if inserting:
+                for path, value in fields.items():
+                    _set_path(doc, path, _clone(value))
+        elif op == "$unset":
+            for path in fields:
+                _unset_path(doc, path)
+        elif op == "$inc":
+            for path, amount in fields.items():
+                current = _get_path(doc, path)
+                _set_path(doc, path, (0 if current is _MISSING else current) + amount)
+        elif op in ("$min", "$max"):
+            for path, value in fields.items():
+                current = _get_path(doc, path)
+                if current is _MISSING or (op == "$min" and value < current) or \
+                        (op == "$max" and value > current):
+                    _set_path(doc, path, value)
+        elif op in ("$push", "$addToSet"):
+            for path, value in fields.items():
+                current = _get_path(doc, path)
+                items = current if isinstance(current, list) else []
+                values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                for item in values:
+                    if op == "$push" or item not in items:
+                        items.append(_clone(item))
+                _set_path(doc, path, items)
+        else:
+            raise ValueError(f"Unsupported update operator: {op}")
+
+
+def _seed_from_filter(query: Dict) -> Dict:
+    """Equality parts of a filter become fields of an upserted document"""
+    doc: Dict = {}
+    for key, condition in (query or {}).items():
+        if key.startswith("$"):
+            continue
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            if "$eq" in condition:
+                _set_path(doc, key, _clone(condition["$eq"]))
+            continue
+        _set_path(doc, key, _clone(condition))
+    return doc
+
+
+def evaluate_expression(doc: Dict, expr: Any) -> Any:
+    """Evaluate the aggregation expressions the embedded engine supports"""
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = _get_path(doc, expr[1:])
+        return None if value is _MISSING else value
+    if isinstance(expr, dict) and len(expr) == 1:
+        op, args = next(iter(expr.items()))
+        if op.startswith("$"):
+            values = [evaluate_expression(doc, a) for a in (args if isinstance(args, list) else [args])]
+            if op == "$add":
+                return sum(v for v in values if v is not None) if None not in values else None
+            if op == "$subtract":
+                a, b = values
+                if a is None or b is None:
+                    return None
+                result = a - b
+                return result.total_seconds() * 1000 if hasattr(result, "total_seconds") else result
+            if op == "$multiply":
+                product = 1
+                for v in values:
+                    if v is None:
+                        return None
+                    product *= v
+                return product
+            if op == "$divide":
+                a, b = values
+                return None if a is None or b is None else a / b
+            if op == "$ifNull":
+                return next((v for v in values if v is not None), None)
+            if op == "$eq":
+                return values[0] == values[1]
+            if op == "$cond":
+                cond, then, other = values if isinstance(args, list) else (
+                    evaluate_expression(doc, args["if"]), evaluate_expression(doc, args["then"]),
+                    evaluate_expression(doc, args["else"]))
+                return then if cond else other
+            if op == "$dateToString":
+                date = evaluate_expression(doc, args["date"])
+                return None if date is None else date.strftime(args.get("format", "%Y-%m-%d"))
+            if op == "$literal":
+                return args
+            raise ValueError(f"Unsupported expression operator: {op}")
+    if isinstance(expr, dict):
+        return {k: evaluate_expression(doc, v) for k, v in expr.items()}
+    if isinstance(expr, list):
+        return [evaluate_expression(doc, v) for v in expr]
+    return expr
+
+
+def _group_stage(docs: Iterable[Dict], spec: Dict) -> List[Dict]:
+    groups: Dict[Any, Dict] = {}
+    key_expr = spec["_id"]
+    accumulators = {field: next(iter(acc.items())) for field, acc in spec.items() if field != "_id"}
+    for doc in docs:
+        key = evaluate_expression(doc, key_expr)
+        hashable_key = repr(key) if not _hashable(key) else key
+        group = groups.get(hashable_key)
+        if group is None:
+            group = groups[hashable_key] = {"_id": key}
+            for field, (op, _) in accumulators.items():
+                group[field] = {"$sum": 0, "$push": [], "$addToSet": []}.get(op)
+                if op == "$avg":
+                    group[field] = [0, 0]
+        for field, (op, operand) in accumulators.items():
+            value = evaluate_expression(doc, operand)
+            current = group[field]
+            if op == "$sum":
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    group[field] = current + value
+            elif op == "$avg":
+                if isinstance(value, (int, float)):
+                    current[0] += value
+                    current[1] += 1
+            elif op == "$min":
+                if value is not None and (current is None or value < current):
+                    group[field] = value
+            elif op == "$max":
+                if value is not None and (current is None or value > current):
+                    group[field] = value
+            elif op == "$first":
+                if field not in group.get("__seen__", ()):
+                    group[field] = value
+                    group.setdefault("__seen__", set()).add(field)
+            elif op == "$last":
+                group[field] = value
+            elif op == "$push":
+                current.append(value)
+            elif op == "$addToSet":
+                if value not in current:
+                    current.append(value)
+            else:
+                raise ValueError(f"Unsupported accumulator: {op}")
+    results = []
+    for group in groups.values():
+        group.pop("__seen__", None)
+        for field, (op, _) in accumulators.items():
+            if op == "$avg":
+                total, count = group[field]
+                group[field] = total / count if count else None
+        results.append(group)
+    return results
+
+
+def _project_stage(doc: Dict, spec: Dict) -> Dict:
+    if all(v in (0, False) for k, v in spec.items()):
+        return apply_projection(doc, spec)
+    result: Dict = {}
+    if spec.get("_id", 1) and "_id" in doc:
+        result["_id"] = doc["_id"]
+    for field, value in spec.items():
+        if field == "_id" and value in (0, 1, True, False):
+            continue
+        if value in (1, True):
+            found = _get_path(doc, field)
+            if found is not _MISSING:
+                _set_path(result, field, _clone(found))
+        elif value not in (0, False):
+            _set_path(result, field, evaluate_expression(doc, value))
+    return result
+
+
+def run_pipeline(docs: Iterable[Dict], pipeline: List[Dict]) -> Iterator[Dict]:
+    """Apply ``$match``/``$group``/``$project``/``$sort``/``$skip``/``$limit``/``$unwind``/``$count``"""
+    stream: Iterable[Dict] = docs
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            stream = [d for d in stream if match_document(d, spec)]
+        elif name == "$group":
+            stream = _group_stage(stream, spec)
+        elif name == "$project":
+            stream = [_project_stage(d, spec) for d in stream]
+        elif name == "$addFields" or name == "$set":
+            added = []
+            for d in stream:
+                d = _clone(d)
+                for field, expr in spec.items():
+                    _set_path(d, field, evaluate_expression(d, expr))
+                added.append(d)
+            stream = added
+        elif name == "$sort":
+            stream = list(stream)
+            for field, direction in reversed(list(spec.items())):
+                stream.sort(key=lambda d, f=field: _sort_key(_get_path(d, f)), reverse=direction < 0)
+        elif name == "$skip":
+            stream = list(stream)[spec:]
+        elif name == "$limit":
+            stream = list(stream)[:spec]
+        elif name == "$unwind":
+            path = (spec if isinstance(spec, str) else spec["path"])[1:]
+            unwound = []
+            for d in stream:
+                values = _get_path(d, path)
+                for value in values if isinstance(values, list) else []:
+                    copy_ = _clone(d)
+                    _set_path(copy_, path, value)
+                    unwound.append(copy_)
+            stream = unwound
+        elif name == "$count":
+            stream = [{spec: sum(1 for _ in stream)}]
+        else:
+            raise ValueError(f"Unsupported pipeline stage: {name}")
+    return iter(stream)
+
+
+_REGEX_META = set(".^$*+?{}[]|()\\")
+
+
+def regex_prefix(pattern: Any, options: str = "") -> Optional[str]:
+    """Literal prefix of an anchored, case-sensitive regex (``^abc...``)"""
+    if isinstance(pattern, re.Pattern):
+        if pattern.flags & re.IGNORECASE:
+            return None
+        pattern = pattern.pattern
+    if "i" in options or not isinstance(pattern, str) or not pattern.startswith("^") \
+            or "|" in pattern:
+        return None
+    prefix = []
+    i = 1
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            prefix.append(pattern[i + 1])
+            i += 2
+            continue
+        if char in _REGEX_META:
+            if char in "*?{" and prefix:
+                prefix.pop()
+            break
+        prefix.append(char)
+        i += 1
+    return "".join(prefix)
+
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    """Smallest string greater than every string starting with ``prefix``"""
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            return prefix[:-1] + chr(last + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+def _range_bounds(condition: Dict) -> Optional[Tuple[Any, Any, bool, bool]]:
+    """Translate range/prefix operators into ``lookup_range`` arguments"""
+    if "$regex" in condition:
+        prefix = regex_prefix(condition["$regex"], condition.get("$options", ""))
+        if not prefix:
+            return None
+        upper = prefix_upper_bound(prefix)
+        return (prefix, _MISSING if upper is None else upper, True, False)
+    low, high = _MISSING, _MISSING
+    low_inclusive = high_inclusive = True
+    if "$gte" in condition:
+        low = condition["$gte"]
+    elif "$gt" in condition:
+        low, low_inclusive = condition["$gt"], False
+    if "$lte" in condition:
+        high = condition["$lte"]
+    elif "$lt" in condition:
+        high, high_inclusive = condition["$lt"], False
+    if low is _MISSING and high is _MISSING:
+        return None
+    return (low, high, low_inclusive, high_inclusive)
+
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+_SORT_IN_MEMORY_LIMIT = 1000
+
+
+def _index_name(keys: List[Tuple[str, int]]) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+class _HashIndex:
+    """Hash index from a (dotted) field value to the set of document ids.
+
+    A sorted list of the distinct keys is built the first time a range or
+    prefix lookup needs it and is then maintained incrementally.  Compound
+    indexes are looked up by their leading field, but a unique compound
+    index also keeps the full key tuples so uniqueness applies to the whole
+    key, as on a server; partial indexes only hold documents matching their
+    filter and are only used for queries that repeat that filter.
+    """
+
+    def __init__(self, name: str, field: str, unique: bool = False,
+                 keys: Optional[List[Tuple[str, int]]] = None, partial: Optional[Dict] = None):
+        self.name = name
+        self.field = field
+        self.unique = unique
+        self.keys = keys or [(field, 1)]
+        self.partial = partial
+        self.entries: Dict[Any, Dict[Any, None]] = {}
+        self._sorted: Optional[List[Any]] = None
+        # Full key tuple -> document ids, kept only for unique compound indexes
+        self.tuples: Optional[Dict[Tuple, Dict[Any, None]]] = \
+            {} if unique and len(self.keys) > 1 else None
+
+    def covers(self, query: Dict) -> bool:
+        """Whether every document matching ``query`` is in the index"""
+        return not self.partial or all(
+            field in query and query[field] == condition
+            for field, condition in self.partial.items())
+
+    def keys_for(self, doc: Dict) -> List[Any]:
+        if self.partial and not match_document(doc, self.partial):
+            return []
+        value = _get_path(doc, self.field)
+        if value is _MISSING:
+            return [None]
+        values = value if isinstance(value, list) else [value]
+        return [v for v in values if _hashable(v)]
+
+    def tuples_for(self, doc: Dict) -> List[Tuple]:
+        """Full key tuples of a compound index (one per element of an array field)"""
+        if self.partial and not match_document(doc, self.partial):
+            return []
+        keys: List[Tuple] = [()]
+        for field, _ in self.keys:
+            value = _get_path(doc, field)
+            if value is _MISSING:
+                values = [None]
+            else:
+                values = value if isinstance(value, list) and value else [value]
+            keys = [key + (v,) for key in keys for v in values if _hashable(v)]
+        return list(dict.fromkeys(keys))
+
+    def check(self, doc: Dict, doc_id: Any) -> None:
+        if not self.unique:
+            return
+        entries, keys = (self.entries, self.keys_for(doc)) if self.tuples is None \
+            else (self.tuples, self.tuples_for(doc))
+        for key in keys:
+            owners = entries.get(key)
+            if owners and (len(owners) > 1 or doc_id not in owners):
+                fields = [field for field, _ in self.keys]
+                values = key if self.tuples is not None else (key,)
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error index: {self.name} dup key: "
+                    f"{{ {', '.join(f'{f}: {v!r}' for f, v in zip(fields, values))} }}")
+
+    def _add_tuples(self, doc: Dict, doc_id: Any) -> None:
+        for key in self.tuples_for(doc):
+            self.tuples.setdefault(key, {})[doc_id] = None
+
+    def _remove_tuples(self, doc: Dict, doc_id: Any) -> None:
+        for key in self.tuples_for(doc):
+            owners = self.tuples.get(key)
+            if owners is not None:
+                owners.pop(doc_id, None)
+                if not owners:
+                    del self.tuples[key]
+
+    def add(self, doc: Dict, doc_id: Any, keys: Optional[Iterable[Any]] = None) -> None:
+        if self.tuples is not None and keys is None:
+            self._add_tuples(doc, doc_id)
+        for key in self.keys_for(doc) if keys is None else keys:
+            owners = self.entries.get(key)
+            if owners is None:
+                owners = self.entries[key] = {}
+                if self._sorted is not None:
+                    bisect.insort(self._sorted, key, key=_sort_key)
+            owners[doc_id] = None
+
+    def remove(self, doc: Dict, doc_id: Any, keys: Optional[Iterable[Any]] = None) -> None:
+        if self.tuples is not None and keys is None:
+            self._remove_tuples(doc, doc_id)
+        for key in self.keys_for(doc) if keys is None else keys:
+            owners = self.entries.get(key)
+            if owners is not None:
+                owners.pop(doc_id, None)
+                if not owners:
+                    del self.entries[key]
+                    if self._sorted is not None:
+                        pos = bisect.bisect_left(self._sorted, _sort_key(key), key=_sort_key)
+                        if pos < len(self._sorted) and self._sorted[pos] == key:
+                            del self._sorted[pos]
+
+    def replace(self, old: Dict, new: Dict, doc_id: Any) -> None:
+        """Re-index an updated document, leaving unchanged keys in place"""
+        if self.tuples is not None:
+            self._remove_tuples(old, doc_id)
+            self._add_tuples(new, doc_id)
+        old_keys, new_keys = self.keys_for(old), self.keys_for(new)
+        if old_keys == new_keys:
+            return
+        self.remove(old, doc_id, [k for k in old_keys if k not in new_keys])
+        self.add(new, doc_id, [k for k in new_keys if k not in old_keys])
+
+    def clear(self) -> None:
+        self.entries.clear()
+        if self.tuples is not None:
+            self.tuples.clear()
+        self._sorted = None
+
+    def lookup(self, keys: Iterable[Any]) -> List[Any]:
+        """Document ids for the given keys, in insertion order per key"""
+        keys = list(keys)
+        if len(keys) == 1:
+            return list(self.entries.get(keys[0], ()))
+        found: Dict[Any, None] = {}
+        for key in keys:
+            found.update(self.entries.get(key, {}))
+        return list(found)
+
+    def keys_in_range(self, low: Any = _MISSING, high: Any = _MISSING,
+                      low_inclusive: bool = True, high_inclusive: bool = False) -> List[Any]:
+        """Distinct keys within the bounds, in index order"""
+        if self._sorted is None:
+            self._sorted = sorted(self.entries, key=_sort_key)
+        keys = self._sorted
+        if low is _MISSING:
+            start = 0
+        elif low_inclusive:
+            start = bisect.bisect_left(keys, _sort_key(low), key=_sort_key)
+        else:
+            start = bisect.bisect_right(keys, _sort_key(low), key=_sort_key)
+        if high is _MISSING:
+            stop = len(keys)
+        elif high_inclusive:
+            stop = bisect.bisect_right(keys, _sort_key(high), key=_sort_key)
+        else:
+            stop = bisect.bisect_left(keys, _sort_key(high), key=_sort_key)
+        selected = keys[start:stop]
+        if low is not _MISSING:
+            selected = [key for key in selected if _compare(key, low) is not None]
+        elif high is not _MISSING:
+            selected = [key for key in selected if _compare(key, high) is not None]
+        return selected
+
+
+class EmbeddedCursor:
+    """Lazy cursor over an embedded collection"""
+
+    def __init__(self, collection: "EmbeddedCollection", query: Optional[Dict],
+                 projection: Optional[Any] = None):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction: int = 1) -> "EmbeddedCursor":
+        if isinstance(key_or_list, str):
+            self._sort = [(key_or_list, direction)]
+        else:
+            self._sort = list(key_or_list)
+        return self
+
+    def skip(self, count: int) -> "EmbeddedCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "EmbeddedCursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int) -> "EmbeddedCursor":
+        return self
+
+    def close(self) -> None:
+        pass
+
+    def explain(self) -> Dict:
+        return self._collection.explain(self._query, self._sort, self._limit)
+
+    def __iter__(self) -> Iterator[Dict]:
+        docs, ordered = self._collection._scan(self._query, self._sort)
+        if self._sort and not ordered:
+            docs = list(docs)
+            for field, direction in reversed(self._sort):
+                docs.sort(key=lambda d, f=field: _sort_key(_get_path(d, f)),
+                          reverse=direction < 0)
+        emitted = skipped = 0
+        for doc in docs:
+            if skipped < self._skip:
+                skipped += 1
+                continue
+            yield apply_projection(doc, self._projection)
+            emitted += 1
+            if self._limit and emitted >= self._limit:
+                return
+
+
+class EmbeddedCollection:
+    """Collection stored as a dict of documents keyed by ``_id``"""
+
+    def __init__(self, name: str, backend: EmbeddedBackend):
+        self.name = name
+        self._backend = backend
+        self._lock = backend._lock
+        self._docs: Dict[Any, Dict] = {}
+        self._seq: Dict[Any, int] = {}
+        self._next_seq = 0
+        self._indexes: Dict[str, _HashIndex] = {}
+
+    # -- internal helpers -------------------------------------------------
+
+    def _index_specs(self) -> List[Dict]:
+        return [{"name": ix.name, "field": ix.field, "unique": ix.unique, "keys": ix.keys,
+                 "partial": ix.partial}
+                for ix in self._indexes.values()]
+
+    def _ensure_index(self, keys: List[Tuple[str, int]], unique: bool, name: str,
+                      partial: Optional[Dict] = None) -> str:
+        if name in self._indexes:
+            return name
+        index = _HashIndex(name, keys[0][0], unique, keys, partial)
+        for doc_id, doc in self._docs.items():
+            index.check(doc, doc_id)
+            index.add(doc, doc_id)
+        self._indexes[name] = index
+        return name
+
+    def _put(self, doc: Dict) -> None:
+        doc_id = doc["_id"]
+        old = self._docs.get(doc_id)
+        for index in self._indexes.values():
+            index.check(doc, doc_id)
+        for index in self._indexes.values():
+            if old is not None:
+                index.replace(old, doc, doc_id)
+            else:
+                index.add(doc, doc_id)
+        if old is None:
+            self._seq[doc_id] = self._next_seq
+            self._next_seq += 1
+        self._docs[doc_id] = doc
+
+    def _remove(self, doc_id: Any) -> None:
+        old = self._docs.pop(doc_id, None)
+        self._seq.pop(doc_id, None)
+        if old is not None:
+            for index in self._indexes.values():
+                index.remove(old, doc_id)
+
+    def _clear(self) -> None:
+        self._docs.clear()
+        self._seq.clear()
+        for index in self._indexes.values():
+            index.clear()
+
+    def _plan(self, query: Dict) -> Optional[Tuple[_HashIndex, str, Any]]:
+        """Pick an index for a top-level predicate.
+
+        Equality and ``$in`` predicates are preferred (the one matching the
+        fewest documents wins); otherwise a range (``$gt``/``$gte``/``$lt``/
+        ``$lte``) or an anchored, case-sensitive prefix regex is answered from
+        the index's sorted keys.
+        """
+        by_field: Dict[str, _HashIndex] = {}
+        for ix in self._indexes.values():
+            if ix.covers(query):
+                by_field.setdefault(ix.field, ix)
+        ranges = []
+        best, best_size = None, 0
+        for key, condition in query.items():
+            index = by_field.get(key)
+            if index is None:
+                continue
+            if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+                if "$eq" in condition:
+                    values = [condition["$eq"]]
+                elif "$in" in condition:
+                    values = list(condition["$in"])
+                else:
+                    bounds = _range_bounds(condition)
+                    if bounds is not None:
+                        ranges.append((index, "range", bounds))
+                    continue
+            elif isinstance(condition, re.Pattern):
+                bounds = _range_bounds({"$regex": condition})
+                if bounds is not None:
+                    ranges.append((index, "range", bounds))
+                continue
+            else:
+                values = [condition]
+            if all(_hashable(v) and not isinstance(v, re.Pattern) for v in values):
+                size = sum(len(index.entries.get(v, ())) for v in values)
+                if best is None or size < best_size:
+                    best, best_size = (index, "eq", values), size
+        if best is not None:
+            return best
+        return ranges[0] if ranges else None
+
+    def _access_path(self, query: Dict, sort: Optional[List[Tuple[str, int]]]
+                     ) -> Tuple[str, Optional[_HashIndex], Any]:
+        """How ``query`` will be answered: ``("id_in"|"id"|"collscan"|"eq"|"range", index, arg)``"""
+        doc_id = query.get("_id", _MISSING)
+        if isinstance(doc_id, dict) and set(doc_id) == {"$in"}:
+            return "id_in", None, doc_id["$in"]
+        if doc_id is not _MISSING and not isinstance(doc_id, (dict, re.Pattern)) \
+                and _hashable(doc_id):
+            return "id", None, doc_id
+        plan = self._plan(query)
+        sort_field = sort[0][0] if sort and len(sort) == 1 else None
+        # The embedded engine looks compound indexes up by their leading field,
+        # so a large (equality, sort) compound match is served by walking the
+        # sort field's index in order, which stops as soon as a limit is reached.
+        compound_sort = plan is not None and plan[1] == "eq" and len(plan[0].keys) > 1 \
+            and plan[0].keys[1][0] == sort_field \
+            and sum(len(plan[0].entries.get(v, ())) for v in plan[2]) > _SORT_IN_MEMORY_LIMIT
+        if sort_field and (plan is None or plan[1] == "range" or compound_sort):
+            ordered = [ix for ix in self._indexes.values()
+                       if ix.field == sort_field and ix.covers(query)]
+            if ordered and (plan is None or plan[0] is not ordered[0]):
+                plan = (ordered[0], "range", (_MISSING, _MISSING, True, True))
+        if plan is None:
+            return "collscan", None, None
+        index, kind, arg = plan
+        return kind, index, arg
+
+    def _scan(self, query: Dict, sort: Optional[List[Tuple[str, int]]] = None
+              ) -> Tuple[Iterator[Dict], bool]:
+        """Iterate matching documents; the flag says whether ``sort`` is already satisfied.
+
+        Range plans walk the index in key order and fetch documents lazily, so
+        a ``limit`` stops the scan early.  A single-field sort on an indexed
+        field is served the same way even without a range predicate.
+        """
+        query = _prepare_query(query)
+        with self._lock:
+            kind, index, arg = self._access_path(query, sort)
+            if kind == "id_in":
+                docs = [self._docs[i] for i in dict.fromkeys(arg) if i in self._docs]
+                if len(docs) > 1:
+                    docs.sort(key=lambda d: self._seq[d["_id"]])
+                return self._filtered(docs, query), not sort
+            if kind == "id":
+                doc = self._docs.get(arg)
+                return self._filtered([doc] if doc is not None else [], query), True
+            if kind == "collscan":
+                return self._filtered(list(self._docs.values()), query), not sort
+            sort_field, direction = sort[0] if sort and len(sort) == 1 else (None, 1)
+            if kind == "eq":
+                ids = index.lookup(arg)
+                if len(arg) > 1 and len(ids) > 1:
+                    ids.sort(key=self._seq.__getitem__)
+                docs = [self._docs[i] for i in ids if i in self._docs]
+                return self._filtered(docs, query), not sort
+            keys = index.keys_in_range(*arg)
+        reverse = index.field == sort_field and direction < 0
+        if reverse:
+            keys.reverse()
+        return self._walk_keys(index, keys, query, reverse), not sort or index.field == sort_field
+
+    def _walk_keys(self, index: _HashIndex, keys: List[Any], query: Dict,
+                   reverse: bool) -> Iterator[Dict]:
+        seen: set = set()
+        multikey = len(keys) > 1
+        for key in keys:
+            with self._lock:
+                ids = list(index.entries.get(key, ()))
+            if reverse:
+                ids.reverse()
+            for doc_id in ids:
+                if multikey:
+                    if doc_id in seen:
+                        continue
+                    seen.add(doc_id)
+                doc = self._docs.get(doc_id)
+                if doc is not None and match_document(doc, query):
+                    yield doc
+
+    @staticmethod
+    def _filtered(docs: List[Dict], query: Dict) -> Iterator[Dict]:
+        for doc in docs:
+            if match_document(doc, query):
+                yield doc
+
+    def _iter_matching(self, query: Dict) -> Iterator[Dict]:
+        return self._scan(query)[0]
+
+    def _first(self, query: Optional[Dict]) -> Optional[Dict]:
+        for doc in self._iter_matching(query or {}):
+            return doc
+        return None
+
+    def _insert(self, document: Dict) -> Any:
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        doc = _clone(document)
+        if doc["_id"] in self._docs:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error index: _id_ dup key: {{ _id: {doc['_id']!r} }}")
+        self._put(doc)
+        self._backend._log({"op": "put", "c": self.name, "d": doc})
+        return doc["_id"]
+
+    def _update(self, query: Dict, update: Dict, upsert: bool, multi: bool) -> Dict:
+        matched = modified = 0
+        upserted_id = None
+        with self._lock:
+            matches = self._iter_matching(query or {})
+            targets = list(matches) if multi else list(islice(matches, 1))
+            for doc in targets:
+                matched += 1
+                new_doc = _clone(doc)
+                apply_update(new_doc, update)
+                if new_doc != doc:
+                    self._put(new_doc)
+                    self._backend._log({"op": "put", "c": self.name, "d": new_doc})
+                    modified += 1
+            if not targets and upsert:
+                new_doc = _seed_from_filter(query)
+                apply_update(new_doc, update, inserting=True)
+                upserted_id = self._insert(new_doc)
+        raw = {"n": matched or (1 if upserted_id is not None else 0),
+               "nModified": modified, "ok": 1.0}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return raw
+
+    # -- pymongo-compatible API ---------------------------------------------
+
+    def create_index(self, keys, unique: bool = False, name: Optional[str] = None,
+                     partialFilterExpression: Optional[Dict] = None, **kwargs) -> str:
+        keys = [(keys, 1)] if isinstance(keys, str) else [tuple(key) for key in keys]
+        name = name or _index_name(keys)
+        with self._lock:
+            existing = self._indexes.get(name)
+            if existing is not None:
+                if (existing.keys, existing.unique, existing.partial) != \
+                        (keys, unique, partialFilterExpression):
+                    raise OperationFailure(
+                        f"An existing index has the same name as the requested index: {name}",
+                        code=86)
+                return name
+            self._ensure_index(keys, unique, name, partialFilterExpression)
+            self._backend._log({"op": "index", "c": self.name,
+                                "spec": self._index_specs()[-1]})
+        return name
+
+    def drop_index(self, index_or_name) -> None:
+        name = index_or_name if isinstance(index_or_name, str) else _index_name(
+            [tuple(key) for key in index_or_name])
+        with self._lock:
+            if self._indexes.pop(name, None) is None:
+                raise OperationFailure(f"index not found with name [{name}]", code=27)
+            self._backend._log({"op": "drop_index", "c": self.name, "name": name})
+
+    def index_information(self) -> Dict[str, Dict]:
+        info = {"_id_": {"key": [("_id", 1)], "v": 2}}
+        for index in self._indexes.values():
+            info[index.name] = {"key": list(index.keys), "v": 2}
+            if index.unique:
+                info[index.name]["unique"] = True
+            if index.partial:
+                info[index.name]["partialFilterExpression"] = index.partial
+        return info
+
+    def explain(self, query: Dict, sort: Optional[List[Tuple[str, int]]] = None,
+                limit: int = 0) -> Dict:
+        """Query plan in the shape of MongoDB's ``explain`` output"""
+        prepared = _prepare_query(query)
+        with self._lock:
+            kind, index, arg = self._access_path(prepared, sort)
+        sort_field, direction = sort[0] if sort and len(sort) == 1 else (None, 1)
+        if kind == "collscan":
+            plan: Dict = {"stage": "COLLSCAN", "filter": query, "direction": "forward"}
+            sorted_by_plan = not sort
+        elif kind == "id":
+            plan = {"stage": "IDHACK"}
+            sorted_by_plan = True
+        else:
+            name, key_pattern = ("_id_", {"_id": 1}) if index is None else \
+                (index.name, dict(index.keys))
+            backward = index is not None and index.field == sort_field and direction < 0
+            plan = {"stage": "FETCH", "inputStage": {
+                "stage": "IXSCAN", "indexName": name, "keyPattern": key_pattern,
+                "isPartial": bool(index is not None and index.partial),
+                "direction": "backward" if backward else "forward"}}
+            sorted_by_plan = not sort or (kind == "range" and index.field == sort_field)
+        if not sorted_by_plan:
+            plan = {"stage": "SORT", "sortPattern": dict(sort), "inputStage": plan}
+        if limit:
+            plan = {"stage": "LIMIT", "limitAmount": limit, "inputStage": plan}
+        return {"queryPlanner": {"namespace": self.name, "parsedQuery": query,
+                                 "winningPlan": plan, "rejectedPlans": []}}
+
+    def insert_one(self, document: Dict) -> InsertOneResult:
+        with self._lock:
+            return InsertOneResult(self._insert(document), True)
+
+    def insert_many(self, documents: Iterable[Dict], ordered: bool = True) -> InsertManyResult:
+        inserted = []
+        errors = []
+        with self._lock:
+            for position, document in enumerate(documents):
+                try:
+                    inserted.append(self._insert(document))
+                except DuplicateKeyError as exc:
+                    errors.append({"index": position, "code": 11000, "errmsg": str(exc),
+                                   "op": document})
+                    if ordered:
+                        break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [],
+                                  "nInserted": len(inserted), "nUpserted": 0, "nMatched": 0,
+                                  "nModified": 0, "nRemoved": 0, "upserted": []})
+        return InsertManyResult(inserted, True)
+
+    def find_one(self, filter: Optional[Dict] = None, projection: Optional[Any] = None,
+                 *args, **kwargs) -> Optional[Dict]:
+        doc = self._first(filter)
+        return None if doc is None else apply_projection(doc, projection)
+
+    def find(self, filter: Optional[Dict] = None, projection: Optional[Any] = None,
+             *args, **kwargs) -> EmbeddedCursor:
+        cursor = EmbeddedCursor(self, filter, projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("skip"):
+            cursor.skip(kwargs["skip"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    def count_documents(self, filter: Optional[Dict] = None, **kwargs) -> int:
+        if not filter:
+            return len(self._docs)
+        return sum(1 for _ in self._iter_matching(filter))
+
+    def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    def distinct(self, key: str, filter: Optional[Dict] = None) -> List[Any]:
+        seen: List[Any] = []
+        for doc in self._iter_matching(filter or {}):
+            value = _get_path(doc, key)
+            for item in value if isinstance(value, list) else [value]:
+                if item is not _MISSING and item not in seen:
+                    seen.append(item)
+        return seen
+
+    def update_one(self, filter: Dict, update: Dict, upsert: bool = False,
+                   **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=False), True)
+
+    def update_many(self, filter: Dict, update: Dict, upsert: bool = False,
+                    **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=True), True)
+
+    def replace_one(self, filter: Dict, replacement: Dict, upsert: bool = False,
+                    **kwargs) -> UpdateResult:
+        with self._lock:
+            current = self._first(filter)
+            if current is None:
+                if not upsert:
+                    return UpdateResult({"n": 0, "nModified": 0, "ok": 1.0}, True)
+                new_doc = _clone(replacement)
+                new_doc.setdefault("_id", _seed_from_filter(filter).get("_id", ObjectId()))
+                doc_id = self._insert(new_doc)
+                return UpdateResult({"n": 1, "nModified": 0, "upserted": doc_id, "ok": 1.0}, True)
+            new_doc = _clone(replacement)
+            new_doc["_id"] = current["_id"]
+            self._put(new_doc)
+            self._backend._log({"op": "put", "c": self.name, "d": new_doc})
+        return UpdateResult({"n": 1, "nModified": int(new_doc != current), "ok": 1.0}, True)
+
+    def delete_one(self, filter: Dict, **kwargs) -> DeleteResult:
+        with self._lock:
+            doc = self._first(filter)
+            if doc is None:
+                return DeleteResult({"n": 0, "ok": 1.0}, True)
+            self._remove(doc["_id"])
+            self._backend._log({"op": "del", "c": self.name, "id": doc["_id"]})
+        return DeleteResult({"n": 1, "ok": 1.0}, True)
+
+    def delete_many(self, filter: Dict, **kwargs) -> DeleteResult:
+        with self._lock:
+            ids = [doc["_id"] for doc in self._iter_matching(filter or {})]
+            for doc_id in ids:
+                self._remove(doc_id)
+                self._backend._log({"op": "del", "c": self.name, "id": doc_id})
+        return DeleteResult({"n": len(ids), "ok": 1.0}, True)
+
+    def find_one_and_update(self, filter: Dict, update: Dict, projection: Optional[Any] = None,
+                            sort: Optional[List[Tuple[str, int]]] = None, upsert: bool = False,
+                            return_document: bool = False, **kwargs) -> Optional[Dict]:
+        """Atomically update the first match; ``return_document`` True returns the new version"""
+        with self._lock:
+            if sort:
+                docs = list(self.find(filter).sort(sort).limit(1))
+                current = self._docs.get(docs[0]["_id"]) if docs else None
+            else:
+                current = self._first(filter)
+            if current is None:
+                if not upsert:
+                    return None
+                new_doc = _seed_from_filter(filter)
+                apply_update(new_doc, update, inserting=True)
+                self._insert(new_doc)
+                return apply_projection(new_doc, projection) if return_document else None
+            new_doc = _clone(current)
+            apply_update(new_doc, update)
+            if new_doc != current:
+                self._put(new_doc)
+                self._backend._log({"op": "put", "c": self.name, "d": new_doc})
+        return apply_projection(new_doc if return_document else current, projection)
+
+    def aggregate(self, pipeline: List[Dict], **kwargs) -> Iterator[Dict]:
+        """Run a pipeline; a leading ``$match`` uses the indexes"""
+        pipeline = list(pipeline)
+        query = pipeline.pop(0)["$match"] if pipeline and "$match" in pipeline[0] else {}
+        with self._lock:
+            results = [_clone(doc) for doc in run_pipeline(self._iter_matching(query), pipeline)]
+        return iter(results)
+
+    def find_one_and_delete(self, filter: Dict, projection: Optional[Any] = None,
+                            **kwargs) -> Optional[Dict]:
+        with self._lock:
+            current = self._first(filter)
+            if current is None:
+                return None
+            self._remove(current["_id"])
+            self._backend._log({"op": "del", "c": self.name, "id": current["_id"]})
+        return apply_projection(current, projection)
+
+    def bulk_write(self, requests: Iterable[Any], ordered: bool = True,
+                   **kwargs) -> BulkWriteResult:
+        totals = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nUpserted": 0,
+                  "nRemoved": 0, "upserted": [], "writeErrors": [], "writeConcernErrors": []}
+        with self._lock:
+            for position, request in enumerate(requests):
+                kind = type(request).__name__
+                try:
+                    if kind == "InsertOne":
+                        self._insert(request._doc)
+                        totals["nInserted"] += 1
+                        continue
+                    if kind in ("DeleteOne", "DeleteMany"):
+                        method = self.delete_one if kind == "DeleteOne" else self.delete_many
+                        totals["nRemoved"] += method(request._filter).deleted_count
+                        continue
+                    if kind == "ReplaceOne":
+                        raw = self.replace_one(request._filter, request._doc,
+                                               upsert=bool(request._upsert)).raw_result
+                    elif kind in ("UpdateOne", "UpdateMany"):
+                        raw = self._update(request._filter, request._doc, bool(request._upsert),
+                                           multi=kind == "UpdateMany")
+                    else:
+                        raise ValueError(f"Unsupported bulk operation: {kind}")
+                except DuplicateKeyError as exc:
+                    totals["writeErrors"].append({"index": position, "code": 11000,
+                                                  "errmsg": str(exc), "op": request})
+                    if ordered:
+                        break
+                    continue
+                if "upserted" in raw:
+                    totals["nUpserted"] += 1
+                    totals["upserted"].append({"index": position, "_id": raw["upserted"]})
+                else:
+                    totals["nMatched"] += raw["n"]
+                    totals["nModified"] += raw["nModified"]
+        if totals["writeErrors"]:
+            raise BulkWriteError(totals)
+        return BulkWriteResult(totals, True)
+
+    def drop(self) -> None:
+        with self._lock:
+            self._clear()
+            self._indexes.clear()
+            self._backend._log({"op": "drop", "c": self.name})
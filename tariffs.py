@@ -0,0 +1,347 @@
+"""Versioned, effective-dated fee schedules.
+
+Each published version of the fee schedule is one document in ``tariffs``,
+keyed by an increasing version number::
+
+    {"_id": 3, "published_at": ..., "note": "ICU rates for 2026",
+     "rates": [{"admission_type": "ICU", "effective_from": datetime(2026, 1, 1),
+                "room_per_day": 12000, "doctor_fee": 3000, "medicine_base": 2500},
+               ...]}
+
+A version holds the complete schedule: every admission type with every
+period of rates, so a stay is always billed from one version.  Room
+charges follow the rate in effect on each day of the stay; the doctor and
+medicine fees are the ones in effect on the admission day.  The earliest
+period of a type also covers days before it.  Admission types without rates
+are rejected instead of being billed as another type.
+
+``Tariff`` compiles a version into sorted start days and cumulative room
+cost per admission type, so the room charges of a stay of any length are
+two binary searches however many periods it spans.  ``TariffBook`` keeps the
+newest version compiled in memory; it checks for a newer one at most every
+``max_age`` seconds (one small indexed read) and at once after ``publish``,
+so billing never waits on the database for rates.  Without any published
+version the built-in ``BUILT_IN_RATES`` apply.
+
+    python tariffs.py show
+    python tariffs.py set-rate ICU --from 2026-01-01 --room 12000
+    python tariffs.py publish schedule.json --note "2026 schedule"
+"""
+import argparse
+import json
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+RATE_FIELDS = ("room_per_day", "doctor_fee", "medicine_base")
+BUILT_IN_RATES = {
+    "Emergency": {"room_per_day": 5000, "doctor_fee": 2000, "medicine_base": 1500},
+    "Regular": {"room_per_day": 3000, "doctor_fee": 1500, "medicine_base": 1000},
+    "ICU": {"room_per_day": 10000, "doctor_fee": 3000, "medicine_base": 2500}
+}
+EPOCH = datetime(1970, 1, 1)
+DEFAULT_MAX_AGE = 60.0
+PUBLISH_ATTEMPTS = 5
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def built_in_rows() -> List[Dict]:
+    return [dict(rates, admission_type=admission_type, effective_from=EPOCH)
+            for admission_type, rates in BUILT_IN_RATES.items()]
+
+
+def validate_rows(rows: Iterable[Dict]) -> List[Dict]:
+    """Normalized copies of rate rows; raises ValueError on the first bad row"""
+    normalized, seen = [], set()
+    for row in rows:
+        admission_type = row.get("admission_type")
+        if not isinstance(admission_type, str) or not admission_type.strip():
+            raise ValueError(f"Rate row without an admission type: {row}")
+        effective_from = row.get("effective_from", EPOCH)
+        if isinstance(effective_from, str):
+            effective_from = datetime.strptime(effective_from, DAY_FORMAT)
+        if not isinstance(effective_from, datetime):
+            raise ValueError(f"Bad effective_from for {admission_type}: {effective_from!r}")
+        effective_from = datetime(effective_from.year, effective_from.month, effective_from.day)
+        key = (admission_type, effective_from)
+        if key in seen:
+            raise ValueError(f"Two {admission_type} rates effective from "
+                             f"{effective_from:%Y-%m-%d}")
+        seen.add(key)
+        clean = {"admission_type": admission_type, "effective_from": effective_from}
+        for field in RATE_FIELDS:
+            value = row.get(field)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise ValueError(f"Bad {field} for {admission_type} from "
+                                 f"{effective_from:%Y-%m-%d}: {value!r}")
+            clean[field] = value
+        normalized.append(clean)
+    if not normalized:
+        raise ValueError("A tariff needs at least one rate row")
+    return sorted(normalized, key=lambda r: (r["admission_type"], r["effective_from"]))
+
+
+class _Schedule:
+    """Periods of one admission type: start days, rates and cumulative room cost"""
+
+    __slots__ = ("starts", "rows", "room", "cumulative")
+
+    def __init__(self, rows: List[Dict]):
+        self.starts = [row["effective_from"].toordinal() for row in rows]
+        self.rows = rows
+        self.room = [row["room_per_day"] for row in rows]
+        # cumulative[i]: room cost of one bed from starts[0] up to starts[i]
+        self.cumulative = [0] * len(rows)
+        for i in range(1, len(rows)):
+            self.cumulative[i] = self.cumulative[i - 1] + \
+                (self.starts[i] - self.starts[i - 1]) * self.room[i - 1]
+
+    def index(self, day: int) -> int:
+        return max(bisect_right(self.starts, day) - 1, 0)
+
+    def room_until(self, day: int):
+        """Room cost of one bed from starts[0] up to ``day`` (negative before it)"""
+        i = self.index(day)
+        return self.cumulative[i] + (day - self.starts[i]) * self.room[i]
+
+
+class Tariff:
+    """One compiled version of the fee schedule"""
+
+    def __init__(self, version: int, rows: Iterable[Dict],
+                 published_at: Optional[datetime] = None, note: str = ""):
+        self.version = version
+        self.published_at = published_at
+        self.note = note
+        self.rows = validate_rows(rows)
+        grouped: Dict[str, List[Dict]] = {}
+        for row in self.rows:
+            grouped.setdefault(row["admission_type"], []).append(row)
+        self._schedules = {t: _Schedule(rows) for t, rows in grouped.items()}
+
+    @classmethod
+    def from_document(cls, document: Dict) -> "Tariff":
+        return cls(document["_id"], document["rates"], document.get("published_at"),
+                   document.get("note", ""))
+
+    @property
+    def admission_types(self) -> List[str]:
+        return sorted(self._schedules)
+
+    def _schedule(self, admission_type: str) -> _Schedule:
+        schedule = self._schedules.get(admission_type)
+        if schedule is None:
+            raise ValueError(f"No rates for admission type '{admission_type}' in tariff "
+                             f"version {self.version} (known: {', '.join(self.admission_types)})")
+        return schedule
+
+    def rates_on(self, admission_type: str, day: datetime) -> Dict:
+        """Rate row in effect for ``admission_type`` on ``day``"""
+        schedule = self._schedule(admission_type)
+        return schedule.rows[schedule.index(day.toordinal())]
+
+    def charges(self, admission_type: str, admission_date: datetime, days: int) -> Dict:
+        """Room, doctor and medicine charges of a ``days``-day stay from ``admission_date``"""
+        schedule = self._schedule(admission_type)
+        first = admission_date.toordinal()
+        row = schedule.rows[schedule.index(first)]
+        room = schedule.room_until(first + days) - schedule.room_until(first) if days > 0 else 0
+        return {"room_charges": room, "doctor_charges": row["doctor_fee"],
+                "medicine_charges": row["medicine_base"]}
+
+    def charge_columns(self, admission_types: List[str], admission_dates: List[datetime],
+                       days: List[int]) -> Tuple[List, List, List]:
+        """Room, doctor and medicine charges of many stays, as one list per charge
+
+        The stays are priced an admission type at a time against its
+        schedule; entries whose type has no rates are None.
+        """
+        size = len(admission_types)
+        room, doctor, medicine = [None] * size, [None] * size, [None] * size
+        by_type: Dict[str, List[int]] = {}
+        for i, admission_type in enumerate(admission_types):
+            by_type.setdefault(admission_type, []).append(i)
+        for admission_type, rows in by_type.items():
+            schedule = self._schedules.get(admission_type)
+            if schedule is None:
+                continue
+            firsts = [admission_dates[i].toordinal() for i in rows]
+            lengths = [days[i] for i in rows]
+            rates = [schedule.rows[schedule.index(first)] for first in firsts]
+            stays = [schedule.room_until(first + n) - schedule.room_until(first) if n > 0 else 0
+                     for first, n in zip(firsts, lengths)]
+            for i, stay, rate in zip(rows, stays, rates):
+                room[i], doctor[i], medicine[i] = stay, rate["doctor_fee"], rate["medicine_base"]
+        return room, doctor, medicine
+
+    def periods(self, admission_type: str, admission_date: datetime,
+                days: int) -> List[Tuple[datetime, int, float]]:
+        """The stay split by rate period, as (first day, days, room rate)"""
+        schedule = self._schedule(admission_type)
+        first, end = admission_date.toordinal(), admission_date.toordinal() + days
+        split = []
+        i = schedule.index(first)
+        while first < end:
+            until = schedule.starts[i + 1] if i + 1 < len(schedule.starts) else end
+            until = min(until, end)
+            split.append((datetime.fromordinal(first), until - first, schedule.room[i]))
+            first, i = until, i + 1
+        return split
+
+    def to_document(self) -> Dict:
+        return {"_id": self.version, "published_at": self.published_at, "note": self.note,
+                "rates": self.rows}
+
+
+DEFAULT_TARIFF = Tariff(0, built_in_rows(), note="built-in")
+
+
+class TariffBook:
+    """Published tariff versions, with the newest kept compiled in memory"""
+
+    def __init__(self, tariffs_collection, max_age: float = DEFAULT_MAX_AGE,
+                 clock=time.monotonic):
+        self.tariffs_collection = tariffs_collection
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._current: Optional[Tariff] = None
+        self._checked_at: Optional[float] = None
+        self._versions: Dict[int, Tariff] = {}
+
+    def _latest_version(self) -> Optional[int]:
+        latest = list(self.tariffs_collection.find({}, {"_id": 1}).sort("_id", -1).limit(1))
+        return latest[0]["_id"] if latest else None
+
+    def current(self) -> Tariff:
+        """The newest published tariff (the built-in one if none was published)"""
+        current, checked_at = self._current, self._checked_at
+        if current is not None and checked_at is not None \
+                and self._clock() - checked_at <= self.max_age:
+            return current
+        with self._lock:
+            latest = self._latest_version()
+            if latest is None:
+                current = DEFAULT_TARIFF
+            elif self._current is not None and self._current.version == latest:
+                current = self._current
+            else:
+                current = self.version(latest)
+            self._current, self._checked_at = current, self._clock()
+            return current
+
+    def version(self, version: int) -> Tariff:
+        """A published version by number; raises ValueError if there is none"""
+        if version == DEFAULT_TARIFF.version:
+            return DEFAULT_TARIFF
+        tariff = self._versions.get(version)
+        if tariff is None:
+            document = self.tariffs_collection.find_one({"_id": version})
+            if document is None:
+                raise ValueError(f"No tariff version {version}")
+            tariff = self._versions[version] = Tariff.from_document(document)
+        return tariff
+
+    def invalidate(self) -> None:
+        """Look for a newer version on the next ``current``"""
+        self._checked_at = None
+
+    def publish(self, rows: Iterable[Dict], note: str = "") -> Tariff:
+        """Store ``rows`` as the next version and make it current here"""
+        rows = validate_rows(rows)
+        for _ in range(PUBLISH_ATTEMPTS):
+            tariff = Tariff((self._latest_version() or 0) + 1, rows, datetime.now(), note)
+            try:
+                self.tariffs_collection.insert_one(tariff.to_document())
+            except DuplicateKeyError:
+                # Another process published the same version number first
+                continue
+            self._versions[tariff.version] = tariff
+            self.invalidate()
+            return tariff
+        raise ValueError("Could not publish the tariff: version numbers kept colliding")
+
+    def set_rate(self, admission_type: str, effective_from: datetime, note: str = "",
+                 **rates) -> Tariff:
+        """Publish the current schedule with one period added or replaced
+
+        Rates that are not given are carried over from the period in effect
+        on ``effective_from``.
+        """
+        current = self.current()
+        effective_from = datetime(effective_from.year, effective_from.month,
+                                  effective_from.day)
+        try:
+            row = dict(current.rates_on(admission_type, effective_from))
+        except ValueError:
+            row = {}
+        missing = [field for field in RATE_FIELDS if rates.get(field) is None and field not in row]
+        if missing:
+            raise ValueError(f"New admission type '{admission_type}' needs "
+                             f"{', '.join(missing)}")
+        row.update({field: value for field, value in rates.items() if value is not None})
+        row.update(admission_type=admission_type, effective_from=effective_from)
+        rows = [r for r in current.rows if (r["admission_type"], r["effective_from"])
+                != (admission_type, effective_from)]
+        return self.publish(rows + [row], note)
+
+
+def _date(value: str) -> datetime:
+    return datetime.strptime(value, DAY_FORMAT)
+
+
+def main():
+    from app import HospitalManagementSystem, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Versioned fee schedules")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="print a tariff version (default: the current one)")
+    show.add_argument("--version", type=int)
+    publish = sub.add_parser("publish", help="publish a JSON list of rate rows")
+    publish.add_argument("file")
+    publish.add_argument("--note", default="")
+    set_rate = sub.add_parser("set-rate", help="publish the current tariff with one new period")
+    set_rate.add_argument("admission_type")
+    set_rate.add_argument("--from", dest="effective_from", type=_date, required=True,
+                          help="first day of the new rates, YYYY-MM-DD")
+    set_rate.add_argument("--room", dest="room_per_day", type=float)
+    set_rate.add_argument("--doctor", dest="doctor_fee", type=float)
+    set_rate.add_argument("--medicine", dest="medicine_base", type=float)
+    set_rate.add_argument("--note", default="")
+    args = parser.parse_args()
+
+    hms = HospitalManagementSystem(backend=backend_from_env())
+    try:
+        book = hms.tariffs
+        if args.command == "show":
+            tariff = book.current() if args.version is None else book.version(args.version)
+            published = f", published {tariff.published_at:%Y-%m-%d %H:%M}" \
+                if tariff.published_at else ""
+            print(f"Tariff version {tariff.version}{published} {tariff.note}".rstrip())
+            print(f"{'type':<12} {'from':<10} {'room/day':>10} {'doctor':>10} {'medicine':>10}")
+            for row in tariff.rows:
+                print(f"{row['admission_type']:<12} {row['effective_from']:%Y-%m-%d} "
+                      f"{row['room_per_day']:>10,.2f} {row['doctor_fee']:>10,.2f} "
+                      f"{row['medicine_base']:>10,.2f}")
+            return
+        if args.command == "publish":
+            with open(args.file, encoding="utf-8") as fh:
+                tariff = book.publish(json.load(fh), args.note)
+        else:
+            tariff = book.set_rate(args.admission_type, args.effective_from, args.note,
+                                   room_per_day=args.room_per_day, doctor_fee=args.doctor_fee,
+                                   medicine_base=args.medicine_base)
+        print(f"✅ Published tariff version {tariff.version} "
+              f"({len(tariff.rows)} rate periods, {len(tariff.admission_types)} admission types)")
+    except ValueError as error:
+        print(f"❌ {error}")
+    finally:
+        hms.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import HospitalManagementSystem  # noqa: E402
+from operations import new_patient_document  # noqa: E402
+from storage import EmbeddedBackend  # noqa: E402
+
+
+@pytest.fixture
+def hms(monkeypatch):
+    """A HospitalManagementSystem on a fresh in-memory backend"""
+    for name in ("HMS_WRITE_BEHIND", "HMS_WRITE_JOURNAL", "HMS_ARCHIVE_DIR"):
+        monkeypatch.delenv(name, raising=False)
+    system = HospitalManagementSystem(backend=EmbeddedBackend())
+    yield system
+    system.close()
+
+
+@pytest.fixture
+def admit(hms):
+    """Onboard a patient directly: ``admit(name, admission_type=..., room=..., ...)``"""
+    def admit(name: str, admission_type: str = "Regular", room: str = "101",
+              doctor: str = "Dr. House", admitted: datetime = datetime(2026, 1, 1, 9)):
+        patient = new_patient_document(hms.generate_patient_id(), {"name": name},
+                                       {"disease": "flu"}, admission_type, doctor, room,
+                                       now=admitted)
+        result = hms.operations.onboard(patient)
+        assert result.ok, result.message
+        return result.patient
+    return admit
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from analytics import LOS_LABELS, los_bucket
+
+START = datetime(2026, 1, 1, 9)
+
+
+@pytest.mark.parametrize("days, label", [
+    (1, "1"), (2, "2"), (3, "3"), (4, "4-7"), (7, "4-7"), (8, "8-14"), (14, "8-14"),
+    (15, "15-30"), (30, "15-30"), (31, "31+"), (400, "31+"),
+])
+def test_los_bucket_boundaries_are_inclusive_upper_bounds(days, label):
+    assert los_bucket(days) == label
+
+
+@pytest.fixture
+def stays(hms, admit):
+    """Admit on START and discharge after ``stay`` days (1 = the same day)"""
+    def stays(*lengths, admission_type="Regular", doctor="Dr. House"):
+        for stay in lengths:
+            patient = admit(f"Stay {stay}", admission_type, doctor=doctor, admitted=START)
+            discharged = START + timedelta(days=stay - 1, hours=2)
+            assert hms.operations.discharge(patient["patient_id"], now=discharged).ok
+    return stays
+
+
+def test_discharges_are_bucketed_by_length_of_stay(hms, stays):
+    stays(1, 3, 4, 7, 8, 31)
+    hms.analytics.update(now=datetime(2026, 3, 1))
+
+    total = hms.analytics.summary()["all"]
+
+    assert total["admissions"] == total["discharges"] == 6
+    assert total["los"] == dict(zip(LOS_LABELS, [1, 0, 1, 2, 1, 0, 1]))
+    assert total["patient_days"] == 54 and total["average_stay"] == 9.0
+
+
+def test_rollups_are_split_by_admission_type_and_doctor(hms, stays):
+    stays(2, 2)
+    stays(5, admission_type="ICU", doctor="Dr. Grey")
+    hms.analytics.update(now=datetime(2026, 2, 1))
+
+    by_type = hms.analytics.summary("admission_type")
+    assert {key: total["discharges"] for key, total in by_type.items()} \
+        == {"Regular": 2, "ICU": 1}
+    assert by_type["ICU"]["los"]["4-7"] == 1
+    assert hms.analytics.summary("assigned_doctor")["Dr. Grey"]["patient_days"] == 5
+
+
+def test_admissions_and_discharges_count_on_their_own_days(hms, stays):
+    stays(3)
+    hms.analytics.update(now=datetime(2026, 2, 1))
+
+    days = {(r["day"], r["admissions"], r["discharges"])
+            for r in hms.analytics.series(key="all")}
+    assert days == {("2026-01-01", 1, 0), ("2026-01-03", 0, 1)}
+
+
+def test_update_leaves_today_open_and_resumes_after_the_watermark(hms, admit, stays):
+    stays(1)
+    assert hms.analytics.update(now=datetime(2026, 1, 1, 23))["days"] == 0
+    assert hms.analytics.watermark() is None
+
+    hms.analytics.update(now=datetime(2026, 1, 5))
+    assert hms.analytics.watermark() == "2026-01-04"
+
+    admit("Late Entry", admitted=datetime(2026, 1, 2, 9))
+    hms.analytics.update(now=datetime(2026, 1, 6))
+    assert hms.analytics.summary()["all"]["admissions"] == 1
+
+    hms.analytics.rebuild(since=datetime(2026, 1, 2), now=datetime(2026, 1, 6))
+    assert hms.analytics.summary()["all"]["admissions"] == 2
+
+
+def test_unknown_dimension_raises_value_error(hms):
+    with pytest.raises(ValueError, match="Unknown dimension 'ward'"):
+        hms.analytics.summary("ward")
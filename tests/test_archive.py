@@ -0,0 +1,93 @@
+from datetime import datetime
+
+import pytest
+
+from app import HospitalManagementSystem
+from billing import build_bill
+from operations import new_patient_document
+from storage import EmbeddedBackend
+
+NOW = datetime(2026, 9, 1)
+
+
+@pytest.fixture(params=["collection", "segment"])
+def system(request, monkeypatch, tmp_path):
+    """A system archiving to collections or to segment files"""
+    for name in ("HMS_WRITE_BEHIND", "HMS_WRITE_JOURNAL", "HMS_ARCHIVE_DIR"):
+        monkeypatch.delenv(name, raising=False)
+    if request.param == "segment":
+        monkeypatch.setenv("HMS_ARCHIVE_DIR", str(tmp_path / "archive"))
+    hms = HospitalManagementSystem(backend=EmbeddedBackend())
+    yield hms
+    hms.close()
+
+
+@pytest.fixture
+def discharged(system):
+    """Admit, bill and discharge a patient on ``day``; ``paid`` settles the bill"""
+    def discharged(name: str, day: datetime = datetime(2026, 1, 1), paid: bool = True) -> str:
+        patient = new_patient_document(system.generate_patient_id(), {"name": name},
+                                       {"disease": "flu"}, "Regular", "Dr. House", "101",
+                                       now=day)
+        system.operations.onboard(patient)
+        bill = build_bill(patient, now=day)
+        system.operations.save_bill(bill, now=day)
+        if paid:
+            system.ledger.record_payment(patient["patient_id"], bill["total_amount"], now=day)
+        system.operations.discharge(patient["patient_id"], now=day)
+        return patient["patient_id"]
+    return discharged
+
+
+def test_settled_old_patients_move_to_the_archive(system, discharged):
+    old = [discharged(f"Old {i}") for i in range(5)]
+    unsettled = discharged("Owes", paid=False)
+    recent = discharged("Recent", day=datetime(2026, 8, 1))
+
+    report = system.archiver.run(older_than_days=180, batch_size=2, now=NOW)
+
+    assert (report.patients, report.bills, report.batches) == (5, 5, 3)
+    assert {p["patient_id"] for p in system.patients_collection.find({})} == {unsettled, recent}
+    record = system.archiver.lookup(old[0])
+    assert record["patient"]["personal_info"]["name"] == "Old 0"
+    assert [b["patient_id"] for b in record["bills"]] == [old[0]]
+    assert system.archiver.lookup(unsettled) is None
+    assert system.census.drift() == {}
+    assert system.ledger.rebuild(check=True) == {"patients": 0, "receivables": 0}
+
+
+def test_stopped_run_is_resumed_by_running_again(system, discharged):
+    for i in range(5):
+        discharged(f"Old {i}")
+
+    assert system.archiver.run(batch_size=2, max_batches=1, now=NOW).patients == 2
+    assert system.archiver.run(batch_size=2, now=NOW).patients == 3
+    assert system.patients_collection.count_documents({}) == 0
+
+
+def test_patient_changed_while_its_batch_is_archived_stays_hot(system, discharged, monkeypatch):
+    changed, other = discharged("Changed"), discharged("Other")
+    write = system.archiver.tier.write
+    removed = []
+    system.archiver.add_listener(lambda changes: removed.extend(
+        before["patient_id"] for before, _ in changes))
+
+    def write_then_change(patients, bills):
+        locations = write(patients, bills)
+        system.operations.update_fields(changed, {"personal_info.phone": "9876543210"})
+        return locations
+
+    monkeypatch.setattr(system.archiver.tier, "write", write_then_change)
+    report = system.archiver.run(now=NOW)
+
+    assert (report.patients, report.bills, removed) == (1, 1, [other])
+    assert system.operations.get_patient(changed)["personal_info"]["phone"] == "9876543210"
+    assert system.billing_collection.count_documents({"patient_id": changed}) == 1
+    assert not system.archiver.is_archived(changed)
+    assert system.archiver.is_archived(other)
+    assert system.census.drift() == {}
+    assert system.ledger.rebuild(check=True) == {"patients": 0, "receivables": 0}
+
+    monkeypatch.undo()
+    assert system.archiver.run(now=NOW).patients == 1
+    assert system.archiver.lookup(changed)["patient"]["personal_info"]["phone"] == "9876543210"
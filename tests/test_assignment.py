@@ -0,0 +1,146 @@
+import logging
+import os
+import time
+
+import pytest
+
+from assignment import AssignmentEngine, load_rooms, room_range, validate_rooms
+from importer import import_file
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      "hospital_db.patients.json")
+
+
+@pytest.fixture
+def wards(hms):
+    """Two Regular rooms with 2 and 3 beds and two single-bed ICU rooms"""
+    hms.assignment.set_rooms({"Regular": {"101": 2, "102": 3}, "ICU": {"500": 1, "501": 1}})
+    return hms.assignment
+
+
+def test_the_inventory_is_read_from_the_rooms_collection(hms, wards):
+    assert load_rooms(hms.rooms_collection) == {"Regular": {"101": 2, "102": 3},
+                                                "ICU": {"500": 1, "501": 1}}
+    assert (wards.free_beds("102"), wards.room_type("500")) == (3, "ICU")
+
+
+def test_without_an_inventory_no_room_is_offered(hms, admit):
+    admit("Aby Pal", room="24")
+    best = hms.assignment.suggest("Regular")
+    assert (best.room_number, best.assigned_doctor) == (None, "Dr. House")
+    assert hms.assignment.free_beds("101") is None
+
+
+def test_suggest_and_reserve_follow_free_beds_and_caseload(wards, admit):
+    admit("Aby Pal", room="102", doctor="Dr. Grey")
+    admit("Ravi Kumar", room="102", doctor="Dr. Grey")
+    admit("Mina Shah", room="101", doctor="Dr. House")
+
+    assert wards.suggest("Regular")[1:] == ("101", "Dr. House", 1, 1)
+    first = wards.reserve("Regular")
+    second = wards.reserve("Regular")
+    assert (first.room_number, second.room_number) == ("101", "102")
+    assert wards.reserve("Regular").room_number is None
+
+    wards.release(second)
+    assert wards.free_beds("102") == 1
+
+
+def test_rooms_missing_from_the_inventory_have_unknown_capacity(wards, admit, caplog):
+    with caplog.at_level(logging.WARNING, logger="assignment"):
+        admit("Aby Pal", admission_type="ICU", room="ICU-3")
+        admit("Ravi Kumar", admission_type="ICU", room="ICU-3")
+
+    assert wards.free_beds("ICU-3") is None
+    assert wards.occupancy("ICU-3") == 2
+    assert [room for room, _ in wards.emptiest_rooms("ICU")] == ["500", "501"]
+    assert sum("ICU-3" in r.getMessage() for r in caplog.records) == 1
+
+
+def test_sample_rooms_are_not_classified_without_an_inventory(hms):
+    import_file(hms.patients_collection, SAMPLE,
+                listeners=[hms.assignment.apply_changes])
+
+    assert hms.assignment.room_type("24") is None
+    assert hms.assignment.free_beds("45") is None
+    assert hms.assignment.occupancy("45") == 1
+
+
+def run_with_answers(monkeypatch, answers, action):
+    answers = iter(answers)
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    return action()
+
+
+def test_onboarding_accepts_a_room_missing_from_the_inventory(hms, wards, admit, monkeypatch,
+                                                              capsys):
+    admit("Aby Pal", admission_type="ICU", room="ICU-3")
+    admit("Ravi Kumar", admission_type="ICU", room="ICU-3")
+
+    patient_id = run_with_answers(monkeypatch, [
+        "Mina Shah", "40", "F", "9876543210", "Main Street", "9876543211",
+        "flu", "fever", "", "", "ICU", "Dr. House", "ICU-3"], hms.patient_onboarding)
+
+    assert patient_id
+    assert hms.get_patient(patient_id)["admission_info"]["room_number"] == "ICU-3"
+    assert "capacity is unknown" in capsys.readouterr().out
+
+
+def test_room_change_refuses_only_full_rooms(hms, wards, admit, monkeypatch):
+    admit("Aby Pal", admission_type="ICU", room="500")
+    patient_id = admit("Ravi Kumar", admission_type="ICU", room="501")["patient_id"]
+
+    assert run_with_answers(monkeypatch, ["3", "500", ""],
+                            lambda: hms.update_patient_info(patient_id)) is False
+    run_with_answers(monkeypatch, ["3", "ICU-9", ""],
+                     lambda: hms.update_patient_info(patient_id))
+
+    assert hms.get_patient(patient_id)["admission_info"]["room_number"] == "ICU-9"
+    assert wards.free_beds("501") == 1
+
+
+def test_requests_never_wait_for_the_periodic_rebuild(hms, wards, monkeypatch):
+    wards.suggest("ICU")
+    calls = []
+    monkeypatch.setattr(wards, "refresh", lambda: calls.append(1))
+
+    for _ in range(100):
+        wards.suggest("ICU")
+        wards.free_beds("500")
+
+    assert calls == []
+
+
+def test_background_refresh_picks_up_other_processes(hms, admit):
+    engine = AssignmentEngine(hms.patients_collection, rooms_collection=hms.rooms_collection,
+                              refresh_interval=0.01)
+    try:
+        assert engine.free_beds("700") is None
+        hms.rooms_collection.insert_one({"_id": "700", "admission_type": "ICU", "beds": 2})
+        admit("Aby Pal", admission_type="ICU", room="700")  # engine is not a listener
+
+        deadline = time.monotonic() + 5
+        while engine.free_beds("700") != 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert engine.free_beds("700") == 1
+    finally:
+        engine.close()
+    assert not engine._thread.is_alive()
+
+
+@pytest.mark.parametrize("rooms", [
+    {"ICU": {"500": 0}},
+    {"ICU": {"500": "2"}},
+    {"ICU": {"500": 1}, "Regular": {"500": 4}},
+    {"ICU": ["500"]},
+])
+def test_bad_inventories_are_rejected(rooms):
+    with pytest.raises(ValueError):
+        validate_rooms(rooms)
+
+
+def test_room_ranges():
+    assert room_range("500-503") == ["500", "501", "502", "503"]
+    assert (room_range("24"), room_range("ICU-3")) == (["24"], ["ICU-3"])
+    with pytest.raises(ValueError):
+        room_range("510-500")
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from app import HospitalManagementSystem
+from assignment import AssignmentEngine
+from async_api import AsyncHospitalService
+from operations import CONFLICT, INVALID, OK, UNAVAILABLE, OperationResult
+from storage import EmbeddedBackend
+from write_queue import WriteBehindQueue
+
+NAME, DISEASE = {"name": "Aby Pal"}, {"disease": "flu"}
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture
+def icu_beds(hms):
+    """A service over a system with ``beds`` single-bed ICU rooms and one doctor"""
+    services = []
+
+    def icu_beds(beds: int) -> AsyncHospitalService:
+        rooms = {"ICU": {str(500 + i): 1 for i in range(beds)}}
+        hms.assignment = AssignmentEngine(hms.patients_collection, rooms=rooms,
+                                          doctors=["Dr. Grey"], census=hms.census)
+        hms.operations.add_listener(hms.assignment.record)
+        services.append(AsyncHospitalService(hms, max_workers=4))
+        return services[-1]
+    yield icu_beds
+    for service in services:
+        service.close()
+
+
+@pytest.fixture
+def service(icu_beds):
+    return icu_beds(1)
+
+
+def test_admission_type_without_rates_is_invalid(service):
+    result = run(service.onboard(NAME, DISEASE, "Daycare"))
+    assert (result.status, result.patient) == (INVALID, None)
+
+
+def test_no_free_bed_is_unavailable_not_a_conflict(service):
+    first = run(service.onboard(NAME, DISEASE, "ICU"))
+    second = run(service.onboard({"name": "Ravi Kumar"}, DISEASE, "ICU"))
+
+    assert first.status == OK
+    assert first.patient["admission_info"]["room_number"] == "500"
+    assert second.status == UNAVAILABLE
+
+
+def test_failed_onboarding_gives_its_reservation_back(hms, service, monkeypatch):
+    monkeypatch.setattr(hms.operations, "onboard",
+                        lambda patient: OperationResult(CONFLICT, None, "lost a race"))
+    assert run(service.onboard(NAME, DISEASE, "ICU")).status == CONFLICT
+    monkeypatch.undo()
+
+    assert run(service.onboard(NAME, DISEASE, "ICU")).status == OK
+
+
+def test_concurrent_onboardings_never_share_a_bed(icu_beds):
+    service = icu_beds(5)
+
+    async def burst():
+        return await asyncio.gather(*(service.onboard({"name": f"Patient {i}"}, DISEASE, "ICU")
+                                      for i in range(8)))
+
+    results = run(burst())
+    rooms = [r.patient["admission_info"]["room_number"] for r in results if r.ok]
+    assert sorted(rooms) == ["500", "501", "502", "503", "504"]
+    assert [r.status for r in results].count(UNAVAILABLE) == 3
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    """A system with write-behind enabled and a service over it"""
+    monkeypatch.setenv("HMS_WRITE_BEHIND", "1")
+    for name in ("HMS_WRITE_JOURNAL", "HMS_ARCHIVE_DIR"):
+        monkeypatch.delenv(name, raising=False)
+    hms = HospitalManagementSystem(backend=EmbeddedBackend())
+    service = AsyncHospitalService(hms, max_workers=4)
+    yield hms, service
+    service.close()
+    hms.close()
+
+
+def test_writes_go_through_the_write_behind_queue(queued):
+    hms, service = queued
+    assert hms.write_queue is not None
+    patient_id = run(service.onboard(NAME, DISEASE, "Regular", "Dr. House", "101")) \
+        .patient["patient_id"]
+
+    async def session():
+        updated = await service.update(patient_id, {"medical_info.symptoms": "cough"})
+        seen = await service.status(patient_id)
+        bill = await service.bill(patient_id, lab_charges=750)
+        first = await service.discharge(patient_id, "home")
+        second = await service.discharge(patient_id, "again")
+        return updated, seen, bill, first, second
+
+    updated, seen, bill, first, second = run(session())
+
+    assert updated.status == OK and seen["medical_info"]["symptoms"] == "cough"
+    assert bill["charges"]["lab_charges"] == 750
+    assert (first.status, second.status) == (OK, CONFLICT)
+    stored = hms.operations.get_patient(patient_id)
+    assert stored["admission_info"]["status"] == "Discharged"
+    assert stored["billing_info"]["total_amount"] == bill["total_amount"]
+
+
+def test_status_includes_writes_still_in_the_queue(queued):
+    hms, service = queued
+    patient_id = run(service.onboard(NAME, DISEASE, "Regular", "Dr. House", "101")) \
+        .patient["patient_id"]
+    hms.write_queue.close()
+    hms.write_queue = WriteBehindQueue(hms.operations, flush_interval=60)
+    hms.write_queue.update_fields(patient_id, {"medical_info.symptoms": "queued"})
+
+    assert run(service.status(patient_id))["medical_info"]["symptoms"] == "queued"
+    assert "symptoms" not in hms.operations.get_patient(patient_id)["medical_info"]
@@ -0,0 +1,181 @@
+from datetime import datetime
+
+import pytest
+
+from billing import POSTING, base_charges, days_admitted
+
+NOW = datetime(2026, 1, 3, 18)  # the third day of a stay from 2026-01-01 09:00
+
+
+def total(hms, patient_id):
+    return hms.ledger.balance(patient_id)["total_amount"]
+
+
+def test_days_admitted_counts_the_admission_day():
+    assert days_admitted(datetime(2026, 1, 1, 23), datetime(2026, 1, 1, 23, 30)) == 1
+    assert days_admitted(datetime(2026, 1, 1, 23), datetime(2026, 1, 2, 1)) == 1
+    assert days_admitted(datetime(2026, 1, 1, 9), NOW) == 3
+
+
+def test_run_bills_active_admissions_with_pending_charges_once(hms, admit):
+    patient_id = admit("Aby Pal")["patient_id"]
+    discharged = admit("Ravi Kumar")["patient_id"]
+    hms.operations.discharge(discharged, now=datetime(2026, 1, 2))
+    hms.billing_engine.add_charge(patient_id, "lab", 750, "CBC panel")
+
+    report = hms.run_billing(now=NOW)
+
+    assert (report.patients, report.charges_applied, report.tariff_version) == (1, 1, 0)
+    assert total(hms, patient_id) == 11500 + 750
+    bill = hms.billing_collection.find_one({"patient_id": patient_id})
+    assert (bill["status"], bill["charges"]["lab_charges"]) == ("Generated", 750)
+
+    hms.run_billing(now=NOW)
+    assert total(hms, patient_id) == 11500 + 750
+    assert hms.billing_collection.find_one({"patient_id": discharged}) is None
+
+
+def test_unknown_admission_type_is_skipped_and_counted(hms, admit):
+    admit("Aby Pal")
+    admit("Day Case", admission_type="Daycare")
+
+    report = hms.run_billing(now=NOW)
+
+    assert (report.patients, report.skipped) == (1, 1)
+
+
+def test_bill_records_the_tariff_version_it_was_priced_with(hms, admit):
+    patient_id = admit("Aby Pal")["patient_id"]
+    hms.tariffs.set_rate("Regular", datetime(2026, 1, 2), room_per_day=4000)
+
+    report = hms.run_billing(now=NOW)
+
+    assert report.tariff_version == 1
+    assert hms.billing_collection.find_one({"patient_id": patient_id})["tariff_version"] == 1
+    # One day at the old rate, two at the new one
+    assert total(hms, patient_id) == 3000 + 2 * 4000 + 1500 + 1000
+
+
+def test_mid_stay_rate_change_matches_base_charges(hms, admit):
+    hms.tariffs.set_rate("Regular", datetime(2026, 1, 2), room_per_day=4000)
+    tariff = hms.tariffs.current()
+
+    charges = base_charges("Regular", datetime(2026, 1, 1, 9), NOW, tariff)
+
+    assert (charges["room_charges"], charges["days_admitted"]) == (11000, 3)
+    assert tariff.periods("Regular", datetime(2026, 1, 1, 9), 3) \
+        == [(datetime(2026, 1, 1), 1, 3000), (datetime(2026, 1, 2), 2, 4000)]
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.mark.parametrize("collection", ["charges_collection", "patients_collection"])
+def test_run_interrupted_after_the_bills_is_finished_without_charging_twice(
+        hms, admit, monkeypatch, collection):
+    patient_id = admit("Aby Pal")["patient_id"]
+    hms.billing_engine.add_charge(patient_id, "pharmacy", 400)
+    hms.ledger.record_payment(patient_id, 1000)
+
+    def crash(*args, **kwargs):
+        raise Crash()
+
+    monkeypatch.setattr(getattr(hms, collection), "bulk_write", crash)
+    with pytest.raises(Crash):
+        hms.run_billing(now=NOW)
+    monkeypatch.undo()
+    assert hms.billing_collection.find_one({"patient_id": patient_id})["status"] == POSTING
+
+    report = hms.run_billing(now=NOW)
+
+    assert report.recovered == 1
+    balance = hms.ledger.balance(patient_id)
+    assert (balance["total_amount"], balance["outstanding_amount"]) == (11900, 10900)
+    assert hms.charges_collection.count_documents({"status": "Pending"}) == 0
+    assert hms.billing_collection.find_one({"patient_id": patient_id})["status"] == "Generated"
+    assert hms.ledger.rebuild(check=True) == {"patients": 0, "receivables": 0}
+
+
+@pytest.mark.parametrize("stop", ["listeners", "marking"])
+def test_run_stopped_after_the_patient_totals_recomputes_the_receivables(
+        hms, admit, monkeypatch, stop):
+    patient_id = admit("Aby Pal")["patient_id"]
+    hms.run_billing(now=datetime(2026, 1, 2, 18))
+    hms.billing_engine.add_charge(patient_id, "lab", 750)
+
+    def crash(*args, **kwargs):
+        raise Crash()
+
+    if stop == "listeners":
+        # Patient totals written, ledger not told
+        monkeypatch.setattr(hms.billing_engine, "_listeners", [crash])
+    else:
+        # Ledger told, bills not yet marked Generated
+        write = hms.billing_collection.bulk_write
+        calls = []
+
+        def second_write_crashes(ops, **kwargs):
+            calls.append(ops)
+            if len(calls) == 2:
+                raise Crash()
+            return write(ops, **kwargs)
+
+        monkeypatch.setattr(hms.billing_collection, "bulk_write", second_write_crashes)
+    with pytest.raises(Crash):
+        hms.run_billing(now=NOW)
+    monkeypatch.undo()
+
+    assert hms.run_billing(now=NOW).recovered == 1
+    assert total(hms, patient_id) == 11500 + 750
+    assert hms.ledger.rebuild(check=True) == {"patients": 0, "receivables": 0}
+
+
+def test_patient_discharged_during_the_run_keeps_the_previous_bill(hms, admit, monkeypatch):
+    staying = admit("Aby Pal")["patient_id"]
+    leaving = admit("Ravi Kumar")["patient_id"]
+    hms.run_billing(now=datetime(2026, 1, 2, 18))
+    hms.billing_engine.add_charge(leaving, "lab", 750)
+    write = hms.billing_collection.bulk_write
+
+    def discharge_first(ops, **kwargs):
+        monkeypatch.setattr(hms.billing_collection, "bulk_write", write)
+        hms.operations.discharge(leaving, now=datetime(2026, 1, 3, 12))
+        return write(ops, **kwargs)
+
+    monkeypatch.setattr(hms.billing_collection, "bulk_write", discharge_first)
+    report = hms.run_billing(now=NOW)
+
+    assert (report.patients, report.charges_applied) == (1, 0)
+    bill = hms.billing_collection.find_one({"patient_id": leaving})
+    assert (bill["status"], bill["total_amount"]) == ("Generated", 8500)
+    assert total(hms, leaving) == 8500
+    assert hms.charges_collection.find_one({"patient_id": leaving})["status"] == "Pending"
+    assert total(hms, staying) == 11500
+    assert hms.ledger.rebuild(check=True) == {"patients": 0, "receivables": 0}
+
+
+def test_desk_bill_adds_to_billed_and_pending_charges(hms, admit, monkeypatch):
+    patient_id = admit("Aby Pal")["patient_id"]
+    hms.billing_engine.add_charge(patient_id, "lab", 750)
+    hms.run_billing(now=datetime(2026, 1, 2, 18))
+    hms.billing_engine.add_charge(patient_id, "pharmacy", 400)
+    answers = iter(["500", "", ""])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+
+    bill = hms.fee_calculator(patient_id)
+
+    assert (bill["charges"]["lab_charges"], bill["charges"]["pharmacy_charges"]) == (1250, 400)
+    stored = hms.billing_collection.find_one({"patient_id": patient_id})
+    assert stored["applied_charges"] == bill["applied_charges"] != []
+    assert hms.charges_collection.count_documents({"status": "Pending"}) == 0
+
+    hms.run_billing(now=NOW)
+    charges = hms.billing_collection.find_one({"patient_id": patient_id})["charges"]
+    assert (charges["lab_charges"], charges["pharmacy_charges"]) == (1250, 400)
+    assert hms.ledger.rebuild(check=True) == {"patients": 0, "receivables": 0}
+
+
+def test_unknown_charge_category_raises_value_error(hms):
+    with pytest.raises(ValueError, match="Unknown charge category 'snacks'"):
+        hms.billing_engine.add_charge("PAT00000001", "snacks", 10)
@@ -0,0 +1,120 @@
+import pytest
+
+from app import HospitalManagementSystem, cache_from_env
+from cache import PatientCache
+from operations import new_patient_document
+from storage import EmbeddedBackend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_least_recently_used_entry_is_evicted_first(clock):
+    cache = PatientCache(max_size=2, clock=clock)
+    cache.put("A", {"patient_id": "A"})
+    cache.put("B", {"patient_id": "B"})
+    cache.get("A")
+
+    cache.put("C", {"patient_id": "C"})
+
+    assert (cache.get("A"), cache.get("B")) == ({"patient_id": "A"}, None)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = PatientCache(ttl=30, clock=clock)
+    cache.put("A", {"patient_id": "A"})
+
+    clock.now = 29.9
+    assert cache.get("A") is not None
+    clock.now = 30.0
+    assert cache.get("A") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["size"]) == (1, 1, 1, 0)
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_callers_get_copies_not_the_cached_document(clock):
+    cache = PatientCache(clock=clock)
+    doc = {"patient_id": "A", "medical_info": {"disease": "flu"}}
+    cache.put("A", doc)
+    doc["medical_info"]["disease"] = "changed by the caller"
+
+    cache.get("A")["medical_info"]["disease"] = "changed again"
+
+    assert cache.get("A")["medical_info"]["disease"] == "flu"
+
+
+def test_storing_none_drops_the_entry(clock):
+    cache = PatientCache(clock=clock)
+    cache.put("A", {"patient_id": "A"})
+    cache.put("B", {"patient_id": "B"})
+
+    cache.put("A", None)
+    cache.invalidate_many(["B", "unknown"])
+
+    assert cache.stats()["size"] == 0
+
+
+def test_misses_are_loaded_but_not_remembered(clock):
+    cache = PatientCache(clock=clock)
+    loads = []
+
+    def loader(patient_id):
+        loads.append(patient_id)
+        return {"patient_id": patient_id} if patient_id == "A" else None
+
+    for patient_id in ("A", "A", "B", "B"):
+        cache.get_or_load(patient_id, loader)
+
+    assert loads == ["A", "B", "B"]
+
+
+def test_size_must_be_positive():
+    with pytest.raises(ValueError):
+        PatientCache(max_size=0)
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    for name in ("HMS_WRITE_BEHIND", "HMS_WRITE_JOURNAL", "HMS_ARCHIVE_DIR"):
+        monkeypatch.delenv(name, raising=False)
+    hms = HospitalManagementSystem(backend=EmbeddedBackend(), cache=PatientCache())
+    yield hms
+    hms.close()
+
+
+def test_writes_keep_cached_patients_current(cached):
+    patient = new_patient_document(cached.generate_patient_id(), {"name": "Aby Pal"},
+                                   {"disease": "flu"}, "Regular", "Dr. House", "101")
+    patient_id = cached.operations.onboard(patient).patient["patient_id"]
+    cached.operations.get_patient(patient_id)
+
+    cached.operations.update_fields(patient_id, {"medical_info.symptoms": "cough"})
+    cached.operations.discharge(patient_id)
+
+    stored = cached.operations.get_patient(patient_id)
+    assert stored["medical_info"]["symptoms"] == "cough"
+    assert stored["admission_info"]["status"] == "Discharged"
+    assert cached.cache.stats()["hits"] == 2
+
+
+def test_cache_is_configured_from_the_environment(monkeypatch):
+    monkeypatch.delenv("HMS_CACHE_SIZE", raising=False)
+    assert cache_from_env() is None
+
+    monkeypatch.setenv("HMS_CACHE_SIZE", "64")
+    monkeypatch.setenv("HMS_CACHE_TTL", "5")
+    cache = cache_from_env()
+    assert (cache.max_size, cache.ttl) == (64, 5.0)
@@ -0,0 +1,58 @@
+from census import census_keys
+
+
+def test_active_patient_counts_in_every_dimension_and_discharged_only_by_status(hms, admit):
+    patient = admit("Aby Pal", admission_type="ICU", room="501", doctor="Dr. Grey")
+
+    assert sorted(census_keys(patient)) == [
+        ("admission_type", "ICU"), ("assigned_doctor", "Dr. Grey"),
+        ("room_number", "501"), ("status", "Active")]
+    discharged = hms.operations.discharge(patient["patient_id"]).patient
+    assert census_keys(discharged) == [("status", "Discharged")]
+    assert census_keys(None) == []
+
+
+def test_writes_move_the_counters(hms, admit):
+    first = admit("Aby Pal", room="101")
+    admit("Ravi Kumar", room="101")
+    admit("Meera Das", room="102", doctor="Dr. Grey")
+
+    hms.operations.update_fields(first["patient_id"], {"admission_info.room_number": "103"})
+    hms.operations.discharge(first["patient_id"])
+
+    assert hms.census.counts("room_number") == {"101": 1, "102": 1}
+    assert hms.census.counts("room_number", include_empty=True)["103"] == 0
+    assert hms.census.get("status", "Discharged") == 1
+    assert hms.census.get("assigned_doctor", "Dr. House") == 1
+    assert hms.census.drift() == {}
+
+
+def test_snapshot_leaves_out_empty_counters(hms, admit):
+    patient = admit("Aby Pal")
+    hms.operations.discharge(patient["patient_id"])
+
+    assert hms.census.snapshot() == {"status": {"Discharged": 1}, "admission_type": {},
+                                     "room_number": {}, "assigned_doctor": {}}
+
+
+def test_rebuild_repairs_writes_made_outside_the_app(hms, admit):
+    patient = admit("Aby Pal", room="101")
+    hms.patients_collection.update_one({"patient_id": patient["patient_id"]},
+                                       {"$set": {"admission_info.room_number": "202"}})
+    assert hms.census.drift() == {("room_number", "101"): (1, 0),
+                                  ("room_number", "202"): (0, 1)}
+
+    corrected = hms.census.rebuild()
+
+    assert set(corrected) == {("room_number", "101"), ("room_number", "202")}
+    assert hms.census.drift() == {}
+    assert hms.census.counts("room_number") == {"202": 1}
+
+
+def test_batch_changes_are_applied_together(hms, admit):
+    before = admit("Aby Pal", room="101")
+    after = dict(before, admission_info=dict(before["admission_info"], room_number="105"))
+
+    hms.census.apply_changes([(before, after), (None, after)])
+
+    assert hms.census.counts("room_number") == {"105": 2}
@@ -0,0 +1,53 @@
+import pytest
+
+from datagen import PatientGenerator, load, scale_count, write_ndjson
+from importer import import_file
+
+
+def test_record_depends_only_on_seed_and_index():
+    generator = PatientGenerator(seed=7)
+    run = list(generator.patients(10_005))[9_995:]
+
+    assert list(generator.patients(10, start=9_995)) == run
+    assert [p["patient_id"] for p in run] == [f"PAT{i:08X}" for i in range(9_995, 10_005)]
+    assert list(PatientGenerator(seed=8).patients(10, start=9_995)) != run
+
+
+def test_records_have_the_shape_of_the_app_documents():
+    for patient, bill in PatientGenerator().records(500):
+        admission = patient["admission_info"]
+        billing = patient["billing_info"]
+        assert set(patient["search"]) == {"name", "tokens"}
+        assert billing["outstanding_amount"] == billing["total_amount"] - billing["paid_amount"]
+        if admission["status"] == "Discharged":
+            assert admission["discharge_date"] >= admission["admission_date"]
+            assert bill is not None
+        if bill is not None:
+            assert bill["total_amount"] == billing["total_amount"]
+            assert bill["patient_id"] == patient["patient_id"]
+
+
+def test_loaded_data_matches_its_ledger(hms):
+    load(hms.patients_collection, hms.billing_collection, 300, batch_size=128,
+         payments_collection=hms.payments_collection)
+    hms.census.rebuild()
+    hms.ledger.rebuild()
+
+    assert hms.patients_collection.count_documents({}) == 300
+    assert hms.ledger.rebuild(check=True) == {"patients": 0, "receivables": 0}
+
+
+def test_ndjson_output_imports_unchanged(hms, tmp_path):
+    path = str(tmp_path / "patients.ndjson.gz")
+
+    written, billed = write_ndjson(path, 50, billing_path=str(tmp_path / "bills.ndjson"))
+
+    assert written == 50 and 0 < billed <= 50
+    assert import_file(hms.patients_collection, path).inserted == 50
+    stored = hms.patients_collection.find_one({"patient_id": "PAT00000007"}, {"_id": 0})
+    assert stored == next(PatientGenerator().patients(1, start=7))
+
+
+@pytest.mark.parametrize("scale, count", [("10k", 10_000), ("1M", 1_000_000), ("2_500", 2500)])
+def test_scale_names_and_numbers(scale, count):
+    assert scale_count(scale) == count
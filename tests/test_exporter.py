@@ -0,0 +1,76 @@
+import csv
+import gzip
+import json
+import sys
+from datetime import datetime
+
+import pytest
+
+import app
+import exporter
+from exporter import BILLING_COLUMNS, PATIENT_COLUMNS, export, export_filter, flattener
+from storage import EmbeddedBackend
+
+
+def test_flattener_reads_dotted_columns_and_fills_gaps():
+    flatten = flattener(["patient_id", "personal_info.name", "personal_info.age",
+                         "billing_info.total_amount", "a.b.c"])
+
+    row = flatten({"patient_id": "PAT1", "personal_info": {"name": "Aby Pal"},
+                   "billing_info": "not a document", "a": {"b": {"c": 3}}})
+
+    assert row == ["PAT1", "Aby Pal", None, None, 3]
+
+
+def test_export_filter_is_half_open():
+    start, end = datetime(2025, 1, 1), datetime(2026, 1, 1)
+    assert export_filter("status", "generated_date", "Generated", start, end) == {
+        "status": "Generated", "generated_date": {"$gte": start, "$lt": end}}
+    assert export_filter("status", "generated_date") == {}
+
+
+def test_csv_gz_export_has_one_flat_row_per_patient(hms, admit, tmp_path):
+    for name in ("Aby Pal", "Ravi, Kumar"):
+        admit(name)
+    path = str(tmp_path / "patients.csv.gz")
+
+    report = export(hms.patients_collection, path, PATIENT_COLUMNS)
+
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as fh:
+        rows = list(csv.DictReader(fh))
+    assert report.rows == 2 and report.bytes > 0
+    assert [r["personal_info.name"] for r in rows] == ["Aby Pal", "Ravi, Kumar"]
+    assert rows[0]["admission_info.admission_date"] == "2026-01-01 09:00:00"
+
+
+def test_ndjson_is_picked_from_the_suffix(hms, admit, tmp_path):
+    admit("Aby Pal")
+    path = str(tmp_path / "patients.ndjson")
+
+    export(hms.patients_collection, path, ["patient_id", "personal_info.name"])
+
+    with open(path, encoding="utf-8") as fh:
+        assert json.loads(fh.readline())["personal_info.name"] == "Aby Pal"
+    with pytest.raises(ValueError):
+        export(hms.patients_collection, path, ["patient_id"], fmt="xml")
+
+
+def test_to_day_is_included(monkeypatch, tmp_path):
+    backend = EmbeddedBackend()
+    backend.collection("billing").insert_many([
+        {"patient_id": f"PAT{day}", "generated_date": datetime(2025, 12, day, hour)}
+        for day, hour in ((30, 9), (31, 0), (31, 23))] + [
+        {"patient_id": "PAT1", "generated_date": datetime(2026, 1, 1)}])
+    path = str(tmp_path / "bills.csv")
+    monkeypatch.setattr(app, "backend_from_env", lambda: backend)
+    monkeypatch.setattr(sys, "argv", ["exporter.py", "billing", path,
+                                      "--from", "2025-12-31", "--to", "2025-12-31"])
+    for name in ("HMS_WRITE_BEHIND", "HMS_ARCHIVE_DIR"):
+        monkeypatch.delenv(name, raising=False)
+
+    exporter.main()
+
+    with open(path, encoding="utf-8", newline="") as fh:
+        rows = list(csv.DictReader(fh))
+    assert list(rows[0]) == BILLING_COLUMNS
+    assert [r["generated_date"] for r in rows] == ["2025-12-31 00:00:00", "2025-12-31 23:00:00"]
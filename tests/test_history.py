@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import HospitalManagementSystem
+from history import BASELINE
+
+START = datetime(2026, 1, 1, 9)
+
+
+def day(n: int) -> datetime:
+    return START + timedelta(days=n)
+
+
+@pytest.fixture
+def history(hms):
+    hms.history.snapshot_every = 4
+    return hms.history
+
+
+def symptoms(document):
+    return document["medical_info"].get("symptoms")
+
+
+def update(hms, patient_id, n):
+    result = hms.operations.update_fields(patient_id, {"medical_info.symptoms": f"s{n}"},
+                                          now=day(n))
+    assert result.ok
+
+
+def test_as_of_replays_each_write_across_snapshots(hms, admit, history):
+    patient_id = admit("Aby Pal", admitted=START)["patient_id"]
+    for n in range(1, 11):
+        update(hms, patient_id, n)
+
+    assert history.as_of(patient_id, START)["personal_info"]["name"] == "Aby Pal"
+    assert symptoms(history.as_of(patient_id, START)) is None
+    for n in range(1, 11):
+        assert symptoms(history.as_of(patient_id, day(n))) == f"s{n}"
+        assert symptoms(history.as_of(patient_id, day(n) + timedelta(hours=12))) == f"s{n}"
+    assert history.as_of(patient_id, START - timedelta(seconds=1)) is None
+
+
+def test_snapshots_are_taken_every_snapshot_every_events(hms, admit, history):
+    patient_id = admit("Aby Pal", admitted=START)["patient_id"]
+    for n in range(1, 10):
+        update(hms, patient_id, n)
+
+    events = list(reversed(history.events(patient_id)))
+    assert [e["depth"] for e in events] == [0, 1, 2, 3, 0, 1, 2, 3, 0, 1]
+    stored = history.history_collection.find({"patient_id": patient_id, "snapshot":
+                                              {"$exists": True}})
+    assert len(list(stored)) == 3
+
+
+def test_depth_continues_from_the_newest_event_after_a_restart(hms, admit, history):
+    patient_id = admit("Aby Pal", admitted=START)["patient_id"]
+    for n in range(1, 3):
+        update(hms, patient_id, n)
+
+    restarted = HospitalManagementSystem(backend=hms.backend)
+    restarted.history.snapshot_every = 4
+    for n in range(3, 7):
+        update(restarted, patient_id, n)
+
+    events = list(reversed(history.events(patient_id)))
+    assert [e["depth"] for e in events] == [0, 1, 2, 3, 0, 1, 2]
+    assert symptoms(restarted.history.as_of(patient_id, day(6))) == "s6"
+
+
+def test_first_write_to_an_existing_patient_records_a_baseline(hms, history):
+    hms.patients_collection.insert_one({"patient_id": "PAT00000001",
+                                        "personal_info": {"name": "Old Record"},
+                                        "medical_info": {"disease": "flu"},
+                                        "updated_at": START})
+    update(hms, "PAT00000001", 1)
+
+    events = list(reversed(history.events("PAT00000001")))
+    assert [e["event"] for e in events] == [BASELINE, "updated"]
+    assert symptoms(history.as_of("PAT00000001", START)) is None
+    assert symptoms(history.as_of("PAT00000001", day(1))) == "s1"
+
+
+def test_due_snapshot_of_a_missing_patient_keeps_counting_depth(history):
+    def billed(total):
+        patient = {"patient_id": "PAT0000FFFFF", "billing_info": {"total_amount": total}}
+        history.billed([(None, patient)])
+
+    for total in (1.0, 2.0, 3.0, 4.0, 5.0):
+        billed(total)
+
+    events = list(reversed(history.events("PAT0000FFFFF")))
+    assert [e["depth"] for e in events] == [1, 2, 3, 4, 5]
+    assert history.history_collection.find_one({"snapshot": {"$exists": True}}) is None
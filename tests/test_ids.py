@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from ids import ID_DIGITS, PATIENT_SEQUENCE, IdAllocator, format_id
+
+
+@pytest.fixture
+def counters(hms):
+    return hms.counters_collection
+
+
+def test_ids_are_prefixed_fixed_width_hex_and_sort_in_allocation_order(counters):
+    ids = IdAllocator(counters, block_size=3)
+    issued = [ids.next_id() for _ in range(20)]
+
+    assert issued[0] == "PAT0000000000"
+    assert all(len(i) == len("PAT") + ID_DIGITS for i in issued)
+    assert issued == sorted(issued) and len(set(issued)) == 20
+    assert format_id(42) == "PAT000000002A"
+    # Never the same length as a legacy PAT + 8 hex digit ID
+    assert len(format_id(0)) != len("PATB221D700")
+
+
+def test_one_round_trip_per_block(counters):
+    ids = IdAllocator(counters, block_size=10)
+    for _ in range(25):
+        ids.next_id()
+
+    assert ids.blocks_reserved == 3
+    assert ids.peek() == 30
+
+
+def test_allocators_sharing_a_counter_never_hand_out_the_same_id(counters):
+    first = IdAllocator(counters, block_size=4)
+    second = IdAllocator(counters, block_size=4)
+
+    issued = [ids.next_id() for _ in range(10) for ids in (first, second)]
+
+    assert len(set(issued)) == len(issued)
+
+
+def test_a_restarted_process_skips_its_unused_values(counters):
+    IdAllocator(counters, block_size=100).next_id()
+
+    assert IdAllocator(counters, block_size=100).next_id() == format_id(100)
+
+
+def test_concurrent_threads_get_unique_ids(counters):
+    ids = IdAllocator(counters, block_size=7)
+    issued = []
+
+    def worker():
+        issued.extend(ids.next_id() for _ in range(200))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(issued) == len(set(issued)) == 1600
+
+
+def test_bulk_allocation_uses_the_rest_of_the_block_then_one_more_reservation(counters):
+    ids = IdAllocator(counters, block_size=10)
+    head = ids.next_id()
+
+    bulk = ids.allocate(25)
+
+    assert bulk == [format_id(v) for v in range(1, 26)]
+    assert head == format_id(0)
+    assert ids.blocks_reserved == 2
+    # The fresh block's spare values are handed out next
+    assert ids.next_id() == format_id(26)
+    assert ids.blocks_reserved == 2
+
+
+def test_block_size_must_be_positive(counters):
+    with pytest.raises(ValueError):
+        IdAllocator(counters, block_size=0)
+
+
+def test_onboarded_patients_get_allocated_ids(hms, admit):
+    admit("Aby Pal")
+    admit("Ravi Kumar")
+
+    stored = sorted(p["patient_id"] for p in hms.patients_collection.find({}, {"patient_id": 1}))
+    assert stored == [format_id(0), format_id(1)]
+    assert hms.counters_collection.find_one({"_id": PATIENT_SEQUENCE})["next"] > 1
@@ -0,0 +1,129 @@
+import gzip
+import io
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from importer import import_file, import_patients, iter_records
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      "hospital_db.patients.json")
+
+
+def patient(patient_id: str, status: str = "Active", room: str = "101", total: float = 0.0):
+    return {"patient_id": patient_id, "personal_info": {"name": f"Name {patient_id}"},
+            "admission_info": {"admission_type": "Regular", "room_number": room,
+                               "assigned_doctor": "Dr. House", "status": status,
+                               "admission_date": {"$date": "2026-01-01T09:00:00Z"}},
+            "billing_info": {"total_amount": total, "paid_amount": 0.0,
+                             "outstanding_amount": total, "billed_on": "2026-01-02"},
+            "updated_at": {"$date": "2026-01-02T09:00:00Z"}}
+
+
+def ndjson(*records) -> io.StringIO:
+    return io.StringIO("".join(json.dumps(r) + "\n" for r in records))
+
+
+def test_array_export_is_streamed_in_small_chunks():
+    with open(SAMPLE, encoding="utf-8") as fh:
+        records = list(iter_records(fh, chunk_size=64))
+    with open(SAMPLE, encoding="utf-8") as fh:
+        expected = json.load(fh)
+
+    assert [n for n, _ in records] == list(range(1, len(expected) + 1))
+    assert records[0][1]["patient_id"] == "PATB221D700"
+    # Extended JSON is decoded to naive datetimes
+    assert records[0][1]["admission_info"]["admission_date"] \
+        == datetime(2025, 6, 16, 18, 12, 59, 499000)
+
+
+def test_ndjson_reports_bad_lines_and_keeps_going(hms):
+    source = io.StringIO(json.dumps(patient("PAT00000001")) + "\n{not json\n\n"
+                         + json.dumps({"patient_id": "PAT00000002"}) + "\n"
+                         + json.dumps(patient("PAT00000003")) + "\n")
+
+    report = import_patients(hms.patients_collection, source, batch_size=2)
+
+    assert (report.read, report.inserted, report.failed) == (4, 2, 2)
+    assert [e["record"] for e in report.errors] == [2, 3]
+    assert "invalid JSON" in report.errors[0]["error"]
+    assert report.errors[1]["error"] == "missing personal_info"
+
+
+def test_duplicates_are_counted_and_the_rest_of_the_batch_is_inserted(hms):
+    hms.patients_collection.insert_one(patient("PAT00000002"))
+
+    report = import_patients(hms.patients_collection, ndjson(
+        patient("PAT00000001"), patient("PAT00000002"), patient("PAT00000003")))
+
+    assert (report.inserted, report.failed) == (2, 1)
+    assert report.errors[0]["record"] == 2
+
+
+def test_listeners_see_only_the_inserted_documents(hms):
+    hms.patients_collection.insert_one(patient("PAT00000002"))
+    seen = []
+
+    import_patients(hms.patients_collection, ndjson(
+        patient("PAT00000001"), patient("PAT00000002"), patient("PAT00000003")),
+        batch_size=2, listeners=[seen.append])
+
+    assert [[after["patient_id"] for before, after in changes] for changes in seen] \
+        == [["PAT00000001"], ["PAT00000003"]]
+    assert all(before is None for changes in seen for before, _ in changes)
+
+
+def test_imported_documents_get_search_keys(hms):
+    import_patients(hms.patients_collection, ndjson(patient("PAT00000001")))
+    assert hms.search_engine.search("name pat")[0]["patient_id"] == "PAT00000001"
+
+
+@pytest.fixture
+def export(tmp_path):
+    path = str(tmp_path / "site_b.ndjson.gz")
+    with gzip.open(path, "wt", encoding="utf-8") as fh:
+        for record in (patient("PAT00000001", total=1000.0),
+                       patient("PAT00000002", room="102"),
+                       patient("PAT00000003", status="Discharged", total=500.0)):
+            fh.write(json.dumps(record) + "\n")
+    return path
+
+
+def test_import_into_a_live_system_updates_every_derived_store(hms, admit, export):
+    hms.assignment.set_rooms({"Regular": {"101": 4, "102": 4, "103": 4}})
+    admit("Already Here", room="101")
+    hms.assignment.suggest("Regular")  # seeded before the import
+    assert hms.census.get("room_number", "101") == 1
+
+    report = hms.import_file(export)
+
+    assert report.inserted == 3
+    assert hms.census.get("room_number", "101") == 2
+    assert hms.census.get("status", "Discharged") == 1
+    assert hms.census.drift() == {}
+    assert hms.ledger.rebuild(check=True) == {"patients": 0, "receivables": 0}
+    assert hms.assignment.caseload("Dr. House") == 3
+    assert hms.assignment.free_beds("102") == hms.assignment.free_beds("103") - 1
+    assert hms.history.as_of("PAT00000001", datetime(2026, 1, 3))["billing_info"] \
+        ["total_amount"] == 1000.0
+
+
+def test_import_drops_cached_misses(monkeypatch, export):
+    from app import HospitalManagementSystem
+    from cache import PatientCache
+    from storage import EmbeddedBackend
+
+    monkeypatch.delenv("HMS_WRITE_BEHIND", raising=False)
+    hms = HospitalManagementSystem(backend=EmbeddedBackend(), cache=PatientCache())
+    try:
+        assert hms.operations.get_patient("PAT00000001") is None
+        hms.import_file(export)
+        assert hms.operations.get_patient("PAT00000001")["patient_id"] == "PAT00000001"
+    finally:
+        hms.close()
+
+
+def test_import_file_reads_gzip_without_listeners(hms, export):
+    assert import_file(hms.patients_collection, export).inserted == 3
@@ -0,0 +1,46 @@
+from indexes import INDEXES, IndexSpec, check_plans, schema_version, sync_indexes
+from storage import EmbeddedBackend
+
+
+def test_no_query_shape_scans_a_whole_collection(hms):
+    checks = check_plans(hms.collections)
+
+    assert [check.shape.name for check in checks if check.collscan] == []
+    by_name = {check.shape.name: check for check in checks}
+    assert by_name["payment by reference"].indexes == ["reference_1"]
+    assert by_name["patient by id"].stages == ["FETCH", "IXSCAN"]
+
+
+def test_sync_is_idempotent(hms):
+    report = sync_indexes(hms.collections)
+
+    assert (report.created, report.rebuilt, report.dropped) == ([], [], [])
+    assert len(report.unchanged) == len([s for s in INDEXES if s.collection in hms.collections])
+
+
+def test_changed_definition_is_rebuilt_and_same_keys_under_another_name_dropped():
+    collection = EmbeddedBackend().collection("payments")
+    collection.create_index([("reference", 1)], name="reference_1")  # not unique yet
+    collection.create_index([("patient_id", 1), ("received_at", 1)], name="legacy")
+    collection.create_index([("method", 1)])
+
+    report = sync_indexes({"payments": collection})
+
+    assert report.rebuilt == ["payments.reference_1"]
+    assert report.created == ["payments.patient_id_1_received_at_1", "payments.unapplied"]
+    assert report.dropped == ["payments.legacy"]
+    assert collection.index_information()["reference_1"]["unique"] is True
+    assert "method_1" in collection.index_information()
+
+    assert sync_indexes({"payments": collection}, drop_extra=True).dropped \
+        == ["payments.method_1"]
+
+
+def test_schema_version_follows_the_declared_indexes(hms):
+    current = schema_version(hms.collections)
+    extra = IndexSpec("patients", [("personal_info.phone", 1)])
+
+    assert schema_version(hms.collections, INDEXES + [extra]) != current
+    # Indexes of collections the deployment does not have are ignored
+    assert schema_version(hms.collections, INDEXES + [IndexSpec("other", [("x", 1)])]) \
+        == current
@@ -0,0 +1,153 @@
+from datetime import datetime
+
+import pytest
+
+from app import HospitalManagementSystem
+from billing import build_bill
+from operations import CONFLICT, NOT_FOUND, OK
+
+
+@pytest.fixture
+def billed(hms, admit):
+    """Bill a fresh patient (Regular, 3 days from 2026-01-01) and return its ID"""
+    def billed(name: str, admission_type: str = "Regular",
+               on: datetime = datetime(2026, 1, 3, 18)):
+        patient = admit(name, admission_type)
+        result = hms.operations.save_bill(build_bill(patient, now=on), now=on)
+        assert result.ok
+        return patient["patient_id"]
+    return billed
+
+
+def test_payments_and_refunds_move_the_balance(hms, billed):
+    patient_id = billed("Aby Pal")  # 3 days * 3000 + 1500 + 1000
+    assert hms.ledger.balance(patient_id)["outstanding_amount"] == 11500
+
+    assert hms.ledger.record_payment(patient_id, 5000, reference="R1").status == OK
+    assert hms.ledger.record_refund(patient_id, 1000, reference="R2").status == OK
+
+    balance = hms.ledger.balance(patient_id)
+    assert (balance["total_amount"], balance["paid_amount"],
+            balance["outstanding_amount"]) == (11500, 4000, 7500)
+    assert [(e["kind"], e["amount"]) for e in hms.ledger.history(patient_id)] \
+        == [("payment", 5000.0), ("refund", -1000.0)]
+
+
+def test_retried_payment_reference_is_rejected_without_moving_the_balance(hms, billed):
+    patient_id = billed("Aby Pal")
+    hms.ledger.record_payment(patient_id, 5000, reference="R1")
+
+    retry = hms.ledger.record_payment(patient_id, 5000, reference="R1")
+
+    assert retry.status == CONFLICT
+    assert hms.ledger.balance(patient_id)["paid_amount"] == 5000
+
+
+def test_payment_for_a_missing_patient_leaves_no_ledger_entry(hms):
+    assert hms.ledger.record_payment("PAT0000FFFFF", 100).status == NOT_FOUND
+    assert hms.ledger.history("PAT0000FFFFF") == []
+
+
+@pytest.mark.parametrize("amount", [0, -5])
+def test_non_positive_payment_raises_value_error(hms, billed, amount):
+    with pytest.raises(ValueError):
+        hms.ledger.record_payment(billed("Aby Pal"), amount)
+
+
+def test_rebilling_replaces_the_total_and_keeps_what_was_paid(hms, admit):
+    patient = admit("Aby Pal")
+    hms.operations.save_bill(build_bill(patient, now=datetime(2026, 1, 3, 18)))
+    hms.ledger.record_payment(patient["patient_id"], 2000)
+
+    hms.operations.save_bill(build_bill(patient, now=datetime(2026, 1, 5, 18)))
+
+    balance = hms.ledger.balance(patient["patient_id"])
+    assert (balance["total_amount"], balance["outstanding_amount"]) == (17500, 15500)
+    assert balance["billed_on"] == "2026-01-03"
+
+
+def test_receivables_are_grouped_by_type_and_aged_from_the_first_bill(hms, billed):
+    first = billed("Aby Pal")
+    billed("Ravi Kumar", on=datetime(2026, 3, 1, 18))
+    billed("Zed Smith", "ICU")
+    hms.ledger.record_payment(first, 1500)
+
+    report = hms.ledger.receivables(now=datetime(2026, 3, 10))
+
+    assert report == {
+        "Regular": {
+            "61-90": {"billed": 11500.0, "paid": 1500.0, "outstanding": 10000.0},
+            "0-30": {"billed": 182500.0, "paid": 0.0, "outstanding": 182500.0},
+        },
+        "ICU": {"61-90": {"billed": 35500.0, "paid": 0.0, "outstanding": 35500.0}},
+    }
+
+
+def test_payment_before_a_bill_is_reported_as_unbilled(hms, admit):
+    patient = admit("Aby Pal")
+    hms.ledger.record_payment(patient["patient_id"], 1000)
+
+    assert hms.ledger.receivables()["Regular"]["unbilled"] \
+        == {"billed": 0.0, "paid": 1000.0, "outstanding": -1000.0}
+
+
+def test_rebuild_finds_no_drift_after_ordinary_writes(hms, billed):
+    patient_id = billed("Aby Pal")
+    hms.ledger.record_payment(patient_id, 2500)
+    hms.operations.discharge(patient_id, "home")
+
+    assert hms.ledger.rebuild(check=True) == {"patients": 0, "receivables": 0}
+
+
+def test_rebuild_repairs_a_balance_written_around_the_ledger(hms, billed):
+    patient_id = billed("Aby Pal")
+    hms.patients_collection.update_one({"patient_id": patient_id},
+                                       {"$set": {"billing_info.paid_amount": 999.0}})
+
+    assert hms.ledger.rebuild(check=True)["patients"] == 1
+    hms.ledger.rebuild()
+
+    assert hms.ledger.rebuild(check=True) == {"patients": 0, "receivables": 0}
+    assert hms.ledger.balance(patient_id)["outstanding_amount"] == 11500
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.mark.parametrize("stop", ["before the balance", "before marking the entry"])
+def test_payment_interrupted_between_its_writes_is_applied_once_on_reconcile(
+        hms, billed, monkeypatch, stop):
+    patient_id = billed("Aby Pal")
+
+    def crash(*args, **kwargs):
+        raise Crash()
+
+    if stop == "before the balance":
+        monkeypatch.setattr(hms.operations, "apply_payment", crash)
+    else:
+        monkeypatch.setattr(hms.payments_collection, "update_one", crash)
+    with pytest.raises(Crash):
+        hms.ledger.record_payment(patient_id, 5000, reference="R1")
+    monkeypatch.undo()
+
+    assert hms.ledger.reconcile() == 1
+    assert hms.ledger.reconcile() == 0
+    assert hms.ledger.balance(patient_id)["outstanding_amount"] == 11500 - 5000
+    assert hms.ledger.rebuild(check=True) == {"patients": 0, "receivables": 0}
+
+
+def test_unapplied_payments_are_applied_when_the_app_starts(hms, billed, monkeypatch):
+    patient_id = billed("Aby Pal")
+
+    def crash(*args, **kwargs):
+        raise Crash()
+
+    monkeypatch.setattr(hms.operations, "apply_payment", crash)
+    with pytest.raises(Crash):
+        hms.ledger.record_payment(patient_id, 5000, reference="R1")
+    monkeypatch.undo()
+
+    restarted = HospitalManagementSystem(backend=hms.backend)
+    assert restarted.ledger.balance(patient_id)["paid_amount"] == 5000
+    assert hms.payments_collection.find_one({"reference": "R1"})["applied"] is True
@@ -0,0 +1,74 @@
+import pytest
+
+from listing import MAX_PAGE_SIZE, listing_filter
+
+
+@pytest.fixture
+def ward(hms):
+    """25 patients PAT00000001..PAT00000019 (hex): every third one discharged"""
+    hms.patients_collection.insert_many([
+        {"patient_id": f"PAT{i:08X}", "personal_info": {"name": f"Patient {i}", "age": 40},
+         "admission_info": {"status": "Discharged" if i % 3 == 0 else "Active",
+                            "admission_type": "ICU" if i % 2 else "Regular",
+                            "assigned_doctor": "Dr. House", "room_number": str(100 + i)}}
+        for i in range(25, 0, -1)])
+    return hms.listing
+
+
+def test_pages_follow_patient_id_order_and_end_with_no_token(ward):
+    first, after = ward.page(limit=10)
+    second, after2 = ward.page(after, limit=10)
+    third, end = ward.page(after2, limit=10)
+
+    ids = [p["patient_id"] for p in first + second + third]
+    assert ids == [f"PAT{i:08X}" for i in range(1, 26)]
+    assert (after, after2, end) == ("PAT0000000A", "PAT00000014", None)
+
+
+def test_exactly_full_last_page_is_followed_by_an_empty_one(ward):
+    pages = list(ward.iter_pages(page_size=5))
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 5]
+
+
+def test_filters_and_count(ward):
+    active_icu = list(ward.iter_patients(status="Active", admission_type="ICU"))
+    assert all(p["admission_info"]["status"] == "Active" for p in active_icu)
+    assert len(active_icu) == ward.count(status="Active", admission_type="ICU") == 9
+    assert ward.count() == 25
+    assert listing_filter(doctor="Dr. House", room_number="101") == {
+        "admission_info.assigned_doctor": "Dr. House", "admission_info.room_number": "101"}
+
+
+def test_summary_projection_leaves_out_other_fields(ward):
+    patient = ward.page(limit=1)[0][0]
+    assert set(patient) == {"patient_id", "personal_info", "admission_info"}
+    assert patient["personal_info"] == {"name": "Patient 1"}
+
+    custom = ward.page(limit=1, projection={"_id": 0, "personal_info.age": 1})[0][0]
+    assert custom == {"patient_id": "PAT00000001", "personal_info": {"age": 40}}
+
+
+@pytest.mark.parametrize("limit, size", [(0, 1), (-5, 1), (MAX_PAGE_SIZE + 1, 25)])
+def test_page_size_is_clamped(ward, limit, size):
+    assert len(ward.page(limit=limit)[0]) == size
+
+
+def test_writes_between_pages_neither_repeat_nor_skip_patients(ward, hms):
+    _, after = ward.page(limit=10)
+    # A patient inserted before the cursor and one removed after it
+    hms.patients_collection.insert_one({"patient_id": "PAT00000000"})
+    hms.patients_collection.delete_one({"patient_id": "PAT00000019"})
+
+    rest = []
+    while after is not None:
+        page, after = ward.page(after, limit=10)
+        rest.extend(p["patient_id"] for p in page)
+
+    assert rest == [f"PAT{i:08X}" for i in range(11, 25)]
+
+
+def test_pages_are_read_from_the_patient_id_index(hms, ward):
+    plan = hms.patients_collection.find({"patient_id": {"$gt": "PAT00000005"}}) \
+        .sort("patient_id", 1).limit(10).explain()["queryPlanner"]["winningPlan"]
+    assert plan["stage"] == "LIMIT"
+    assert plan["inputStage"]["inputStage"]["keyPattern"] == {"patient_id": 1}
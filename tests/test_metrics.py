@@ -0,0 +1,70 @@
+import pytest
+
+from metrics import Metrics, _failure_code, timed
+
+
+@pytest.fixture
+def metrics():
+    # Every call counts as slow
+    return Metrics(slow_ms=0.0)
+
+
+def slow_entries(metrics):
+    return metrics.snapshot()["slow"]["recent"]
+
+
+def test_slow_log_names_the_patient_by_id_only(metrics):
+    class Operations:
+        @timed("update_fields", metrics)
+        def update_fields(self, patient_id, changes):
+            return changes
+
+    Operations().update_fields("PATB221D700", {"personal_info.phone": "9876543210"})
+
+    assert slow_entries(metrics)[0]["detail"] == "patient_id=PATB221D700"
+
+
+def test_slow_log_takes_the_id_from_a_patient_document(metrics):
+    @timed("onboard", metrics)
+    def onboard(self, patient):
+        return patient
+
+    onboard(None, {"patient_id": "PATB221D700", "personal_info": {"name": "Aby Pal"}})
+
+    assert slow_entries(metrics)[0]["detail"] == "patient_id=PATB221D700"
+
+
+@pytest.mark.parametrize("args", [
+    ("Aby Pal", 20),
+    ({"personal_info": {"name": "Aby Pal"}},),
+    ("PATB221D700 OR 1=1",),
+])
+def test_slow_log_leaves_out_arguments_that_are_not_patient_ids(metrics, args):
+    @timed("search", metrics)
+    def search(self, *args):
+        return []
+
+    search(None, *args)
+
+    entry = slow_entries(metrics)[0]
+    assert entry["detail"] == ""
+    assert "Aby" not in str(metrics.snapshot())
+
+
+def test_failed_operation_is_counted_and_reraised(metrics):
+    @timed("discharge", metrics)
+    def discharge(self, patient_id):
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        discharge(None, "PATB221D700")
+
+    assert metrics.snapshot()["operations"]["discharge"]["errors"] == 1
+
+
+def test_command_failure_records_the_error_code_not_the_message():
+    failure = {"code": 11000, "codeName": "DuplicateKey",
+               "errmsg": "E11000 dup key: { name: \"Aby Pal\" }"}
+    assert _failure_code(failure) == "DuplicateKey"
+    assert _failure_code({"code": 50}) == "50"
+    assert _failure_code("Aby Pal") == "error"
@@ -0,0 +1,105 @@
+from datetime import datetime
+
+from billing import build_bill
+from operations import (BILLED, CONFLICT, DISCHARGED, NOT_FOUND, OK, UPDATED,
+                        expected_values, to_millis)
+
+NOW = datetime(2026, 1, 3, 18)
+
+
+def test_second_discharge_is_a_conflict_with_the_current_state(hms, admit):
+    patient_id = admit("Aby Pal")["patient_id"]
+
+    first = hms.operations.discharge(patient_id, "home", now=NOW)
+    second = hms.operations.discharge(patient_id, "again", now=NOW)
+
+    assert first.status == OK
+    assert first.patient["admission_info"]["discharge_date"] == NOW
+    assert second.status == CONFLICT
+    assert second.patient["admission_info"]["discharge_notes"] == "home"
+    assert "status: Discharged" in second.message
+    assert hms.operations.discharge("PAT00000000").status == NOT_FOUND
+
+
+def test_duplicate_onboarding_is_a_conflict(hms, admit):
+    patient = admit("Aby Pal")
+    duplicate = dict(patient)
+    duplicate.pop("_id", None)
+
+    result = hms.operations.onboard(duplicate)
+
+    assert (result.status, result.patient) == (CONFLICT, None)
+    assert patient["patient_id"] in result.message
+
+
+def test_discharge_many_tells_own_discharges_from_earlier_ones(hms, admit):
+    ids = [admit(f"Patient {i}")["patient_id"] for i in range(3)]
+    hms.operations.discharge(ids[1], now=NOW)
+
+    outcomes = hms.operations.discharge_many(ids + ["PAT00000000", ids[0]], now=NOW)
+
+    assert outcomes == {ids[0]: OK, ids[1]: CONFLICT, ids[2]: OK, "PAT00000000": NOT_FOUND}
+
+
+def test_update_with_stale_expected_values_is_a_conflict(hms, admit):
+    patient = admit("Aby Pal")
+    expected = expected_values(patient, ["admission_info.room_number"])
+    assert expected == {"admission_info.room_number": "101"}
+
+    first = hms.operations.update_fields(patient["patient_id"],
+                                         {"admission_info.room_number": "202"}, expected)
+    second = hms.operations.update_fields(patient["patient_id"],
+                                          {"admission_info.room_number": "303"}, expected)
+
+    assert (first.status, second.status) == (OK, CONFLICT)
+    assert second.patient["admission_info"]["room_number"] == "202"
+
+
+def test_bill_keeps_what_was_already_paid(hms, admit):
+    patient = admit("Aby Pal")
+    hms.operations.apply_payment(patient["patient_id"], 2000, now=NOW)
+
+    result = hms.operations.save_bill(build_bill(patient, lab_charges=500, now=NOW), now=NOW)
+
+    assert (result.status, result.message) == (OK, "created")
+    assert result.patient["billing_info"] == {
+        "total_amount": 12000, "paid_amount": 2000, "outstanding_amount": 10000,
+        "billed_on": "2026-01-03"}
+    assert hms.operations.save_bill(build_bill(patient, now=NOW)).message == "updated"
+
+
+def test_bill_for_an_unknown_patient_stores_nothing(hms, admit):
+    patient = dict(admit("Aby Pal"), patient_id="PAT00000000")
+
+    result = hms.operations.save_bill(build_bill(patient, now=NOW))
+
+    assert result.status == NOT_FOUND
+    assert hms.billing_collection.count_documents({}) == 0
+
+
+def test_listeners_get_each_write_with_its_pre_image(hms, admit):
+    seen = []
+    patient = admit("Aby Pal")
+    hms.operations.add_listener(lambda event, before, after: seen.append(
+        (event, before["billing_info"]["total_amount"], after["billing_info"]["total_amount"])))
+
+    hms.operations.save_bill(build_bill(patient, now=NOW))
+    hms.operations.update_fields(patient["patient_id"], {"medical_info.symptoms": "cough"})
+    hms.operations.discharge(patient["patient_id"])
+
+    assert seen == [(BILLED, 0.0, 11500), (UPDATED, 11500, 11500), (DISCHARGED, 11500, 11500)]
+
+
+def test_failing_listener_does_not_fail_the_write(hms, admit):
+    def broken(event, before, after):
+        raise RuntimeError("listener down")
+
+    hms.operations.add_listener(broken)
+    patient = admit("Aby Pal")
+
+    assert hms.operations.discharge(patient["patient_id"]).ok
+
+
+def test_to_millis_truncates_to_bson_precision():
+    assert to_millis(datetime(2026, 1, 1, 9, 0, 0, 123456)) \
+        == datetime(2026, 1, 1, 9, 0, 0, 123000)
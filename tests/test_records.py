@@ -0,0 +1,88 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from datagen import PatientGenerator
+from records import PatientColumns, PatientRecord
+
+
+def patient(i: int, status: str = "Active", admission_type: str = "Regular",
+            outstanding: float = 100.0, **personal):
+    return {"patient_id": f"PAT{i:08X}",
+            "personal_info": dict({"name": f"Patient {i}", "age": 40}, **personal),
+            "medical_info": {"disease": "flu"},
+            "admission_info": {"admission_date": datetime(2026, 1, 1, 9, 30, 0, 123000),
+                               "admission_type": admission_type, "status": status,
+                               "assigned_doctor": "Dr. House", "room_number": "101"},
+            "billing_info": {"total_amount": outstanding, "paid_amount": 0.0,
+                             "outstanding_amount": outstanding}}
+
+
+def test_record_round_trips_fields_it_does_not_model():
+    doc = next(PatientGenerator().patients(1))
+    doc["_id"] = "object-id"
+    doc["admission_info"]["discharge_batch"] = "batch-1"
+    doc["legacy_flag"] = True
+
+    record = PatientRecord.from_document(doc)
+
+    assert record.extra == {"admission_info.discharge_batch": "batch-1", "legacy_flag": True}
+    assert record.to_document() == doc
+    assert PatientRecord.from_document(record.to_document()) == record
+
+
+def test_unknown_record_field_is_rejected():
+    with pytest.raises(TypeError, match="wardrobe"):
+        PatientRecord(patient_id="PAT00000001", wardrobe="left")
+
+
+def test_columns_group_and_filter_like_the_documents():
+    docs = [patient(i, status="Discharged" if i % 3 == 0 else "Active",
+                    admission_type=("ICU", "Regular", "Emergency")[i % 3 == 1],
+                    outstanding=float(i)) for i in range(1, 31)]
+    batch = PatientColumns.from_documents(docs)
+
+    assert batch.count_by("admission_type") == {"ICU": 20, "Regular": 10}
+    assert batch.count_by("admission_type", status="Active") == {"ICU": 10, "Regular": 10}
+    assert batch.sum_by("admission_type", "outstanding_amount", status="Active") == {
+        "ICU": float(sum(i for i in range(1, 31) if i % 3 == 2)),
+        "Regular": float(sum(i for i in range(1, 31) if i % 3 == 1))}
+    assert batch.total("outstanding_amount", status="Discharged") == float(sum(range(3, 31, 3)))
+    assert batch.mask(status="Unknown") == bytes(30)
+    with pytest.raises(ValueError):
+        batch.mask(name="Patient 1")
+
+
+def test_row_reads_back_as_a_projected_document():
+    doc = patient(1)
+    doc["admission_info"]["admission_date"] = datetime(2026, 1, 1, 9, 30, tzinfo=timezone.utc)
+    batch = PatientColumns.from_documents([doc])
+
+    row = batch.document(0)
+
+    assert row["admission_info"]["admission_date"] == datetime(2026, 1, 1, 9, 30)
+    assert "discharge_date" not in row["admission_info"]
+    assert batch.record(0).patient_id == "PAT00000001"
+
+
+@pytest.mark.parametrize("age", [None, "", "unknown", "42.5", float("nan"), -3, 40000, True])
+def test_unusable_ages_are_stored_as_unknown(age):
+    docs = [patient(1, age=age), patient(2, age="57")]
+    if age is None:
+        del docs[0]["personal_info"]["age"]
+
+    batch = PatientColumns.from_documents(docs)
+
+    assert (batch.value("age", 0), batch.value("age", 1)) == (None, 57)
+
+
+def test_codes_widen_as_distinct_values_grow():
+    docs = (dict(patient(i), medical_info={"disease": f"condition {i}"}) for i in range(70_000))
+
+    batch = PatientColumns.from_documents(docs)
+
+    codes = batch.columns["disease"].codes
+    assert codes.typecode == "I"
+    assert batch.value("disease", 69_999) == "condition 69999"
+    assert batch.count_by("disease")["condition 65537"] == 1
+    assert batch.sum_by("status", "outstanding_amount") == {"Active": 7_000_000.0}
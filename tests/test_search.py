@@ -0,0 +1,69 @@
+from search import normalize_name, search_keys
+
+
+def names(results):
+    return [p["personal_info"]["name"] for p in results]
+
+
+def test_normalize_name_strips_accents_and_punctuation():
+    assert normalize_name("  José  O'Brien-Smith ") == "jose o brien smith"
+    assert search_keys("Aby Pal") == {"name": "aby pal", "tokens": ["aby", "pal"]}
+
+
+def test_pat_prefix_of_a_name_ranks_names_before_patient_ids(hms, admit):
+    for i in range(10):
+        admit(f"Person {i}")
+    admit("Patricia Jones")
+
+    assert names(hms.search_engine.search("pat", limit=5))[0] == "Patricia Jones"
+    assert names(hms.search_engine.search("Patri", limit=5)) == ["Patricia Jones"]
+
+
+def test_id_shaped_terms_match_patient_ids_first(hms, admit):
+    patient = admit("Aby Pal")
+    admit("Aby Pal Junior")
+
+    assert hms.search_engine.search(patient["patient_id"].lower())[0]["patient_id"] \
+        == patient["patient_id"]
+    prefix = hms.search_engine.search(patient["patient_id"][:-1], limit=50)
+    assert patient["patient_id"] in [p["patient_id"] for p in prefix]
+
+
+def test_exact_name_ranks_before_name_prefix_and_token_matches(hms, admit):
+    admit("Ravi Kumar Sharma")
+    admit("Ravi Kumar")
+    admit("Sharma Ravi")
+
+    assert names(hms.search_engine.search("ravi kumar")) == ["Ravi Kumar", "Ravi Kumar Sharma"]
+    assert names(hms.search_engine.search("ravi")) == ["Ravi Kumar", "Ravi Kumar Sharma",
+                                                      "Sharma Ravi"]
+
+
+def test_every_word_is_matched_by_the_database_not_after_the_limit(hms):
+    hms.patients_collection.insert_many([
+        {"patient_id": f"PAT{i:08X}", "personal_info": {"name": f"John Doe{i}"},
+         "search": search_keys(f"John Doe{i}")} for i in range(300)])
+    hms.patients_collection.insert_one({"patient_id": "PATFFFFFFFF",
+                                        "personal_info": {"name": "Zed John Smith"},
+                                        "search": search_keys("Zed John Smith")})
+
+    assert names(hms.search_engine.search("john smi", limit=5)) == ["Zed John Smith"]
+
+
+def test_backfill_adds_keys_and_invalidates_cached_documents(monkeypatch):
+    from app import HospitalManagementSystem
+    from cache import PatientCache
+    from storage import EmbeddedBackend
+
+    monkeypatch.delenv("HMS_WRITE_BEHIND", raising=False)
+    cache = PatientCache()
+    hms = HospitalManagementSystem(backend=EmbeddedBackend(), cache=cache)
+    try:
+        hms.patients_collection.insert_one({"patient_id": "PAT00000001",
+                                            "personal_info": {"name": "Old Record"}})
+        assert "search" not in hms.operations.get_patient("PAT00000001")
+
+        assert hms.search_engine.backfill() == 1
+        assert hms.operations.get_patient("PAT00000001")["search"]["name"] == "old record"
+    finally:
+        hms.close()
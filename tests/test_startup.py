@@ -0,0 +1,107 @@
+from datetime import datetime
+
+import pymongo
+import pytest
+
+import app
+from app import HospitalManagementSystem
+from storage import EmbeddedBackend, LazyCollection, MongoBackend, _load_entry
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """A stand-in MongoDB server: MongoClient serves collections of one embedded backend"""
+    store = EmbeddedBackend()
+    store.clients = 0
+
+    class Database:
+        def __getitem__(self, name):
+            return store.collection(name)
+
+        def command(self, name):
+            return {"ok": 1}
+
+    class Client:
+        def __init__(self, *args, **kwargs):
+            store.clients += 1
+            self.admin = Database()
+
+        def __getitem__(self, db_name):
+            return Database()
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(pymongo, "MongoClient", Client)
+    for name in ("HMS_WRITE_BEHIND", "HMS_WRITE_JOURNAL", "HMS_ARCHIVE_DIR"):
+        monkeypatch.delenv(name, raising=False)
+    return store
+
+
+@pytest.fixture
+def syncs(monkeypatch):
+    calls = []
+    real = app.sync_indexes
+    monkeypatch.setattr(app, "sync_indexes", lambda *args, **kwargs: calls.append(1)
+                        or real(*args, **kwargs))
+    return calls
+
+
+def test_constructor_does_not_connect(server, syncs):
+    hms = HospitalManagementSystem(backend=MongoBackend("mongodb://db.invalid:27017/"))
+
+    assert server.clients == 0
+    assert isinstance(hms.patients_collection, LazyCollection)
+    assert syncs == []
+
+    assert hms.get_patient("PAT00000001") is None
+    assert (server.clients, len(syncs)) == (1, 1)
+    assert "patient_id_1" in server.collection("patients").index_information()
+
+
+def test_index_sync_is_skipped_while_the_schema_version_is_current(server, syncs):
+    HospitalManagementSystem(backend=MongoBackend()).get_patient("PAT00000001")
+    HospitalManagementSystem(backend=MongoBackend()).get_patient("PAT00000001")
+    assert len(syncs) == 1
+
+    server.collection("meta").update_one({"_id": "schema"}, {"$set": {"version": "old"}})
+    HospitalManagementSystem(backend=MongoBackend()).get_patient("PAT00000001")
+    assert len(syncs) == 2
+
+
+def test_failing_hook_is_retried_on_the_next_use(server):
+    backend = MongoBackend()
+    attempts = []
+
+    def hook():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("not yet")
+
+    backend.on_connect(hook)
+    collection = backend.collection("patients")
+    with pytest.raises(RuntimeError):
+        collection.count_documents({})
+
+    assert collection.count_documents({}) == 0
+    assert collection.count_documents({}) == 0
+    assert len(attempts) == 2
+
+
+def test_eager_start_connects_in_the_constructor(server):
+    HospitalManagementSystem(backend=MongoBackend(), lazy=False)
+    assert server.clients == 1
+
+
+def test_journal_dates_are_epoch_milliseconds_and_iso_still_loads(tmp_path):
+    path = str(tmp_path / "hms.journal")
+    backend = EmbeddedBackend(path)
+    backend.collection("patients").insert_one({"_id": 1, "at": datetime(2026, 1, 2, 3, 4, 5)})
+    backend.close()
+
+    with open(path, encoding="utf-8") as fh:
+        assert '"$date": 1767323045000' in fh.read()
+    assert EmbeddedBackend(path).collection("patients").find_one({"_id": 1})["at"] \
+        == datetime(2026, 1, 2, 3, 4, 5)
+    legacy = '{"op": "put", "c": "patients", "d": {"at": {"$date": "2026-01-02T03:04:05Z"}}}'
+    assert _load_entry(legacy)["d"]["at"].replace(tzinfo=None) == datetime(2026, 1, 2, 3, 4, 5)
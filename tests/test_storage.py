@@ -0,0 +1,298 @@
+"""EmbeddedBackend checked against what a MongoDB server does for the same calls"""
+from datetime import datetime
+
+import pytest
+from pymongo import DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from storage import EmbeddedBackend
+
+
+@pytest.fixture
+def backend():
+    backend = EmbeddedBackend()
+    yield backend
+    backend.close()
+
+
+@pytest.fixture
+def patients(backend):
+    return backend.collection("patients")
+
+
+def ids(cursor):
+    return [doc["_id"] for doc in cursor]
+
+
+# -- indexes -----------------------------------------------------------------
+
+def test_unique_compound_index_allows_a_repeated_leading_field(patients):
+    patients.create_index([("ward", 1), ("bed", 1)], unique=True)
+    patients.insert_one({"_id": 1, "ward": "ICU", "bed": 1})
+    patients.insert_one({"_id": 2, "ward": "ICU", "bed": 2})
+    patients.insert_one({"_id": 3, "ward": "Regular", "bed": 1})
+
+    with pytest.raises(DuplicateKeyError, match="ward: 'ICU', bed: 1"):
+        patients.insert_one({"_id": 4, "ward": "ICU", "bed": 1})
+    assert patients.count_documents({}) == 3
+
+
+def test_unique_compound_index_checks_updates_and_frees_deleted_keys(patients):
+    patients.create_index([("ward", 1), ("bed", 1)], unique=True)
+    patients.insert_many([{"_id": 1, "ward": "ICU", "bed": 1},
+                          {"_id": 2, "ward": "ICU", "bed": 2}])
+
+    with pytest.raises(DuplicateKeyError):
+        patients.update_one({"_id": 2}, {"$set": {"bed": 1}})
+    patients.update_one({"_id": 1}, {"$set": {"bed": 3}})  # moving frees bed 1
+    patients.update_one({"_id": 2}, {"$set": {"bed": 1}})
+    patients.delete_one({"_id": 2})
+    patients.insert_one({"_id": 5, "ward": "ICU", "bed": 1})
+
+    assert sorted((d["ward"], d["bed"]) for d in patients.find({})) \
+        == [("ICU", 1), ("ICU", 3)]
+
+
+def test_creating_a_unique_compound_index_over_duplicates_fails(patients):
+    patients.insert_many([{"ward": "ICU", "bed": 1}, {"ward": "ICU", "bed": 1}])
+    with pytest.raises(DuplicateKeyError):
+        patients.create_index([("ward", 1), ("bed", 1)], unique=True)
+
+
+def test_missing_fields_count_as_null_in_a_unique_index(patients):
+    patients.create_index("reference", unique=True)
+    patients.insert_one({"_id": 1})
+    with pytest.raises(DuplicateKeyError):
+        patients.insert_one({"_id": 2})
+
+
+def test_partial_unique_index_only_covers_matching_documents(patients):
+    patients.create_index("bed", unique=True,
+                          partialFilterExpression={"status": "Active"})
+    patients.insert_one({"bed": 1, "status": "Active"})
+    patients.insert_one({"bed": 1, "status": "Discharged"})
+    with pytest.raises(DuplicateKeyError):
+        patients.insert_one({"bed": 1, "status": "Active"})
+
+
+def test_same_index_name_with_other_options_is_refused(patients):
+    patients.create_index("patient_id", name="by_id")
+    assert patients.create_index("patient_id", name="by_id") == "by_id"
+    with pytest.raises(OperationFailure):
+        patients.create_index("patient_id", name="by_id", unique=True)
+
+
+def test_unordered_insert_many_reports_every_duplicate(patients):
+    patients.create_index("patient_id", unique=True)
+    with pytest.raises(BulkWriteError) as error:
+        patients.insert_many([{"patient_id": "A"}, {"patient_id": "A"},
+                              {"patient_id": "B"}, {"patient_id": "B"}], ordered=False)
+    assert error.value.details["nInserted"] == 2
+    assert [e["index"] for e in error.value.details["writeErrors"]] == [1, 3]
+
+
+def test_ordered_insert_many_stops_at_the_first_duplicate(patients):
+    patients.create_index("patient_id", unique=True)
+    with pytest.raises(BulkWriteError):
+        patients.insert_many([{"patient_id": "A"}, {"patient_id": "A"},
+                              {"patient_id": "B"}])
+    assert patients.distinct("patient_id") == ["A"]
+
+
+# -- queries -----------------------------------------------------------------
+
+@pytest.fixture
+def people(patients):
+    patients.insert_many([
+        {"_id": i, "name": name, "age": age, "tags": tags}
+        for i, (name, age, tags) in enumerate([
+            ("ann", 30, ["a"]), ("bob", 25, []), ("cid", 41, ["a", "b"]),
+            ("dan", None, ["b"]), ("eve", 30, ["c"])])])
+    return patients
+
+
+@pytest.mark.parametrize("query, expected", [
+    ({"age": 30}, [0, 4]),
+    ({"age": {"$gte": 30}}, [0, 2, 4]),
+    ({"age": None}, [3]),
+    ({"tags": "a"}, [0, 2]),
+    ({"tags": {"$in": ["b", "c"]}}, [2, 3, 4]),
+    ({"name": {"$regex": "^[ab]"}}, [0, 1]),
+    ({"$or": [{"age": 25}, {"name": "eve"}]}, [1, 4]),
+    ({"age": {"$ne": 30}}, [1, 2, 3]),
+    ({"missing": {"$exists": False}}, [0, 1, 2, 3, 4]),
+])
+def test_indexed_and_unindexed_queries_agree(people, query, expected):
+    assert sorted(ids(people.find(query))) == expected
+    people.create_index("age")
+    people.create_index("tags")
+    people.create_index("name")
+    assert sorted(ids(people.find(query))) == expected
+
+
+def test_sort_skip_and_limit(people):
+    people.create_index("age")
+    # Nulls sort before numbers, as on a server
+    assert ids(people.find({}).sort([("age", 1), ("name", -1)])) == [3, 1, 4, 0, 2]
+    assert ids(people.find({}).sort("age", -1).skip(1).limit(2)) == [4, 0]
+
+
+def test_projection_includes_or_excludes(people):
+    assert people.find_one({"_id": 0}, {"_id": 0, "name": 1}) == {"name": "ann"}
+    assert set(people.find_one({"_id": 0}, {"tags": 0})) == {"_id", "name", "age"}
+
+
+# -- updates -----------------------------------------------------------------
+
+def test_update_pipeline_computes_from_the_current_document(patients):
+    patients.insert_one({"_id": 1, "billing": {"paid": 200.0}})
+    patients.insert_one({"_id": 2})
+    pipeline = [{"$set": {
+        "billing.total": 1000.0,
+        "billing.outstanding": {"$subtract": [1000.0, {"$ifNull": ["$billing.paid", 0]}]},
+        "billing.billed_on": {"$ifNull": ["$billing.billed_on", "2026-01-03"]}}}]
+
+    patients.update_many({}, pipeline)
+    patients.update_one({"_id": 1}, [{"$set": {"billing.billed_on": {
+        "$ifNull": ["$billing.billed_on", "2026-02-01"]}}}])
+
+    assert patients.find_one({"_id": 1})["billing"] == {
+        "paid": 200.0, "total": 1000.0, "outstanding": 800.0, "billed_on": "2026-01-03"}
+    assert patients.find_one({"_id": 2})["billing"]["outstanding"] == 1000.0
+
+
+def test_upsert_seeds_equality_fields_and_set_on_insert(patients):
+    patients.update_one({"patient_id": "A", "n": {"$gt": 1}},
+                        {"$set": {"x": 1}, "$setOnInsert": {"created": True}}, upsert=True)
+    patients.update_one({"patient_id": "A"},
+                        {"$set": {"x": 2}, "$setOnInsert": {"created": False}}, upsert=True)
+
+    doc = patients.find_one({"patient_id": "A"}, {"_id": 0})
+    assert doc == {"patient_id": "A", "x": 2, "created": True}
+
+
+def test_update_operators(patients):
+    patients.insert_one({"_id": 1, "n": 5, "tags": ["a"]})
+    patients.update_one({"_id": 1}, {"$inc": {"n": 2, "m": 1}, "$max": {"hi": 3},
+                                     "$addToSet": {"tags": {"$each": ["a", "b"]}},
+                                     "$unset": {"gone": ""}})
+    assert patients.find_one({"_id": 1}) == {"_id": 1, "n": 7, "m": 1, "hi": 3,
+                                             "tags": ["a", "b"]}
+    with pytest.raises(ValueError):
+        patients.update_one({"_id": 1}, {"n": 1})
+
+
+def test_find_one_and_update_returns_the_requested_version(patients):
+    patients.insert_one({"_id": 1, "n": 1})
+    before = patients.find_one_and_update({"_id": 1}, {"$inc": {"n": 1}})
+    after = patients.find_one_and_update({"_id": 1}, {"$inc": {"n": 1}},
+                                         return_document=ReturnDocument.AFTER)
+    assert (before["n"], after["n"]) == (1, 3)
+    assert patients.find_one_and_update({"_id": 9}, {"$inc": {"n": 1}}) is None
+
+
+def test_bulk_write_counts_like_a_server(patients):
+    patients.insert_one({"_id": 1, "n": 1})
+    result = patients.bulk_write([
+        UpdateOne({"_id": 1}, {"$set": {"n": 1}}),  # matched, not modified
+        UpdateOne({"_id": 2}, {"$set": {"n": 2}}, upsert=True),
+        InsertOne({"_id": 3}),
+        DeleteOne({"_id": 1}),
+    ])
+    assert (result.matched_count, result.modified_count, result.upserted_count,
+            result.inserted_count, result.deleted_count) == (1, 0, 1, 1, 1)
+    assert result.upserted_ids == {1: 2}
+
+
+# -- aggregation -------------------------------------------------------------
+
+def test_aggregate_matches_groups_and_sorts(patients):
+    patients.insert_many([
+        {"type": "ICU", "at": datetime(2026, 1, 1, 9), "amount": 10},
+        {"type": "ICU", "at": datetime(2026, 1, 1, 20), "amount": 5},
+        {"type": "Regular", "at": datetime(2026, 1, 2, 9), "amount": 7},
+        {"type": "Regular", "at": datetime(2025, 12, 31), "amount": 100},
+    ])
+    rows = list(patients.aggregate([
+        {"$match": {"at": {"$gte": datetime(2026, 1, 1)}}},
+        {"$group": {"_id": {"type": "$type",
+                            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$at"}}},
+                    "total": {"$sum": "$amount"}, "count": {"$sum": 1},
+                    "largest": {"$max": "$amount"}}},
+        {"$sort": {"total": -1}},
+        {"$project": {"_id": 0, "type": "$_id.type", "total": 1, "count": 1}},
+    ]))
+    assert rows == [{"type": "ICU", "total": 15, "count": 2},
+                    {"type": "Regular", "total": 7, "count": 1}]
+
+
+def test_aggregate_unwinds_and_counts(patients):
+    patients.insert_many([{"tags": ["a", "b"]}, {"tags": []}, {"tags": ["a"]}])
+    assert list(patients.aggregate([{"$unwind": "$tags"}, {"$match": {"tags": "a"}},
+                                    {"$count": "n"}])) == [{"n": 2}]
+
+
+def test_unsupported_stage_raises(patients):
+    with pytest.raises(ValueError, match="Unsupported pipeline stage"):
+        list(patients.aggregate([{"$lookup": {}}]))
+
+
+# -- explain -----------------------------------------------------------------
+
+def winning(plan):
+    return plan["queryPlanner"]["winningPlan"]
+
+
+def stages(plan):
+    stage, found = winning(plan), []
+    while stage:
+        found.append(stage["stage"])
+        stage = stage.get("inputStage")
+    return found
+
+
+def test_explain_reports_the_access_path(people):
+    assert stages(people.find({"age": 30}).explain()) == ["COLLSCAN"]
+    assert stages(people.find({"_id": 1}).explain()) == ["IDHACK"]
+
+    people.create_index("age")
+    plan = people.find({"age": 30}).explain()
+    assert stages(plan) == ["FETCH", "IXSCAN"]
+    assert winning(plan)["inputStage"]["keyPattern"] == {"age": 1}
+
+
+def test_explain_adds_sort_and_limit_stages(people):
+    people.create_index("age")
+    assert stages(people.find({"age": 30}).sort("name", 1).limit(1).explain()) \
+        == ["LIMIT", "SORT", "FETCH", "IXSCAN"]
+    walk = people.find({}).sort("age", -1).limit(2).explain()
+    assert stages(walk) == ["LIMIT", "FETCH", "IXSCAN"]
+    assert winning(walk)["inputStage"]["inputStage"]["direction"] == "backward"
+
+
+def test_explain_uses_a_partial_index_only_for_its_filter(patients):
+    patients.create_index("bed", partialFilterExpression={"status": "Active"})
+    assert stages(patients.find({"bed": 1}).explain()) == ["COLLSCAN"]
+    assert stages(patients.find({"bed": 1, "status": "Active"}).explain()) \
+        == ["FETCH", "IXSCAN"]
+
+
+# -- journal -----------------------------------------------------------------
+
+def test_journal_replays_documents_and_indexes(tmp_path):
+    path = str(tmp_path / "hms.journal")
+    backend = EmbeddedBackend(path)
+    coll = backend.collection("patients")
+    coll.create_index([("ward", 1), ("bed", 1)], unique=True)
+    coll.insert_many([{"_id": 1, "ward": "ICU", "bed": 1, "at": datetime(2026, 1, 1, 9)},
+                      {"_id": 2, "ward": "ICU", "bed": 2}])
+    coll.delete_one({"_id": 2})
+    backend.close()
+
+    reopened = EmbeddedBackend(path).collection("patients")
+
+    assert list(reopened.find({})) == [{"_id": 1, "ward": "ICU", "bed": 1,
+                                        "at": datetime(2026, 1, 1, 9)}]
+    reopened.insert_one({"ward": "ICU", "bed": 2})
+    with pytest.raises(DuplicateKeyError):
+        reopened.insert_one({"ward": "ICU", "bed": 1})
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from tariffs import DEFAULT_TARIFF, Tariff, TariffBook
+
+
+def regular(effective_from: datetime, room_per_day: float) -> dict:
+    return {"admission_type": "Regular", "effective_from": effective_from,
+            "room_per_day": room_per_day, "doctor_fee": 1500, "medicine_base": 1000}
+
+
+@pytest.fixture
+def tariff():
+    return Tariff(1, [regular(datetime(1970, 1, 1), 3000),
+                      regular(datetime(2026, 3, 1), 3300),
+                      regular(datetime(2026, 3, 10), 3600)])
+
+
+def room_by_day(tariff, admission_date, days):
+    return sum(tariff.rates_on("Regular", admission_date + timedelta(days=d))["room_per_day"]
+               for d in range(days))
+
+
+@pytest.mark.parametrize("admission_date, days", [
+    (datetime(2026, 2, 27), 2),   # ends the day before a change
+    (datetime(2026, 2, 27), 3),   # ends on the day of a change
+    (datetime(2026, 2, 28), 12),  # spans two changes
+    (datetime(2026, 3, 1), 1),    # starts on the day of a change
+    (datetime(2026, 3, 9), 1),    # last day of a period
+    (datetime(2026, 3, 20), 5),   # entirely in the last period
+])
+def test_room_charges_match_a_day_by_day_count_across_period_boundaries(
+        tariff, admission_date, days):
+    charges = tariff.charges("Regular", admission_date, days)
+    assert charges["room_charges"] == room_by_day(tariff, admission_date, days)
+
+
+def test_charge_columns_match_charges_stay_by_stay(tariff):
+    stays = [(datetime(2026, 2, 28), 12), (datetime(2026, 3, 20), 5), (datetime(2025, 1, 1), 0)]
+    types = ["Regular", "ICU", "Regular", "Regular"]
+    dates = [stays[0][0], stays[0][0], stays[1][0], stays[2][0]]
+    days = [stays[0][1], stays[0][1], stays[1][1], stays[2][1]]
+
+    room, doctor, medicine = tariff.charge_columns(types, dates, days)
+
+    assert (room[1], doctor[1], medicine[1]) == (None, None, None)
+    for i in (0, 2, 3):
+        assert tariff.charges("Regular", dates[i], days[i]) == {
+            "room_charges": room[i], "doctor_charges": doctor[i], "medicine_charges": medicine[i]}
+
+
+def test_periods_split_a_stay_at_each_rate_change(tariff):
+    periods = tariff.periods("Regular", datetime(2026, 2, 28), 12)
+
+    assert periods == [(datetime(2026, 2, 28), 1, 3000), (datetime(2026, 3, 1), 9, 3300),
+                       (datetime(2026, 3, 10), 2, 3600)]
+    assert sum(days * rate for _, days, rate in periods) \
+        == tariff.charges("Regular", datetime(2026, 2, 28), 12)["room_charges"]
+
+
+def test_earliest_period_covers_days_before_it():
+    tariff = Tariff(1, [regular(datetime(2026, 1, 1), 3000)])
+    assert tariff.rates_on("Regular", datetime(2020, 6, 1))["room_per_day"] == 3000
+    assert tariff.charges("Regular", datetime(2025, 12, 30), 4)["room_charges"] == 12000
+
+
+def test_doctor_and_medicine_fees_come_from_the_admission_day(tariff):
+    later = Tariff(2, tariff.rows + [dict(regular(datetime(2026, 4, 1), 3600),
+                                          doctor_fee=9999)])
+    assert later.charges("Regular", datetime(2026, 3, 30), 5)["doctor_charges"] == 1500
+    assert later.charges("Regular", datetime(2026, 4, 1), 5)["doctor_charges"] == 9999
+
+
+def test_unknown_admission_type_raises_value_error(tariff):
+    with pytest.raises(ValueError, match="No rates for admission type 'ICU'"):
+        tariff.charges("ICU", datetime(2026, 1, 1), 1)
+
+
+@pytest.mark.parametrize("row", [
+    {"effective_from": datetime(2026, 1, 1), "room_per_day": 1, "doctor_fee": 1,
+     "medicine_base": 1},
+    dict(regular(datetime(2026, 1, 1), -1)),
+    dict(regular(datetime(2026, 1, 1), True)),
+])
+def test_bad_rows_are_rejected(row):
+    with pytest.raises(ValueError):
+        Tariff(1, [row])
+
+
+def test_two_rows_for_the_same_day_are_rejected():
+    with pytest.raises(ValueError, match="Two Regular rates"):
+        Tariff(1, [regular(datetime(2026, 1, 1), 1), regular(datetime(2026, 1, 1, 12), 2)])
+
+
+def test_book_starts_with_the_built_in_tariff(hms):
+    assert hms.tariffs.current() is DEFAULT_TARIFF
+
+
+def test_set_rate_publishes_a_new_version_and_carries_other_rates_over(hms):
+    book = hms.tariffs
+    tariff = book.set_rate("Regular", datetime(2026, 3, 1), room_per_day=3300)
+
+    assert tariff.version == 1 and book.current() is tariff
+    rates = tariff.rates_on("Regular", datetime(2026, 3, 5))
+    assert (rates["room_per_day"], rates["doctor_fee"]) == (3300, 1500)
+    assert tariff.rates_on("Regular", datetime(2026, 2, 28))["room_per_day"] == 3000
+    assert book.version(1) is tariff
+
+
+def test_new_admission_type_needs_every_rate(hms):
+    with pytest.raises(ValueError, match="needs doctor_fee, medicine_base"):
+        hms.tariffs.set_rate("Daycare", datetime(2026, 1, 1), room_per_day=800)
+
+
+def test_current_is_cached_until_invalidated(hms):
+    clock = [0.0]
+    book = TariffBook(hms.tariffs_collection, max_age=60, clock=lambda: clock[0])
+    other = TariffBook(hms.tariffs_collection)
+    assert book.current() is DEFAULT_TARIFF
+
+    other.set_rate("Regular", datetime(2026, 3, 1), room_per_day=3300)
+    assert book.current() is DEFAULT_TARIFF
+
+    clock[0] = 61.0
+    assert book.current().version == 1
+
+    other.set_rate("Regular", datetime(2026, 4, 1), room_per_day=3600)
+    book.invalidate()
+    assert book.current().version == 2
+
+
+def test_missing_version_raises_value_error(hms):
+    with pytest.raises(ValueError, match="No tariff version 7"):
+        hms.tariffs.version(7)
@@ -0,0 +1,156 @@
+from datetime import datetime
+
+import pytest
+
+from billing import build_bill
+from operations import CONFLICT, DISCHARGED, NOT_FOUND, OK, ONBOARDED, UPDATED
+from write_queue import WriteBehindQueue, WriteJournal
+
+
+@pytest.fixture
+def queue(hms):
+    # Nothing is flushed until a test asks for it
+    queue = WriteBehindQueue(hms.operations, flush_interval=60)
+    yield queue
+    queue.close()
+
+
+@pytest.fixture
+def events(hms):
+    """Writes published to listeners, apart from the onboardings that set up a test"""
+    seen = []
+    hms.operations.add_listener(lambda event, before, after: seen.append(
+        (event, after["patient_id"])) if event != ONBOARDED else None)
+    return seen
+
+
+def test_writes_to_one_patient_are_coalesced_into_one_update(hms, admit, queue, events):
+    patient = admit("Aby Pal")
+    first = queue.update_fields(patient["patient_id"], {"medical_info.symptoms": "cough"})
+    second = queue.update_fields(patient["patient_id"], {"medical_info.disease": "asthma"})
+
+    report = queue.flush()
+
+    assert (report.writes, report.bulk_writes) == (2, 1)
+    assert first.result().status == second.result().status == OK
+    stored = hms.operations.get_patient(patient["patient_id"])
+    assert stored["medical_info"] == {"disease": "asthma", "symptoms": "cough"}
+    assert events == [(UPDATED, patient["patient_id"])]
+
+
+def test_reads_through_the_queue_include_queued_writes(hms, admit, queue):
+    patient = admit("Aby Pal")
+    queue.update_fields(patient["patient_id"], {"medical_info.symptoms": "cough"})
+
+    assert queue.get_patient(patient["patient_id"])["medical_info"]["symptoms"] == "cough"
+    assert "symptoms" not in hms.operations.get_patient(patient["patient_id"])["medical_info"]
+
+
+def test_expected_value_that_contradicts_a_queued_write_conflicts_at_once(admit, queue):
+    patient = admit("Aby Pal")
+    queue.update_fields(patient["patient_id"], {"admission_info.room_number": "202"})
+
+    late = queue.update_fields(patient["patient_id"], {"admission_info.room_number": "303"},
+                               expected={"admission_info.room_number": "101"})
+
+    assert late.done() and late.result().status == CONFLICT
+    assert queue.pending() == 1
+
+
+def test_expected_value_matching_a_queued_write_is_merged(hms, admit, queue):
+    patient = admit("Aby Pal")
+    queue.update_fields(patient["patient_id"], {"admission_info.room_number": "202"})
+    chained = queue.update_fields(patient["patient_id"], {"admission_info.room_number": "303"},
+                                  expected={"admission_info.room_number": "202"})
+
+    queue.flush()
+
+    assert chained.result().status == OK
+    assert hms.operations.get_patient(
+        patient["patient_id"])["admission_info"]["room_number"] == "303"
+
+
+def test_second_discharge_of_a_queued_discharge_is_rejected(admit, queue, events):
+    patient = admit("Aby Pal")
+    first = queue.discharge(patient["patient_id"], "home")
+    second = queue.discharge(patient["patient_id"], "again")
+    queue.flush()
+
+    assert first.result().status == OK
+    assert second.result().status == CONFLICT
+    assert events == [(DISCHARGED, patient["patient_id"])]
+
+
+def test_write_to_a_missing_patient_resolves_not_found(queue):
+    missing = queue.update_fields("PAT0000FFFFF", {"medical_info.symptoms": "x"})
+    queue.flush()
+    assert missing.result().status == NOT_FOUND
+
+
+def test_queued_bill_for_a_missing_patient_stores_no_bill(hms, admit, queue):
+    patient = dict(admit("Aby Pal"), patient_id="PAT00000000")
+    future = queue.save_bill(build_bill(patient, now=datetime(2026, 1, 3)))
+
+    queue.flush()
+
+    assert future.result().status == NOT_FOUND
+    assert hms.billing_collection.count_documents({}) == 0
+
+
+def test_lone_write_is_flushed_without_waiting_for_a_batch(hms, admit):
+    patient = admit("Aby Pal")
+    queue = WriteBehindQueue(hms.operations, flush_interval=0.01)
+    try:
+        future = queue.update_fields(patient["patient_id"], {"medical_info.symptoms": "x"})
+        assert future.result(timeout=5).status == OK
+    finally:
+        queue.close()
+
+
+def test_failed_flush_does_not_write_or_publish_resolved_patients_twice(
+        hms, admit, queue, events, monkeypatch):
+    patients = [admit(f"Patient {i}") for i in range(3)]
+    futures = [queue.update_fields(p["patient_id"], {"medical_info.symptoms": "x"})
+               for p in patients]
+    collection = hms.patients_collection
+    real_bulk_write, real_find = collection.bulk_write, collection.find
+    calls = {"find": 0}
+
+    def racing_bulk_write(ops, **kwargs):
+        # Another writer touches the first patient, so it needs a second round
+        monkeypatch.setattr(collection, "bulk_write", real_bulk_write)
+        collection.update_one({"patient_id": patients[0]["patient_id"]},
+                              {"$set": {"updated_at": datetime(2030, 1, 1)}})
+        return real_bulk_write(ops, **kwargs)
+
+    def failing_find(*args, **kwargs):
+        calls["find"] += 1
+        if calls["find"] == 3:  # pre-images of the second round
+            raise RuntimeError("connection reset")
+        return real_find(*args, **kwargs)
+
+    monkeypatch.setattr(collection, "bulk_write", racing_bulk_write)
+    monkeypatch.setattr(collection, "find", failing_find)
+    with pytest.raises(RuntimeError):
+        queue.flush()
+    monkeypatch.setattr(collection, "find", real_find)
+
+    assert queue.pending() == 1
+    queue.flush()
+
+    assert [f.result().status for f in futures] == [OK, OK, OK]
+    assert sorted(events) == sorted((UPDATED, p["patient_id"]) for p in patients)
+
+
+def test_journal_replays_writes_left_by_a_crash(hms, admit, tmp_path):
+    patient = admit("Aby Pal")
+    path = str(tmp_path / "writes.ndjson")
+    crashed = WriteBehindQueue(hms.operations, flush_interval=60, journal=WriteJournal(path))
+    crashed.update_fields(patient["patient_id"], {"medical_info.symptoms": "journaled"})
+    crashed.journal.close()  # the process dies before flushing
+
+    restarted = WriteBehindQueue(hms.operations, flush_interval=60, journal=WriteJournal(path))
+    restarted.close()
+
+    assert hms.operations.get_patient(
+        patient["patient_id"])["medical_info"]["symptoms"] == "journaled"
@@ -0,0 +1,586 @@
+"""Write-behind queue for patient updates, discharges and bills.
+
+With ``HMS_WRITE_BEHIND=1`` the terminal flows hand their writes to a
+``WriteBehindQueue`` instead of waiting for each acknowledgement.  Writes
+to the same patient are coalesced in memory into one ``$set`` (later values
+win), and a background thread flushes the queue as one ordered
+``bulk_write`` per collection whenever ``batch_size`` patients are waiting
+or the oldest write is ``flush_interval`` seconds old.  A shift change where
+hundreds of nurses touch the same ward therefore costs a handful of bulk
+writes instead of one round trip per keystroke.
+
+Every queued call returns a ``concurrent.futures.Future`` that resolves to
+the same ``OperationResult`` the synchronous ``PatientOperations`` call
+would have produced.  Conditions are preserved: a discharge still requires
+an ``Active`` patient and ``expected`` values still turn a concurrent edit
+into a ``conflict``.  They are checked against the document read just
+before the flush, and each write in the bulk is pinned to that document's
+``updated_at``.  A patient changed by someone else in between is read and
+retried.  All writes coalesced into one flush share its outcome.  A
+condition on a field that is itself still queued is checked against the
+queued value.  ``get_patient`` overlays queued changes, so a terminal reads
+its own writes.
+
+Backpressure: at most ``max_pending`` patients wait in the queue.  A caller
+that would exceed it waits up to ``max_wait`` seconds for the flusher and
+then flushes in its own thread.  Durability: with a ``WriteJournal`` every
+write is appended (and fsynced) to a local file before the call returns,
+and anything still in the file at start-up is replayed.  Flush listeners
+receive a ``FlushReport`` after each flush.
+
+    HMS_WRITE_BEHIND=1 HMS_WRITE_JOURNAL=/var/lib/hms/writes.ndjson python app.py
+"""
+import copy
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from bson import json_util
+from pymongo import UpdateOne
+
+from metrics import timed
+from operations import (BILLED, CONFLICT, DISCHARGED, NOT_FOUND, OK, UPDATED, OperationResult,
+                        bill_total_update, to_millis)
+from storage import apply_update, match_document
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 0.05
+DEFAULT_MAX_PENDING = 5000
+DEFAULT_MAX_WAIT = 1.0
+MAX_ATTEMPTS = 3
+MAX_BACKOFF = 5.0
+# Event announced for a coalesced write, most significant first
+EVENT_ORDER = (DISCHARGED, BILLED, UPDATED)
+CONFLICT_MESSAGES = {
+    DISCHARGED: "Patient is not currently active (status: {patient[admission_info][status]})",
+    UPDATED: "Patient was changed by someone else",
+}
+
+_JSON_OPTIONS = json_util.JSONOptions(tz_aware=False)
+
+
+def _overlaps(path: str, other: str) -> bool:
+    """True if one dotted path is the other or lies inside it"""
+    return path == other or path.startswith(other + ".") or other.startswith(path + ".")
+
+
+class FlushReport:
+    """What one flush wrote"""
+
+    def __init__(self):
+        self.patients = 0
+        self.writes = 0
+        self.bulk_writes = 0
+        self.conflicts = 0
+        self.retries = 0
+        self.elapsed = 0.0
+
+    def summary(self) -> str:
+        return (f"{self.writes:,} writes to {self.patients:,} patients in "
+                f"{self.bulk_writes:,} bulk writes ({self.conflicts:,} conflicts, "
+                f"{self.elapsed * 1000:.1f}ms)")
+
+
+class WriteJournal:
+    """Local NDJSON file holding the writes that have not been flushed yet"""
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self.appended = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._fh = open(path, "a", encoding="utf-8")
+
+    def append(self, entry: Dict) -> None:
+        self._fh.write(json_util.dumps(entry) + "\n")
+        self._fh.flush()
+        if self.fsync:
+            os.fsync(self._fh.fileno())
+        self.appended += 1
+
+    def compact(self, entries: Iterable[Dict]) -> None:
+        """Replace the file with ``entries`` (what is still queued)"""
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            for entry in entries:
+                fh.write(json_util.dumps(entry) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        self._fh.close()
+        os.replace(tmp, self.path)
+        self._fh = open(self.path, "a", encoding="utf-8")
+        self.appended = 0
+
+    def load(self) -> List[Dict]:
+        with open(self.path, encoding="utf-8") as fh:
+            return [json_util.loads(line, json_options=_JSON_OPTIONS)
+                    for line in fh if line.strip()]
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class _Pending:
+    """Coalesced writes waiting for one patient"""
+
+    __slots__ = ("patient_id", "changes", "expressions", "conditions", "bill", "events",
+                 "futures", "entries", "queued_at", "resolved")
+
+    def __init__(self, patient_id: str, queued_at: float):
+        self.patient_id = patient_id
+        self.changes: Dict[str, Any] = {}
+        self.expressions: Dict[str, Any] = {}
+        self.conditions: Dict[str, Any] = {}
+        self.bill: Optional[Dict] = None
+        self.events: List[str] = []
+        self.futures: List[Future] = []
+        self.entries: List[Dict] = []
+        self.queued_at = queued_at
+        self.resolved = False
+
+    def fields(self) -> List[str]:
+        return list(self.changes) + list(self.expressions)
+
+    def check(self, conditions: Dict, fields: Iterable[str]) -> Tuple[str, Dict]:
+        """How a new write relates to the writes queued here
+
+        Returns ``("merge", conditions)`` with the conditions still to be
+        checked in the database (a condition on a field queued here is
+        checked against the queued value instead), ``("conflict", {})`` if
+        such a condition already fails, or ``("flush", {})`` if this patient
+        has to be written first: the new write contradicts a queued
+        condition or touches part of a queued sub-document.
+        """
+        queued = self.fields()
+        remaining = {}
+        for field, value in conditions.items():
+            if field in self.changes:
+                if self.changes[field] != value:
+                    return "conflict", {}
+            elif any(_overlaps(field, other) for other in queued):
+                return "flush", {}
+            elif field in self.conditions and self.conditions[field] != value:
+                return "flush", {}
+            else:
+                remaining[field] = value
+        if any(_overlaps(field, other) and field != other for field in fields for other in queued):
+            return "flush", {}
+        return "merge", remaining
+
+    def add(self, event: str, conditions: Dict, changes: Dict, expressions: Dict,
+            future: Future, entry: Dict) -> None:
+        self.conditions.update(conditions)
+        for field, value in changes.items():
+            self.expressions.pop(field, None)
+            self.changes[field] = value
+        for field, value in expressions.items():
+            self.changes.pop(field, None)
+            self.expressions[field] = value
+        if event not in self.events:
+            self.events.append(event)
+        self.futures.append(future)
+        self.entries.append(entry)
+
+    def absorb(self, later: "_Pending") -> None:
+        """Fold writes queued after this one back in (after a failed flush)"""
+        self.conditions.update({k: v for k, v in later.conditions.items()
+                                if k not in self.conditions})
+        for field, value in later.changes.items():
+            self.expressions.pop(field, None)
+            self.changes[field] = value
+        for field, value in later.expressions.items():
+            self.changes.pop(field, None)
+            self.expressions[field] = value
+        if later.bill is not None:
+            self.bill = dict(self.bill or {}, **later.bill)
+        self.events.extend(e for e in later.events if e not in self.events)
+        self.futures.extend(later.futures)
+        self.entries.extend(later.entries)
+
+    @property
+    def event(self) -> str:
+        return next(e for e in EVENT_ORDER if e in self.events)
+
+    def update(self) -> Any:
+        """One update applying every queued change"""
+        if not self.expressions:
+            return {"$set": dict(self.changes)}
+        stage = {field: {"$literal": value} for field, value in self.changes.items()}
+        stage.update(self.expressions)
+        return [{"$set": stage}]
+
+    def resolve(self, result: OperationResult) -> None:
+        self.resolved = True
+        for future in self.futures:
+            if not future.done():
+                future.set_result(result)
+
+
+class WriteBehindQueue:
+    """Coalesces patient writes in memory and flushes them as bulk writes"""
+
+    def __init__(self, operations, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 max_pending: int = DEFAULT_MAX_PENDING, max_wait: float = DEFAULT_MAX_WAIT,
+                 journal: Optional[WriteJournal] = None):
+        self.operations = operations
+        self.patients_collection = operations.patients_collection
+        self.billing_collection = operations.billing_collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.journal = journal
+        self._pending: Dict[str, _Pending] = {}
+        self._in_flight: Dict[str, _Pending] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._room = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._listeners: List[Callable[[FlushReport], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.enqueued = 0
+        self.coalesced = 0
+        self.flushed = 0
+        self.bulk_writes = 0
+        if journal is not None:
+            entries = journal.load()
+            if entries:
+                journal.compact([])
+                self.replay(entries)
+
+    def add_flush_listener(self, listener: Callable[[FlushReport], None]) -> None:
+        """Call ``listener(report)`` after every flush that wrote something"""
+        self._listeners.append(listener)
+
+    # -- enqueueing --------------------------------------------------------
+
+    def update_fields(self, patient_id: str, changes: Dict, expected: Optional[Dict] = None,
+                      now: Optional[datetime] = None) -> Future:
+        """Queued ``PatientOperations.update_fields``"""
+        now = to_millis(now or datetime.now())
+        changes = dict(changes, updated_at=now)
+        return self._enqueue({"op": "update", "patient_id": patient_id, "changes": changes,
+                              "expected": expected or {}, "now": now})
+
+    def discharge(self, patient_id: str, notes: str = "", now: Optional[datetime] = None) -> Future:
+        """Queued ``PatientOperations.discharge``"""
+        now = to_millis(now or datetime.now())
+        return self._enqueue({"op": "discharge", "patient_id": patient_id, "notes": notes,
+                              "now": now})
+
+    def save_bill(self, bill: Dict, now: Optional[datetime] = None) -> Future:
+        """Queued ``PatientOperations.save_bill``"""
+        now = to_millis(now or datetime.now())
+        return self._enqueue({"op": "bill", "patient_id": bill["patient_id"], "bill": bill,
+                              "now": now})
+
+    def replay(self, entries: Iterable[Dict]) -> int:
+        """Queue journal entries again (writes that were not flushed before a crash)"""
+        count = 0
+        for entry in entries:
+            self._enqueue(entry)
+            count += 1
+        if count:
+            logger.warning("Replayed %d queued writes from %s", count, self.journal.path
+                           if self.journal else "journal")
+        return count
+
+    @staticmethod
+    def _parts(entry: Dict):
+        """(event, conditions, literal changes, expressions) of a journal entry"""
+        if entry["op"] == "update":
+            return UPDATED, dict(entry["expected"]), dict(entry["changes"]), {}
+        if entry["op"] == "discharge":
+            return DISCHARGED, {"admission_info.status": "Active"}, {
+                "admission_info.status": "Discharged",
+                "admission_info.discharge_date": entry["now"],
+                "admission_info.discharge_notes": entry["notes"],
+                "updated_at": entry["now"]}, {}
+        bill = entry["bill"]
+        stage = bill_total_update(bill["total_amount"], bill["generated_date"], entry["now"])
+        return BILLED, {}, {}, stage[0]["$set"]
+
+    @timed("write_queue_enqueue")
+    def _enqueue(self, entry: Dict) -> Future:
+        patient_id = entry["patient_id"]
+        event, conditions, changes, expressions = self._parts(entry)
+        fields = list(changes) + list(expressions)
+        future: Future = Future()
+        deadline = None
+        while True:
+            with self._lock:
+                pending = self._pending.get(patient_id)
+                in_flight = self._in_flight.get(patient_id)
+                if in_flight is not None and any(_overlaps(field, other) for field in conditions
+                                                 for other in in_flight.fields()):
+                    # The condition depends on a write that may still fail, so wait for it
+                    action = "flush"
+                elif pending is not None:
+                    action, conditions = pending.check(conditions, fields)
+                elif len(self._pending) >= self.max_pending:
+                    deadline = deadline or time.monotonic() + self.max_wait
+                    if time.monotonic() < deadline:
+                        self._changed.notify()
+                        self._room.wait(deadline - time.monotonic())
+                        continue
+                    action = "full"
+                else:
+                    action = "merge"
+                if action == "merge":
+                    if pending is None:
+                        pending = self._pending[patient_id] = _Pending(patient_id, time.monotonic())
+                    else:
+                        self.coalesced += 1
+                    if entry["op"] == "bill":
+                        pending.bill = dict(entry["bill"])
+                    pending.add(event, conditions, changes, expressions, future, entry)
+                    if self.journal is not None:
+                        self.journal.append(entry)
+                    self.enqueued += 1
+                    self._ensure_thread()
+                    # The flusher sleeps without a deadline while the queue is empty
+                    if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                        self._changed.notify()
+                    return future
+            if action == "conflict":
+                current = self.get_patient(patient_id)
+                message = CONFLICT_MESSAGES.get(event, CONFLICT_MESSAGES[UPDATED])
+                future.set_result(OperationResult(CONFLICT, current,
+                                                  message.format(patient=current)))
+                return future
+            if action == "flush":
+                self.flush([patient_id])
+            else:
+                # Backpressure: the queue stayed full, so the caller writes a batch itself
+                self._flush_once()
+
+    # -- reading -----------------------------------------------------------
+
+    def get_patient(self, patient_id: str, projection: Optional[Dict] = None) -> Optional[Dict]:
+        """``PatientOperations.get_patient`` with this queue's writes applied"""
+        patient = self.operations.get_patient(patient_id, projection)
+        with self._lock:
+            queued = [p.update() for p in (self._in_flight.get(patient_id),
+                                           self._pending.get(patient_id)) if p is not None]
+        if patient is not None:
+            for update in queued:
+                apply_update(patient, update)
+        return patient
+
+    def pending(self) -> int:
+        """Patients with writes not yet flushed"""
+        with self._lock:
+            return len(self._pending) + len(self._in_flight)
+
+    # -- flushing ----------------------------------------------------------
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name="hms-write-behind",
+                                            daemon=True)
+            self._thread.start()
+
+    def _due_in(self) -> Optional[float]:
+        """Seconds until the next flush is due (0 = now), None if nothing is queued"""
+        if not self._pending:
+            return None
+        if self._closed or len(self._pending) >= self.batch_size:
+            return 0.0
+        oldest = next(iter(self._pending.values())).queued_at
+        return max(0.0, oldest + self.flush_interval - time.monotonic())
+
+    def _run(self) -> None:
+        backoff = self.flush_interval
+        while True:
+            with self._lock:
+                while True:
+                    due = self._due_in()
+                    if due == 0.0 or (due is None and self._closed):
+                        break
+                    self._changed.wait(due)
+                if due is None:
+                    return
+            try:
+                self._flush_once()
+                backoff = self.flush_interval
+            except Exception:
+                logger.exception("Write-behind flush failed; retrying in %.1fs", backoff)
+                with self._lock:
+                    if self._closed:
+                        return
+                    self._changed.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def flush(self, patient_ids: Optional[Iterable[str]] = None) -> FlushReport:
+        """Write everything queued (or only ``patient_ids``) now"""
+        total = FlushReport()
+        wanted = None if patient_ids is None else set(patient_ids)
+        while True:
+            report = self._flush_once(wanted)
+            if report is None:
+                return total
+            for field in ("patients", "writes", "bulk_writes", "conflicts", "retries",
+                          "elapsed"):
+                setattr(total, field, getattr(total, field) + getattr(report, field))
+
+    def _flush_once(self, wanted=None) -> Optional[FlushReport]:
+        with self._flush_lock:
+            with self._lock:
+                ids = [pid for pid in self._pending if wanted is None or pid in wanted]
+                ids = ids[:self.batch_size]
+                if not ids:
+                    return None
+                batch = [self._pending.pop(pid) for pid in ids]
+                self._in_flight = {p.patient_id: p for p in batch}
+                self._room.notify_all()
+            try:
+                report = self._write(batch)
+            except Exception:
+                with self._lock:
+                    self._restore(batch)
+                raise
+            finally:
+                with self._lock:
+                    self._in_flight = {}
+            with self._lock:
+                if self.journal is not None and (
+                        not self._pending or self.journal.appended > 4 * self.max_pending):
+                    self.journal.compact(e for p in self._pending.values() for e in p.entries)
+            for listener in self._listeners:
+                try:
+                    listener(report)
+                except Exception:
+                    logger.exception("Flush listener %r failed", listener)
+            return report
+
+    def _restore(self, batch: List[_Pending]) -> None:
+        """Put what a failed flush left unresolved back at the front of the queue
+
+        Writes resolved before the failure were applied (and published) or
+        rejected, so they are not written again.
+        """
+        restored: Dict[str, _Pending] = {}
+        for pending in batch:
+            if pending.resolved:
+                continue
+            later = self._pending.pop(pending.patient_id, None)
+            if later is not None:
+                pending.absorb(later)
+            restored[pending.patient_id] = pending
+        restored.update(self._pending)
+        self._pending = restored
+
+    @timed("write_queue_flush")
+    def _write(self, batch: List[_Pending]) -> FlushReport:
+        report = FlushReport()
+        started = time.perf_counter()
+        report.patients = len(batch)
+        report.writes = sum(len(p.futures) for p in batch)
+        remaining = batch
+        for attempt in range(MAX_ATTEMPTS):
+            if attempt:
+                report.retries += len(remaining)
+            remaining = self._write_patients(remaining, report)
+            if not remaining:
+                break
+        for pending in remaining:
+            current = self.operations.get_patient(pending.patient_id)
+            pending.resolve(OperationResult(CONFLICT, current,
+                                            "Patient kept changing; write not applied"))
+            report.conflicts += 1
+        self.flushed += report.writes
+        self.bulk_writes += report.bulk_writes
+        report.elapsed = time.perf_counter() - started
+        return report
+
+    def _write_patients(self, batch: List[_Pending], report: FlushReport) -> List[_Pending]:
+        """One read of the pre-images and one bulk write; returns what lost a race
+
+        Bills follow in one more bulk write, only for the patients written,
+        so none is stored for a patient that does not exist.
+        """
+        ids = [p.patient_id for p in batch]
+        before = {doc["patient_id"]: doc for doc in self.patients_collection.find(
+            {"patient_id": {"$in": ids}})}
+        ops, staged = [], []
+        for pending in batch:
+            current = before.get(pending.patient_id)
+            if current is None:
+                if self.operations.cache is not None:
+                    self.operations.cache.invalidate(pending.patient_id)
+                pending.resolve(OperationResult(NOT_FOUND, None, "Patient not found"))
+            elif not match_document(current, pending.conditions):
+                message = CONFLICT_MESSAGES.get(pending.event, CONFLICT_MESSAGES[UPDATED])
+                pending.resolve(OperationResult(CONFLICT, current,
+                                                message.format(patient=current)))
+                report.conflicts += 1
+            else:
+                update = pending.update()
+                after = copy.deepcopy(current)
+                apply_update(after, update)
+                ops.append(UpdateOne({"patient_id": pending.patient_id,
+                                      "updated_at": current.get("updated_at")}, update))
+                staged.append((pending, current, after))
+        if not ops:
+            return []
+        try:
+            result = self.patients_collection.bulk_write(ops, ordered=True)
+            lost = set() if result.matched_count == len(ops) else None
+        except Exception:
+            # Some of the batch may have been written; find out which below
+            lost = None
+            logger.warning("Bulk write of %d patients failed; checking what was applied",
+                           len(ops), exc_info=True)
+        if lost is None:
+            written = {doc["patient_id"]: doc.get("updated_at") for doc in
+                       self.patients_collection.find(
+                           {"patient_id": {"$in": [p.patient_id for p, _, _ in staged]}},
+                           {"_id": 0, "patient_id": 1, "updated_at": 1})}
+            lost = {p.patient_id for p, _, after in staged
+                    if written.get(p.patient_id) != after.get("updated_at")}
+        report.bulk_writes += 1
+        billed = [p for p, _, _ in staged if p.bill is not None and p.patient_id not in lost]
+        created = set()
+        if billed:
+            result = self.billing_collection.bulk_write(
+                [UpdateOne({"patient_id": p.patient_id}, {"$set": p.bill}, upsert=True)
+                 for p in billed], ordered=True)
+            created = {billed[item["index"]].patient_id
+                       for item in result.bulk_api_result.get("upserted", [])}
+            report.bulk_writes += 1
+        retry = []
+        for pending, current, after in staged:
+            if pending.patient_id in lost:
+                retry.append(pending)
+                continue
+            self.operations.publish(pending.event, current, after)
+            message = ("created" if pending.patient_id in created else "updated") \
+                if pending.bill is not None else ""
+            pending.resolve(OperationResult(OK, after, message))
+        return retry
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            waiting = len(self._pending) + len(self._in_flight)
+        return {"enqueued": self.enqueued, "coalesced": self.coalesced,
+                "flushed": self.flushed, "bulk_writes": self.bulk_writes, "pending": waiting}
+
+    def close(self) -> None:
+        """Flush everything still queued and stop the background thread"""
+        with self._lock:
+            self._closed = True
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        if self.journal is not None:
+            self.journal.close()